@@ -0,0 +1,18 @@
+"""Python backend tools for the sun lamp fleet (stdlib only).
+
+    python -m sunlamp_backend.mqttlite   stand-in MQTT broker
+    python -m sunlamp_backend.fleet      N simulated lamps + load report
+    python -m sunlamp_backend.ingest     batched status -> InfluxDB bridge
+    python -m sunlamp_backend.influx_stub  stand-in for the InfluxDB write API
+    python -m sunlamp_backend.ota_push   send an OTA package to a lamp
+    python -m sunlamp_backend.shadow     read or update the device shadow
+
+Run from the backend/ directory.
+"""
+STATUS_TOPIC = 'esp32/sunlamp/status'
+CMD_TOPIC = 'esp32/sunlamp/cmd'
+REPLY_TOPIC = 'esp32/sunlamp/reply'
+DESIRED_TOPIC = 'esp32/sunlamp/shadow/desired'
+REPORTED_TOPIC = 'esp32/sunlamp/shadow/reported'
+REPORTED_DELTA_TOPIC = 'esp32/sunlamp/shadow/reported/delta'
+PUBLISH_INTERVAL_S = 5      # firmware default status cadence (config.py)
@@ -0,0 +1,435 @@
+"""Fleet load simulator: N virtual sun lamps in one asyncio process.
+
+Every lamp is its own MQTT connection and speaks the firmware protocol:
+it publishes the full status document on esp32/sunlamp/status every 5 s
+(sensor readings follow mean-reverting random walks) and applies set/anim
+commands from esp32/sunlamp/cmd. A controller client consumes all status
+traffic (like the Node-RED "mqtt in" node) and sends commands to random
+lamps. It reports:
+
+- status publish throughput, sent by the lamps vs received by the consumer
+- messages dropped (by the broker and end-to-end)
+- command delivery latency (publish -> lamp applies it)
+- command round trip (publish -> first status showing the new state;
+  dominated by the 5 s cadence, as on real hardware)
+
+All lamps share the single command topic of the real protocol, so every
+command fans out to every lamp. Commands carry "device_id", and lamps
+ignore commands addressed to another id; real firmware ignores the field.
+
+    python -m sunlamp_backend.fleet --devices 1000 --duration 60
+    python -m sunlamp_backend.fleet --host 127.0.0.1 --port 21883 --user esp32:esp32
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import resource
+import sys
+import time
+
+from sunlamp_backend import STATUS_TOPIC, CMD_TOPIC, PUBLISH_INTERVAL_S
+from sunlamp_backend.mqttlite import Broker, Client, MQTTError
+
+ANIMATIONS = {'wakeup': 600, 'warning': 0, 'sunset': 900, 'breathe': 3}
+RECONNECT_S = 5             # firmware waits 5 s after a failed connect
+
+
+def percentiles(values, ps=(50, 90, 99)):
+    """Nearest-rank percentiles of a list; {} when empty."""
+    if not values:
+        return {}
+    s = sorted(values)
+    out = {'p{}'.format(p): s[min(len(s) - 1, max(0, int(math.ceil(p / 100.0 * len(s))) - 1))]
+           for p in ps}
+    out['max'] = s[-1]
+    out['n'] = len(s)
+    return out
+
+
+class Walk:
+    """Mean-reverting random walk (Ornstein-Uhlenbeck, Euler step) clamped to [lo, hi]."""
+
+    def __init__(self, rng, mean, sigma, lo, hi, theta=0.01, digits=1):
+        self.rng = rng
+        self.mean = mean
+        self.sigma = sigma
+        self.lo = lo
+        self.hi = hi
+        self.theta = theta
+        self.digits = digits
+        self.x = mean + rng.gauss(0, sigma * 3)
+
+    def step(self, dt):
+        self.x += self.theta * (self.mean - self.x) * dt + self.sigma * math.sqrt(dt) * self.rng.gauss(0, 1)
+        self.x = min(self.hi, max(self.lo, self.x))
+        return round(self.x, self.digits) if self.digits else int(self.x)
+
+
+class VirtualLamp:
+    def __init__(self, idx, rng, fleet):
+        self.device_id = 'lamp-{:05d}'.format(idx)
+        self.rng = rng
+        self.fleet = fleet
+        self.walks = {
+            'temperature': Walk(rng, rng.uniform(19, 26), 0.05, -10, 50),
+            'humidity': Walk(rng, rng.uniform(35, 60), 0.2, 0, 100),
+            'eco2': Walk(rng, rng.uniform(450, 900), 4.0, 400, 60000, digits=0),
+            'tvoc': Walk(rng, rng.uniform(10, 120), 1.0, 0, 60000, digits=0),
+            'light': Walk(rng, rng.uniform(300, 2500), 15.0, 0, 4095, digits=0),
+        }
+        self.sensor = {k: w.step(0) for k, w in self.walks.items()}
+        self.filtered = dict(self.sensor)
+        self.lamp = {
+            'is_on': False, 'brightness': 50, 'color_mode': 'temp', 'brightness_mode': 'manual',
+            'color_temp_k': 4000, 'custom_rgb': [255, 220, 200], 'animation': None,
+            'animation_start_ms': 0, 'animation_duration_s': 0, 'animation_progress': 0.0,
+        }
+        self.client = None
+        self.published = 0
+        self.commands = 0
+        self.boot_ms = {'main': rng.randint(30, 60), 'lamp': rng.randint(80, 120),
+                        'network': rng.randint(400, 3500), 'display': rng.randint(500, 3800)}
+
+    # ---------------- protocol -----------------
+    def status(self, now_ms, dt):
+        for k, w in self.walks.items():
+            v = w.step(dt)
+            self.sensor[k] = v
+            # the firmware reports EMA-smoothed values next to the raw ones
+            self.filtered[k] = round(0.7 * self.filtered[k] + 0.3 * v, 2)
+        lamp = self.lamp
+        if lamp['animation'] in ('wakeup', 'sunset'):
+            dur = max(1, lamp['animation_duration_s']) * 1000.0
+            p = min(1.0, (now_ms - lamp['animation_start_ms']) / dur)
+            lamp['animation_progress'] = round(p, 3)
+            if p >= 1.0:
+                if lamp['animation'] == 'sunset':
+                    lamp['is_on'] = False
+                lamp['animation'] = None
+        return {
+            'device_id': self.device_id,
+            'ts': now_ms,
+            'synced': True,
+            'sensor': dict(self.sensor),
+            'filtered': dict(self.filtered),
+            'trend': {k: round(self.rng.gauss(0, 0.05), 3) for k in self.sensor},
+            'network': {'wifi': 'connected', 'mqtt': 'connected',
+                        'wifi_stats': {'attempts': 1, 'fast_ok': 1, 'scan_ok': 0, 'failures': 0,
+                                       'last_ms': 620, 'last_method': 'fast',
+                                       'avg_fast_ms': 620, 'avg_scan_ms': 0}},
+            'lamp': dict(lamp),
+            'daylight': {'target': 2500, 'kp': 0.01, 'ki': 0.02, 'deadband': 60,
+                         'measured': self.sensor['light'], 'output': None},
+            'schedule': None,
+            'clock': {'synced': True, 'syncs': 1, 'failures': 0, 'rtt_ms': 18, 'drift_ppm': 4.2},
+            'i2c': {'0x3c': {'ops': 900, 'errors': 0, 'last_us': 410, 'max_us': 2900, 'avg_us': 520},
+                    '0x58': {'ops': 300, 'errors': 0, 'last_us': 380, 'max_us': 1200, 'avg_us': 390}},
+            'boot_ms': self.boot_ms,
+        }
+
+    def on_message(self, topic, payload):
+        try:
+            j = json.loads(payload)
+        except ValueError:
+            return
+        target = j.get('device_id')
+        if target is not None and target != self.device_id:
+            return
+        self.commands += 1
+        lamp = self.lamp
+        cmd = j.get('cmd')
+        if cmd == 'set':
+            if 'is_on' in j:
+                lamp['is_on'] = bool(j['is_on'])
+            if 'brightness' in j:
+                lamp['brightness'] = max(0, min(100, int(j['brightness'])))
+                lamp['brightness_mode'] = 'manual'
+            if j.get('brightness_mode') in ('manual', 'auto'):
+                lamp['brightness_mode'] = j['brightness_mode']
+            if 'color_temp_k' in j:
+                lamp['color_temp_k'] = int(j['color_temp_k'])
+                lamp['color_mode'] = 'temp'
+            if isinstance(j.get('rgb'), list) and len(j['rgb']) == 3:
+                lamp['custom_rgb'] = [max(0, min(255, int(x))) for x in j['rgb']]
+                lamp['color_mode'] = 'custom'
+            lamp['animation'] = None
+        elif cmd == 'anim' and j.get('type') in ANIMATIONS:
+            lamp['animation'] = j['type']
+            lamp['animation_start_ms'] = int(j.get('start_ms') or time.time() * 1000)
+            lamp['animation_duration_s'] = int(j.get('duration_s', ANIMATIONS[j['type']]))
+            lamp['animation_progress'] = 0.0
+            lamp['is_on'] = True
+        if 'req' in j:
+            self.fleet.delivered(j['req'])
+
+    async def run(self, interval, phase):
+        fleet = self.fleet
+        while True:
+            self.client = Client(self.device_id, fleet.host, fleet.port, fleet.user, fleet.password,
+                                 on_message=self.on_message)
+            try:
+                await self.client.connect()
+                await self.client.subscribe(CMD_TOPIC)
+            except (OSError, MQTTError, asyncio.TimeoutError):
+                fleet.stats['connect_failures'] += 1
+                await self.client.close()
+                await asyncio.sleep(RECONNECT_S)
+                continue
+            fleet.connected += 1
+            await asyncio.sleep(phase)
+            nxt = time.monotonic()
+            last = nxt
+            try:
+                while self.client.connected:
+                    now = time.monotonic()
+                    doc = self.status(int(time.time() * 1000), now - last)
+                    last = now
+                    data = json.dumps(doc)
+                    self.client.publish(STATUS_TOPIC, data)
+                    self.published += 1
+                    fleet.stats['published'] += 1
+                    fleet.stats['bytes'] += len(data)
+                    # fixed-rate schedule like the firmware; no catch-up bursts after a stall
+                    nxt = max(nxt + interval, time.monotonic())
+                    await asyncio.sleep(nxt - time.monotonic())
+            except MQTTError:
+                pass
+            fleet.connected -= 1
+            fleet.stats['disconnects'] += 1
+            await self.client.close()
+            await asyncio.sleep(RECONNECT_S)
+
+
+class Fleet:
+    def __init__(self, host, port, user=None, password=None, seed=1):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.rng = random.Random(seed)
+        self.lamps = []
+        self.connected = 0
+        self.stats = {'published': 0, 'received': 0, 'bytes': 0, 'connect_failures': 0,
+                      'disconnects': 0, 'cmds_sent': 0, 'cmds_delivered': 0, 'cmds_confirmed': 0,
+                      'cmds_lost': 0, 'bad_status': 0}
+        self.delivery_ms = []
+        self.rtt_ms = []
+        self.loop_lag_ms = []
+        self._sent = {}         # req -> send time (monotonic)
+        self._pending = {}      # device_id -> (req, brightness, send time)
+        self._req = 0
+        self.consumer = None
+
+    # ---------------- consumer / controller -----------------
+    def delivered(self, req):
+        t = self._sent.get(req)
+        if t is not None:
+            self.stats['cmds_delivered'] += 1
+            self.delivery_ms.append((time.monotonic() - t) * 1000.0)
+
+    def on_status(self, topic, payload):
+        try:
+            doc = json.loads(payload)
+            dev = doc['device_id']
+            brightness = doc['lamp']['brightness']
+        except (ValueError, KeyError, TypeError):
+            self.stats['bad_status'] += 1
+            return
+        self.stats['received'] += 1
+        p = self._pending.get(dev)
+        if p is not None and brightness == p[1]:
+            del self._pending[dev]
+            self._sent.pop(p[0], None)
+            self.stats['cmds_confirmed'] += 1
+            self.rtt_ms.append((time.monotonic() - p[2]) * 1000.0)
+
+    async def start_consumer(self):
+        self.consumer = Client('fleet-consumer', self.host, self.port, self.user, self.password,
+                               on_message=self.on_status)
+        await self.consumer.connect()
+        await self.consumer.subscribe(STATUS_TOPIC)
+
+    def send_command(self):
+        idle = [l for l in self.rng.sample(self.lamps, min(8, len(self.lamps)))
+                if l.device_id not in self._pending and l.client and l.client.connected]
+        if not idle:
+            return
+        lamp = idle[0]
+        b = self.rng.randint(1, 100)
+        while b == lamp.lamp['brightness']:
+            b = self.rng.randint(1, 100)
+        self._req += 1
+        now = time.monotonic()
+        self._sent[self._req] = now
+        self._pending[lamp.device_id] = (self._req, b, now)
+        self.consumer.publish(CMD_TOPIC, json.dumps(
+            {'cmd': 'set', 'is_on': True, 'brightness': b, 'device_id': lamp.device_id, 'req': self._req}))
+        self.stats['cmds_sent'] += 1
+
+    def expire(self, timeout_s):
+        now = time.monotonic()
+        for dev, (req, _b, t) in list(self._pending.items()):
+            if now - t > timeout_s:
+                del self._pending[dev]
+                self._sent.pop(req, None)
+                self.stats['cmds_lost'] += 1
+
+    async def lag_monitor(self, period=0.1):
+        """Event-loop lag: when this grows, the simulator itself is the bottleneck."""
+        while True:
+            t = time.monotonic()
+            await asyncio.sleep(period)
+            self.loop_lag_ms.append((time.monotonic() - t - period) * 1000.0)
+
+    async def command_loop(self, rate, timeout_s):
+        if rate <= 0:
+            return
+        while True:
+            await asyncio.sleep(1.0 / rate)
+            if self.consumer.connected:
+                self.send_command()
+            self.expire(timeout_s)
+
+    # ---------------- lamps -----------------
+    async def spawn(self, n, ramp_per_s, interval):
+        tasks = []
+        for i in range(n):
+            lamp = VirtualLamp(i, random.Random(self.rng.random()), self)
+            self.lamps.append(lamp)
+            tasks.append(asyncio.ensure_future(lamp.run(interval, self.rng.uniform(0, interval))))
+            if ramp_per_s and (i + 1) % max(1, int(ramp_per_s / 10)) == 0:
+                await asyncio.sleep(0.1)
+        return tasks
+
+
+def _raise_fd_limit(need):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < need:
+        new = need if hard == resource.RLIM_INFINITY else min(hard, need)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (new, hard))
+        soft = new
+    return soft
+
+
+async def run(args):
+    broker = None
+    host, port = args.host, args.port
+    user = password = None
+    if args.user:
+        user, _, password = args.user.partition(':')
+    if host is None:
+        broker = await Broker('127.0.0.1', 0, {'esp32': 'esp32'}, max_queue=args.broker_queue).start()
+        host, port = '127.0.0.1', broker.port
+        user, password = 'esp32', 'esp32'
+    limit = _raise_fd_limit(args.devices * (2 if broker else 1) + 64)
+    if limit < args.devices * (2 if broker else 1) + 64:
+        print('warning: open file limit {} is too low for {} devices'.format(limit, args.devices))
+
+    fleet = Fleet(host, port, user, password, seed=args.seed)
+    await fleet.start_consumer()
+    lag_task = asyncio.ensure_future(fleet.lag_monitor())
+    t0 = time.monotonic()
+    tasks = await fleet.spawn(args.devices, args.ramp, args.interval)
+    ramp_s = time.monotonic() - t0
+    cmd_task = asyncio.ensure_future(fleet.command_loop(args.cmd_rate, args.cmd_timeout))
+
+    last = dict(fleet.stats)
+    last_t = time.monotonic()
+    end = t0 + args.duration
+    while time.monotonic() < end:
+        await asyncio.sleep(min(args.report_s, max(0.0, end - time.monotonic())))
+        now = time.monotonic()
+        dt = max(1e-6, now - last_t)
+        s = fleet.stats
+        rtt = percentiles(fleet.rtt_ms)
+        lag = percentiles(fleet.loop_lag_ms[-int(args.report_s * 10):])
+        print('[{:6.1f}s] conn {:5d}  pub {:7.1f}/s  recv {:7.1f}/s  cmds {}/{}  rtt p50 {}  '
+              'drop {}  loop lag p99 {:.0f}ms'.format(
+                  now - t0, fleet.connected, (s['published'] - last['published']) / dt,
+                  (s['received'] - last['received']) / dt, s['cmds_confirmed'], s['cmds_sent'],
+                  '{:.0f}ms'.format(rtt['p50']) if rtt else '-',
+                  broker.stats['dropped'] if broker else '-', lag.get('p99', 0)))
+        last = dict(s)
+        last_t = now
+
+    cmd_task.cancel()
+    lag_task.cancel()
+    # let in-flight statuses arrive before counting drops
+    await asyncio.sleep(args.grace)
+    fleet.expire(args.cmd_timeout)
+    elapsed = time.monotonic() - t0
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for lamp in fleet.lamps:
+        if lamp.client is not None:
+            await lamp.client.close()
+    s = fleet.stats
+    summary = {
+        'devices': args.devices,
+        'connected': fleet.connected,
+        'ramp_s': round(ramp_s, 2),
+        'elapsed_s': round(elapsed, 1),
+        'published': s['published'],
+        'received': s['received'],
+        'publish_rate': round(s['published'] / elapsed, 1),
+        'avg_payload_bytes': s['bytes'] // s['published'] if s['published'] else 0,
+        'receive_rate': round(s['received'] / elapsed, 1),
+        # published but not seen by the consumer (lost, or still queued after --grace)
+        'not_received': max(0, s['published'] - s['received']),
+        'dropped_by_broker': broker.stats['dropped'] if broker else None,
+        'connect_failures': s['connect_failures'],
+        'disconnects': s['disconnects'],
+        'commands': {'sent': s['cmds_sent'], 'delivered': s['cmds_delivered'],
+                     'confirmed': s['cmds_confirmed'], 'lost': s['cmds_lost'],
+                     'in_flight': len(fleet._pending),
+                     'fanout': args.devices},
+        'cmd_delivery_ms': {k: round(v, 1) for k, v in percentiles(fleet.delivery_ms).items()},
+        'cmd_rtt_ms': {k: round(v, 1) for k, v in percentiles(fleet.rtt_ms).items()},
+        'loop_lag_ms': {k: round(v, 1) for k, v in percentiles(fleet.loop_lag_ms).items()},
+    }
+    if summary['loop_lag_ms'].get('p99', 0) > 250:
+        print('warning: event-loop lag p99 {} ms - the simulator is saturated; latencies above '
+              'include simulator delay (use fewer devices per process)'.format(summary['loop_lag_ms']['p99']))
+    await fleet.consumer.close()
+    if broker:
+        await broker.stop()
+    return summary
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m sunlamp_backend.fleet',
+                                 description='Simulate a fleet of sun lamps against an MQTT broker.')
+    ap.add_argument('--devices', type=int, default=200)
+    ap.add_argument('--duration', type=float, default=60.0, help='seconds, including the ramp')
+    ap.add_argument('--interval', type=float, default=PUBLISH_INTERVAL_S, help='status period per lamp')
+    ap.add_argument('--ramp', type=float, default=500.0, help='new connections per second (0: all at once)')
+    ap.add_argument('--cmd-rate', type=float, default=2.0, help='commands per second')
+    ap.add_argument('--cmd-timeout', type=float, default=3 * PUBLISH_INTERVAL_S)
+    ap.add_argument('--host', help='external broker; default starts an in-process stand-in')
+    ap.add_argument('--port', type=int, default=1883)
+    ap.add_argument('--user', help='USER:PASSWORD for an external broker')
+    ap.add_argument('--broker-queue', type=int, default=1000,
+                    help='per-subscriber queue of the in-process broker before it drops')
+    ap.add_argument('--report-s', type=float, default=5.0)
+    ap.add_argument('--grace', type=float, default=2.0)
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--json', help='also write the summary to this file')
+    args = ap.parse_args(argv)
+
+    try:
+        summary = asyncio.run(run(args))
+    except (OSError, MQTTError, asyncio.TimeoutError) as e:
+        print('cannot connect to broker {}:{}: {}'.format(args.host or 'in-process', args.port, e))
+        return 2
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 0 if summary['connected'] == args.devices else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
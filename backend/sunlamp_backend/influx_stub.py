@@ -0,0 +1,256 @@
+"""Local HTTP stand-in for the InfluxDB v2 write API.
+
+Accepts POST /api/v2/write?org=..&bucket=..&precision=.. (optionally gzip),
+parses the line protocol and counts points per measurement and device_id.
+Invalid lines get a 400 like InfluxDB's partial-write response (valid lines
+in the same request are kept). Slowness and failures can be injected:
+
+- --latency-ms / --jitter-ms: delay before every response;
+- --points-per-s: write capacity shared by all connections (requests
+  queue behind each other, so large batches take proportionally longer);
+- --fail-rate: fraction of writes answered 503 with Retry-After;
+- --token: require "Authorization: Token <token>" (401 otherwise).
+
+GET /health answers like InfluxDB; GET /stats returns the counters as JSON.
+
+    python -m sunlamp_backend.influx_stub --port 8086 --latency-ms 200 --fail-rate 0.05
+"""
+import argparse
+import asyncio
+import collections
+import gzip
+import json
+import random
+import sys
+import urllib.parse
+
+from sunlamp_backend.ingest import HTTPError, read_body, read_headers
+
+
+def _split(s, sep):
+    """Split on sep outside backslash escapes and double quotes."""
+    out = []
+    cur = []
+    i = 0
+    quoted = False
+    while i < len(s):
+        c = s[i]
+        if c == '\\' and i + 1 < len(s):
+            cur.append(s[i:i + 2])
+            i += 2
+            continue
+        if c == '"':
+            quoted = not quoted
+        elif c == sep and not quoted:
+            out.append(''.join(cur))
+            cur = []
+            i += 1
+            continue
+        cur.append(c)
+        i += 1
+    out.append(''.join(cur))
+    return out
+
+
+def _unescape(s):
+    out = []
+    i = 0
+    while i < len(s):
+        if s[i] == '\\' and i + 1 < len(s):
+            i += 1
+        out.append(s[i])
+        i += 1
+    return ''.join(out)
+
+
+def _field_value(v):
+    if v.startswith('"') and v.endswith('"') and len(v) >= 2:
+        return v[1:-1]
+    if v in ('t', 'T', 'true', 'True', 'TRUE'):
+        return True
+    if v in ('f', 'F', 'false', 'False', 'FALSE'):
+        return False
+    if v.endswith('i') or v.endswith('u'):
+        return int(v[:-1])
+    return float(v)
+
+
+def parse_line(line):
+    """Parse one line-protocol line into (measurement, tags, fields, ts or None); ValueError if invalid."""
+    parts = _split(line, ' ')
+    if len(parts) not in (2, 3):
+        raise ValueError('expected "measurement[,tags] fields [timestamp]"')
+    key = _split(parts[0], ',')
+    measurement = _unescape(key[0])
+    if not measurement:
+        raise ValueError('missing measurement')
+    tags = {}
+    for t in key[1:]:
+        k, sep, v = t.partition('=')
+        if not sep or not k or not v:
+            raise ValueError('bad tag {!r}'.format(t))
+        tags[_unescape(k)] = _unescape(v)
+    fields = {}
+    for f in _split(parts[1], ','):
+        k, sep, v = f.partition('=')
+        if not sep or not k or not v:
+            raise ValueError('bad field {!r}'.format(f))
+        fields[_unescape(k)] = _field_value(v)
+    ts = int(parts[2]) if len(parts) == 3 else None
+    return measurement, tags, fields, ts
+
+
+class InfluxStub:
+    def __init__(self, host='127.0.0.1', port=8086, latency_ms=0.0, jitter_ms=0.0,
+                 points_per_s=0.0, fail_rate=0.0, token=None, seed=1):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.points_per_s = points_per_s
+        self.fail_rate = fail_rate
+        self.token = token
+        self.rng = random.Random(seed)
+        self.server = None
+        self._capacity = asyncio.Lock()
+        self.stats = {'requests': 0, 'writes': 0, 'points': 0, 'bytes': 0, 'failed': 0,
+                      'unauthorized': 0, 'bad_lines': 0, 'connections': 0}
+        self.points = collections.Counter()     # (measurement, device_id) -> points
+        self.fields = collections.Counter()     # field name -> values
+        self.last_ts = {}                       # device_id -> newest timestamp
+        self.batch_sizes = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.stats['connections'] += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                parts = line.decode('latin-1').split()
+                if len(parts) < 2:
+                    return
+                headers = await read_headers(reader)
+                body = await read_body(reader, headers)
+                self.stats['requests'] += 1
+                code, extra, data = await self._route(parts[0], parts[1], headers, body)
+                self._respond(writer, code, data, extra)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    return
+        except (OSError, HTTPError, ValueError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, writer, code, data, extra=None):
+        reason = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized',
+                  404: 'Not Found', 503: 'Service Unavailable'}.get(code, '')
+        body = json.dumps(data).encode() if data is not None else b''
+        head = ['HTTP/1.1 {} {}'.format(code, reason), 'Content-Length: {}'.format(len(body))]
+        if body:
+            head.append('Content-Type: application/json; charset=utf-8')
+        for k, v in (extra or {}).items():
+            head.append('{}: {}'.format(k, v))
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+
+    async def _route(self, method, target, headers, body):
+        url = urllib.parse.urlsplit(target)
+        if method == 'GET' and url.path in ('/health', '/ping'):
+            return 200, None, {'name': 'influxdb', 'status': 'pass', 'message': 'ready for queries and writes'}
+        if method == 'GET' and url.path == '/stats':
+            return 200, None, self.snapshot()
+        if url.path != '/api/v2/write' or method != 'POST':
+            return 404, None, {'code': 'not found', 'message': 'path not found'}
+        if self.token and headers.get('authorization') != 'Token {}'.format(self.token):
+            self.stats['unauthorized'] += 1
+            return 401, None, {'code': 'unauthorized', 'message': 'unauthorized access'}
+        q = urllib.parse.parse_qs(url.query)
+        if not q.get('bucket') or not q.get('org'):
+            return 400, None, {'code': 'invalid', 'message': 'org and bucket are required'}
+        if headers.get('content-encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        lines = [l for l in body.decode('utf-8').split('\n') if l.strip() and not l.startswith('#')]
+        delay = self.latency_ms + (self.rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay:
+            await asyncio.sleep(delay / 1000.0)
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            self.stats['failed'] += 1
+            return 503, {'Retry-After': '1'}, {'code': 'unavailable', 'message': 'injected failure'}
+        if self.points_per_s:
+            async with self._capacity:
+                await asyncio.sleep(len(lines) / self.points_per_s)
+        errors = []
+        for n, l in enumerate(lines):
+            try:
+                m, tags, fields, ts = parse_line(l)
+            except ValueError as e:
+                errors.append('line {}: {}'.format(n + 1, e))
+                continue
+            dev = tags.get('device_id', '')
+            self.points[(m, dev)] += 1
+            for k in fields:
+                self.fields[k] += 1
+            if ts is not None and ts > self.last_ts.get(dev, 0):
+                self.last_ts[dev] = ts
+        self.stats['writes'] += 1
+        self.stats['points'] += len(lines) - len(errors)
+        self.stats['bytes'] += len(body)
+        self.batch_sizes.append(len(lines))
+        if errors:
+            self.stats['bad_lines'] += len(errors)
+            return 400, None, {'code': 'invalid', 'message': 'partial write: ' + '; '.join(errors[:5])}
+        return 204, None, None
+
+    def snapshot(self):
+        sizes = self.batch_sizes
+        return dict(self.stats, devices=len(self.last_ts), fields=dict(self.fields),
+                    measurements=sorted({m for m, _d in self.points}),
+                    avg_batch=round(sum(sizes) / len(sizes), 1) if sizes else 0)
+
+
+async def serve(args):
+    stub = await InfluxStub(args.host, args.port, args.latency_ms, args.jitter_ms,
+                            args.points_per_s, args.fail_rate, args.token).start()
+    print('InfluxDB stand-in on {}:{}'.format(args.host, stub.port))
+    last = 0
+    while True:
+        await asyncio.sleep(args.report_s)
+        s = stub.snapshot()
+        print('{} writes  {} points (+{:.0f}/s)  {} devices  avg batch {}  failed {}  bad lines {}'.format(
+            s['writes'], s['points'], (s['points'] - last) / args.report_s, s['devices'],
+            s['avg_batch'], s['failed'], s['bad_lines']))
+        last = s['points']
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m sunlamp_backend.influx_stub',
+                                 description='HTTP stand-in for the InfluxDB v2 write API.')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=8086)
+    ap.add_argument('--latency-ms', type=float, default=0.0)
+    ap.add_argument('--jitter-ms', type=float, default=0.0)
+    ap.add_argument('--points-per-s', type=float, default=0.0, help='write capacity (0: unlimited)')
+    ap.add_argument('--fail-rate', type=float, default=0.0)
+    ap.add_argument('--token', help='require this API token')
+    ap.add_argument('--report-s', type=float, default=10.0)
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
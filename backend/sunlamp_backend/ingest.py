@@ -0,0 +1,528 @@
+"""Batched MQTT -> InfluxDB ingest bridge.
+
+Replaces the Node-RED "Flattening JSON" + "influxdb out" pair, which issues
+one HTTP write per status message (one request per device every 5 s).
+This service subscribes to esp32/sunlamp/status, flattens each document
+into the same measurement and fields (sensor_readings: temp, humid, voc,
+co2, light), tags it with device_id and writes line protocol in batches:
+
+- a batch is flushed when it reaches --batch-size points or when its oldest
+  point has waited --flush-s seconds;
+- up to --max-inflight batches are written concurrently, each writer on its
+  own keep-alive HTTP connection;
+- 5xx, 429 and network errors are retried with exponential backoff (or the
+  server's Retry-After); 400 (bad line protocol) drops the batch and counts it;
+  413 splits the batch in half;
+- at most --max-buffer points are buffered or in flight. When InfluxDB
+  falls behind and the buffer is full, the bridge stops reading from MQTT:
+  the client's inbound queue fills, the socket stops being read and the
+  broker sees a slow subscriber (EMQX then drops QoS 0 traffic for it and
+  counts the drops). Memory stays bounded; the metrics show the pause.
+
+Metrics are printed every --report-s seconds and served in Prometheus text
+format on http://<host>:--metrics-port/metrics.
+
+    python -m sunlamp_backend.ingest --host 127.0.0.1 --port 21883 --user esp32:esp32 \\
+        --influx-url http://127.0.0.1:8086 --org iot_org --bucket sensor_data --token $INFLUX_TOKEN
+"""
+import argparse
+import asyncio
+import collections
+import gzip
+import json
+import math
+import os
+import signal
+import ssl
+import sys
+import time
+import urllib.parse
+
+from sunlamp_backend import STATUS_TOPIC
+from sunlamp_backend.fleet import percentiles
+from sunlamp_backend.mqttlite import Client, MQTTError
+
+MEASUREMENT = 'sensor_readings'
+# status['sensor'] key -> InfluxDB field (same names as the Node-RED flow)
+FIELDS = (('temperature', 'temp'), ('humidity', 'humid'), ('tvoc', 'voc'),
+          ('eco2', 'co2'), ('light', 'light'))
+MAX_SKEW_MS = 24 * 3600 * 1000  # device timestamps further off than this are replaced
+RECONNECT_S = 5
+WINDOW = 10000                  # samples kept for latency percentiles
+
+
+class HTTPError(Exception):
+    pass
+
+
+def escape_tag(s):
+    """Escape a tag key/value for line protocol."""
+    return s.replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+
+def to_line(doc, now_ms, measurement=MEASUREMENT):
+    """Flatten one status document into a line-protocol line, or None if it has no readings.
+
+    Fields are written as floats, as Node-RED does for JS numbers, so the
+    field types match data already in the bucket. The device timestamp is
+    used only when the device reports a synced clock close to ours.
+    """
+    sensor = doc.get('sensor') if isinstance(doc, dict) else None
+    if not isinstance(sensor, dict):
+        return None
+    fields = []
+    for src, dst in FIELDS:
+        v = sensor.get(src)
+        if isinstance(v, bool) or not isinstance(v, (int, float)) or not math.isfinite(v):
+            continue
+        fields.append('{}={!r}'.format(dst, float(v)))
+    if not fields:
+        return None
+    ts = doc.get('ts')
+    if not (doc.get('synced') is True and isinstance(ts, int) and abs(ts - now_ms) < MAX_SKEW_MS):
+        ts = now_ms
+    dev = doc.get('device_id') or 'unknown'
+    return '{},device_id={} {} {}'.format(measurement, escape_tag(str(dev)), ','.join(fields), ts)
+
+
+# ---------------- InfluxDB v2 write API -----------------
+class InfluxWriter:
+    """One keep-alive HTTP/1.1 connection to POST /api/v2/write."""
+
+    def __init__(self, url, org, bucket, token=None, precision='ms', timeout=10.0, compress=False):
+        u = urllib.parse.urlsplit(url)
+        if u.scheme not in ('http', 'https') or not u.hostname:
+            raise ValueError('bad InfluxDB url: {}'.format(url))
+        self.host = u.hostname
+        self.port = u.port or (443 if u.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if u.scheme == 'https' else None
+        self.path = '{}/api/v2/write?{}'.format(u.path.rstrip('/'), urllib.parse.urlencode(
+            {'org': org, 'bucket': bucket, 'precision': precision}))
+        self.token = token
+        self.timeout = timeout
+        self.compress = compress
+        self.reader = None
+        self.writer = None
+
+    async def write(self, body):
+        """POST a line-protocol body; returns (status, headers, text). Raises on I/O errors."""
+        try:
+            return await asyncio.wait_for(self._post(body), self.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _post(self, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        head = ['POST {} HTTP/1.1'.format(self.path), 'Host: {}:{}'.format(self.host, self.port),
+                'Content-Type: text/plain; charset=utf-8', 'Accept: application/json']
+        if self.token:
+            head.append('Authorization: Token {}'.format(self.token))
+        if self.compress:
+            body = gzip.compress(body, 5)
+            head.append('Content-Encoding: gzip')
+        head.append('Content-Length: {}'.format(len(body)))
+        self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+        status, headers, text = await read_response(self.reader)
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, headers, text
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def read_headers(reader):
+    """Read header lines up to the blank line; keys are lower-cased."""
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise HTTPError('connection closed in headers')
+        line = line.decode('latin-1').rstrip('\r\n')
+        if not line:
+            return headers
+        k, _, v = line.partition(':')
+        headers[k.strip().lower()] = v.strip()
+
+
+async def read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        out = bytearray()
+        while True:
+            n = int((await reader.readline()).split(b';')[0], 16)
+            if not n:
+                await reader.readline()
+                return bytes(out)
+            out += await reader.readexactly(n)
+            await reader.readline()
+    n = int(headers.get('content-length', 0))
+    return await reader.readexactly(n) if n else b''
+
+
+async def read_response(reader):
+    line = await reader.readline()
+    parts = line.decode('latin-1').split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+        raise HTTPError('bad status line {!r}'.format(line[:80]))
+    headers = await read_headers(reader)
+    body = await read_body(reader, headers)
+    return int(parts[1]), headers, body.decode('utf-8', 'replace')
+
+
+# ---------------- bridge -----------------
+class Ingest:
+    def __init__(self, args):
+        self.args = args
+        self.buffer = collections.deque()   # (line, receive time)
+        self.pending = 0                    # buffered + in flight, bounded by max_buffer
+        self.in_flight = 0
+        self.client = None
+        self.closing = False
+        self.drain_deadline = None
+        self._wake = asyncio.Event()        # a batch may be ready
+        self._room = asyncio.Event()        # pending dropped below max_buffer
+        self._paused_at = None
+        self.stats = {'received': 0, 'bad_json': 0, 'no_readings': 0, 'points': 0,
+                      'written': 0, 'batches': 0, 'flush_size': 0, 'flush_time': 0,
+                      'retries': 0, 'rejected': 0, 'lost': 0, 'bytes': 0,
+                      'pauses': 0, 'paused_s': 0.0, 'connects': 0, 'connect_failures': 0}
+        self.write_ms = collections.deque(maxlen=WINDOW)
+        self.lag_ms = collections.deque(maxlen=WINDOW)     # received -> written
+        self.age_ms = collections.deque(maxlen=WINDOW)     # device timestamp -> written
+        self.last_error = None
+        self.t0 = time.monotonic()
+
+    # ---------------- MQTT side -----------------
+    async def mqtt_loop(self):
+        a = self.args
+        while not self.closing:
+            client = Client(a.client_id, a.host, a.port, a.mqtt_user, a.mqtt_password,
+                            max_queue=a.mqtt_queue)
+            try:
+                await client.connect()
+                await client.subscribe(a.topic)
+            except (OSError, MQTTError, asyncio.TimeoutError) as e:
+                self.stats['connect_failures'] += 1
+                self.last_error = 'mqtt: {}'.format(e)
+                await client.close()
+                await asyncio.sleep(RECONNECT_S)
+                continue
+            self.stats['connects'] += 1
+            self.client = client
+            try:
+                while not self.closing and (client.connected or not client.messages.empty()):
+                    try:
+                        _topic, payload = await asyncio.wait_for(client.messages.get(), 1.0)
+                    except asyncio.TimeoutError:
+                        continue
+                    await self.add(payload)
+            finally:
+                await client.close()
+            if not self.closing:
+                await asyncio.sleep(RECONNECT_S)
+
+    async def add(self, payload):
+        self.stats['received'] += 1
+        now = time.time()
+        try:
+            doc = json.loads(payload)
+        except ValueError:
+            self.stats['bad_json'] += 1
+            return
+        line = to_line(doc, int(now * 1000), self.args.measurement)
+        if line is None:
+            self.stats['no_readings'] += 1
+            return
+        if self.pending >= self.args.max_buffer:
+            # backpressure: stop taking messages until a write completes
+            self.stats['pauses'] += 1
+            self._paused_at = time.monotonic()
+            try:
+                while self.pending >= self.args.max_buffer:
+                    self._room.clear()
+                    await self._room.wait()
+            finally:
+                self.stats['paused_s'] += time.monotonic() - self._paused_at
+                self._paused_at = None
+        self.buffer.append((line, time.monotonic()))
+        self.pending += 1
+        self.stats['points'] += 1
+        if len(self.buffer) == 1 or len(self.buffer) >= self.args.batch_size:
+            self._wake.set()
+
+    # ---------------- InfluxDB side -----------------
+    async def _next_batch(self):
+        a = self.args
+        while True:
+            if self.closing and time.monotonic() > self.drain_deadline:
+                return None
+            if self.buffer:
+                age = time.monotonic() - self.buffer[0][1]
+                full = len(self.buffer) >= a.batch_size
+                if full or age >= a.flush_s or self.closing:
+                    self.stats['flush_size' if full else 'flush_time'] += 1
+                    return [self.buffer.popleft() for _ in range(min(a.batch_size, len(self.buffer)))]
+                timeout = a.flush_s - age
+            elif self.closing:
+                return None
+            else:
+                timeout = None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _release(self, n):
+        self.pending -= n
+        if self.pending < self.args.max_buffer:
+            self._room.set()
+
+    async def writer_loop(self, conn):
+        try:
+            while True:
+                batch = await self._next_batch()
+                if batch is None:
+                    return
+                self.in_flight += len(batch)
+                try:
+                    await self.write_batch(conn, batch)
+                finally:
+                    self.in_flight -= len(batch)
+                    self._release(len(batch))
+                if self.buffer:
+                    self._wake.set()
+        finally:
+            conn.close()
+
+    async def write_batch(self, conn, batch):
+        a = self.args
+        body = '\n'.join(line for line, _t in batch).encode()
+        delay = a.retry_s
+        while True:
+            t = time.monotonic()
+            try:
+                status, headers, text = await conn.write(body)
+            except (OSError, HTTPError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                status, headers, text = None, {}, '{}: {}'.format(type(e).__name__, e)
+            if status is not None and 200 <= status < 300:
+                done = time.monotonic()
+                self.write_ms.append((done - t) * 1000.0)
+                now_ms = time.time() * 1000.0
+                for line, t_recv in batch:
+                    self.lag_ms.append((done - t_recv) * 1000.0)
+                    self.age_ms.append(now_ms - int(line.rsplit(' ', 1)[1]))
+                self.stats['batches'] += 1
+                self.stats['written'] += len(batch)
+                self.stats['bytes'] += len(body)
+                return
+            if status == 413 and len(batch) > 1:
+                half = len(batch) // 2
+                await self.write_batch(conn, batch[:half])
+                await self.write_batch(conn, batch[half:])
+                return
+            self.last_error = 'influx: {} {}'.format(status or 'error', text.strip()[:200])
+            if status is not None and 400 <= status < 500 and status not in (401, 403, 404, 408, 429):
+                # the data itself is bad; retrying cannot help
+                self.stats['rejected'] += len(batch)
+                print('batch of {} points rejected: {}'.format(len(batch), self.last_error))
+                return
+            if self.closing and time.monotonic() > self.drain_deadline:
+                self.stats['lost'] += len(batch)
+                return
+            self.stats['retries'] += 1
+            wait = delay
+            try:
+                wait = max(wait, float(headers.get('retry-after', 0)))
+            except ValueError:
+                pass
+            await asyncio.sleep(min(wait, a.max_retry_s))
+            delay = min(delay * 2, a.max_retry_s)
+
+    # ---------------- metrics -----------------
+    def snapshot(self):
+        s = dict(self.stats)
+        if self._paused_at is not None:
+            s['paused_s'] += time.monotonic() - self._paused_at
+        s['paused_s'] = round(s['paused_s'], 2)
+        s.update({
+            'uptime_s': round(time.monotonic() - self.t0, 1),
+            'buffered': len(self.buffer),
+            'in_flight': self.in_flight,
+            'mqtt_queue': self.client.messages.qsize() if self.client else 0,
+            'mqtt_connected': bool(self.client and self.client.connected),
+            'paused': self._paused_at is not None,
+            'write_ms': {k: round(v, 1) for k, v in percentiles(list(self.write_ms)).items()},
+            'lag_ms': {k: round(v, 1) for k, v in percentiles(list(self.lag_ms)).items()},
+            'age_ms': {k: round(v, 1) for k, v in percentiles(list(self.age_ms)).items()},
+            'last_error': self.last_error,
+        })
+        return s
+
+    def prometheus(self):
+        s = self.snapshot()
+        out = []
+
+        def metric(name, kind, value, help_, labels=''):
+            out.append('# HELP sunlamp_ingest_{} {}'.format(name, help_))
+            out.append('# TYPE sunlamp_ingest_{} {}'.format(name, kind))
+            out.append('sunlamp_ingest_{}{} {}'.format(name, labels, value))
+
+        metric('messages_total', 'counter', s['received'], 'Status messages received from MQTT.')
+        metric('points_total', 'counter', s['points'], 'Points accepted into the buffer.')
+        metric('written_total', 'counter', s['written'], 'Points written to InfluxDB.')
+        metric('rejected_total', 'counter', s['rejected'], 'Points dropped after a 4xx from InfluxDB.')
+        metric('lost_total', 'counter', s['lost'], 'Points still unwritten at shutdown.')
+        metric('invalid_total', 'counter', s['bad_json'] + s['no_readings'],
+               'Messages without usable readings.')
+        metric('batches_total', 'counter', s['batches'], 'Successful write requests.')
+        metric('retries_total', 'counter', s['retries'], 'Failed write attempts that were retried.')
+        metric('bytes_total', 'counter', s['bytes'], 'Line-protocol bytes written (before gzip).')
+        metric('paused_seconds_total', 'counter', s['paused_s'], 'Time spent not reading MQTT.')
+        metric('buffered_points', 'gauge', s['buffered'], 'Points waiting for a batch.')
+        metric('in_flight_points', 'gauge', s['in_flight'], 'Points in write requests.')
+        metric('mqtt_queue', 'gauge', s['mqtt_queue'], 'Messages read from MQTT but not yet processed.')
+        metric('mqtt_connected', 'gauge', int(s['mqtt_connected']), 'MQTT session is up.')
+        for name, key, help_ in (('write_ms', 'write_ms', 'Write request latency (ms).'),
+                                 ('lag_ms', 'lag_ms', 'Receive-to-written delay per point (ms).'),
+                                 ('age_ms', 'age_ms', 'Point timestamp-to-written delay (ms).')):
+            q = s[key]
+            out.append('# HELP sunlamp_ingest_{} {}'.format(name, help_))
+            out.append('# TYPE sunlamp_ingest_{} summary'.format(name))
+            for p in (50, 90, 99):
+                if 'p{}'.format(p) in q:
+                    out.append('sunlamp_ingest_{}{{quantile="0.{}"}} {}'.format(name, p, q['p{}'.format(p)]))
+        return '\n'.join(out) + '\n'
+
+    async def serve_metrics(self, reader, writer):
+        try:
+            line = await reader.readline()
+            await read_headers(reader)
+            path = line.decode('latin-1').split()[1] if len(line.split()) > 1 else '/'
+            if path == '/metrics':
+                code, ctype, body = '200 OK', 'text/plain; version=0.0.4', self.prometheus()
+            elif path == '/metrics.json':
+                code, ctype, body = '200 OK', 'application/json', json.dumps(self.snapshot())
+            else:
+                code, ctype, body = '404 Not Found', 'text/plain', 'not found\n'
+            data = body.encode()
+            writer.write('HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'
+                         .format(code, ctype, len(data)).encode() + data)
+            await writer.drain()
+        except (OSError, HTTPError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run(args):
+    ing = Ingest(args)
+    writers = [asyncio.ensure_future(ing.writer_loop(InfluxWriter(
+        args.influx_url, args.org, args.bucket, args.token, timeout=args.timeout, compress=args.gzip)))
+        for _ in range(args.max_inflight)]
+    mqtt = asyncio.ensure_future(ing.mqtt_loop())
+    server = None
+    if args.metrics_port:
+        server = await asyncio.start_server(ing.serve_metrics, args.metrics_host, args.metrics_port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    end = ing.t0 + args.duration if args.duration else None
+    last = dict(ing.stats)
+    last_t = ing.t0
+    while end is None or time.monotonic() < end:
+        left = args.report_s if end is None else min(args.report_s, max(0.0, end - time.monotonic()))
+        try:
+            await asyncio.wait_for(stop.wait(), left)
+            break
+        except asyncio.TimeoutError:
+            pass
+        now = time.monotonic()
+        dt = max(1e-6, now - last_t)
+        s = ing.snapshot()
+        print('[{:7.1f}s] in {:7.1f}/s  written {:7.1f}/s  batches {:5.1f}/s  buffer {:6d}+{:<6d} '
+              'lag p99 {}  write p99 {}  retries {}  {}'.format(
+                  s['uptime_s'], (s['points'] - last['points']) / dt,
+                  (s['written'] - last['written']) / dt, (s['batches'] - last['batches']) / dt,
+                  s['buffered'], s['in_flight'],
+                  '{:.0f}ms'.format(s['lag_ms']['p99']) if s['lag_ms'] else '-',
+                  '{:.0f}ms'.format(s['write_ms']['p99']) if s['write_ms'] else '-',
+                  s['retries'], 'PAUSED' if s['paused'] else ''))
+        last = dict(ing.stats)
+        last_t = now
+    # stop reading, then flush what is buffered for up to --drain-s
+    ing.closing = True
+    ing.drain_deadline = time.monotonic() + args.drain_s
+    mqtt.cancel()
+    await asyncio.gather(mqtt, return_exceptions=True)
+    if ing.client is not None:
+        await ing.client.close()
+    ing._wake.set()
+    done, late = await asyncio.wait(writers, timeout=args.drain_s + args.timeout)
+    for t in late:
+        t.cancel()
+    # whatever was accepted but not written or rejected (buffered or cut off mid-write)
+    ing.stats['lost'] = ing.stats['points'] - ing.stats['written'] - ing.stats['rejected']
+    ing.buffer.clear()
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+    return ing.snapshot()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m sunlamp_backend.ingest',
+                                 description='Batch sun lamp status messages from MQTT into InfluxDB.')
+    ap.add_argument('--host', default='127.0.0.1', help='MQTT broker')
+    ap.add_argument('--port', type=int, default=1883)
+    ap.add_argument('--user', help='USER:PASSWORD for the broker')
+    ap.add_argument('--topic', default=STATUS_TOPIC)
+    ap.add_argument('--client-id', default='sunlamp-ingest')
+    ap.add_argument('--mqtt-queue', type=int, default=1000,
+                    help='inbound messages held before the socket stops being read')
+    ap.add_argument('--influx-url', default='http://127.0.0.1:8086')
+    ap.add_argument('--org', default='iot_org')
+    ap.add_argument('--bucket', default='sensor_data')
+    ap.add_argument('--token', default=os.environ.get('INFLUX_TOKEN'), help='default: $INFLUX_TOKEN')
+    ap.add_argument('--measurement', default=MEASUREMENT)
+    ap.add_argument('--gzip', action='store_true', help='gzip request bodies')
+    ap.add_argument('--batch-size', type=int, default=5000, help='points per write')
+    ap.add_argument('--flush-s', type=float, default=1.0, help='max wait before a partial batch is sent')
+    ap.add_argument('--max-inflight', type=int, default=2, help='concurrent write requests')
+    ap.add_argument('--max-buffer', type=int, default=50000,
+                    help='points buffered or in flight before MQTT reads pause')
+    ap.add_argument('--timeout', type=float, default=10.0, help='write request timeout')
+    ap.add_argument('--retry-s', type=float, default=0.5, help='first retry delay (doubles)')
+    ap.add_argument('--max-retry-s', type=float, default=30.0)
+    ap.add_argument('--metrics-host', default='127.0.0.1')
+    ap.add_argument('--metrics-port', type=int, default=9108, help='0 disables the endpoint')
+    ap.add_argument('--report-s', type=float, default=10.0)
+    ap.add_argument('--duration', type=float, default=0.0, help='seconds to run (0: until Ctrl-C)')
+    ap.add_argument('--drain-s', type=float, default=10.0, help='time to flush the buffer on exit')
+    ap.add_argument('--json', help='write the final metrics to this file')
+    args = ap.parse_args(argv)
+    args.mqtt_user = args.mqtt_password = None
+    if args.user:
+        args.mqtt_user, _, args.mqtt_password = args.user.partition(':')
+    if args.batch_size < 1 or args.max_buffer < args.batch_size or args.max_inflight < 1:
+        ap.error('need batch-size >= 1, max-buffer >= batch-size and max-inflight >= 1')
+
+    summary = asyncio.run(run(args))
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 0 if not summary['lost'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,396 @@
+"""Minimal asyncio MQTT 3.1.1 (QoS 0) client and stand-in broker.
+
+Only what the sunlamp protocol uses: CONNECT with username/password,
+PUBLISH QoS 0 (with retain), SUBSCRIBE with + / # wildcards, PINGREQ and
+DISCONNECT. The broker queues outbound messages per connection and drops
+(and counts) messages for subscribers that fall too far behind, which is
+how EMQX treats QoS 0 traffic to a slow consumer.
+
+Run a stand-in broker:  python -m sunlamp_backend.mqttlite --port 1883
+"""
+import argparse
+import asyncio
+import struct
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+MAX_PACKET = 256 * 1024
+
+
+class MQTTError(Exception):
+    pass
+
+
+def topic_matches(pattern, topic):
+    """MQTT filter match with '+' (one level) and '#' (rest)."""
+    p = pattern.split('/')
+    t = topic.split('/')
+    for i, part in enumerate(p):
+        if part == '#':
+            return True
+        if i >= len(t) or (part != '+' and part != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+# ---------------- codec -----------------
+def _varlen(n):
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        out.append(b | 0x80 if n else b)
+        if not n:
+            return bytes(out)
+
+
+def _str(s):
+    b = s if isinstance(s, bytes) else s.encode()
+    return struct.pack('!H', len(b)) + b
+
+
+def packet(ptype, body=b'', flags=0):
+    return bytes([ptype << 4 | flags]) + _varlen(len(body)) + body
+
+
+def publish_packet(topic, payload, retain=False):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return packet(PUBLISH, _str(topic) + payload, 1 if retain else 0)
+
+
+async def read_packet(reader):
+    """Read one packet; returns (type, flags, body). Raises IncompleteReadError on EOF."""
+    h = await reader.readexactly(1)
+    n = 0
+    shift = 0
+    while True:
+        b = (await reader.readexactly(1))[0]
+        n |= (b & 0x7F) << shift
+        if not b & 0x80:
+            break
+        shift += 7
+        if shift > 21:
+            raise MQTTError('malformed remaining length')
+    if n > MAX_PACKET:
+        raise MQTTError('packet too large ({} bytes)'.format(n))
+    body = await reader.readexactly(n) if n else b''
+    return h[0] >> 4, h[0] & 0x0F, body
+
+
+def _take_str(body, i):
+    n = struct.unpack_from('!H', body, i)[0]
+    return body[i + 2:i + 2 + n].decode(), i + 2 + n
+
+
+def parse_publish(flags, body):
+    topic, i = _take_str(body, 0)
+    if (flags >> 1) & 3:
+        i += 2      # packet id (QoS > 0 is accepted but delivered as QoS 0)
+    return topic, body[i:], bool(flags & 1)
+
+
+# ---------------- client -----------------
+class Client:
+    """QoS 0 client. Incoming messages go to on_message(topic, payload) or the `messages` queue.
+
+    With max_queue, a full `messages` queue stops reading from the socket, so
+    a slow consumer pushes back on the broker through TCP instead of growing
+    without bound.
+    """
+
+    def __init__(self, client_id, host='127.0.0.1', port=1883, user=None, password=None,
+                 keepalive=60, on_message=None, max_queue=0):
+        self.client_id = client_id
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.keepalive = keepalive
+        self.on_message = on_message
+        self.messages = asyncio.Queue(max_queue) if on_message is None else None
+        self.reader = None
+        self.writer = None
+        self.connected = False
+        self._tasks = []
+        self._pid = 0
+        self._acks = {}
+        self.sent = 0
+        self.received = 0
+
+    async def connect(self, timeout=10.0):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout)
+        flags = 0x02    # clean session
+        payload = _str(self.client_id)
+        if self.user is not None:
+            flags |= 0x80
+            payload += _str(self.user)
+            if self.password is not None:
+                flags |= 0x40
+                payload += _str(self.password)
+        body = _str('MQTT') + bytes([4, flags]) + struct.pack('!H', self.keepalive) + payload
+        self.writer.write(packet(CONNECT, body))
+        ptype, _f, body = await asyncio.wait_for(read_packet(self.reader), timeout)
+        if ptype != CONNACK or len(body) < 2 or body[1] != 0:
+            self.writer.close()
+            raise MQTTError('connection refused (code {})'.format(body[1] if len(body) > 1 else '?'))
+        self.connected = True
+        self._tasks = [asyncio.ensure_future(self._read_loop())]
+        if self.keepalive:
+            self._tasks.append(asyncio.ensure_future(self._ping_loop()))
+
+    async def _read_loop(self):
+        try:
+            while True:
+                ptype, flags, body = await read_packet(self.reader)
+                if ptype == PUBLISH:
+                    topic, payload, _r = parse_publish(flags, body)
+                    self.received += 1
+                    if self.on_message is not None:
+                        self.on_message(topic, payload)
+                    else:
+                        await self.messages.put((topic, payload))
+                elif ptype in (SUBACK, UNSUBACK):
+                    fut = self._acks.pop(struct.unpack_from('!H', body)[0], None)
+                    if fut is not None and not fut.done():
+                        fut.set_result(body[2:])
+        except (asyncio.IncompleteReadError, ConnectionError, MQTTError):
+            pass
+        finally:
+            self.connected = False
+            for fut in self._acks.values():
+                if not fut.done():
+                    fut.set_exception(MQTTError('connection lost'))
+            self._acks.clear()
+
+    async def _ping_loop(self):
+        while self.connected:
+            await asyncio.sleep(self.keepalive / 2.0)
+            self._write(packet(PINGREQ))
+
+    def _write(self, data):
+        if not self.connected:
+            raise MQTTError('not connected')
+        self.writer.write(data)
+
+    def publish(self, topic, payload, retain=False):
+        self._write(publish_packet(topic, payload, retain))
+        self.sent += 1
+
+    async def drain(self):
+        """Wait until the socket buffer has room (TCP backpressure)."""
+        await self.writer.drain()
+
+    async def subscribe(self, topic, timeout=10.0):
+        self._pid = self._pid % 0xFFFF + 1
+        fut = asyncio.get_running_loop().create_future()
+        self._acks[self._pid] = fut
+        self._write(packet(SUBSCRIBE, struct.pack('!H', self._pid) + _str(topic) + b'\x00', 2))
+        await asyncio.wait_for(fut, timeout)
+
+    async def close(self):
+        if self.connected:
+            try:
+                self.writer.write(packet(DISCONNECT))
+                await self.writer.drain()
+            except ConnectionError:
+                pass
+        self.connected = False
+        for t in self._tasks:
+            t.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+
+# ---------------- broker -----------------
+class _Session:
+    def __init__(self, broker, writer, max_queue):
+        self.broker = broker
+        self.writer = writer
+        self.client_id = None
+        self.subs = []
+        self.queue = asyncio.Queue(max_queue)
+        self.dropped = 0
+        self.sender = None
+
+    def deliver(self, data):
+        try:
+            self.queue.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def send_loop(self):
+        try:
+            while True:
+                data = await self.queue.get()
+                self.writer.write(data)
+                # batch whatever else is queued, then honour TCP backpressure
+                while not self.queue.empty():
+                    self.writer.write(self.queue.get_nowait())
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+
+class Broker:
+    """Stand-in MQTT broker (QoS 0, retained messages, wildcard subscriptions)."""
+
+    def __init__(self, host='127.0.0.1', port=1883, users=None, max_queue=1000):
+        self.host = host
+        self.port = port
+        self.users = users          # {user: password} or None for anonymous
+        self.max_queue = max_queue
+        self.sessions = {}          # client id -> _Session
+        self.retained = {}
+        self.server = None
+        self.stats = {'connects': 0, 'refused': 0, 'received': 0, 'delivered': 0, 'dropped': 0}
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for s in list(self.sessions.values()):
+            if s.sender:
+                s.sender.cancel()
+            s.writer.close()
+        self.sessions.clear()
+
+    def publish(self, topic, payload, retain=False):
+        data = publish_packet(topic, payload)
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        self.stats['received'] += 1
+        for s in self.sessions.values():
+            for f in s.subs:
+                if topic_matches(f, topic):
+                    if s.deliver(data):
+                        self.stats['delivered'] += 1
+                    else:
+                        self.stats['dropped'] += 1
+                    break
+
+    def _auth(self, flags, body, i):
+        user = password = None
+        if flags & 0x04:            # will topic + message
+            _t, i = _take_str(body, i)
+            n = struct.unpack_from('!H', body, i)[0]
+            i += 2 + n
+        if flags & 0x80:
+            user, i = _take_str(body, i)
+        if flags & 0x40:
+            n = struct.unpack_from('!H', body, i)[0]
+            password = body[i + 2:i + 2 + n].decode()
+        return self.users is None or (user in self.users and self.users[user] == password)
+
+    async def _handle(self, reader, writer):
+        s = _Session(self, writer, self.max_queue)
+        try:
+            ptype, _f, body = await asyncio.wait_for(read_packet(reader), 10)
+            if ptype != CONNECT:
+                return
+            _proto, i = _take_str(body, 0)
+            flags = body[i + 1]
+            client_id, i = _take_str(body, i + 4)
+            if not self._auth(flags, body, i):
+                self.stats['refused'] += 1
+                writer.write(packet(CONNACK, b'\x00\x05'))
+                await writer.drain()
+                return
+            old = self.sessions.get(client_id)
+            if old is not None:     # same client id takes over
+                old.writer.close()
+            s.client_id = client_id
+            self.sessions[client_id] = s
+            self.stats['connects'] += 1
+            writer.write(packet(CONNACK, b'\x00\x00'))
+            s.sender = asyncio.ensure_future(s.send_loop())
+            while True:
+                ptype, flags, body = await read_packet(reader)
+                if ptype == PUBLISH:
+                    topic, payload, retain = parse_publish(flags, body)
+                    self.publish(topic, payload, retain)
+                elif ptype == SUBSCRIBE:
+                    pid = body[:2]
+                    i = 2
+                    codes = bytearray()
+                    while i < len(body):
+                        f, i = _take_str(body, i)
+                        i += 1
+                        if f not in s.subs:
+                            s.subs.append(f)
+                        codes.append(0)
+                        for t, p in self.retained.items():
+                            if topic_matches(f, t):
+                                s.deliver(publish_packet(t, p, True))
+                    s.deliver(packet(SUBACK, pid + bytes(codes)))
+                elif ptype == UNSUBSCRIBE:
+                    pid = body[:2]
+                    i = 2
+                    while i < len(body):
+                        f, i = _take_str(body, i)
+                        if f in s.subs:
+                            s.subs.remove(f)
+                    s.deliver(packet(UNSUBACK, pid))
+                elif ptype == PINGREQ:
+                    s.deliver(packet(PINGRESP))
+                elif ptype == DISCONNECT:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, MQTTError,
+                struct.error, IndexError, UnicodeDecodeError):
+            pass
+        except asyncio.CancelledError:
+            # shutdown: end the connection handler quietly (asyncio.streams
+            # reports a cancelled handler task as an error)
+            pass
+        finally:
+            if s.client_id is not None and self.sessions.get(s.client_id) is s:
+                del self.sessions[s.client_id]
+            if s.sender:
+                s.sender.cancel()
+            writer.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Stand-in MQTT broker (QoS 0)')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=1883)
+    ap.add_argument('--user', help='require USER:PASSWORD')
+    args = ap.parse_args(argv)
+    users = None
+    if args.user:
+        u, _, p = args.user.partition(':')
+        users = {u: p}
+
+    async def serve():
+        b = await Broker(args.host, args.port, users).start()
+        print('mqttlite broker on {}:{}'.format(args.host, b.port))
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
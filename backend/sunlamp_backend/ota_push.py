@@ -0,0 +1,230 @@
+"""Send an OTA package (tools/ota_manifest.py output) to a lamp.
+
+MQTT push: the manifest goes out in an "ota begin" command. The lamp answers
+on the reply topic with the files it needs (the ones whose hash differs
+from what it runs) and the next {path, off} it expects. The sender
+then streams base64 chunks stop-and-wait. Every reply names the next
+offset, so a lost command or reply is simply resent after --timeout. A
+transfer interrupted by a reboot resumes where the staged file ends.
+After "commit" the lamp restarts into the new version.
+
+HTTP pull (--serve HOST:PORT): the package directory is served over HTTP
+(with Range support for resumes) and the lamp is told to fetch it; the
+lamp downloads, verifies and commits on its own, this tool only watches
+the status replies.
+
+    python -m sunlamp_backend.ota_push ../build/ota --host 192.168.1.10 --user esp32:esp32
+    python -m sunlamp_backend.ota_push ../build/ota --serve 192.168.1.20:8070
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+from sunlamp_backend import CMD_TOPIC, REPLY_TOPIC
+from sunlamp_backend.mqttlite import Client, MQTTError
+
+
+class PushError(Exception):
+    pass
+
+
+class Lamp:
+    """Request/reply over the command and reply topics, matched by "req"."""
+
+    def __init__(self, client, timeout, retries):
+        self.client = client
+        self.timeout = timeout
+        self.retries = retries
+        self.req = int(time.time()) % 100000 * 1000
+        self.resends = 0
+
+    async def request(self, cmd):
+        self.req += 1
+        cmd = dict(cmd, cmd='ota', req=self.req)
+        payload = json.dumps(cmd, separators=(',', ':'))
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.resends += 1
+            self.client.publish(CMD_TOPIC, payload)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    _topic, body = await asyncio.wait_for(self.client.messages.get(), left)
+                except asyncio.TimeoutError:
+                    break
+                try:
+                    reply = json.loads(body)
+                except ValueError:
+                    continue
+                if reply.get('cmd') == 'ota' and reply.get('req') == self.req:
+                    return reply
+        raise PushError('no reply to {} after {} tries'.format(cmd['op'], self.retries + 1))
+
+
+def read_chunk(pkg, path, off, size):
+    with open(os.path.join(pkg, path), 'rb') as f:
+        f.seek(off)
+        return f.read(size)
+
+
+async def push(lamp, pkg, manifest, chunk, full=False, commit=True):
+    """Stream the files the lamp asks for; returns (files, bytes) sent."""
+    reply = await lamp.request({'op': 'begin', 'manifest': manifest, 'full': full})
+    if not reply.get('ok'):
+        raise PushError('begin refused: {}'.format(reply.get('error')))
+    need = reply.get('need', [])
+    total = sum(manifest['files'][p]['size'] for p in need)
+    print('lamp needs {} of {} files, {} bytes'.format(len(need), len(manifest['files']), total))
+    sent = 0
+    errors = 0
+    t0 = time.monotonic()
+    nxt = reply.get('next')
+    while nxt:
+        data = read_chunk(pkg, nxt['path'], nxt['off'], chunk)
+        reply = await lamp.request({'op': 'chunk', 'path': nxt['path'], 'off': nxt['off'],
+                                    'data': base64.b64encode(data).decode()})
+        if reply.get('ok'):
+            sent += len(data)
+        else:
+            # the lamp says where it wants to continue (resend, hash mismatch...)
+            errors += 1
+            print('  {}: {}'.format(nxt['path'], reply.get('error')))
+            if errors > lamp.retries * 4:
+                raise PushError('too many chunk errors')
+        if nxt['path'] != (reply.get('next') or {}).get('path'):
+            print('  {} done'.format(nxt['path']))
+        nxt = reply.get('next')
+    dt = time.monotonic() - t0
+    print('sent {} bytes in {:.1f} s ({:.0f} B/s), {} resends'.format(
+        sent, dt, sent / dt if dt else 0, lamp.resends))
+    if commit and (need or manifest.get('delete')):
+        reply = await lamp.request({'op': 'commit'})
+        if not reply.get('ok'):
+            raise PushError('commit refused: {}'.format(reply.get('error')))
+        print('committed {}; the lamp restarts and confirms it after a healthy trial'.format(
+            manifest['version']))
+    return len(need), sent
+
+
+async def serve_package(pkg, host, port):
+    """Plain HTTP/1.0 file server for the package directory (GET with Range)."""
+    root = os.path.realpath(pkg)
+
+    async def handle(reader, writer):
+        try:
+            line = await reader.readline()
+            headers = {}
+            while True:
+                h = await reader.readline()
+                if h in (b'\r\n', b'\n', b''):
+                    break
+                k, _, v = h.decode('latin-1').partition(':')
+                headers[k.strip().lower()] = v.strip()
+            parts = line.decode('latin-1').split()
+            path = os.path.realpath(os.path.join(root, parts[1].lstrip('/'))) if len(parts) > 1 else ''
+            if not path.startswith(root + os.sep) or not os.path.isfile(path):
+                writer.write(b'HTTP/1.0 404 Not Found\r\n\r\n')
+                return
+            off = 0
+            rng = headers.get('range', '')
+            if rng.startswith('bytes=') and rng.endswith('-'):
+                off = int(rng[6:-1])
+            size = os.path.getsize(path)
+            status = '206 Partial Content' if off else '200 OK'
+            writer.write('HTTP/1.0 {}\r\nContent-Length: {}\r\n\r\n'.format(status, size - off).encode())
+            with open(path, 'rb') as f:
+                f.seek(off)
+                for block in iter(lambda: f.read(4096), b''):
+                    writer.write(block)
+                    await writer.drain()
+            print('  served {} from {}'.format(os.path.relpath(path, root), off))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def pull(lamp, serve, full=False):
+    """Tell the lamp to fetch from our HTTP server and follow its progress."""
+    reply = await lamp.request({'op': 'fetch', 'url': 'http://{}/'.format(serve), 'full': full})
+    if not reply.get('ok'):
+        raise PushError('fetch refused: {}'.format(reply.get('error')))
+    while True:
+        await asyncio.sleep(2)
+        try:
+            st = await lamp.request({'op': 'status'})
+        except PushError:
+            print('lamp stopped answering: restarting into the new version')
+            return
+        print('  {} {}/{} files, next {}'.format(st.get('pending'), st.get('done'),
+                                               st.get('files'), st.get('next')))
+        if not st.get('fetching'):
+            if st.get('error'):
+                raise PushError('fetch failed: {}'.format(st['error']))
+            if st.get('boot_state') == 'swapping':
+                print('committed; the lamp restarts and confirms it after a healthy trial')
+            else:
+                print('nothing to install')
+            return
+
+
+async def run(args):
+    with open(os.path.join(args.package, 'manifest.json')) as f:
+        manifest = json.load(f)
+    client = Client(args.client_id, args.host, args.port, args.mqtt_user, args.mqtt_password)
+    await client.connect()
+    await client.subscribe(REPLY_TOPIC)
+    lamp = Lamp(client, args.timeout, args.retries)
+    server = None
+    try:
+        status = await lamp.request({'op': 'status'})
+        print('lamp runs {} (boot state {})'.format(status.get('installed'), status.get('boot_state')))
+        if args.serve:
+            host, _, port = args.serve.rpartition(':')
+            server = await serve_package(args.package, '0.0.0.0', int(port))
+            await pull(lamp, args.serve, args.full)
+        else:
+            await push(lamp, args.package, manifest, args.chunk, args.full, not args.no_commit)
+    finally:
+        if server is not None:
+            server.close()
+        await client.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m sunlamp_backend.ota_push',
+                                 description=__doc__.splitlines()[0])
+    ap.add_argument('package', help='directory written by tools/ota_manifest.py')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=1883)
+    ap.add_argument('--user', help='USER:PASSWORD for the broker')
+    ap.add_argument('--client-id', default='sunlamp-ota')
+    ap.add_argument('--chunk', type=int, default=512, help='bytes per MQTT chunk (before base64)')
+    ap.add_argument('--timeout', type=float, default=5.0, help='seconds to wait for each reply')
+    ap.add_argument('--retries', type=int, default=5)
+    ap.add_argument('--full', action='store_true', help='lamp hashes its files instead of trusting its installed manifest')
+    ap.add_argument('--no-commit', action='store_true', help='stage and verify only')
+    ap.add_argument('--serve', metavar='HOST:PORT', help='serve the package over HTTP and let the lamp pull it')
+    args = ap.parse_args(argv)
+    args.mqtt_user = args.mqtt_password = None
+    if args.user:
+        args.mqtt_user, _, args.mqtt_password = args.user.partition(':')
+    try:
+        asyncio.run(run(args))
+    except (PushError, MQTTError, OSError) as e:
+        print('OTA failed: {}'.format(e))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
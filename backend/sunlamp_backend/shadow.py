@@ -0,0 +1,184 @@
+"""Read and update a lamp's device shadow (firmware core/shadow.py).
+
+The backend owns the retained *desired* document ({"version", "state"}).
+The lamp owns the retained *reported* document and, after it, publishes
+only deltas against that document. Each delta lists every key that differs
+from the retained copy named by its "base" version. So the retained
+document plus the latest delta is the lamp's current state.
+
+"requested" and "applied" are told apart by versions. The desired version
+the lamp has reconciled comes back as "desired_version". Desired keys that
+still differ from the reported state are pending.
+
+    python -m sunlamp_backend.shadow get
+    python -m sunlamp_backend.shadow set is_on=true brightness=40 --wait 10
+    python -m sunlamp_backend.shadow set color_temp_k=2700 --host 192.168.1.10 --user esp32:esp32
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from sunlamp_backend import DESIRED_TOPIC, REPORTED_TOPIC, REPORTED_DELTA_TOPIC
+from sunlamp_backend.mqttlite import Client, MQTTError
+
+DESIRED_KEYS = ('is_on', 'brightness', 'brightness_mode', 'color_mode', 'color_temp_k', 'rgb')
+
+
+class ShadowView:
+    """Desired and reported documents as seen on the broker, merged with the latest delta."""
+
+    def __init__(self):
+        self.desired = None
+        self.full = None
+        self.delta = None
+
+    def feed(self, topic, payload):
+        """Take one message from the shadow topics; returns True if it was one."""
+        try:
+            doc = json.loads(payload) if payload else None
+        except ValueError:
+            return False
+        if topic == DESIRED_TOPIC:
+            self.desired = doc
+        elif topic == REPORTED_TOPIC:
+            self.full = doc
+            if self.delta is not None and doc and self.delta.get('version', 0) <= doc.get('version', 0):
+                self.delta = None
+        elif topic == REPORTED_DELTA_TOPIC:
+            if doc and (self.delta is None or doc.get('version', 0) > self.delta.get('version', 0)):
+                self.delta = doc
+        else:
+            return False
+        return True
+
+    def reported(self):
+        """(version, desired_version, state) of the lamp, or None before the retained document arrived."""
+        if not self.full:
+            return None
+        state = dict(self.full.get('state') or {})
+        d = self.delta
+        if d and d.get('base') == self.full.get('version') and d.get('version', 0) > self.full.get('version', 0):
+            state.update(d.get('state') or {})
+            return d['version'], d.get('desired_version'), state
+        return self.full.get('version'), self.full.get('desired_version'), state
+
+    def pending(self):
+        """Desired keys the lamp has not reached yet ({} once applied)."""
+        rep = self.reported()
+        want = (self.desired or {}).get('state') or {}
+        if rep is None:
+            return dict(want)
+        state = rep[2]
+        out = dict((k, v) for k, v in want.items() if state.get(k) != v)
+        if want.get('brightness_mode') == 'auto':
+            out.pop('brightness', None)
+        return out
+
+    def applied(self):
+        rep = self.reported()
+        version = (self.desired or {}).get('version', 0)
+        return rep is not None and (rep[1] or 0) >= version and not self.pending()
+
+
+def parse_value(text):
+    """Command-line value: JSON when it parses (true, 40, [255,0,0]), else the string."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def parse_assignments(items):
+    state = {}
+    for item in items:
+        key, sep, value = item.partition('=')
+        if not sep or key not in DESIRED_KEYS:
+            raise SystemExit('expected KEY=VALUE with KEY one of {}'.format(', '.join(DESIRED_KEYS)))
+        state[key] = parse_value(value)
+    return state
+
+
+async def collect(client, view, seconds):
+    """Feed messages into the view for `seconds` (retained documents arrive on subscribe)."""
+    end = time.monotonic() + seconds
+    while True:
+        left = end - time.monotonic()
+        if left <= 0:
+            return
+        try:
+            topic, payload = await asyncio.wait_for(client.messages.get(), left)
+        except asyncio.TimeoutError:
+            return
+        view.feed(topic, payload)
+
+
+def show(view):
+    rep = view.reported()
+    print('desired : {}'.format(json.dumps(view.desired)))
+    if rep is None:
+        print('reported: none (lamp never connected?)')
+        return
+    print('reported: version {} desired_version {} {}'.format(rep[0], rep[1], json.dumps(rep[2], sort_keys=True)))
+    pending = view.pending()
+    print('pending : {}'.format(json.dumps(pending, sort_keys=True) if pending else 'none (applied)'))
+
+
+async def run(args):
+    client = Client(args.client_id, args.host, args.port, args.mqtt_user, args.mqtt_password)
+    await client.connect()
+    view = ShadowView()
+    try:
+        for topic in (DESIRED_TOPIC, REPORTED_TOPIC, REPORTED_DELTA_TOPIC):
+            await client.subscribe(topic)
+        await collect(client, view, args.settle)
+        if args.action == 'get':
+            show(view)
+            return 0
+        state = dict(((view.desired or {}).get('state') or {}), **args.state)
+        doc = {'version': (view.desired or {}).get('version', 0) + 1, 'state': state}
+        client.publish(DESIRED_TOPIC, json.dumps(doc, separators=(',', ':')), retain=True)
+        view.desired = doc
+        print('desired version {}: {}'.format(doc['version'], json.dumps(state, sort_keys=True)))
+        if not args.wait:
+            return 0
+        t0 = time.monotonic()
+        while not view.applied() and time.monotonic() - t0 < args.wait:
+            await collect(client, view, 0.1)
+        if view.applied():
+            print('applied in {:.0f} ms'.format((time.monotonic() - t0) * 1000))
+            return 0
+        print('requested, not applied after {} s (lamp offline? it reconciles on reconnect)'.format(args.wait))
+        show(view)
+        return 2
+    finally:
+        await client.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m sunlamp_backend.shadow', description=__doc__.splitlines()[0])
+    ap.add_argument('action', choices=('get', 'set'))
+    ap.add_argument('assign', nargs='*', metavar='KEY=VALUE', help='desired keys to change (set)')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=1883)
+    ap.add_argument('--user', help='USER:PASSWORD for the broker')
+    ap.add_argument('--client-id', default='sunlamp-shadow')
+    ap.add_argument('--settle', type=float, default=1.0, help='seconds to collect retained documents first')
+    ap.add_argument('--wait', type=float, default=0, help='seconds to wait for the lamp to apply a set')
+    args = ap.parse_args(argv)
+    if args.action == 'set' and not args.assign:
+        ap.error('set needs at least one KEY=VALUE')
+    args.state = parse_assignments(args.assign)
+    args.mqtt_user = args.mqtt_password = None
+    if args.user:
+        args.mqtt_user, _, args.mqtt_password = args.user.partition(':')
+    try:
+        return asyncio.run(run(args))
+    except (MQTTError, OSError) as e:
+        print('shadow failed: {}'.format(e))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# Micro-benchmarks for the hot paths (frame rendering, strip buffer, status
+# serialization, OLED rendering/refresh, command parsing).
+#
+# Same entry point everywhere:
+#   device (mpremote/REPL):  import bench; bench.run()          # bench.run(save=True)
+#   host (sim stand-ins):    python -m bench [--save] [prefix ...]
+#
+# Each case reports µs/op, heap bytes allocated per op and, where the case
+# returns a number, that output (e.g. bytes sent to the OLED). Results are
+# compared with the baseline stored for this platform in BASELINE_FILE.
+import gc
+import sys
+import time
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+BASELINE_FILE = 'bench_baseline.json'
+TARGET_US = 20000       # calibrate reps so one round lasts at least this long
+ROUNDS = 3              # best of N rounds
+MAX_REPS = 10000
+ALLOC_REPS = 4          # ops per allocation probe (gc disabled on device)
+TIME_TOL = 0.20         # slower than baseline by more than 20 % ...
+TIME_FLOOR_US = 5       # ... and by more than 5 µs is a regression
+ALLOC_TOL = 0.10
+ALLOC_FLOOR_B = 16
+
+_mem_alloc = getattr(gc, 'mem_alloc', None)
+
+
+def platform():
+    """基线按平台分开保存（esp32 与主机数值不可比）。"""
+    return '{}-{}'.format(sys.platform, sys.implementation.name)
+
+
+def _time_us(op, reps):
+    t0 = time.ticks_us()
+    for _ in range(reps):
+        op()
+    return time.ticks_diff(time.ticks_us(), t0)
+
+
+def time_per_op(op):
+    """自动确定重复次数，取 ROUNDS 轮中最快一轮的单次耗时（µs）。"""
+    reps = 1
+    while True:
+        dt = _time_us(op, reps)
+        if dt >= TARGET_US or reps >= MAX_REPS:
+            break
+        reps = min(MAX_REPS, reps * 4 if dt < TARGET_US // 8 else reps * 2)
+    best = dt
+    for _ in range(ROUNDS - 1):
+        dt = _time_us(op, reps)
+        if dt < best:
+            best = dt
+    return best / reps
+
+
+def alloc_per_op(op):
+    """单次操作分配的堆字节数；设备上为 gc.mem_alloc 差值，主机上为 tracemalloc 峰值增量。"""
+    if _mem_alloc is not None:
+        gc.collect()
+        gc.disable()
+        try:
+            a = _mem_alloc()
+            for _ in range(ALLOC_REPS):
+                op()
+            b = _mem_alloc()
+        finally:
+            gc.enable()
+        return (b - a) // ALLOC_REPS
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        total = 0
+        for _ in range(ALLOC_REPS):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            op()
+            total += tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return total // ALLOC_REPS
+
+
+def measure(op):
+    op()            # warm-up: one-time costs (first full OLED refresh, imports)
+    out = op()      # a numeric return value is reported as the case output
+    res = {'us': round(time_per_op(op), 2), 'b': alloc_per_op(op)}
+    if isinstance(out, (int, float)) and not isinstance(out, bool):
+        res['out'] = out
+    return res
+
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path) as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(results, path=BASELINE_FILE, drop=()):
+    """合并写入当前平台的基线（保留其它平台与未运行用例的条目，删除 drop 中已不存在的用例）。"""
+    data = load_baseline(path)
+    mine = data.get(platform()) or {}
+    mine.update(results)
+    for name in drop:
+        mine.pop(name, None)
+    data[platform()] = mine
+    with open(path, 'w') as f:
+        f.write(json.dumps(data))
+
+
+def compare(res, base):
+    """与基线比较，返回回归原因列表（空表示正常）。"""
+    why = []
+    if res['us'] > base['us'] * (1 + TIME_TOL) and res['us'] - base['us'] > TIME_FLOOR_US:
+        why.append('time +{:.0f}%'.format(100.0 * (res['us'] - base['us']) / base['us']))
+    if res['b'] > base['b'] * (1 + ALLOC_TOL) + ALLOC_FLOOR_B:
+        why.append('alloc {}->{} B'.format(base['b'], res['b']))
+    if 'out' in res and 'out' in base and res['out'] > base['out']:
+        why.append('out {}->{}'.format(base['out'], res['out']))
+    return why
+
+
+def _match(name, prefixes):
+    if not prefixes:
+        return True
+    for p in prefixes:
+        if name.startswith(p):
+            return True
+    return False
+
+
+def run(prefixes=None, save=False, path=BASELINE_FILE):
+    """运行匹配前缀的用例并打印结果；返回回归数量（出错的用例与基线中缺失的用例也计入）。"""
+    from bench.cases import CASES
+    base = load_baseline(path).get(platform()) or {}
+    results = {}
+    regressions = 0
+    errors = 0
+    print('{:30s} {:>10s} {:>8s} {:>8s}  {}'.format('case', 'us/op', 'B/op', 'out', 'vs baseline'))
+    for name, factory in CASES:
+        if not _match(name, prefixes):
+            continue
+        try:
+            res = measure(factory())
+        except Exception as e:
+            # a case that crashes after a change is a regression, not a skipped row
+            print('{:30s} ERROR {}'.format(name, e))
+            errors += 1
+            continue
+        results[name] = res
+        note = ''
+        b = base.get(name)
+        if b:
+            why = compare(res, b)
+            if why:
+                regressions += 1
+                note = 'REGRESSION ' + ', '.join(why)
+            else:
+                note = '{:+.0f}%'.format(100.0 * (res['us'] - b['us']) / b['us']) if b['us'] else 'ok'
+        print('{:30s} {:10.2f} {:8d} {:>8s}  {}'.format(name, res['us'], res['b'],
+                                                      str(res.get('out', '')), note))
+        gc.collect()
+    defined = [name for name, _f in CASES]
+    missing = [name for name in sorted(base) if _match(name, prefixes) and name not in defined]
+    for name in missing:
+        print('{:30s} MISSING (in the baseline, no longer defined)'.format(name))
+    if save:
+        save_baseline(results, path, missing)
+        print('baseline saved for', platform(), 'to', path)
+        missing = []
+    elif not base:
+        print('no baseline for', platform(), '- run with save=True to record one')
+    elif missing:
+        print('removed on purpose? run with save=True to drop them from the baseline')
+    if errors:
+        print(errors, 'case(s) failed')
+    if regressions:
+        print(regressions, 'regression(s)')
+    return regressions + errors + len(missing)
@@ -0,0 +1,42 @@
+"""Host entry point: python -m bench [--save] [--baseline FILE] [prefix ...]
+
+Runs the benchmark cases on CPython against the sim/ hardware stand-ins,
+with real (wall-clock) ticks, and exits non-zero on a regression, a case that
+raises, or a baseline case that no longer exists.
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_host():
+    """Install the stand-ins with wall-clock time and the configured I2C devices."""
+    for p in (os.path.join(ROOT, 'lib'), ROOT):
+        if p not in sys.path:
+            sys.path.insert(0, p)
+    import sim
+    from sim import world
+    from sim.harness import power_on_hardware
+    from sim.vclock import WallClock
+    w = world.create(clock=WallClock())
+    sim.install(w.clock)
+    import config
+    power_on_hardware(w, config)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m bench', description=__doc__.splitlines()[0])
+    ap.add_argument('prefixes', nargs='*', help='only cases whose name starts with one of these')
+    ap.add_argument('--save', action='store_true', help='record the results as the new baseline')
+    ap.add_argument('--baseline', default=os.path.join(ROOT, 'bench_baseline.json'),
+                    help='baseline file (default: %(default)s)')
+    args = ap.parse_args(argv)
+    setup_host()
+    import bench
+    return 1 if bench.run(args.prefixes, save=args.save, path=args.baseline) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# Benchmark cases: (name, factory) pairs. A factory builds its fixtures once
+# and returns the zero-argument operation to time.
+import math
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+CASES = []
+
+PIXEL_COUNTS = (8, 60, 300)
+ANIMATIONS = (None, 'wakeup', 'sunset', 'breathe', 'warning')
+NOW_MS = 1781244000000
+
+
+def case(name):
+    def deco(factory):
+        CASES.append((name, factory))
+        return factory
+    return deco
+
+
+def _lamp(anim=None):
+    return {
+        'is_on': True, 'brightness': 80, 'color_mode': 'temp', 'brightness_mode': 'manual',
+        'color_temp_k': 4000, 'custom_rgb': (255, 220, 200), 'animation': anim,
+        'animation_start_ms': NOW_MS - 200000, 'animation_duration_s': 900,
+        'animation_progress': 0.0,
+    }
+
+
+def _state():
+    """与 main.system_state 同构、填入典型数值的状态副本。"""
+    from core import bootlog
+    import main
+    bootlog.stop_profile()  # importing main starts the boot import profiler
+    s = json.loads(json.dumps(main.system_state))
+    s['sensor'] = {'temperature': 22.6, 'humidity': 45.2, 'eco2': 612, 'tvoc': 41, 'light': 1380}
+    for k, v in s['sensor'].items():
+        s['filtered'][k] = v + 0.25
+        s['trend'][k] = -0.125
+    s['lamp'] = _lamp('sunset')
+    s['network'].update({'wifi_status': 'connected', 'mqtt_status': 'connected',
+                         'ip': '192.168.1.57', 'last_mqtt_pub_ts': 1781243995,
+                         'wifi_stats': {'attempts': 3, 'fast_ok': 2, 'scan_ok': 1, 'failures': 0,
+                                        'last_ms': 612, 'last_method': 'fast',
+                                        'avg_fast_ms': 640, 'avg_scan_ms': 3400}})
+    s['clock'] = {'synced': True, 'syncs': 4, 'failures': 0, 'last_step_ms': 3,
+                  'rtt_ms': 18, 'drift_ppm': 12.5, 'last_sync_ms': 1781243000000}
+    s['schedule'] = {'count': 2, 'next_ts': 1781290800, 'next_id': 'wk'}
+    s['meta']['boot_ms'] = {'main': 40, 'lamp': 95, 'network': 420, 'display': 610}
+    return s
+
+
+I2C_REPORT = {'0x3c': {'ops': 5210, 'errors': 0, 'last_us': 410, 'max_us': 2900, 'avg_us': 520},
+              '0x58': {'ops': 1840, 'errors': 1, 'last_us': 380, 'max_us': 1200, 'avg_us': 390}}
+
+
+# ---------------- actuator frame computation -----------------
+def _frame_case(anim, n):
+    def factory():
+        from tasks.actuator_task import render_frame
+        lamp = _lamp(anim)
+        return lambda: render_frame(lamp, NOW_MS, n)
+    return factory
+
+
+for _n in PIXEL_COUNTS:
+    for _a in ANIMATIONS:
+        CASES.append(('frame.{}.{}'.format(_a or 'static', _n), _frame_case(_a, _n)))
+
+
+# ---------------- WS2811 buffer preparation -----------------
+def _strip_case(n, send):
+    def factory():
+        from drivers.actuator.ws2811 import WS2811
+        from tasks.actuator_task import render_frame
+        from config import SUN_LAMP_PIN
+        strip = WS2811(SUN_LAMP_PIN, n, min_gap_ms=0)
+        pixels = render_frame(_lamp('sunset'), NOW_MS, n)[0]
+        if send:
+            return lambda: strip.write_pixels(pixels)
+        return lambda: strip.load(pixels)
+    return factory
+
+
+for _n in PIXEL_COUNTS:
+    CASES.append(('ws2811.load.{}'.format(_n), _strip_case(_n, False)))
+    CASES.append(('ws2811.write_pixels.{}'.format(_n), _strip_case(_n, True)))
+
+
+# ---------------- status payload -----------------
+@case('status.build')
+def _status_build():
+    from tasks.mqtt_task import build_status
+    s = _state()
+    return lambda: build_status(s, I2C_REPORT)
+
+
+@case('status.dumps')
+def _status_dumps():
+    from tasks.mqtt_task import build_status
+    payload = build_status(_state(), I2C_REPORT)
+    return lambda: len(json.dumps(payload))
+
+
+# ---------------- OLED rendering and refresh -----------------
+def _screens():
+    from drivers.display.ssd1306 import SSD1306Display
+    from core.i2c_bus import get_bus
+    from core.history import History
+    from tasks.display_task import Screens
+    oled = SSD1306Display(bus=get_bus())
+    s = _state()
+    hist = {}
+    for i, field in enumerate(('temperature', 'humidity', 'eco2', 'light')):
+        h = History(62)
+        for k in range(62):
+            h.push(s['sensor'][field] * (1 + 0.05 * math.sin(k / (4.0 + i))))
+        hist[field] = h
+    s['history'] = hist
+    return oled, Screens(oled), s
+
+
+def _render_case(screen):
+    def factory():
+        oled, screens, s = _screens()
+        return lambda: screens.draw(screen, s)
+    return factory
+
+
+for _sc in ('readings', 'network', 'lamp'):
+    CASES.append(('display.render.{}'.format(_sc), _render_case(_sc)))
+
+
+@case('display.show.idle')
+def _show_idle():
+    # nothing changed since the last refresh: must send 0 bytes
+    oled, screens, s = _screens()
+    screens.draw('readings', s)
+    oled.show()
+    return lambda: oled.show()
+
+
+@case('display.show.reading_tick')
+def _show_tick():
+    # one reading changes per refresh (typical sensor update)
+    oled, screens, s = _screens()
+    temps = (22.6, 22.7)
+    box = [0]
+
+    def op():
+        box[0] ^= 1
+        s['sensor']['temperature'] = temps[box[0]]
+        screens.draw('readings', s)
+        return oled.show()
+    return op
+
+
+@case('display.show.anim_progress')
+def _show_anim():
+    # lamp screen during a sunset: the progress bar advances every refresh
+    from core import clock
+    oled, screens, s = _screens()
+    lamp = s['lamp']
+    box = [0]
+
+    def op():
+        # the bar is drawn against clock.now_ms(); step it by ~1 % each refresh
+        box[0] ^= 1
+        lamp['animation_start_ms'] = clock.now_ms() - 200000 - box[0] * 9000
+        screens.draw('lamp', s)
+        return oled.show()
+    return op
+
+
+@case('display.show.screen_switch')
+def _show_switch():
+    # full redraw between two different screens
+    oled, screens, s = _screens()
+    names = ('readings', 'network')
+    box = [0]
+
+    def op():
+        box[0] ^= 1
+        screens.draw(names[box[0]], s)
+        return oled.show()
+    return op
+
+
+# ---------------- MQTT command parsing -----------------
+def _cmd_case(msg):
+    def factory():
+        from core.commands import handle_command
+        s = _state()
+        raw = msg.encode()
+
+        def op():
+            j = json.loads(raw.decode())
+            handle_command(s, j)
+        return op
+    return factory
+
+
+CASES.append(('cmd.set', _cmd_case('{"cmd":"set","is_on":true,"brightness":40,"color_temp_k":3000}')))
+CASES.append(('cmd.set_rgb', _cmd_case('{"cmd":"set","color_hex":"#ffa040","brightness_mode":"auto"}')))
+CASES.append(('cmd.anim', _cmd_case('{"cmd":"anim","type":"sunset","duration_s":900}')))
@@ -13,6 +13,14 @@
 # boot.py
 # Runs on boot. Initializes the system and starts main.py
 
+# --- OTA: finish an interrupted update or roll back a bad one before main.py
+# imports anything (ota_boot.py is never replaced over the air) ---
+try:
+    import ota_boot
+    ota_boot.check()
+except Exception as e:
+    print('ota_boot error', e)
+
 # import sys
 # import time
 # import machine
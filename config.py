@@ -4,6 +4,9 @@
 AP_SSID = "ESP32_Configurator"
 AP_PASSWORD = "12345678" # 至少8位
 
+# STA 快速重连：复用上次 DHCP 获得的 IP 配置（跳过 DHCP）。路由器地址池会变动时保持 False
+WIFI_REUSE_IP = False
+
 # MQTT 配置
 MQTT_SERVER = '8.138.213.43'
 MQTT_PORT = 21883
@@ -11,19 +14,86 @@ MQTT_USER = b"esp32"
 MQTT_PASSWORD = b"esp32"
 MQTT_TOPIC_PUB = 'esp32/sunlamp/status'
 MQTT_TOPIC_SUB = 'esp32/sunlamp/cmd'
+MQTT_TOPIC_REPLY = 'esp32/sunlamp/reply'   # 指令回复（如 schedule list）
+# 设备影子（core/shadow.py）：desired 由后端保留发布，reported 由设备保留发布，之后只发差异
+MQTT_TOPIC_DESIRED = 'esp32/sunlamp/shadow/desired'
+MQTT_TOPIC_REPORTED = 'esp32/sunlamp/shadow/reported'
+MQTT_TOPIC_REPORTED_DELTA = 'esp32/sunlamp/shadow/reported/delta'
+SHADOW_MIN_MS = 250                         # reported 差异的最小发布间隔（合并滑条连发）
+SHADOW_FULL_S = 60                          # 有变化时刷新保留的完整 reported 文档的最短间隔
+# 组控制：设置组名后额外订阅该组的指令主题（多台灯同步动画，anim 可带 start_ms/seq）
+MQTT_GROUP = None                           # 例如 'bedroom'；None 表示不加入任何组
+MQTT_TOPIC_GROUP = 'esp32/sunlamp/group/{}/cmd'
 
 # 传感器引脚配置 (请根据您的实际接线修改！)
 DHT22_PIN = 15          # DHT22 数据引脚
-SGP30_I2C_SDA = 8       # SGP30 SDA 引脚
-SGP30_I2C_SCL = 9       # SGP30 SCL 引脚
 LIGHT_SENSOR_PIN = 7    # 光敏电阻 ADC 引脚
+LIGHT_SENSOR_INVERT = False  # 若接线为越亮读数越小，置 True
+ADC_MAX = 4095
 
 # 传感器读取间隔 (秒)
-SENSOR_READ_INTERVAL_S = 1
+SENSOR_READ_INTERVAL_S = 1    # 可在线调整：sensor_read_interval_s
+
+# 标注「可在线调整」的项为默认值，运行时可用 {"cmd":"config","set":{...}} 修改（core/settings.py，
+# 保存在 settings.json，无需重刷/重启）
+PUBLISH_INTERVAL_S = 5          # status 发布间隔（秒），可在线调整：publish_interval_s
+
+# 传感器信号处理（core/filters.py）
+FILTER_WINDOW = 5        # Hampel 中值窗口（样本数）
+FILTER_HAMPEL_K = 3.0    # 超过 k·MAD 判为离群
+FILTER_EMA_ALPHA = 0.3   # EMA 平滑系数
+TREND_WINDOW = 30        # 趋势斜率窗口（样本数），输出单位/分钟
+
+# 日光补偿（auto 亮度模式，tasks/daylight_task.py）
+DAYLIGHT_LOOP_MS = 200          # 控制周期
+DAYLIGHT_IDLE_MS = 1000         # 非 auto 模式时的检查周期
+DAYLIGHT_TARGET = 2500          # 目标总照度（光敏 ADC 读数）
+DAYLIGHT_KP = 0.01              # 亮度%/ADC 计数
+DAYLIGHT_KI = 0.02              # 亮度%/(ADC 计数·秒)
+DAYLIGHT_DEADBAND = 60          # 滞回死区（ADC 计数）
+DAYLIGHT_MAX_STEP = 5           # 每周期最大亮度变化（%）
+DAYLIGHT_MIN_BRIGHTNESS = 5     # auto 模式最低亮度，避免灯完全熄灭
+DAYLIGHT_TARGET_STEP = 100      # auto 模式下上/下键调整目标的步长
+
+# OLED 界面：按需重绘（状态变化时），并设置最长重绘间隔
+DISPLAY_CEILING_MS = 5000       # 无变化时的最长重绘间隔，可在线调整：display_ceiling_ms
+DISPLAY_ANIM_REFRESH_MS = 1000  # 灯光页动画进度条刷新间隔，可在线调整：display_anim_refresh_ms
+SPARK_POINTS = 62               # 走势图点数（环形缓冲长度）
+HISTORY_SAMPLE_S = 10           # 走势图采样间隔（秒），62 点约 10 分钟
+
+# 共享 I2C 总线（SGP30 与 OLED 共用 I2C(0)，由 core/i2c_bus.py 统一管理）
+I2C_BUS_ID = 0
+I2C_SDA_PIN = 8         # SGP30 与 OLED 的 SDA（唯一的 I2C 引脚配置）
+I2C_SCL_PIN = 9         # SGP30 与 OLED 的 SCL
+I2C_FREQ_HZ = 400000    # fast-mode
+I2C_DEVICES = {'sgp30': 0x58, 'oled': 0x3C}  # 启动扫描时检查的设备
+
+# NTP 时钟（core/clock.py）：Wi-Fi 连上后同步，定期重同步并估计晶振漂移
+NTP_HOST = 'ntp.aliyun.com'     # 可指向局域网/本机的 NTP 服务用于测试
+NTP_PORT = 123
+NTP_TIMEOUT_MS = 2000
+NTP_RESYNC_S = 3600
+NTP_RETRY_S = 30
 
-# OLED 显示器引脚配置
-OLED_SDA_PIN = 8  # 可以是任何支持 I2C 的引脚
-OLED_SCL_PIN = 9  # 可以是任何支持 I2C 的引脚
+# 本地定时（core/scheduler.py）：wakeup/sunset 按星期/时刻在本地触发，断网也生效
+TZ_OFFSET_S = 8 * 3600          # 本地时区相对 RTC（UTC）的偏移，无夏令时
+SCHEDULE_MAX = 8                # 最多保存的定时项
+SCHEDULE_GRACE_S = 120          # 触发时间已过多久内仍补触发
+SCHEDULE_MAX_SLEEP_S = 600      # 单次睡眠上限，限制 RTC 漂移的影响
+
+# 本地规则（core/rules.py）：传感器阈值/滞回/持续时间触发灯光动作，断网也生效
+RULES_MAX = 16                  # 最多保存的规则
+RULES_FIRED_LOG = 5             # status 中保留的最近触发记录条数
+
+# 启动剖析（core/bootlog.py）：保存各阶段与各模块导入耗时，并与上次启动对比
+BOOT_PROFILE = False            # True 时每次启动写入 BOOT_PROFILE_FILE（调试用，避免常开写闪存）
+BOOT_PROFILE_FILE = 'boot_prof.json'
+
+# 闪存状态日志（core/journal.py）：追加写 + 轮转段文件，合并去抖后落盘
+JOURNAL_PREFIX = 'state'        # 段文件名 state<N>.jnl
+JOURNAL_SEG_BYTES = 4096        # 段写满后新建段（写入全量快照）并删除旧段
+JOURNAL_DEBOUNCE_MS = 3000      # 最后一次修改后静默多久才写入
+JOURNAL_MAX_DELAY_MS = 15000    # 持续修改时最长延迟
 
 # RGB-LED指示信号灯引脚配置（板载单灯珠）
 RGB_PIN = 38
@@ -31,6 +101,8 @@ RGB_PIN = 38
 # WS2812 太阳灯灯条
 SUN_LAMP_PIN = 2
 SUN_LAMP_COUNT = 8
+FRAME_INTERVAL_MS = 100         # 动画帧间隔，可在线调整：frame_interval_ms
+STRIP_MIN_GAP_MS = 20           # 两次写灯带的最小间隔，可在线调整：strip_min_gap_ms
 
 
 # 五向开关引脚配置（新增）
@@ -39,4 +111,39 @@ KEY_UP_PIN = 4
 KEY_DOWN_PIN = 5
 KEY_LEFT_PIN = 6
 KEY_RIGHT_PIN = 10
-KEY_SET_PIN = 11
\ No newline at end of file
+KEY_SET_PIN = 11
+DEBOUNCE_MS = 20                # 按键去抖，可在线调整：debounce_ms
+
+# 局域网控制 API（tasks/api_task.py）：STA 连上后提供 REST 与 WebSocket，断网也可直连控制
+API_PORT = 80                   # None 关闭；AP 配网时释放给门户
+API_TOKEN = None                # 设置后需 Authorization: Bearer <token>（WebSocket 用 ?token=）
+API_ALLOWED_ORIGIN = None       # 允许跨域访问的网页源，如 'http://192.168.1.20:1880'；None 只允许同源页面与非浏览器客户端
+API_COMMANDS = ('set', 'anim', 'schedule', 'rule')  # 局域网 API 可执行的指令
+API_ADMIN_COMMANDS = ('config', 'ota', 'logs')      # 仅在设置 API_TOKEN 后可经局域网 API 执行
+API_MAX_CLIENTS = 4             # 同时连接数上限（HTTP + WebSocket），超出返回 503
+API_PUSH_MS = 100               # WebSocket 状态推送最小间隔（合并滑条连发引起的变化）
+API_OUTBOX = 8                  # 每个 WebSocket 待发回复上限，超出丢弃最旧
+API_SEND_TIMEOUT_MS = 2000      # 发送阻塞超过此时间断开慢客户端
+
+# OTA 更新（core/ota.py 接收与试运行监督，ota_boot.py 启动时换入/回滚）
+OTA_BUF = 512                   # 流式下载/校验的固定缓冲区字节数
+OTA_MAX_FILE = 256 * 1024       # 单个文件上限（字节）
+OTA_HEALTHY_S = 60              # 新版本无任务崩溃地运行多久后确认
+OTA_HEALTH_TIMEOUT_S = 300      # 期限内未连上 MQTT 视为不健康，重启并回滚
+OTA_RESET_DELAY_MS = 1500       # commit 后留给回复发出的时间，然后重启
+
+# 功耗管理（core/power.py、tasks/power_task.py）
+POWER_FREQ_PERF = 240000000     # 动画/交互时的 CPU 频率
+POWER_FREQ_ECO = 80000000       # 其余时间（Wi-Fi 需要 ≥ 80 MHz）
+POWER_BOOST_MS = 3000           # 按键/MQTT 指令后保持 perf 的时间
+POWER_IDLE_S = 30               # 灯光/界面/定时无变化多久后进入 idle
+POWER_IDLE_STRETCH = 4          # idle 时轮询类定时器的拉长倍数
+POWER_WLAN_PM = True            # idle 时开启 Wi-Fi 调制解调器省电（PM_POWERSAVE）
+POWER_TICK_MS = 1000            # 功耗状态评估周期
+
+# 日志（core/log.py）：二进制环形缓冲，{"cmd":"logs"} 经 MQTT 分页读取
+LOG_ENTRIES = 128               # 环形缓冲条数（每条 40 字节，启动时一次分配）
+LOG_LEVEL = 1                   # 记录的最低级别：1 info，2 warn，3 error
+LOG_CONSOLE = True              # 同时打印到串口；量产可关闭省去 UART 时间
+LOG_REPEAT_MS = 60000           # 同一消息代码在此时间内重复只计数，不记录不打印
+LOG_PAGE_MAX = 16               # 每次 logs 回复的最多条数（控制 MQTT 报文大小）
@@ -0,0 +1,134 @@
+# === FILE: core/bootlog.py ===
+# Boot stage timing. Import this first in main.py; every mark() records the
+# milliseconds since reset (ticks_ms starts at 0 on boot) and since main began.
+# profile_imports() additionally wraps builtins.__import__ so every module
+# that is actually loaded (not already in sys.modules) gets its ticks_us cost
+# recorded, inclusive and exclusive of the imports it triggers itself.
+import sys
+import time
+
+T0_MS = time.ticks_ms()
+marks = []
+imports = []        # (name, inclusive_us, self_us) in completion order
+_stack = []         # child import time accumulated per active import
+_orig_import = None
+
+
+def mark(stage):
+    """记录并打印一个启动阶段完成的时间点。"""
+    now = time.ticks_ms()
+    marks.append((stage, now, time.ticks_diff(now, T0_MS)))
+    print('[boot] {:<12} +{:>5} ms (since reset {} ms)'.format(stage, time.ticks_diff(now, T0_MS), now))
+
+
+def report():
+    """返回 {阶段: 自 main 开始的毫秒数}，用于上报/比较启动回归。"""
+    return {stage: rel for stage, _abs, rel in marks}
+
+
+# ---------------- import profiler -----------------
+def _profiled_import(name, globals=None, locals=None, fromlist=None, level=0):
+    label = name
+    mod = sys.modules.get(name)
+    if mod is not None:
+        missing = [f for f in fromlist or () if not hasattr(mod, f)]
+        if not missing:
+            return _orig_import(name, globals, locals, fromlist, level)
+        # `from pkg import submodule` with the package already loaded
+        label = name + '.' + ','.join(missing)
+    _stack.append(0)
+    t0 = time.ticks_us()
+    try:
+        return _orig_import(name, globals, locals, fromlist, level)
+    finally:
+        dt = time.ticks_diff(time.ticks_us(), t0)
+        child = _stack.pop()
+        if _stack:
+            _stack[-1] += dt
+        imports.append((label, dt, dt - child))
+
+
+def profile_imports():
+    """开始记录每个模块导入耗时（需固件支持覆盖 builtins.__import__）。返回是否生效。"""
+    global _orig_import
+    if _orig_import is not None:
+        return True
+    try:
+        import builtins
+        _orig_import = builtins.__import__
+        builtins.__import__ = _profiled_import
+        return True
+    except Exception as e:
+        _orig_import = None
+        print('[boot] import profiler unavailable', e)
+        return False
+
+
+def stop_profile():
+    """恢复原始 __import__，之后的按需导入不再计时。"""
+    global _orig_import
+    if _orig_import is None:
+        return
+    try:
+        import builtins
+        builtins.__import__ = _orig_import
+    except Exception:
+        pass
+    _orig_import = None
+
+
+def top_imports(n=10):
+    """按自身耗时（不含子导入）排序的前 n 个导入 [(name, self_us)]。"""
+    rows = [(name, self_us) for name, _incl, self_us in imports]
+    rows.sort(key=lambda r: r[1], reverse=True)
+    return rows[:n]
+
+
+def profile():
+    """汇总本次启动：阶段时间、各导入自身耗时、延迟加载模块耗时。"""
+    try:
+        from core.lazy import loaded
+    except ImportError:
+        loaded = {}
+    return {
+        'marks': report(),
+        'imports': {name: self_us for name, _incl, self_us in imports},
+        'import_us': sum(self_us for _n, _i, self_us in imports),
+        'lazy': dict(loaded),
+    }
+
+
+def diff(old, new, n=8):
+    """打印两次启动剖析的差异（阶段毫秒与变化最大的导入）。"""
+    print('[boot] stage         before    after    delta (ms)')
+    for stage, ms in sorted(new['marks'].items(), key=lambda kv: kv[1]):
+        was = old.get('marks', {}).get(stage)
+        if was is None:
+            print('[boot] {:<12} {:>8} {:>8}'.format(stage, '-', ms))
+        else:
+            print('[boot] {:<12} {:>8} {:>8} {:>+8}'.format(stage, was, ms, ms - was))
+    print('[boot] imports total {} us -> {} us'.format(old.get('import_us', 0), new['import_us']))
+    old_imp = old.get('imports', {})
+    names = set(old_imp) | set(new['imports'])
+    rows = [(name, new['imports'].get(name, 0) - old_imp.get(name, 0)) for name in names]
+    rows.sort(key=lambda r: abs(r[1]), reverse=True)
+    for name, d in rows[:n]:
+        print('[boot]   {:<28} {:>+8} us'.format(name, d))
+
+
+def save(path):
+    """保存本次剖析；若存在上一次的结果则先打印前后对比（如 .py 与 .mpy 部署）。"""
+    import ujson
+    new = profile()
+    try:
+        with open(path, 'r') as f:
+            diff(ujson.loads(f.read()), new)
+    except (OSError, ValueError):
+        for name, us in top_imports():
+            print('[boot]   {:<28} {:>8} us'.format(name, us))
+    try:
+        with open(path, 'w') as f:
+            f.write(ujson.dumps(new))
+    except OSError as e:
+        print('[boot] profile save failed', e)
+    return new
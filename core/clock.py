@@ -0,0 +1,153 @@
+# === FILE: core/clock.py ===
+# Wall clock in Unix milliseconds. now_ms() is ticks_ms() extended past its
+# wrap plus an offset, so frame loops can call it every frame without an RTC
+# read. sync() disciplines the offset against an NTP server over UDP: each
+# sync steps the offset and measures how fast the local oscillator drifts,
+# and the drift rate is applied between syncs.
+import time
+import struct
+import socket
+import uasyncio as asyncio
+from core import log
+
+NTP_DELTA_S = 2208988800            # 1900-01-01 -> 1970-01-01
+# device epoch (MicroPython ports count from 2000-01-01) -> Unix epoch
+EPOCH_DELTA_S = 946684800 if time.gmtime(0)[0] == 2000 else 0
+MAX_DRIFT_PPM = 500                 # reject drift estimates beyond crystal tolerance
+DRIFT_MIN_SPAN_MS = 600000          # need 10 min between syncs to estimate drift
+
+_last_ticks = time.ticks_ms()
+_mono = 0                           # ms since boot, wrap-free
+_offset_ms = int(time.time() + EPOCH_DELTA_S) * 1000   # Unix ms at mono 0 (RTC guess until synced)
+_sync_mono = 0                      # mono at last sync
+_rate = 0.0                         # drift correction, ms per ms of mono since last sync
+synced = False
+stats = {'syncs': 0, 'failures': 0, 'last_step_ms': 0, 'rtt_ms': 0, 'drift_ppm': 0.0, 'last_sync_ms': 0}
+_step_listeners = []
+
+
+def mono_ms():
+    """开机以来的毫秒数（处理 ticks_ms 回绕；至少每个回绕周期调用一次）。"""
+    global _last_ticks, _mono
+    t = time.ticks_ms()
+    _mono += time.ticks_diff(t, _last_ticks)
+    _last_ticks = t
+    return _mono
+
+
+def now_ms():
+    """当前 Unix 毫秒时间戳（未同步时基于 RTC 估计，见 synced）。"""
+    m = mono_ms()
+    # keep the large terms integral: ESP32 floats are single precision
+    return _offset_ms + m + int((m - _sync_mono) * _rate)
+
+
+def add_step_listener(fn):
+    """注册时钟跳变回调 fn(delta_ms)（同步时修正量较大时调用）。"""
+    _step_listeners.append(fn)
+
+
+def to_device_s(unix_ms):
+    """Unix 毫秒 -> 设备纪元秒（与 time.time()/localtime 同一纪元）。"""
+    return unix_ms // 1000 - EPOCH_DELTA_S
+
+
+def _set_rtc(unix_ms):
+    try:
+        import machine
+        tm = time.gmtime(to_device_s(unix_ms))
+        machine.RTC().datetime((tm[0], tm[1], tm[2], tm[6], tm[3], tm[4], tm[5], (unix_ms % 1000) * 1000))
+    except Exception as e:
+        log.msg(log.RTC_SET, e)
+
+
+def discipline(server_ms, rtt_ms, at_mono):
+    """用一次 NTP 测量（服务器时间 + 往返时延）校正偏移与漂移率；返回时钟跳变量（毫秒）。"""
+    global _offset_ms, _sync_mono, _rate, synced
+    target = server_ms + rtt_ms // 2
+    local = _offset_ms + at_mono + int((at_mono - _sync_mono) * _rate)
+    step = target - local
+    if synced:
+        span = at_mono - _sync_mono
+        if span >= DRIFT_MIN_SPAN_MS:
+            # residual error over the interval is the uncorrected drift
+            rate = _rate + step / span
+            if abs(rate) * 1e6 <= MAX_DRIFT_PPM:
+                _rate = rate
+    _offset_ms = target - at_mono
+    _sync_mono = at_mono
+    synced = True
+    stats['syncs'] += 1
+    stats['last_step_ms'] = step
+    stats['rtt_ms'] = rtt_ms
+    stats['drift_ppm'] = round(_rate * 1e6, 1)
+    stats['last_sync_ms'] = target
+    return step
+
+
+def _request():
+    pkt = bytearray(48)
+    pkt[0] = 0x23                   # LI=0, VN=4, mode=3 (client)
+    return pkt
+
+
+def _parse(resp):
+    """解析 NTP 应答，返回 (server_rx_ms, server_tx_ms)（Unix 毫秒）；无效返回 None。"""
+    if len(resp) < 48 or (resp[0] & 0x07) != 4 or resp[1] == 0:
+        return None
+    rx_s, rx_f, tx_s, tx_f = struct.unpack('!IIII', resp[32:48])
+    if tx_s == 0:
+        return None
+    rx = (rx_s - NTP_DELTA_S) * 1000 + (rx_f * 1000 >> 32)
+    tx = (tx_s - NTP_DELTA_S) * 1000 + (tx_f * 1000 >> 32)
+    return rx, tx
+
+
+async def query(host, port=123, timeout_ms=2000):
+    """向 NTP 服务器查询一次，返回 (服务器时间毫秒, 往返毫秒, 收到应答时的 mono_ms)；失败返回 None。"""
+    addr = socket.getaddrinfo(host, port)[0][-1]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setblocking(False)
+        t1 = mono_ms()
+        sock.sendto(_request(), addr)
+        while mono_ms() - t1 < timeout_ms:
+            try:
+                resp = sock.recv(48)
+            except OSError:
+                await asyncio.sleep_ms(10)
+                continue
+            t4 = mono_ms()
+            times = _parse(resp)
+            if times is None:
+                return None
+            rx, tx = times
+            # subtract the server's processing time from the round trip
+            rtt = max(0, (t4 - t1) - (tx - rx))
+            return tx, rtt, t4
+        return None
+    finally:
+        sock.close()
+
+
+async def sync(host, port=123, timeout_ms=2000, step_threshold_ms=1000):
+    """NTP 同步一次并设置 RTC；成功返回跳变量（毫秒），失败返回 None。"""
+    try:
+        res = await query(host, port, timeout_ms)
+    except OSError as e:
+        log.msg(log.NTP_ERROR, e)
+        res = None
+    if res is None:
+        stats['failures'] += 1
+        return None
+    server_ms, rtt, at = res
+    was_synced = synced
+    step = discipline(server_ms, rtt, at)
+    _set_rtc(now_ms())
+    if not was_synced or abs(step) >= step_threshold_ms:
+        for fn in _step_listeners:
+            try:
+                fn(step)
+            except Exception as e:
+                log.msg(log.CLOCK_LISTENER, e)
+    return step
@@ -0,0 +1,189 @@
+# === FILE: core/commands.py ===
+# Command handling shared by every control path (MQTT, local API, scheduler...).
+# Functions mutate system_state in place; callers hold the state lock and
+# notify the affected events sections afterwards. run_command() does both for
+# a complete JSON command.
+from core import clock
+from core import events
+from core import log
+from config import ADC_MAX
+
+# default duration per animation type (breathe: period)
+ANIMATIONS = {'wakeup': 600, 'warning': 0, 'sunset': 900, 'breathe': 3}
+ANIM_MAX_LEAD_MS = 60000    # a start_ms further ahead than this is treated as "now"
+COLOR_TEMP_MIN_K = 1000
+COLOR_TEMP_MAX_K = 10000
+
+
+def start_animation(lamp, typ, duration_s=None, start_ms=None, sync=False):
+    """启动动画（wakeup/sunset/warning/breathe）；sync=True 表示 start_ms 为组内共享的绝对时刻。类型未知返回 False。"""
+    if typ not in ANIMATIONS:
+        return False
+    lamp['animation'] = typ
+    lamp['animation_start_ms'] = clock.now_ms() if start_ms is None else start_ms
+    # absolute group start: clock steps must not shift it (tasks/time_task.py)
+    lamp['animation_sync'] = start_ms if sync else None
+    lamp['animation_duration_s'] = ANIMATIONS[typ] if duration_s is None else int(duration_s)
+    lamp['animation_progress'] = 0.0
+    lamp['is_on'] = True
+    return True
+
+
+def apply_anim(system_state, j):
+    """处理 anim；组指令带 start_ms（Unix 毫秒）与 seq，各灯按同步后的时钟从同一时刻渲染。"""
+    lamp = system_state['lamp']
+    start = j.get('start_ms')
+    if start is not None:
+        start = int(start)
+        if not clock.synced or start - clock.now_ms() > ANIM_MAX_LEAD_MS:
+            # an unsynced clock cannot honour an absolute start: start on arrival
+            start = None
+    seq = j.get('seq')
+    if seq is not None:
+        seq = int(seq)
+        last = lamp.get('animation_seq')
+        # the same group command can arrive twice (group + device topic, resend):
+        # drop it unless it is newer by sequence or by start time. Without a
+        # start time (clock unsynced) only the sequence can tell.
+        if last is not None and seq <= last \
+                and (start is None or start <= (lamp.get('animation_sync') or 0)):
+            return False
+    if not start_animation(lamp, j.get('type'), j.get('duration_s'), start, start is not None):
+        return False
+    if seq is not None:
+        lamp['animation_seq'] = seq
+    return True
+
+
+def hex_rgb(hx):
+    """'#RRGGBB' 或 'RRGGBB' 转 (r, g, b)；格式错误抛 ValueError。"""
+    if not isinstance(hx, str) or len(hx) not in (6, 7):
+        raise ValueError('bad color_hex')
+    hx = hx[1:] if hx.startswith('#') else hx
+    if len(hx) != 6:
+        raise ValueError('bad color_hex')
+    return int(hx[0:2], 16), int(hx[2:4], 16), int(hx[4:6], 16)
+
+
+def _set_field_ok(k, v):
+    if k == 'brightness':
+        return 0 <= int(v) <= 100
+    if k == 'brightness_mode':
+        return v in ('manual', 'auto')
+    if k == 'color_mode':
+        return v in ('temp', 'custom')
+    if k == 'color_temp_k':
+        return COLOR_TEMP_MIN_K <= int(v) <= COLOR_TEMP_MAX_K
+    if k == 'rgb':
+        return isinstance(v, (list, tuple)) and len(v) == 3 and all(0 <= int(x) <= 255 for x in v)
+    if k == 'color_hex':
+        return bool(hex_rgb(v))
+    if k in ('auto_target', 'auto_kp', 'auto_ki', 'auto_deadband'):
+        return float(v) >= 0
+    return True
+
+
+def check_set(j):
+    """按 apply_set 的转换校验 set 字段的类型与范围；非法时抛 ValueError（用于保存后才执行的指令，如规则动作）。"""
+    for k, v in j.items():
+        try:
+            ok = _set_field_ok(k, v)
+        except (ValueError, TypeError):
+            ok = False
+        if not ok:
+            raise ValueError('bad ' + k)
+
+
+def apply_set(system_state, j):
+    """处理 set：开关/亮度/亮度模式/日光补偿参数/色温/自定义颜色，并结束当前动画。"""
+    lamp = system_state['lamp']
+    if 'is_on' in j:
+        lamp['is_on'] = bool(j['is_on'])
+    if 'brightness' in j:
+        bv = int(j['brightness'])
+        lamp['brightness'] = max(0, min(100, bv))
+        # an explicit brightness is a manual override unless auto is requested too
+        lamp['brightness_mode'] = 'manual'
+    if j.get('brightness_mode') in ('manual', 'auto'):
+        lamp['brightness_mode'] = j['brightness_mode']
+    # daylight-harvesting tuning
+    dl = system_state['daylight']
+    try:
+        if 'auto_target' in j:
+            dl['target'] = max(0, min(ADC_MAX, int(j['auto_target'])))
+        if 'auto_kp' in j:
+            dl['kp'] = max(0.0, float(j['auto_kp']))
+        if 'auto_ki' in j:
+            dl['ki'] = max(0.0, float(j['auto_ki']))
+        if 'auto_deadband' in j:
+            dl['deadband'] = max(0, int(j['auto_deadband']))
+    except Exception:
+        pass
+    if 'color_mode' in j:
+        cm = j['color_mode']
+        if cm in ('temp', 'custom'):
+            lamp['color_mode'] = cm
+    if 'color_temp_k' in j:
+        try:
+            lamp['color_temp_k'] = int(j['color_temp_k'])
+            lamp['color_mode'] = 'temp'
+        except Exception:
+            pass
+    # custom RGB from list or hex
+    if 'rgb' in j and isinstance(j['rgb'], (list, tuple)) and len(j['rgb']) == 3:
+        try:
+            r, g, b = [max(0, min(255, int(x))) for x in j['rgb']]
+            lamp['custom_rgb'] = (r, g, b)
+            lamp['color_mode'] = 'custom'
+        except Exception:
+            pass
+    elif 'color_hex' in j:
+        try:
+            lamp['custom_rgb'] = hex_rgb(j['color_hex'])
+            lamp['color_mode'] = 'custom'
+        except Exception:
+            pass
+    lamp['animation'] = None
+
+
+def handle_command(system_state, j):
+    """分发一条 JSON 指令；返回需要回复给发送方的 dict（无回复时为 None）。"""
+    cmd = j.get('cmd')
+    if cmd == 'set':
+        apply_set(system_state, j)
+    elif cmd == 'anim':
+        apply_anim(system_state, j)
+    elif cmd == 'schedule':
+        from core import scheduler
+        return scheduler.handle(j)
+    elif cmd == 'rule':
+        from core import rules
+        return rules.handle(j)
+    elif cmd == 'ota':
+        from core import ota
+        return ota.handle(j)
+    elif cmd == 'config':
+        from core import settings
+        return settings.handle(j)
+    elif cmd == 'logs':
+        return log.handle(j)
+    return None
+
+
+async def run_command(system_state, lock, j):
+    """在状态锁内执行一条 JSON 指令并通知 lamp 分区；返回回复 dict（带 req，无回复时为 None）。"""
+    try:
+        await lock.acquire()
+        reply = handle_command(system_state, j)
+    except Exception as e:
+        log.msg(log.COMMAND_ERROR, e)
+        reply = {'cmd': j.get('cmd'), 'ok': False, 'error': str(e)}
+    finally:
+        try:
+            lock.release()
+        except:
+            pass
+    if reply is not None and 'req' in j:
+        reply['req'] = j['req']  # lets the sender match replies to requests
+    events.notify('lamp')
+    return reply
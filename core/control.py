@@ -0,0 +1,58 @@
+# === FILE: core/control.py ===
+# Small closed-loop controllers shared by tasks.
+
+
+class PIController:
+    """带抗积分饱和与滞回死区的 PI 控制器。
+
+    误差进入 deadband 后保持输出不变，直到误差超过 2×deadband 才重新调节，
+    避免传感噪声引起输出来回抖动；输出饱和时停止同向积分（条件积分）。
+    """
+
+    def __init__(self, kp, ki, out_min=0.0, out_max=100.0, deadband=0.0):
+        self.kp = kp
+        self.ki = ki
+        self.out_min = out_min
+        self.out_max = out_max
+        self.deadband = deadband
+        self.integral = 0.0
+        self.output = None
+        self._holding = False
+
+    def reset(self, output=None):
+        """清零状态；给定 output 时做无扰切换（积分项预置为当前输出）。"""
+        self._holding = False
+        if output is None:
+            self.integral = 0.0
+            self.output = None
+        else:
+            self.integral = float(output)
+            self.output = float(output)
+
+    def update(self, setpoint, measured, dt_s):
+        err = setpoint - measured
+        if self.output is not None and self.deadband > 0:
+            limit = self.deadband * 2 if self._holding else self.deadband
+            if -limit <= err <= limit:
+                self._holding = True
+                return self.output
+        self._holding = False
+        integral = self.integral + self.ki * err * dt_s
+        out = self.kp * err + integral
+        if out > self.out_max:
+            out = self.out_max
+            if err < 0:
+                self.integral = integral
+        elif out < self.out_min:
+            out = self.out_min
+            if err > 0:
+                self.integral = integral
+        else:
+            self.integral = integral
+        # keep the integral term itself inside the output range
+        if self.integral > self.out_max:
+            self.integral = self.out_max
+        elif self.integral < self.out_min:
+            self.integral = self.out_min
+        self.output = out
+        return out
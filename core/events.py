@@ -0,0 +1,49 @@
+# === FILE: core/events.py ===
+# Lightweight change notification between tasks.
+# Writers bump a per-section version and wake every subscriber; readers keep
+# the versions they last rendered/handled and compare instead of polling state.
+import uasyncio as asyncio
+
+_versions = {}
+_subscribers = []
+
+
+def notify(section):
+    """标记 system_state 某一分区（sensor/lamp/network/ui...）已变化并唤醒订阅者。"""
+    _versions[section] = _versions.get(section, 0) + 1
+    for ev in _subscribers:
+        ev.set()
+
+
+def version(section):
+    return _versions.get(section, 0)
+
+
+def versions(sections):
+    """返回若干分区的版本号元组，便于与上次比较。"""
+    return tuple(_versions.get(s, 0) for s in sections)
+
+
+def subscribe():
+    """注册一个订阅者，返回其专属 Event（每个订阅者独立 clear）。"""
+    ev = asyncio.Event()
+    _subscribers.append(ev)
+    return ev
+
+
+def unsubscribe(ev):
+    try:
+        _subscribers.remove(ev)
+    except ValueError:
+        pass
+
+
+async def wait(ev, timeout_ms):
+    """等待通知或超时；返回 True 表示被通知唤醒。"""
+    try:
+        await asyncio.wait_for_ms(ev.wait(), timeout_ms)
+        woke = True
+    except asyncio.TimeoutError:
+        woke = False
+    ev.clear()
+    return woke
@@ -0,0 +1,164 @@
+# === FILE: core/filters.py ===
+# Streaming signal processing for sensor readings.
+# Each stage is a primed generator: send() one sample, get one output back.
+# All state lives in fixed-size array ring buffers, so per-sample cost is
+# bounded by the (constant) window size and no memory is allocated per sample.
+import time
+from array import array
+
+MAD_SCALE = 1.4826  # MAD -> sigma for gaussian noise
+
+
+def _insort(buf, n, x):
+    # insert x into sorted buf[0:n] (buf has room for n+1 items)
+    i = n
+    while i > 0 and buf[i - 1] > x:
+        buf[i] = buf[i - 1]
+        i -= 1
+    buf[i] = x
+
+
+def _remove(buf, n, x):
+    # remove one occurrence of x from sorted buf[0:n]
+    i = 0
+    while i < n and buf[i] != x:
+        i += 1
+    while i < n - 1:
+        buf[i] = buf[i + 1]
+        i += 1
+
+
+def _median(buf, n):
+    m = n // 2
+    if n & 1:
+        return buf[m]
+    return (buf[m - 1] + buf[m]) * 0.5
+
+
+def hampel(window=5, k=3.0):
+    """Hampel 离群值剔除：偏离窗口中值超过 k·MAD 的样本以中值替代。"""
+    ring = array('f', [0.0] * window)
+    srt = array('f', [0.0] * window)   # ring contents kept sorted incrementally
+    dev = array('f', [0.0] * window)   # scratch for MAD
+    n = 0
+    idx = 0
+    out = None
+    while True:
+        x = yield out
+        if n == window:
+            _remove(srt, n, ring[idx])
+            n -= 1
+        ring[idx] = x
+        # read back the float32-rounded value so comparisons stay consistent
+        x = ring[idx]
+        _insort(srt, n, x)
+        n += 1
+        idx = (idx + 1) % window
+        med = _median(srt, n)
+        for i in range(n):
+            _insort(dev, i, abs(srt[i] - med))
+        mad = _median(dev, n)
+        if n >= 3 and abs(x - med) > k * MAD_SCALE * mad:
+            out = med
+        else:
+            out = x
+
+
+def ema(alpha=0.3):
+    """指数滑动平均。"""
+    y = None
+    while True:
+        x = yield y
+        y = x if y is None else y + alpha * (x - y)
+
+
+def slope(window=30):
+    """窗口内最小二乘斜率（单位：每样本），用滑动累加和 O(1) 更新。"""
+    ring = array('f', [0.0] * window)
+    n = 0
+    idx = 0
+    s_x = 0.0    # sum x_i
+    s_ix = 0.0   # sum i * x_i, i = 0 oldest .. n-1 newest
+    since_resync = 0
+    out = None
+    while True:
+        x = yield out
+        if n < window:
+            s_ix += n * x
+            s_x += x
+            n += 1
+        else:
+            x0 = ring[idx]
+            s_ix = s_ix - (s_x - x0) + (n - 1) * x
+            s_x = s_x - x0 + x
+        ring[idx] = x
+        idx = (idx + 1) % window
+        since_resync += 1
+        if since_resync >= window:
+            # recompute exactly once per window to cancel float drift
+            since_resync = 0
+            s_x = 0.0
+            s_ix = 0.0
+            start = idx if n == window else 0
+            for i in range(n):
+                v = ring[(start + i) % window]
+                s_x += v
+                s_ix += i * v
+        if n < 2:
+            out = 0.0
+            continue
+        s_i = n * (n - 1) / 2
+        s_ii = (n - 1) * n * (2 * n - 1) / 6
+        out = (n * s_ix - s_i * s_x) / (n * s_ii - s_i * s_i)
+
+
+class Pipeline:
+    """将若干生成器阶段串联；None 输入（读数失败）不推进，返回上一输出。"""
+
+    def __init__(self, *stages):
+        self.stages = stages
+        for g in stages:
+            next(g)
+        self.value = None
+
+    def push(self, x):
+        if x is None:
+            return self.value
+        for g in self.stages:
+            x = g.send(x)
+        self.value = x
+        return x
+
+
+class SensorFilter:
+    """按字段维护 Hampel→EMA 平滑与趋势斜率（单位/分钟）。"""
+
+    def __init__(self, fields, window=5, k=3.0, alpha=0.3, trend_window=30):
+        self.fields = fields
+        self.smooth = {}
+        self.trends = {}
+        for f in fields:
+            self.smooth[f] = Pipeline(hampel(window, k), ema(alpha))
+            self.trends[f] = Pipeline(slope(trend_window))
+        self._last_ms = None
+        self._dt_s = None   # EMA of sample interval, seconds
+
+    def update(self, sample, filtered, trend, now_ms=None):
+        """sample: 字段到原始读数（可为 None）；结果写入 filtered/trend 字典。"""
+        if now_ms is None:
+            now_ms = time.ticks_ms()
+        if self._last_ms is not None:
+            dt = time.ticks_diff(now_ms, self._last_ms) / 1000.0
+            if dt > 0:
+                self._dt_s = dt if self._dt_s is None else self._dt_s + 0.2 * (dt - self._dt_s)
+        self._last_ms = now_ms
+        for f in self.fields:
+            v = self.smooth[f].push(sample.get(f))
+            if v is None:
+                continue
+            filtered[f] = round(v, 2)
+            if sample.get(f) is None:
+                continue
+            per_sample = self.trends[f].push(v)
+            if self._dt_s:
+                trend[f] = round(per_sample * 60.0 / self._dt_s, 2)
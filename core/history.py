@@ -0,0 +1,37 @@
+# === FILE: core/history.py ===
+from array import array
+
+
+class History:
+    """定长 array 环形缓冲，保存最近 n 个采样（用于 OLED 走势图）。"""
+
+    def __init__(self, n, typecode='f'):
+        self.n = n
+        self.buf = array(typecode, [0] * n)
+        self.count = 0
+        self.head = 0   # next write position
+
+    def push(self, v):
+        self.buf[self.head] = v
+        self.head = (self.head + 1) % self.n
+        if self.count < self.n:
+            self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def get(self, i):
+        # i = 0 oldest .. count-1 newest
+        return self.buf[(self.head - self.count + i) % self.n]
+
+    def bounds(self):
+        if not self.count:
+            return 0, 0
+        lo = hi = self.get(0)
+        for i in range(1, self.count):
+            v = self.get(i)
+            if v < lo:
+                lo = v
+            elif v > hi:
+                hi = v
+        return lo, hi
@@ -0,0 +1,158 @@
+# === FILE: core/i2c_bus.py ===
+import uasyncio as asyncio
+import time
+from machine import I2C, Pin
+from core import log
+from config import I2C_BUS_ID, I2C_SDA_PIN, I2C_SCL_PIN, I2C_FREQ_HZ, I2C_DEVICES
+
+# per-device counters: [ops, errors, last_us, max_us, total_us]
+_OPS = 0
+_ERRORS = 1
+_LAST_US = 2
+_MAX_US = 3
+_TOTAL_US = 4
+
+
+class _Batch:
+    # async context manager returned by I2CBus.batch()
+    def __init__(self, bus):
+        self.bus = bus
+
+    async def __aenter__(self):
+        await self.bus.acquire()
+        return self.bus
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.bus.release()
+        return False
+
+
+class I2CBus:
+    """共享 I2C 总线：统一频率、协程锁串行化事务，并统计各设备错误/耗时。
+
+    同步的 writeto/readfrom/writevto 与 machine.I2C 接口一致，可直接交给
+    ssd1306 等驱动使用；异步调用方先 acquire()（或 async with bus.batch()）
+    再在锁内连续访问，锁只在单次短事务期间持有。
+    """
+
+    def __init__(self, bus_id=I2C_BUS_ID, scl_pin=I2C_SCL_PIN, sda_pin=I2C_SDA_PIN, freq=I2C_FREQ_HZ):
+        self.freq = freq
+        self.i2c = I2C(bus_id, scl=Pin(scl_pin), sda=Pin(sda_pin), freq=freq)
+        self.lock = asyncio.Lock()
+        self.stats = {}
+
+    # ---------------- locking -----------------
+    async def acquire(self):
+        await self.lock.acquire()
+
+    def release(self):
+        try:
+            self.lock.release()
+        except Exception:
+            pass
+
+    def batch(self):
+        """返回异步上下文管理器，在一次加锁区间内执行多次读写。"""
+        return _Batch(self)
+
+    # ---------------- counted transfers -----------------
+    def _counter(self, addr):
+        c = self.stats.get(addr)
+        if c is None:
+            c = [0, 0, 0, 0, 0]
+            self.stats[addr] = c
+        return c
+
+    def _done(self, addr, t0, ok):
+        c = self._counter(addr)
+        dt = time.ticks_diff(time.ticks_us(), t0)
+        c[_OPS] += 1
+        if not ok:
+            c[_ERRORS] += 1
+        c[_LAST_US] = dt
+        if dt > c[_MAX_US]:
+            c[_MAX_US] = dt
+        c[_TOTAL_US] += dt
+
+    def writeto(self, addr, buf, stop=True):
+        t0 = time.ticks_us()
+        try:
+            n = self.i2c.writeto(addr, buf, stop)
+        except Exception:
+            self._done(addr, t0, False)
+            raise
+        self._done(addr, t0, True)
+        return n
+
+    def writevto(self, addr, vector, stop=True):
+        t0 = time.ticks_us()
+        try:
+            n = self.i2c.writevto(addr, vector, stop)
+        except Exception:
+            self._done(addr, t0, False)
+            raise
+        self._done(addr, t0, True)
+        return n
+
+    def readfrom(self, addr, nbytes, stop=True):
+        t0 = time.ticks_us()
+        try:
+            data = self.i2c.readfrom(addr, nbytes, stop)
+        except Exception:
+            self._done(addr, t0, False)
+            raise
+        self._done(addr, t0, True)
+        return data
+
+    def readfrom_into(self, addr, buf, stop=True):
+        t0 = time.ticks_us()
+        try:
+            self.i2c.readfrom_into(addr, buf, stop)
+        except Exception:
+            self._done(addr, t0, False)
+            raise
+        self._done(addr, t0, True)
+
+    # ---------------- diagnostics -----------------
+    def scan(self, expected=None):
+        """启动时扫描总线，返回缺失设备名列表（expected: 名称到地址的映射）。"""
+        if expected is None:
+            expected = I2C_DEVICES
+        try:
+            found = self.i2c.scan()
+        except Exception as e:
+            log.msg(log.I2C_SCAN_ERROR, e)
+            found = []
+        log.msg(log.I2C_SCAN, '{}Hz {}'.format(self.freq, ' '.join('{:02x}'.format(a) for a in found)))
+        missing = []
+        for name, addr in expected.items():
+            if addr not in found:
+                missing.append(name)
+        if missing:
+            # one record for all of them: a second one would be rate limited
+            log.msg(log.I2C_MISSING, ' '.join(missing))
+        return missing
+
+    def report(self):
+        """返回各设备计数 {addr_hex: {ops, errors, last_us, max_us, avg_us}}。"""
+        out = {}
+        for addr, c in self.stats.items():
+            out['0x{:02x}'.format(addr)] = {
+                'ops': c[_OPS],
+                'errors': c[_ERRORS],
+                'last_us': c[_LAST_US],
+                'max_us': c[_MAX_US],
+                'avg_us': c[_TOTAL_US] // c[_OPS] if c[_OPS] else 0,
+            }
+        return out
+
+
+_bus = None
+
+
+def get_bus():
+    """返回进程内唯一的 I2CBus（首次调用时创建 I2C(0)）。"""
+    global _bus
+    if _bus is None:
+        _bus = I2CBus()
+    return _bus
@@ -0,0 +1,217 @@
+# === FILE: core/interrupts.py ===
+# IRQ-driven key input.
+# Pin IRQ handlers only timestamp edges into a preallocated ring and wake the
+# input task; debounce and gesture recognition run in the task from those
+# timestamps, so an idle lamp costs no wakeups at all.
+import micropython
+import time
+import uasyncio as asyncio
+from array import array
+from machine import Pin
+
+EDGE_RING = 32
+
+# gesture names emitted by GestureRecognizer
+CLICK = 'click'
+DOUBLE = 'double'
+LONG = 'long'
+REPEAT = 'repeat'
+
+
+class _Wakeup:
+    # ThreadSafeFlag stand-in for firmware without it: the IRQ schedules set()
+    def __init__(self):
+        self._ev = asyncio.Event()
+        self._set_ref = self._set
+
+    def _set(self, _):
+        self._ev.set()
+
+    def set(self):
+        try:
+            micropython.schedule(self._set_ref, 0)
+        except RuntimeError:
+            pass  # schedule queue full; the next edge wakes us
+
+    async def wait(self):
+        await self._ev.wait()
+        self._ev.clear()
+
+
+class KeyIRQ:
+    """为每个按键引脚注册双边沿中断，中断内只记录 (时间戳, 键, 电平) 到环形缓冲。"""
+
+    def __init__(self, pins, ring=EDGE_RING):
+        self.names = list(pins)
+        self.pins = [pins[n] for n in self.names]
+        self.ts = array('I', [0] * ring)
+        self.key = bytearray(ring)
+        self.level = bytearray(ring)
+        self.size = ring
+        self.head = 0      # written by IRQ
+        self.tail = 0      # read by task
+        self.dropped = 0
+        try:
+            self.flag = asyncio.ThreadSafeFlag()
+        except AttributeError:
+            self.flag = _Wakeup()
+        for i, pin in enumerate(self.pins):
+            pin.irq(trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, handler=self._handler(i))
+
+    def _handler(self, idx):
+        pin = self.pins[idx]
+
+        def isr(_):
+            h = self.head
+            nxt = (h + 1) % self.size
+            if nxt == self.tail:
+                self.dropped += 1
+            else:
+                self.ts[h] = time.ticks_ms()
+                self.key[h] = idx
+                self.level[h] = pin.value()
+                self.head = nxt
+            self.flag.set()
+        return isr
+
+    def pending(self):
+        return self.head != self.tail
+
+    def pop(self):
+        # -> (ticks_ms, key index, level); only call when pending()
+        t = self.tail
+        item = (self.ts[t], self.key[t], self.level[t])
+        self.tail = (t + 1) % self.size
+        return item
+
+    def value(self, idx):
+        return self.pins[idx].value()
+
+    async def wait(self, timeout_ms=None):
+        """睡眠直到有新边沿；timeout_ms 为 None 时无限期等待。"""
+        if self.pending():
+            return True
+        if timeout_ms is None:
+            await self.flag.wait()
+            return True
+        try:
+            await asyncio.wait_for_ms(self.flag.wait(), max(0, timeout_ms))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class GestureRecognizer:
+    """基于边沿时间戳的去抖与手势识别：单击、双击、长按、按住连发（逐渐加速）。
+
+    double_keys 中的键在松开后等待 double_ms 判断是否双击，其它键松开即发出单击；
+    repeat_keys 中的键按住后发出加速的 repeat 事件，其它键按住超过 longpress_ms
+    发出一次 long。
+    """
+
+    def __init__(self, names, debounce_ms=20, longpress_ms=1500, double_ms=250,
+                 double_keys=(), repeat_keys=(), repeat_delay_ms=400,
+                 repeat_start_ms=200, repeat_min_ms=40):
+        n = len(names)
+        self.names = names
+        self.debounce_ms = debounce_ms
+        self.longpress_ms = longpress_ms
+        self.double_ms = double_ms
+        self.repeat_delay_ms = repeat_delay_ms
+        self.repeat_start_ms = repeat_start_ms
+        self.repeat_min_ms = repeat_min_ms
+        self.double = bytearray(n)
+        self.repeat = bytearray(n)
+        for i in range(n):
+            self.double[i] = 1 if names[i] in double_keys else 0
+            self.repeat[i] = 1 if names[i] in repeat_keys else 0
+        self.down = bytearray(n)          # debounced state, 1 = pressed
+        self.last_edge = array('I', [0] * n)
+        self.t_down = array('I', [0] * n)
+        self.t_up = array('I', [0] * n)
+        self.clicks = bytearray(n)        # releases waiting for the double-click window
+        self.long_sent = bytearray(n)
+        self.next_rep = array('I', [0] * n)
+        self.rep_iv = array('I', [0] * n)
+        self.rep_count = array('I', [0] * n)
+        self.unsettled = bytearray(n)     # an edge was dropped by debounce; re-check level
+
+    @staticmethod
+    def _diff(a, b):
+        return time.ticks_diff(a, b)
+
+    def feed(self, t, idx, level, out):
+        """处理一个原始边沿（level: 0 按下 / 1 松开，低电平有效）。"""
+        pressed = 1 if level == 0 else 0
+        if self._diff(t, self.last_edge[idx]) < self.debounce_ms or pressed == self.down[idx]:
+            self.unsettled[idx] = 1
+            return
+        self.last_edge[idx] = t
+        self.unsettled[idx] = 0
+        self.down[idx] = pressed
+        name = self.names[idx]
+        if pressed:
+            self.t_down[idx] = t
+            self.long_sent[idx] = 0
+            self.rep_count[idx] = 0
+            self.next_rep[idx] = time.ticks_add(t, self.repeat_delay_ms)
+            self.rep_iv[idx] = self.repeat_start_ms
+            return
+        self.t_up[idx] = t
+        if self.long_sent[idx] or self.rep_count[idx]:
+            return  # hold already produced its gesture
+        if self.double[idx]:
+            self.clicks[idx] += 1
+            if self.clicks[idx] >= 2:
+                self.clicks[idx] = 0
+                out.append((name, DOUBLE, 0))
+        else:
+            out.append((name, CLICK, 0))
+
+    def poll(self, now, out, levels=None):
+        """处理到期的计时（双击窗口、长按、连发）；levels(idx) 用于去抖后的电平复核。"""
+        for idx in range(len(self.names)):
+            if self.unsettled[idx] and levels is not None and \
+                    self._diff(now, self.last_edge[idx]) >= self.debounce_ms:
+                self.unsettled[idx] = 0
+                lvl = levels(idx)
+                if (1 if lvl == 0 else 0) != self.down[idx]:
+                    # the last real transition was swallowed by debounce
+                    self.feed(now, idx, lvl, out)
+            name = self.names[idx]
+            if self.clicks[idx] and not self.down[idx] and \
+                    self._diff(now, self.t_up[idx]) >= self.double_ms:
+                self.clicks[idx] = 0
+                out.append((name, CLICK, 0))
+            if not self.down[idx]:
+                continue
+            if self.repeat[idx]:
+                if self._diff(now, self.next_rep[idx]) >= 0:
+                    self.rep_count[idx] += 1
+                    out.append((name, REPEAT, self.rep_count[idx]))
+                    self.next_rep[idx] = time.ticks_add(now, self.rep_iv[idx])
+                    self.rep_iv[idx] = max(self.repeat_min_ms, self.rep_iv[idx] * 4 // 5)
+            elif not self.long_sent[idx] and self._diff(now, self.t_down[idx]) >= self.longpress_ms:
+                self.long_sent[idx] = 1
+                out.append((name, LONG, 0))
+
+    def next_deadline(self, now):
+        """距下一个计时事件的毫秒数；无待处理计时返回 None（任务可无限期睡眠）。"""
+        best = None
+        for idx in range(len(self.names)):
+            cands = []
+            if self.unsettled[idx]:
+                cands.append(self.debounce_ms - self._diff(now, self.last_edge[idx]))
+            if self.clicks[idx]:
+                cands.append(self.double_ms - self._diff(now, self.t_up[idx]))
+            if self.down[idx]:
+                if self.repeat[idx]:
+                    cands.append(self._diff(self.next_rep[idx], now))
+                elif not self.long_sent[idx]:
+                    cands.append(self.longpress_ms - self._diff(now, self.t_down[idx]))
+            for c in cands:
+                if best is None or c < best:
+                    best = c
+        if best is None:
+            return None
+        return best if best > 0 else 0
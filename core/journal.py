@@ -0,0 +1,208 @@
+# === FILE: core/journal.py ===
+# Append-only key/value journal on flash. Each put is a small CRC-checked
+# record appended to the active segment file; when a segment fills up a new
+# one is started with a snapshot of every live key and only then are the
+# older segments deleted, so a reset at any point leaves a readable state.
+# Writes rotate through fresh files instead of rewriting one file in place,
+# and puts are coalesced in RAM until the caller flushes (debounced by
+# persist_task), so a burst of MQTT slider updates costs one record.
+import os
+import time
+import ujson
+import struct
+import binascii
+
+MAGIC = 0xA5
+HEADER = '<BHI'             # magic, payload length, crc32(payload)
+HEADER_LEN = struct.calcsize(HEADER)
+SUFFIX = '.jnl'
+
+
+def encode(key, value):
+    """编码一条记录：头部（魔数/长度/CRC32）+ JSON 负载。"""
+    payload = ujson.dumps([key, value]).encode()
+    return struct.pack(HEADER, MAGIC, len(payload), binascii.crc32(payload) & 0xFFFFFFFF) + payload
+
+
+def decode(data, state):
+    """依次重放 data 中的记录到 state；返回有效字节数（遇到残缺/损坏记录即停止）。"""
+    pos = 0
+    n = len(data)
+    while pos + HEADER_LEN <= n:
+        magic, size, crc = struct.unpack_from(HEADER, data, pos)
+        end = pos + HEADER_LEN + size
+        if magic != MAGIC or end > n:
+            break
+        payload = data[pos + HEADER_LEN:end]
+        if binascii.crc32(payload) & 0xFFFFFFFF != crc:
+            break
+        try:
+            key, value = ujson.loads(payload)
+        except Exception:
+            break
+        if value is None:
+            state.pop(key, None)
+        else:
+            state[key] = value
+        pos = end
+    return pos
+
+
+class Journal:
+    """带 CRC 的追加式日志：轮转段文件、快照压缩、内存合并写入。"""
+
+    def __init__(self, prefix='state', seg_bytes=4096, root='.'):
+        self.prefix = prefix
+        self.seg_bytes = seg_bytes
+        self.root = root
+        self.state = {}         # committed (on flash) values
+        self.pending = {}       # puts not yet written
+        self.first_put_ms = None
+        self.last_put_ms = None
+        self.seq = 0
+        self.size = 0
+        self.stats = {'records': 0, 'compactions': 0, 'torn': 0, 'bytes': 0}
+        self._load()
+
+    # ---------------- files -----------------
+    def _path(self, seq):
+        return '{}/{}{}{}'.format(self.root, self.prefix, seq, SUFFIX)
+
+    def _segments(self):
+        segs = []
+        for name in os.listdir(self.root):
+            if name.startswith(self.prefix) and name.endswith(SUFFIX):
+                try:
+                    segs.append(int(name[len(self.prefix):-len(SUFFIX)]))
+                except ValueError:
+                    pass
+        segs.sort()
+        return segs
+
+    def _load(self):
+        segs = self._segments()
+        torn = False
+        for seq in segs:
+            try:
+                with open(self._path(seq), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            good = decode(data, self.state)
+            if good != len(data):
+                # a reset mid-append leaves a partial record at the tail
+                torn = True
+                self.stats['torn'] += 1
+            self.seq = seq
+            self.size = good
+        if not segs:
+            self._compact(0)
+        elif torn or len(segs) > 1:
+            # never append behind a damaged record; a fresh snapshot also
+            # drops segments a previous compaction did not finish deleting
+            self._compact(self.seq + 1)
+
+    def _append(self, records):
+        with open(self._path(self.seq), 'ab') as f:
+            f.write(records)
+        self.size += len(records)
+        self.stats['bytes'] += len(records)
+
+    def _compact(self, seq):
+        """写入新段（全部键的快照），完成后再删除旧段。"""
+        old = [s for s in self._segments() if s < seq]
+        snap = b''.join(encode(k, v) for k, v in self.state.items())
+        with open(self._path(seq), 'wb') as f:
+            f.write(snap)
+        self.seq = seq
+        self.size = len(snap)
+        self.stats['bytes'] += len(snap)
+        for s in old:
+            try:
+                os.remove(self._path(s))
+            except OSError:
+                pass
+        if old:
+            self.stats['compactions'] += 1
+
+    # ---------------- API -----------------
+    def get(self, key, default=None):
+        """读取键的最新值（含尚未落盘的值）。"""
+        if key in self.pending:
+            v = self.pending[key]
+            return default if v is None else v
+        return self.state.get(key, default)
+
+    def put(self, key, value):
+        """更新键值（value=None 表示删除）；仅记入内存，由 flush() 合并写入。"""
+        now = time.ticks_ms()
+        if self.first_put_ms is None:
+            self.first_put_ms = now
+        self.last_put_ms = now
+        self.pending[key] = value
+
+    def delete(self, key):
+        self.put(key, None)
+
+    def due(self, debounce_ms, max_delay_ms, now=None):
+        """距最后一次 put 已静默 debounce_ms，或首个待写已等待 max_delay_ms 时返回 True。"""
+        if not self.pending:
+            return False
+        if now is None:
+            now = time.ticks_ms()
+        return (time.ticks_diff(now, self.last_put_ms) >= debounce_ms
+                or time.ticks_diff(now, self.first_put_ms) >= max_delay_ms)
+
+    def flush(self):
+        """把待写键值追加到当前段（值未变化的跳过）；返回写入的记录数。"""
+        pending = self.pending
+        self.pending = {}
+        self.first_put_ms = self.last_put_ms = None
+        recs = []
+        undo = {}
+        for k, v in pending.items():
+            if v is None:
+                if k not in self.state:
+                    continue
+            elif self.state.get(k) == v:
+                continue
+            undo[k] = self.state.get(k)
+            recs.append(encode(k, v))
+            if v is None:
+                self.state.pop(k)
+            else:
+                self.state[k] = v
+        if not recs:
+            return 0
+        data = b''.join(recs)
+        try:
+            if self.size + len(data) > self.seg_bytes:
+                # state already holds the new values, so the snapshot covers them
+                self._compact(self.seq + 1)
+            else:
+                self._append(data)
+        except OSError:
+            # keep the values queued so the next flush retries them
+            for k, v in undo.items():
+                if v is None:
+                    self.state.pop(k, None)
+                else:
+                    self.state[k] = v
+            for k, v in pending.items():
+                self.pending.setdefault(k, v)
+            self.first_put_ms = self.last_put_ms = time.ticks_ms()
+            raise
+        self.stats['records'] += len(recs)
+        return len(recs)
+
+
+_journal = None
+
+
+def get_journal():
+    """返回全局 Journal 单例（首次调用时从闪存重放）。"""
+    global _journal
+    if _journal is None:
+        from config import JOURNAL_PREFIX, JOURNAL_SEG_BYTES
+        _journal = Journal(JOURNAL_PREFIX, JOURNAL_SEG_BYTES)
+    return _journal
@@ -0,0 +1,37 @@
+# === FILE: core/lazy.py ===
+# Deferred imports. `mod = lazy('umqtt.simple')` at module level costs nothing
+# at import time; the real module is imported on the first attribute access
+# (e.g. mod.MQTTClient) and the load time is recorded for the boot profile.
+import time
+
+loaded = {}     # module name -> import cost in us, for modules loaded through a proxy
+
+
+class LazyModule:
+    """模块代理：首次访问属性时才真正导入。"""
+
+    def __init__(self, name):
+        self._name = name
+        self._mod = None
+
+    def _load(self):
+        t0 = time.ticks_us()
+        # __import__ returns the top package of a dotted name: walk down to the leaf
+        # (a fake fromlist would show up as a bogus 'pkg.mod._' in the import profile)
+        mod = __import__(self._name)
+        for part in self._name.split('.')[1:]:
+            mod = getattr(mod, part)
+        loaded[self._name] = time.ticks_diff(time.ticks_us(), t0)
+        self._mod = mod
+        return mod
+
+    def __getattr__(self, attr):
+        mod = self._mod
+        if mod is None:
+            mod = self._load()
+        return getattr(mod, attr)
+
+
+def lazy(name):
+    """返回模块 name 的延迟导入代理。"""
+    return LazyModule(name)
@@ -0,0 +1,273 @@
+# === FILE: core/log.py ===
+# Structured logger. A message is a numeric code from MESSAGES (level + fixed
+# text) plus an optional short detail (exception text, a value). Records go
+# into a preallocated binary ring of LOG_ENTRIES x RECORD bytes and are
+# printed only when LOG_CONSOLE is set. A warning or error code that repeats
+# within LOG_REPEAT_MS is only counted: it is neither stored nor printed
+# again, and its next record carries the number of occurrences it stands for.
+# So a dead sensor costs one record a minute instead of a UART write every
+# second. Info messages (a rule or schedule fired, NTP synced) are discrete
+# events and always recorded.
+# {"cmd": "logs"} pages through the ring over MQTT (or the local API once
+# API_TOKEN is set).
+import struct
+import time
+from config import LOG_ENTRIES, LOG_LEVEL, LOG_CONSOLE, LOG_REPEAT_MS, LOG_PAGE_MAX
+
+INFO = 1
+WARN = 2
+ERROR = 3
+LEVELS = {'info': INFO, 'warn': WARN, 'error': ERROR}
+LEVEL_CHARS = ' IWE'
+
+# seq, ticks_ms, code, level, detail length, repeats, detail bytes
+HEAD = '<IIHBBH'
+HEAD_SIZE = struct.calcsize(HEAD)
+RECORD = 40
+DETAIL = RECORD - HEAD_SIZE
+
+# codes are stable (dumps are decoded with this table): never reuse a retired one
+# 1xx sensors and buses
+DHT_READ = 101
+SGP30_INIT = 102
+SGP30_READ = 103
+SGP30_HUMIDITY = 104
+LIGHT_READ = 105
+SENSOR_TASK = 106
+I2C_SCAN = 110
+I2C_SCAN_ERROR = 111
+I2C_MISSING = 112
+I2C_INIT = 113
+# 2xx network
+MQTT_CONNECT = 201
+MQTT_CHECK = 202
+MQTT_PAYLOAD = 203
+MQTT_TASK = 204
+NTP_ERROR = 210
+NTP_SYNCED = 211
+NTP_RETRY = 212
+RTC_SET = 213
+CLOCK_LISTENER = 214
+CLOCK_TASK = 215
+WIFI_TASK = 220
+STA_CONNECT = 221
+STA_SCAN = 222
+STA_ACTIVATE = 223
+AP_STARTED = 224
+AP_FAILED = 225
+WIFI_SAVED = 226
+WIFI_SAVE_FAILED = 227
+PORTAL_TIMEOUT = 228
+PORTAL_STARTED = 229
+PORTAL_FAILED = 230
+PORTAL_DNS = 231
+PORTAL_SCAN = 232
+PORTAL_CLIENT = 233
+API_STARTED = 240
+API_STOPPED = 241
+API_SERVER = 242
+API_CLIENT = 243
+SHADOW_APPLIED = 250
+SHADOW_ERROR = 251
+# 3xx lamp and user interface
+ACTUATOR_TASK = 301
+STRIP_WRITE = 302
+DAYLIGHT_TASK = 303
+DISPLAY_TASK = 304
+INPUT_TASK = 305
+RGB_LED = 306
+SCHEDULE_FIRED = 310
+SCHEDULER_TASK = 311
+RULE_FIRED = 312
+RULE_ACTION = 313
+# 4xx system
+BOOT = 401
+TASK_DIED = 402
+LAMP_RESTORED = 403
+RESTORE_ERROR = 404
+PERSIST_TASK = 405
+COMMAND_ERROR = 406
+SETTINGS_IGNORED = 407
+SETTINGS_SAVE = 408
+POWER_FREQ = 409
+POWER_WLAN = 410
+POWER_TASK = 411
+FATAL = 412
+# 5xx OTA
+OTA_BEGIN = 501
+OTA_COMMITTED = 502
+OTA_FETCH = 503
+OTA_CONFIRMED = 504
+OTA_TRIAL_FAILED = 505
+
+MESSAGES = {
+    DHT_READ: (WARN, 'DHT22 read error'),
+    SGP30_INIT: (ERROR, 'SGP30 init error'),
+    SGP30_READ: (WARN, 'SGP30 read error'),
+    SGP30_HUMIDITY: (WARN, 'SGP30 humidity compensation error'),
+    LIGHT_READ: (WARN, 'LightSensor read error'),
+    SENSOR_TASK: (ERROR, 'sensor_task error'),
+    I2C_SCAN: (INFO, 'I2C scan'),
+    I2C_SCAN_ERROR: (ERROR, 'I2C scan error'),
+    I2C_MISSING: (ERROR, 'I2C device missing'),
+    I2C_INIT: (ERROR, 'I2C bus init failed'),
+    MQTT_CONNECT: (WARN, 'MQTT connect failed'),
+    MQTT_CHECK: (WARN, 'MQTT check_msg error'),
+    MQTT_PAYLOAD: (WARN, 'Invalid mqtt payload'),
+    MQTT_TASK: (ERROR, 'mqtt_client_task error'),
+    NTP_ERROR: (WARN, 'NTP error'),
+    NTP_SYNCED: (INFO, 'NTP synced'),
+    NTP_RETRY: (WARN, 'NTP sync failed, retrying'),
+    RTC_SET: (ERROR, 'RTC set failed'),
+    CLOCK_LISTENER: (ERROR, 'clock listener error'),
+    CLOCK_TASK: (ERROR, 'clock_task error'),
+    WIFI_TASK: (ERROR, 'wifi_manager_task error'),
+    STA_CONNECT: (WARN, 'STA start/connect error'),
+    STA_SCAN: (WARN, 'STA scan error'),
+    STA_ACTIVATE: (ERROR, 'STA activate error'),
+    AP_STARTED: (INFO, 'AP started'),
+    AP_FAILED: (ERROR, 'AP start failed'),
+    WIFI_SAVED: (INFO, 'WiFi config saved via captive portal'),
+    WIFI_SAVE_FAILED: (ERROR, 'save wifi config error'),
+    PORTAL_TIMEOUT: (WARN, 'Captive portal timeout, retrying AP'),
+    PORTAL_STARTED: (INFO, 'Captive portal running'),
+    PORTAL_FAILED: (ERROR, 'Captive portal start failed'),
+    PORTAL_DNS: (WARN, 'captive dns error'),
+    PORTAL_SCAN: (WARN, 'captive scan error'),
+    PORTAL_CLIENT: (WARN, 'captive handler error'),
+    API_STARTED: (INFO, 'Local API started'),
+    API_STOPPED: (INFO, 'Local API stopped'),
+    API_SERVER: (ERROR, 'api server error'),
+    API_CLIENT: (WARN, 'api client error'),
+    SHADOW_APPLIED: (INFO, 'Shadow desired applied'),
+    SHADOW_ERROR: (WARN, 'shadow desired error'),
+    ACTUATOR_TASK: (ERROR, 'actuator_task error'),
+    STRIP_WRITE: (ERROR, 'ws2811 write error'),
+    DAYLIGHT_TASK: (ERROR, 'daylight_task error'),
+    DISPLAY_TASK: (ERROR, 'display_task error'),
+    INPUT_TASK: (ERROR, 'input_task error'),
+    RGB_LED: (WARN, 'IndicatorRGB error'),
+    SCHEDULE_FIRED: (INFO, 'Schedule fired'),
+    SCHEDULER_TASK: (ERROR, 'scheduler_task error'),
+    RULE_FIRED: (INFO, 'Rule fired'),
+    RULE_ACTION: (WARN, 'rule action error'),
+    BOOT: (INFO, 'Starting main'),
+    TASK_DIED: (ERROR, 'Task finished unexpectedly'),
+    LAMP_RESTORED: (INFO, 'Lamp state restored'),
+    RESTORE_ERROR: (ERROR, 'lamp state restore error'),
+    PERSIST_TASK: (ERROR, 'persist_task error'),
+    COMMAND_ERROR: (WARN, 'command error'),
+    SETTINGS_IGNORED: (WARN, 'settings: ignoring'),
+    SETTINGS_SAVE: (ERROR, 'settings: save failed'),
+    POWER_FREQ: (WARN, 'power: freq failed'),
+    POWER_WLAN: (WARN, 'power: WLAN pm failed'),
+    POWER_TASK: (ERROR, 'power_task error'),
+    FATAL: (ERROR, 'Fatal in main'),
+    OTA_BEGIN: (INFO, 'OTA: begin'),
+    OTA_COMMITTED: (INFO, 'OTA: committed, restarting'),
+    OTA_FETCH: (ERROR, 'OTA: fetch failed'),
+    OTA_CONFIRMED: (INFO, 'OTA: confirmed'),
+    OTA_TRIAL_FAILED: (ERROR, 'OTA: trial failed'),
+}
+
+_buf = bytearray(LOG_ENTRIES * RECORD)
+_seq = 0                # sequence number of the next record
+_last = {}              # code -> ticks_ms of its last stored record
+_suppressed = {}        # code -> occurrences counted since then
+_totals = [0, 0, 0, 0]  # occurrences per level, stored or not
+
+
+def _text(detail):
+    d = str(detail).encode()
+    if len(d) <= DETAIL:
+        return d
+    d = d[:DETAIL]
+    # do not leave half a UTF-8 character at the cut
+    for _ in range(3):
+        try:
+            d.decode()
+            break
+        except UnicodeError:
+            d = d[:-1]
+    return d
+
+
+def msg(code, detail=None):
+    """记录一条消息；warn/error 同一代码 LOG_REPEAT_MS 内重复出现只计数。"""
+    global _seq
+    level, text = MESSAGES.get(code, (ERROR, '?'))
+    _totals[level] += 1
+    if level < LOG_LEVEL:
+        return
+    now = time.ticks_ms()
+    if level >= WARN:
+        last = _last.get(code)
+        if last is not None and time.ticks_diff(now, last) < LOG_REPEAT_MS:
+            _suppressed[code] = _suppressed.get(code, 0) + 1
+            return
+        _last[code] = now
+    repeats = _suppressed.pop(code, 0)
+    d = _text(detail) if detail is not None else b''
+    off = (_seq % LOG_ENTRIES) * RECORD
+    struct.pack_into(HEAD, _buf, off, _seq, now, code, level, len(d), min(repeats, 0xFFFF))
+    _buf[off + HEAD_SIZE:off + HEAD_SIZE + len(d)] = d
+    _seq += 1
+    if LOG_CONSOLE:
+        line = '{}{} {}'.format(LEVEL_CHARS[level], code, text)
+        if d:
+            line += ': ' + d.decode()
+        if repeats:
+            line += ' (+{} repeats)'.format(repeats)
+        print(line)
+
+
+def entry(seq):
+    """按序号读取一条记录（已被覆盖或尚未写入返回 None）。"""
+    if seq < 0 or seq >= _seq or seq < _seq - LOG_ENTRIES:
+        return None
+    off = (seq % LOG_ENTRIES) * RECORD
+    s, ticks, code, level, n, repeats = struct.unpack_from(HEAD, _buf, off)
+    return s, ticks, code, level, bytes(_buf[off + HEAD_SIZE:off + HEAD_SIZE + n]).decode(), repeats
+
+
+def summary():
+    """status 上报：各级别累计次数、被限流次数与最新序号。"""
+    return {'info': _totals[INFO], 'warn': _totals[WARN], 'error': _totals[ERROR],
+            'suppressed': sum(_suppressed.values()), 'seq': _seq}
+
+
+def handle(j):
+    """处理 {"cmd":"logs","since":序号,"max":条数,"level":"warn"}：从 since 起按页返回记录。"""
+    from core import clock
+    reply = {'cmd': 'logs', 'ok': True}
+    try:
+        first = max(0, _seq - LOG_ENTRIES)
+        since = int(j.get('since', first))
+        limit = max(1, min(LOG_PAGE_MAX, int(j.get('max', LOG_PAGE_MAX))))
+        min_level = LEVELS.get(j.get('level', 'info'))
+        if min_level is None:
+            raise ValueError('bad level')
+    except (ValueError, TypeError) as e:
+        reply['ok'] = False
+        reply['error'] = str(e)
+        return reply
+    if since < first:
+        reply['lost'] = first - since   # overwritten before they were fetched
+        since = first
+    now_ms = clock.now_ms()
+    now = time.ticks_ms()
+    out = []
+    seq = since
+    while seq < _seq and len(out) < limit:
+        e = entry(seq)
+        seq += 1
+        if e[3] < min_level:
+            continue
+        s, ticks, code, level, detail, repeats = e
+        out.append({'seq': s, 'ts': now_ms - time.ticks_diff(now, ticks), 'level': LEVEL_CHARS[level],
+                    'code': code, 'msg': MESSAGES.get(code, (0, '?'))[1], 'detail': detail, 'repeats': repeats})
+    reply['entries'] = out
+    reply['next'] = seq
+    reply['more'] = seq < _seq
+    reply['summary'] = summary()
+    return reply
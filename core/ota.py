@@ -0,0 +1,451 @@
+# === FILE: core/ota.py ===
+# Over-the-air update, receiving half (ota_boot.py does the swap at boot).
+#
+# A package is a manifest {"version", "files": {path: {"sha256", "size"}},
+# "delete": [path]} plus the files it lists. begin() compares the manifest
+# with the installed hashes (ota_manifest.json, or the files themselves) so
+# only changed files are transferred. Each file streams into STAGE_DIR, from
+# MQTT chunks (stop-and-wait, the reply names the next offset) or an HTTP
+# pull, through one fixed OTA_BUF buffer while its SHA-256 is updated
+# incrementally; a staged file that fails its hash is thrown away. commit()
+# hands the verified set to ota_boot and resets. After the swap the new
+# version runs on trial: supervise() confirms it once every task survived
+# OTA_HEALTHY_S with MQTT connected, otherwise it is marked unhealthy and
+# the next boot restores the backups.
+import os
+import time
+import hashlib
+import binascii
+import ujson
+import uasyncio as asyncio
+import ota_boot
+from ota_boot import STAGE_DIR, PROTECTED, PROTECTED_DIRS
+from core import log
+from config import OTA_BUF, OTA_MAX_FILE, OTA_HEALTHY_S, OTA_HEALTH_TIMEOUT_S, OTA_RESET_DELAY_MS
+
+MAX_MANIFEST = 16 * 1024        # bytes accepted for a fetched manifest.json
+MAX_FILES = 128
+FREE_MARGIN = 8 * 1024          # keep this much flash free after staging
+
+
+def file_sha256(path, buf=None):
+    """以固定缓冲区计算文件 SHA-256（十六进制）；文件不存在返回 None。"""
+    return _hash_prefix(path, -1, buf)[0]
+
+
+def _hash_prefix(path, limit, buf=None):
+    """计算文件前 limit 字节（-1 为全部）的 SHA-256；返回 (hex 或 None, hash 对象, 已读字节数)。"""
+    h = hashlib.sha256()
+    n = 0
+    buf = buf or bytearray(OTA_BUF)
+    mv = memoryview(buf)
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return None, h, 0
+    with f:
+        while limit < 0 or n < limit:
+            want = len(buf) if limit < 0 else min(len(buf), limit - n)
+            got = f.readinto(mv[:want])
+            if not got:
+                break
+            h.update(mv[:got])
+            n += got
+    if limit < 0:
+        return _hex(h), None, n
+    return None, h, n
+
+
+def _hex(h):
+    return binascii.hexlify(h.digest()).decode()
+
+
+def check_path(path):
+    """校验清单中的相对路径；非法时抛 ValueError。"""
+    if not isinstance(path, str) or not path or path[0] == '/' or '\\' in path:
+        raise ValueError('bad path')
+    parts = path.split('/')
+    if '..' in parts or '.' in parts or '' in parts:
+        raise ValueError('bad path')
+    if path in PROTECTED or parts[0] in PROTECTED_DIRS or path.endswith('.tmp'):
+        raise ValueError('protected path ' + path)
+
+
+def check_manifest(m):
+    """校验清单并返回 (version, files, delete)；非法时抛 ValueError。"""
+    if not isinstance(m, dict) or not isinstance(m.get('files'), dict):
+        raise ValueError('bad manifest')
+    version = m.get('version')
+    if not isinstance(version, str) or not version or len(version) > 32:
+        raise ValueError('bad version')
+    files = m['files']
+    if len(files) > MAX_FILES:
+        raise ValueError('too many files')
+    for path, info in files.items():
+        check_path(path)
+        sha = info.get('sha256') if isinstance(info, dict) else None
+        size = info.get('size') if isinstance(info, dict) else None
+        if not isinstance(sha, str) or len(sha) != 64:
+            raise ValueError('bad sha256 for ' + path)
+        if not isinstance(size, int) or not 0 <= size <= OTA_MAX_FILE:
+            raise ValueError('bad size for ' + path)
+    delete = m.get('delete') or []
+    for path in delete:
+        check_path(path)
+        if path in files:
+            raise ValueError('delete lists a package file')
+    return version, files, delete
+
+
+def free_bytes():
+    try:
+        st = os.statvfs('.')
+        return st[0] * st[3]
+    except Exception:
+        return None
+
+
+def installed_version():
+    man = ota_boot.load_json(ota_boot.MANIFEST_FILE)
+    return man.get('version') if man else None
+
+
+class Updater:
+    """接收一个更新包：差量计算、暂存区流式写入与逐文件校验、提交。"""
+
+    def __init__(self):
+        self.buf = bytearray(OTA_BUF)
+        self.fetching = None        # HTTP pull task
+        self.error = None
+        self._reset()
+
+    def _reset(self):
+        self.version = None
+        self.files = {}
+        self.delete = []
+        self.need = []
+        self.done = 0
+        self.cur = None
+        self.off = 0
+        self.h = None
+
+    # ---------------- receiving -----------------
+    def begin(self, manifest, full=False):
+        """开始（或续传）一次更新：返回需要传输的文件列表。"""
+        if self.fetching is not None:
+            raise ValueError('busy')
+        return self._begin(manifest, full)
+
+    def _begin(self, manifest, full):
+        st = ota_boot.load_state()
+        if st and st.get('state') in ('swapping', 'trial'):
+            raise ValueError('update pending: ' + st['state'])
+        version, files, delete = check_manifest(manifest)
+        installed = None if full else ota_boot.load_json(ota_boot.MANIFEST_FILE)
+        have = installed.get('files', {}) if installed else {}
+        need = []
+        for path in sorted(files):
+            sha = have.get(path)
+            if sha is None or not ota_boot.exists(path):
+                sha = file_sha256(path, self.buf)
+            if sha != files[path]['sha256']:
+                need.append(path)
+        delete = [p for p in delete if ota_boot.exists(p)]
+        total = sum(files[p]['size'] for p in need)
+        free = free_bytes()
+        if free is not None and total + FREE_MARGIN > free:
+            raise ValueError('not enough flash ({} > {})'.format(total, free))
+        marker = STAGE_DIR + '/.version'
+        try:
+            with open(marker) as f:
+                staged = f.read()
+        except OSError:
+            staged = None
+        if staged != version:
+            # staged files of another package are useless; the same version resumes
+            ota_boot.rmtree(STAGE_DIR)
+            ota_boot.makedirs(STAGE_DIR)
+            with open(marker, 'w') as f:
+                f.write(version)
+        self._reset()
+        self.error = None
+        self.version, self.files, self.delete, self.need = version, files, delete, need
+        self._next_file()
+        log.msg(log.OTA_BEGIN, '{} {}/{} {}B'.format(version, len(need), len(files), total))
+        return need
+
+    def _next_file(self):
+        """选择下一个未完成文件；已暂存的部分重新计算哈希后续传。"""
+        self.cur = None
+        while self.done < len(self.need):
+            path = self.need[self.done]
+            info = self.files[path]
+            stage = STAGE_DIR + '/' + path
+            ota_boot.makedirs(ota_boot.dirname(stage))
+            try:
+                n = os.stat(stage)[6]
+            except OSError:
+                open(stage, 'wb').close()
+                n = 0
+            if n > info['size']:
+                os.remove(stage)
+                n = 0
+            h, n = _hash_prefix(stage, n, self.buf)[1:]
+            if n == info['size'] and _hex(h) == info['sha256']:
+                self.done += 1      # already staged by an earlier, interrupted transfer
+                continue
+            if n == info['size']:
+                if not n:
+                    raise ValueError('sha256 mismatch for ' + path)
+                open(stage, 'wb').close()   # complete but wrong: start over
+                h, n = hashlib.sha256(), 0
+            self.cur, self.off, self.h = path, n, h
+            return
+
+    def next(self):
+        """下一段期望的数据 {'path','off'}；全部完成时为 None。"""
+        return {'path': self.cur, 'off': self.off} if self.cur else None
+
+    def write(self, path, off, data):
+        """写入一段数据（必须与 next() 一致）；文件写满后校验 SHA-256。"""
+        if self.version is None:
+            raise ValueError('no update in progress')
+        if path != self.cur or off != self.off:
+            raise ValueError('expected {} @ {}'.format(self.cur, self.off))
+        info = self.files[path]
+        if self.off + len(data) > info['size']:
+            raise ValueError('data past end of ' + path)
+        with open(STAGE_DIR + '/' + path, 'ab') as f:
+            f.write(data)
+        self.h.update(data)
+        self.off += len(data)
+        if self.off == info['size']:
+            if _hex(self.h) != info['sha256']:
+                open(STAGE_DIR + '/' + path, 'wb').close()
+                self.off, self.h = 0, hashlib.sha256()
+                raise ValueError('sha256 mismatch for ' + path)
+            self.done += 1
+            self._next_file()
+
+    def commit(self):
+        """全部文件校验通过后写入换入状态并安排重启。"""
+        if self.version is None or self.cur is not None:
+            raise ValueError('transfer incomplete')
+        if not self.need and not self.delete:
+            raise ValueError('already up to date')
+        st = {
+            'state': 'swapping',
+            'version': self.version,
+            'prev': installed_version(),
+            'files': self.need,
+            'delete': self.delete,
+            'new': [p for p in self.need if not ota_boot.exists(p)],
+            'hashes': dict((p, i['sha256']) for p, i in self.files.items()),
+        }
+        ota_boot.rmtree(ota_boot.BACKUP_DIR)
+        ota_boot.save_state(st)
+        log.msg(log.OTA_COMMITTED, self.version)
+        self._reset()
+        asyncio.create_task(_restart(OTA_RESET_DELAY_MS))
+
+    def abort(self):
+        if self.fetching is not None:
+            self.fetching.cancel()
+            self.fetching = None
+        self._reset()
+        ota_boot.rmtree(STAGE_DIR)
+
+    def status(self):
+        st = ota_boot.load_state() or {}
+        return {
+            'installed': installed_version(),
+            'boot_state': st.get('state'),
+            'boot_version': st.get('version'),
+            'pending': self.version,
+            'files': len(self.need),
+            'done': self.done,
+            'next': self.next(),
+            'fetching': self.fetching is not None,
+            'error': self.error,
+        }
+
+    # ---------------- HTTP pull -----------------
+    def start_fetch(self, url, commit=True, full=False):
+        if self.fetching is not None:
+            raise ValueError('busy')
+        host, port, base = parse_url(url)
+        self.error = None
+        self.fetching = asyncio.create_task(self._fetch(host, port, base, commit, full))
+
+    async def _fetch(self, host, port, base, commit, full):
+        try:
+            body = bytearray()
+
+            def keep(data):
+                if len(body) + len(data) > MAX_MANIFEST:
+                    raise ValueError('manifest too large')
+                body.extend(data)
+            await self._get(host, port, base + 'manifest.json', 0, keep)
+            self._begin(ujson.loads(bytes(body)), full)
+            while self.cur is not None:
+                path = self.cur
+                await self._get(host, port, base + path, self.off,
+                                lambda data: self.write(path, self.off, data))
+                if self.cur == path:
+                    raise ValueError('short download of ' + path)
+            if commit:
+                self.commit()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = str(e)
+            log.msg(log.OTA_FETCH, e)
+        finally:
+            self.fetching = None
+
+    async def _get(self, host, port, path, off, sink):
+        """HTTP/1.0 GET，按 OTA_BUF 分块交给 sink；off>0 时用 Range 续传。"""
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            req = 'GET /{} HTTP/1.0\r\nHost: {}\r\n'.format(path, host)
+            if off:
+                req += 'Range: bytes={}-\r\n'.format(off)
+            writer.write((req + '\r\n').encode())
+            await writer.drain()
+            line = await reader.readline()
+            parts = line.split()
+            code = int(parts[1]) if len(parts) > 1 else 0
+            if code not in (200, 206):
+                raise ValueError('HTTP {} for {}'.format(code, path))
+            while True:
+                line = await reader.readline()
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+            skip = off if code == 200 else 0    # server ignored the Range header
+            while True:
+                data = await reader.read(len(self.buf))
+                if not data:
+                    break
+                if skip:
+                    n = min(skip, len(data))
+                    skip -= n
+                    data = data[n:]
+                    if not data:
+                        continue
+                sink(data)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+def parse_url(url):
+    """'http://host[:port]/dir/' -> (host, port, 'dir/')。"""
+    if not url.startswith('http://'):
+        raise ValueError('only http:// URLs')
+    rest = url[7:]
+    i = rest.find('/')
+    hostport, base = (rest, '') if i < 0 else (rest[:i], rest[i + 1:])
+    if base and not base.endswith('/'):
+        base += '/'
+    host, port = hostport, 80
+    if ':' in hostport:
+        host, p = hostport.rsplit(':', 1)
+        port = int(p)
+    if not host:
+        raise ValueError('bad url')
+    return host, port, base
+
+
+async def _restart(delay_ms):
+    await asyncio.sleep_ms(delay_ms)
+    import machine
+    machine.reset()
+
+
+_updater = None
+
+
+def get_ota():
+    global _updater
+    if _updater is None:
+        _updater = Updater()
+    return _updater
+
+
+def handle(j):
+    """处理 {"cmd":"ota","op":"begin|chunk|commit|abort|status|fetch",...}，返回回复 dict。"""
+    up = get_ota()
+    op = j.get('op', 'status')
+    reply = {'cmd': 'ota', 'op': op, 'ok': True}
+    try:
+        if op == 'begin':
+            reply['need'] = up.begin(j.get('manifest'), bool(j.get('full')))
+        elif op == 'chunk':
+            up.write(j.get('path'), j.get('off'), binascii.a2b_base64(j.get('data', '')))
+        elif op == 'commit':
+            up.commit()
+        elif op == 'abort':
+            up.abort()
+        elif op == 'fetch':
+            up.start_fetch(j.get('url', ''), j.get('commit', True), bool(j.get('full')))
+        elif op != 'status':
+            raise ValueError('bad op')
+    except (ValueError, TypeError, KeyError, OSError) as e:
+        reply['ok'] = False
+        reply['error'] = str(e)
+    if op == 'status':
+        reply.update(up.status())
+    else:
+        reply['next'] = up.next()
+    return reply
+
+
+# ---------------- trial supervision -----------------
+def confirm():
+    """试运行通过：合并新哈希到已安装清单，删除备份。"""
+    st = ota_boot.load_state()
+    man = ota_boot.load_json(ota_boot.MANIFEST_FILE) or {'files': {}}
+    man['files'].update(st.get('hashes', {}))
+    for path in st.get('delete', ()):
+        man['files'].pop(path, None)
+    man['version'] = st.get('version')
+    ota_boot.save_json(ota_boot.MANIFEST_FILE, man)
+    ota_boot.rmtree(ota_boot.BACKUP_DIR)
+    st['state'] = 'confirmed'
+    for k in ('files', 'delete', 'new', 'hashes'):
+        st.pop(k, None)
+    ota_boot.save_state(st)
+
+
+async def supervise(system_state, tasks):
+    """试运行监督：任务无崩溃运行 OTA_HEALTHY_S 且连上过 MQTT 则确认；否则标记不健康并重启回滚。
+
+    Args:
+        system_state: 共享状态（读取 MQTT 连接状态）。
+        tasks: main.py 的任务表；确认后从中移除自身。
+    """
+    start = time.ticks_ms()
+    online = False
+    reason = None
+    while reason is None:
+        await asyncio.sleep(1)
+        for name, task in tasks.items():
+            if name != 'ota' and task.done():
+                reason = 'task {} died'.format(name)
+        online = online or system_state['network']['mqtt_status'] == 'connected'
+        elapsed = time.ticks_diff(time.ticks_ms(), start)
+        if reason is None and online and elapsed >= OTA_HEALTHY_S * 1000:
+            confirm()
+            log.msg(log.OTA_CONFIRMED, installed_version())
+            tasks.pop('ota', None)
+            return
+        if not online and elapsed >= OTA_HEALTH_TIMEOUT_S * 1000:
+            reason = 'no MQTT connection'
+    log.msg(log.OTA_TRIAL_FAILED, reason)
+    st = ota_boot.load_state()
+    st['unhealthy'] = reason
+    ota_boot.save_state(st)
+    await _restart(0)
@@ -0,0 +1,94 @@
+# === FILE: core/persist.py ===
+# Lamp state persistence so a power blip restores the lamp (including an
+# in-progress wakeup/sunset) before anything else boots. Stored under the
+# 'lamp' key of the flash journal (core/journal.py).
+import time
+import uasyncio as asyncio
+from core import events
+from core import clock
+from core import log
+from core.journal import get_journal
+from config import JOURNAL_DEBOUNCE_MS, JOURNAL_MAX_DELAY_MS
+
+ANIM_SAVE_S = 30            # refresh animation progress this often while one runs
+
+LAMP_KEYS = ('is_on', 'brightness', 'color_mode', 'color_temp_k', 'custom_rgb',
+             'brightness_mode', 'animation', 'animation_duration_s', 'animation_sync',
+             'animation_seq')
+TIMED_ANIMATIONS = ('wakeup', 'sunset')
+
+
+def snapshot(lamp, now=None):
+    """提取需要持久化的灯状态；动画记录已进行的毫秒数而非绝对时间戳。"""
+    snap = {}
+    for k in LAMP_KEYS:
+        if k in lamp:
+            v = lamp[k]
+            snap[k] = list(v) if isinstance(v, tuple) else v
+    if snap.get('brightness_mode') == 'auto':
+        # daylight_task re-derives it; persisting it would rewrite flash on every PI step
+        snap.pop('brightness', None)
+    if lamp.get('animation'):
+        if now is None:
+            now = clock.now_ms()
+        snap['animation_elapsed_ms'] = max(0, now - lamp.get('animation_start_ms', now))
+    return snap
+
+
+def restore(lamp, snap, now=None):
+    """将快照写回 lamp 字典，动画从中断处继续。"""
+    if now is None:
+        now = clock.now_ms()
+    for k in LAMP_KEYS:
+        if k in snap:
+            lamp[k] = snap[k]
+    if isinstance(lamp.get('custom_rgb'), list):
+        lamp['custom_rgb'] = tuple(lamp['custom_rgb'])
+    if lamp.get('animation'):
+        lamp['animation_start_ms'] = now - snap.get('animation_elapsed_ms', 0)
+        lamp['animation_progress'] = 0.0
+
+
+def load_lamp(lamp):
+    """启动第一阶段调用：从日志恢复灯状态，成功返回 True。"""
+    try:
+        snap = get_journal().get('lamp')
+        if not snap:
+            return False
+        restore(lamp, snap)
+        return True
+    except Exception as e:
+        log.msg(log.RESTORE_ERROR, e)
+        return False
+
+
+async def persist_task(system_state, lock):
+    """lamp 变化时写入日志（合并去抖后落盘）；动画进行中定期保存进度；同时提交其他模块的 put。"""
+    j = get_journal()
+    sub = events.subscribe()
+    last_lamp = events.version('lamp')
+    last_anim = time.ticks_ms()
+    while True:
+        try:
+            # wake at the debounce period so puts from other modules get committed too
+            await events.wait(sub, JOURNAL_DEBOUNCE_MS)
+            now = time.ticks_ms()
+            await lock.acquire()
+            try:
+                lamp = system_state['lamp']
+                animating = lamp.get('animation') in TIMED_ANIMATIONS
+                changed = events.version('lamp') != last_lamp
+                if changed or (animating and time.ticks_diff(now, last_anim) >= ANIM_SAVE_S * 1000):
+                    j.put('lamp', snapshot(lamp))
+                    last_lamp = events.version('lamp')
+                    last_anim = now
+            finally:
+                try:
+                    lock.release()
+                except:
+                    pass
+            if j.due(JOURNAL_DEBOUNCE_MS, JOURNAL_MAX_DELAY_MS, now):
+                j.flush()
+        except Exception as e:
+            log.msg(log.PERSIST_TASK, e)
+            await asyncio.sleep(5)
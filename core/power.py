@@ -0,0 +1,141 @@
+# === FILE: core/power.py ===
+# Workload-aware power governor shared by the tasks.
+#   perf  animation running, or just after a key press / MQTT command:
+#         POWER_FREQ_PERF for smooth frames and quick replies
+#   eco   something changed within POWER_IDLE_S, auto brightness is
+#         regulating, or the network is reconnecting: POWER_FREQ_ECO
+#   idle  nothing changed for POWER_IDLE_S: POWER_FREQ_ECO, polling timers
+#         stretched by POWER_IDLE_STRETCH (fewer wakeups, longer CPU idle)
+#         and Wi-Fi modem power save
+# kick() (key IRQ, MQTT traffic) switches to perf at once and ends every
+# stretched sleep, so the slow idle cadence never delays a reaction.
+# MicroPython cannot light-sleep with Wi-Fi associated; the CPU idles in
+# the scheduler between wakeups, so fewer wakeups is the idle saving.
+import time
+import uasyncio as asyncio
+from core import log
+from config import POWER_FREQ_PERF, POWER_FREQ_ECO, POWER_BOOST_MS, POWER_IDLE_S
+from config import POWER_IDLE_STRETCH, POWER_WLAN_PM
+
+STATES = ('perf', 'eco', 'idle')
+PM_PERFORMANCE = 1      # network.WLAN.PM_* on the ESP32 port
+PM_POWERSAVE = 2
+
+
+def _set_freq(hz):
+    try:
+        import machine
+        if machine.freq() != hz:
+            machine.freq(hz)
+    except Exception as e:
+        log.msg(log.POWER_FREQ, '{} {}'.format(hz, e))
+
+
+def _set_wlan_pm(powersave):
+    try:
+        import network
+        wlan = network.WLAN(network.STA_IF)
+        if wlan.active():
+            pm = getattr(network.WLAN, 'PM_POWERSAVE' if powersave else 'PM_PERFORMANCE',
+                         PM_POWERSAVE if powersave else PM_PERFORMANCE)
+            wlan.config(pm=pm)
+    except Exception as e:
+        log.msg(log.POWER_WLAN, e)
+
+
+class Governor:
+    """功耗状态机：按活动切换 CPU 频率与 Wi-Fi 省电，统计各状态累计时间。"""
+
+    def __init__(self):
+        now = time.ticks_ms()
+        self.state = None
+        self.since = now
+        self.time_ms = {'perf': 0, 'eco': 0, 'idle': 0}
+        self.transitions = 0
+        self.reason = None
+        self.last_activity = now
+        self.boost_until = now
+        self.wake = asyncio.Event()
+        self._enter('perf', 'boot')
+
+    def _enter(self, state, reason):
+        if state == self.state:
+            return
+        now = time.ticks_ms()
+        if self.state is not None:
+            self.time_ms[self.state] += time.ticks_diff(now, self.since)
+            self.transitions += 1
+        leaving_idle = self.state == 'idle'
+        self.state = state
+        self.since = now
+        self.reason = reason
+        _set_freq(POWER_FREQ_PERF if state == 'perf' else POWER_FREQ_ECO)
+        if POWER_WLAN_PM and (state == 'idle' or leaving_idle):
+            _set_wlan_pm(state == 'idle')
+        if state == 'idle':
+            self.wake.clear()
+        else:
+            self.wake.set()     # cut short any stretched sleep
+
+    def kick(self, reason):
+        """按键中断/MQTT 消息：立即进入 perf 并结束被拉长的休眠。"""
+        now = time.ticks_ms()
+        self.last_activity = now
+        self.boost_until = time.ticks_add(now, POWER_BOOST_MS)
+        self._enter('perf', reason)
+
+    def activity(self):
+        """状态变化（灯光/界面/定时）：推迟进入 idle，不提升频率。"""
+        self.last_activity = time.ticks_ms()
+        if self.state == 'idle':
+            self._enter('eco', 'activity')
+
+    def update(self, animating, busy):
+        """按当前负载选择状态（由 power_task 周期调用）。"""
+        now = time.ticks_ms()
+        if animating:
+            self._enter('perf', 'animation')
+        elif time.ticks_diff(self.boost_until, now) > 0:
+            pass    # stay in perf until the boost after a kick ends
+        elif busy:
+            self._enter('eco', 'busy')
+        elif time.ticks_diff(now, self.last_activity) < POWER_IDLE_S * 1000:
+            self._enter('eco', 'recent activity')
+        else:
+            self._enter('idle', 'no activity')
+
+    def stretch(self, ms):
+        """空闲时把轮询周期拉长 POWER_IDLE_STRETCH 倍。"""
+        return ms * POWER_IDLE_STRETCH if self.state == 'idle' else ms
+
+    async def sleep_ms(self, ms):
+        """可被 kick() 提前结束的休眠；仅 idle 时拉长。"""
+        if self.state != 'idle':
+            await asyncio.sleep_ms(ms)
+            return
+        try:
+            await asyncio.wait_for_ms(self.wake.wait(), ms * POWER_IDLE_STRETCH)
+        except asyncio.TimeoutError:
+            pass
+
+    def report(self):
+        """status 上报：当前状态、频率与各状态累计秒数（估算）。"""
+        times = dict(self.time_ms)
+        times[self.state] += time.ticks_diff(time.ticks_ms(), self.since)
+        return {
+            'state': self.state,
+            'reason': self.reason,
+            'freq_mhz': (POWER_FREQ_PERF if self.state == 'perf' else POWER_FREQ_ECO) // 1000000,
+            'time_s': dict((s, times[s] // 1000) for s in STATES),
+            'transitions': self.transitions,
+        }
+
+
+_governor = None
+
+
+def get_governor():
+    global _governor
+    if _governor is None:
+        _governor = Governor()
+    return _governor
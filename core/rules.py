@@ -0,0 +1,212 @@
+# === FILE: core/rules.py ===
+# On-device automation: "eco2 above 1500 for 30 s -> warning", "light below
+# 800 -> sunset". Rules live in the flash journal under 'rules' and keep
+# working without the broker. Each rule watches one sensor field:
+#   fires    when the value is beyond the threshold for for_s seconds
+#   releases when it comes back past threshold -/+ hysteresis (and runs the
+#            optional release action); only then can it fire again
+# The rules are compiled into a flat table (parallel arrays, one row per
+# enabled rule) plus an index field -> rows, so a sample only evaluates the
+# rules that reference its field.
+import time
+from array import array
+from core import events
+from core import clock
+from core.commands import ANIMATIONS, check_set
+from core.journal import get_journal
+from config import RULES_MAX, RULES_FIRED_LOG
+
+JOURNAL_KEY = 'rules'
+FIELDS = ('temperature', 'humidity', 'eco2', 'tvoc', 'light')
+ACTIONS = ('set', 'anim')
+MAX_FOR_S = 24 * 3600
+
+IDLE = 0
+PENDING = 1     # beyond the threshold, waiting for for_s
+ACTIVE = 2      # fired, waiting for the release level
+
+
+def parse_action(a, name):
+    """校验规则动作（set/anim 指令 dict）；非法时抛 ValueError。"""
+    if not isinstance(a, dict) or a.get('cmd') not in ACTIONS:
+        raise ValueError('bad {}: cmd must be set or anim'.format(name))
+    if a['cmd'] == 'anim' and a.get('type') not in ANIMATIONS:
+        raise ValueError('bad {}: unknown animation'.format(name))
+    if a['cmd'] == 'set':
+        # a bad field would only fail when the rule fires, under the state lock
+        try:
+            check_set(a)
+        except ValueError as e:
+            raise ValueError('bad {}: {}'.format(name, e))
+    return dict(a)
+
+
+def parse_rule(j):
+    """校验 MQTT add 指令并返回规范化的规则；非法时抛 ValueError。"""
+    rid = j.get('id')
+    if not isinstance(rid, str) or not rid or len(rid) > 16:
+        raise ValueError('bad id')
+    field = j.get('field')
+    if field not in FIELDS:
+        raise ValueError('bad field')
+    if ('above' in j) == ('below' in j):
+        raise ValueError('need exactly one of above/below')
+    above = 'above' in j
+    threshold = float(j['above'] if above else j['below'])
+    hysteresis = float(j.get('hysteresis', 0))
+    for_s = int(j.get('for_s', 0))
+    if hysteresis < 0:
+        raise ValueError('bad hysteresis')
+    if not 0 <= for_s <= MAX_FOR_S:
+        raise ValueError('bad for_s')
+    rule = {
+        'id': rid,
+        'field': field,
+        'above' if above else 'below': threshold,
+        'hysteresis': hysteresis,
+        'for_s': for_s,
+        'do': parse_action(j.get('do'), 'do'),
+        'enabled': bool(j.get('enabled', True)),
+    }
+    if j.get('release') is not None:
+        rule['release'] = parse_action(j['release'], 'release')
+    return rule
+
+
+class RuleEngine:
+    """规则集合 + 编译后的扁平评估表（按字段索引）。"""
+
+    def __init__(self, rules=()):
+        self.rules = {r['id']: r for r in rules}
+        self.fired = []         # recent firings [id, ts_ms, value], newest last
+        self.counts = {}        # id -> times fired since boot
+        self.ids = []
+        self.defs = []
+        self.state = bytearray()
+        self.since = []
+        self.compile()
+
+    def compile(self):
+        """把启用的规则编译为平行数组；定义未变的规则保留其运行状态。"""
+        old = {}
+        for i, rid in enumerate(self.ids):
+            old[rid] = (self.defs[i], self.state[i], self.since[i])
+        rows = [r for _rid, r in sorted(self.rules.items()) if r['enabled']]
+        n = len(rows)
+        self.ids = [r['id'] for r in rows]
+        self.defs = rows
+        # comparisons run on sign * value so above/below share one code path
+        self.sign = array('b', [1 if 'above' in r else -1 for r in rows])
+        self.trigger = array('f', [self.sign[i] * r.get('above', r.get('below')) for i, r in enumerate(rows)])
+        self.release = array('f', [self.trigger[i] - r['hysteresis'] for i, r in enumerate(rows)])
+        self.for_ms = array('i', [r['for_s'] * 1000 for r in rows])
+        self.state = bytearray(n)
+        self.since = [0] * n
+        self.by_field = {}
+        for i, r in enumerate(rows):
+            self.by_field.setdefault(r['field'], []).append(i)
+            prev = old.get(r['id'])
+            if prev is not None and prev[0] == r:
+                self.state[i] = prev[1]
+                self.since[i] = prev[2]
+
+    def evaluate(self, field, value, now=None):
+        """用一个新样本评估引用该字段的规则；返回要执行的 [(id, 动作)]。"""
+        rows = self.by_field.get(field)
+        if not rows or value is None:
+            return ()
+        if now is None:
+            now = time.ticks_ms()
+        out = []
+        for i in rows:
+            v = self.sign[i] * value
+            st = self.state[i]
+            if st == ACTIVE:
+                if v < self.release[i]:
+                    self.state[i] = IDLE
+                    act = self.defs[i].get('release')
+                    if act:
+                        out.append((self.ids[i], act))
+            elif v > self.trigger[i]:
+                if st == IDLE:
+                    self.state[i] = PENDING
+                    self.since[i] = now
+                if time.ticks_diff(now, self.since[i]) >= self.for_ms[i]:
+                    self.state[i] = ACTIVE
+                    self._log(self.ids[i], value)
+                    out.append((self.ids[i], self.defs[i]['do']))
+            else:
+                self.state[i] = IDLE
+        return out
+
+    def _log(self, rid, value):
+        self.counts[rid] = self.counts.get(rid, 0) + 1
+        self.fired.append([rid, clock.now_ms(), value])
+        if len(self.fired) > RULES_FIRED_LOG:
+            self.fired.pop(0)
+
+    def active(self):
+        return [self.ids[i] for i in range(len(self.ids)) if self.state[i] == ACTIVE]
+
+    def report(self):
+        """status 上报：规则数、当前触发中的规则与最近触发记录。"""
+        return {'count': len(self.rules), 'active': self.active(), 'fired': [list(f) for f in self.fired]}
+
+    # ---------------- management -----------------
+    def _changed(self):
+        get_journal().put(JOURNAL_KEY, list(self.rules.values()))
+        self.compile()
+        events.notify('rules')
+
+    def add(self, rule):
+        if rule['id'] not in self.rules and len(self.rules) >= RULES_MAX:
+            raise ValueError('too many rules')
+        self.rules[rule['id']] = rule
+        self._changed()
+
+    def remove(self, rid):
+        if self.rules.pop(rid, None) is None:
+            return False
+        self._changed()
+        return True
+
+    def listing(self):
+        states = dict(zip(self.ids, self.state))
+        out = []
+        for rid in sorted(self.rules):
+            r = dict(self.rules[rid])
+            r['state'] = ('idle', 'pending', 'active')[states.get(rid, IDLE)]
+            r['fired'] = self.counts.get(rid, 0)
+            out.append(r)
+        return out
+
+
+_engine = None
+
+
+def get_engine():
+    """返回全局 RuleEngine（首次调用时从日志加载规则）。"""
+    global _engine
+    if _engine is None:
+        _engine = RuleEngine(get_journal().get(JOURNAL_KEY, []))
+    return _engine
+
+
+def handle(j):
+    """处理 {"cmd":"rule","op":"add|del|list",...}，返回回复 dict。"""
+    engine = get_engine()
+    op = j.get('op', 'list')
+    reply = {'cmd': 'rule', 'op': op, 'ok': True}
+    try:
+        if op == 'add':
+            engine.add(parse_rule(j))
+        elif op == 'del':
+            if not engine.remove(j.get('id')):
+                raise ValueError('unknown id')
+        elif op != 'list':
+            raise ValueError('bad op')
+    except (ValueError, TypeError, KeyError) as e:
+        reply['ok'] = False
+        reply['error'] = str(e)
+    reply['rules'] = engine.listing()
+    return reply
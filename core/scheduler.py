@@ -0,0 +1,191 @@
+# === FILE: core/scheduler.py ===
+# Recurring local alarms (weekday 06:45 wakeup, daily 22:30 sunset...).
+# Schedules live in the flash journal under 'schedules'; the next fire time of
+# every enabled entry sits in a heap so the task sleeps until the earliest one
+# instead of polling the clock.
+import time
+import heapq
+import uasyncio as asyncio
+from core import events
+from core.commands import ANIMATIONS
+from core.journal import get_journal
+from config import TZ_OFFSET_S, SCHEDULE_MAX, SCHEDULE_GRACE_S
+
+JOURNAL_KEY = 'schedules'
+DAY_S = 86400
+MIN_VALID_YEAR = 2024       # RTC not set yet (epoch 2000) below this
+SCHEDULED_ANIMATIONS = ('wakeup', 'sunset')
+DAY_PRESETS = {
+    'daily': (0, 1, 2, 3, 4, 5, 6),
+    'weekdays': (0, 1, 2, 3, 4),
+    'weekends': (5, 6),
+}
+
+
+def clock_valid(now=None):
+    """RTC 是否已设置为真实时间（未同步时不触发定时）。"""
+    return time.localtime(time.time() if now is None else now)[0] >= MIN_VALID_YEAR
+
+
+def parse_days(v):
+    """'daily'/'weekdays'/'weekends' 或 0..6（周一=0）列表 -> 排序后的列表。"""
+    if isinstance(v, str):
+        if v not in DAY_PRESETS:
+            raise ValueError('bad days')
+        return list(DAY_PRESETS[v])
+    days = sorted(set(int(d) for d in v))
+    if not days or days[0] < 0 or days[-1] > 6:
+        raise ValueError('bad days')
+    return days
+
+
+def parse_entry(j):
+    """校验 MQTT add 指令并返回规范化的定时项；非法时抛 ValueError。"""
+    sid = j.get('id')
+    if not isinstance(sid, str) or not sid or len(sid) > 16:
+        raise ValueError('bad id')
+    anim = j.get('anim')
+    if anim not in SCHEDULED_ANIMATIONS:
+        raise ValueError('bad anim')
+    try:
+        hh, mm = [int(x) for x in j.get('at', '').split(':')]
+    except Exception:
+        raise ValueError('bad at')
+    if not (0 <= hh < 24 and 0 <= mm < 60):
+        raise ValueError('bad at')
+    duration = int(j.get('duration_s', ANIMATIONS[anim]))
+    if not 1 <= duration <= 4 * 3600:
+        raise ValueError('bad duration_s')
+    return {
+        'id': sid,
+        'anim': anim,
+        'at': [hh, mm],
+        'days': parse_days(j.get('days', 'daily')),
+        'duration_s': duration,
+        'enabled': bool(j.get('enabled', True)),
+    }
+
+
+def next_fire(entry, now, tz_offset_s=TZ_OFFSET_S):
+    """返回 now 之后该定时项的下一次触发时间（设备纪元秒）。"""
+    local = now + tz_offset_s
+    tm = time.localtime(local)
+    midnight = local - (tm[3] * 3600 + tm[4] * 60 + tm[5])
+    hh, mm = entry['at']
+    for d in range(8):
+        t = midnight + d * DAY_S + hh * 3600 + mm * 60
+        if t > local and (tm[6] + d) % 7 in entry['days']:
+            return t - tz_offset_s
+    return None
+
+
+class Scheduler:
+    """定时项集合 + 下次触发时间小根堆。"""
+
+    def __init__(self, entries=(), tz_offset_s=TZ_OFFSET_S, grace_s=SCHEDULE_GRACE_S):
+        self.entries = {e['id']: e for e in entries}
+        self.tz = tz_offset_s
+        self.grace_s = grace_s
+        self.heap = []          # (fire_ts, id)
+        self.dirty = True       # heap must be rebuilt before use
+        self.wake = asyncio.Event()
+
+    def rebuild(self, now):
+        """按当前时间重新计算所有启用项的下次触发时间。"""
+        heap = []
+        for sid, e in self.entries.items():
+            if e['enabled']:
+                t = next_fire(e, now, self.tz)
+                if t is not None:
+                    heap.append((t, sid))
+        heapq.heapify(heap)
+        self.heap = heap
+        self.dirty = False
+
+    def invalidate(self, _delta_ms=None):
+        """时钟跳变后调用：下次循环按新时间重建堆。"""
+        self.dirty = True
+        self.wake.set()
+
+    def next_ts(self):
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now):
+        """弹出已到期的定时项并排入其下一次触发；错过超过 grace_s 的只重排不触发。"""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            t, sid = heapq.heappop(self.heap)
+            e = self.entries.get(sid)
+            if e is None or not e['enabled']:
+                continue
+            if now - t <= self.grace_s:
+                due.append(e)
+            nt = next_fire(e, max(t, now), self.tz)
+            if nt is not None:
+                heapq.heappush(self.heap, (nt, sid))
+        return due
+
+    def upcoming(self):
+        """[(触发时间, id)] 按时间排序。"""
+        return sorted(self.heap)
+
+    # ---------------- management -----------------
+    def _changed(self):
+        get_journal().put(JOURNAL_KEY, list(self.entries.values()))
+        if clock_valid():
+            self.rebuild(time.time())
+        self.wake.set()
+        events.notify('schedule')
+
+    def add(self, entry):
+        if entry['id'] not in self.entries and len(self.entries) >= SCHEDULE_MAX:
+            raise ValueError('too many schedules')
+        self.entries[entry['id']] = entry
+        self._changed()
+
+    def remove(self, sid):
+        if self.entries.pop(sid, None) is None:
+            return False
+        self._changed()
+        return True
+
+    def listing(self):
+        nxt = {sid: t for t, sid in self.heap}
+        out = []
+        for sid in sorted(self.entries):
+            e = dict(self.entries[sid])
+            e['at'] = '{:02d}:{:02d}'.format(e['at'][0], e['at'][1])
+            e['next_ts'] = nxt.get(sid)
+            out.append(e)
+        return out
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """返回全局 Scheduler（首次调用时从日志加载定时项）。"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler(get_journal().get(JOURNAL_KEY, []))
+    return _scheduler
+
+
+def handle(j):
+    """处理 {"cmd":"schedule","op":"add|del|list",...}，返回回复 dict。"""
+    sched = get_scheduler()
+    op = j.get('op', 'list')
+    reply = {'cmd': 'schedule', 'op': op, 'ok': True}
+    try:
+        if op == 'add':
+            sched.add(parse_entry(j))
+        elif op == 'del':
+            if not sched.remove(j.get('id')):
+                raise ValueError('unknown id')
+        elif op != 'list':
+            raise ValueError('bad op')
+    except (ValueError, TypeError) as e:
+        reply['ok'] = False
+        reply['error'] = str(e)
+    reply['schedules'] = sched.listing()
+    return reply
@@ -0,0 +1,135 @@
+# === FILE: core/settings.py ===
+# Runtime-tunable settings. Defaults come from config.py; overrides sent with
+# {"cmd": "config", "set": {...}} are validated against SPECS, applied at once
+# and kept in SETTINGS_FILE (only the values that differ from config.py), so
+# they survive reboots and OTA updates. Tasks read get_settings().get(name)
+# every cycle; a change is announced with events.notify('settings') so tasks
+# sleeping on events pick it up without waiting for their timer.
+from core import events
+from core import log
+from ota_boot import load_json, save_json
+from config import PUBLISH_INTERVAL_S, SENSOR_READ_INTERVAL_S, DISPLAY_CEILING_MS
+from config import DISPLAY_ANIM_REFRESH_MS, DEBOUNCE_MS, FRAME_INTERVAL_MS, STRIP_MIN_GAP_MS
+
+SETTINGS_FILE = 'settings.json'
+
+# name: (type, default, min, max)
+SPECS = {
+    'publish_interval_s': (int, PUBLISH_INTERVAL_S, 1, 3600),
+    'sensor_read_interval_s': (int, SENSOR_READ_INTERVAL_S, 1, 60),
+    'display_ceiling_ms': (int, DISPLAY_CEILING_MS, 200, 60000),
+    'display_anim_refresh_ms': (int, DISPLAY_ANIM_REFRESH_MS, 100, 10000),
+    'debounce_ms': (int, DEBOUNCE_MS, 2, 200),
+    'frame_interval_ms': (int, FRAME_INTERVAL_MS, 20, 1000),
+    'strip_min_gap_ms': (int, STRIP_MIN_GAP_MS, 0, 1000),
+}
+
+
+def coerce(name, value):
+    """按 SPECS 校验并转换一个值；未知名称、类型或越界抛出 ValueError。"""
+    spec = SPECS.get(name)
+    if spec is None:
+        raise ValueError('unknown setting {}'.format(name))
+    typ, _default, lo, hi = spec
+    # JSON has no int/float distinction worth trusting; bool is an int in Python
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('{} must be a number'.format(name))
+    if typ is int:
+        if value != int(value):
+            raise ValueError('{} must be an integer'.format(name))
+        value = int(value)
+    else:
+        value = typ(value)
+    if value < lo or value > hi:
+        raise ValueError('{} must be {}..{}'.format(name, lo, hi))
+    return value
+
+
+class Settings:
+    """设置注册表：config.py 默认值 + settings.json 覆盖 + 运行时更新。"""
+
+    def __init__(self, path=SETTINGS_FILE):
+        self.path = path
+        self.values = dict((n, s[1]) for n, s in SPECS.items())
+        self.load()
+
+    def load(self):
+        """读取覆盖文件；无效项（旧版本遗留、手改出错）忽略并记录日志。"""
+        saved = load_json(self.path)
+        if not isinstance(saved, dict):
+            return
+        for name, value in saved.items():
+            try:
+                self.values[name] = coerce(name, value)
+            except ValueError as e:
+                log.msg(log.SETTINGS_IGNORED, e)
+
+    def get(self, name):
+        return self.values[name]
+
+    def overrides(self):
+        return dict((n, v) for n, v in self.values.items() if v != SPECS[n][1])
+
+    def update(self, changes):
+        """整体校验后应用（任一项无效则不改任何值）；返回实际变化的项。"""
+        if not isinstance(changes, dict):
+            raise ValueError('set must be an object')
+        new = {}
+        for name, value in changes.items():
+            new[name] = coerce(name, value)
+        changed = dict((n, v) for n, v in new.items() if self.values[n] != v)
+        if changed:
+            self.values.update(changed)
+            self._commit()
+        return changed
+
+    def reset(self, names=None):
+        """恢复 config.py 默认值（names 为 None 时全部）；返回实际变化的项。"""
+        if names is None:
+            names = list(SPECS)
+        for name in names:
+            if name not in SPECS:
+                raise ValueError('unknown setting {}'.format(name))
+        changed = dict((n, SPECS[n][1]) for n in names if self.values[n] != SPECS[n][1])
+        if changed:
+            self.values.update(changed)
+            self._commit()
+        return changed
+
+    def _commit(self):
+        try:
+            save_json(self.path, self.overrides())
+        except OSError as e:
+            # still applied for this boot
+            log.msg(log.SETTINGS_SAVE, e)
+        events.notify('settings')
+
+
+_settings = None
+
+
+def get_settings():
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+
+def handle(j):
+    """处理 {"cmd":"config"[,"set":{..}][,"reset":[..]|true]}，返回当前设置与变化项。"""
+    st = get_settings()
+    reply = {'cmd': 'config', 'ok': True}
+    changed = {}
+    try:
+        reset = j.get('reset')
+        if reset:
+            changed.update(st.reset(None if reset is True else list(reset)))
+        if 'set' in j:
+            changed.update(st.update(j['set']))
+    except (ValueError, TypeError) as e:
+        reply['ok'] = False
+        reply['error'] = str(e)
+    reply['changed'] = changed
+    reply['settings'] = dict(st.values)
+    reply['overrides'] = sorted(st.overrides())
+    return reply
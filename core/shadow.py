@@ -0,0 +1,153 @@
+# === FILE: core/shadow.py ===
+# Device shadow: the lamp state the backend wants versus the state it has.
+#   desired   MQTT_TOPIC_DESIRED, retained, written by the backend:
+#             {"version": n, "state": {...}}; state uses the keys of a `set`
+#             command (DESIRED_KEYS). A lamp that was offline receives it on
+#             subscribe and applies it in one step, no command needs resending.
+#   reported  MQTT_TOPIC_REPORTED, retained, written by the lamp:
+#             {"version": v, "desired_version": n, "state": {...}, "ts": ms}
+#   delta     MQTT_TOPIC_REPORTED_DELTA, not retained: {"version", "base",
+#             "desired_version", "state", "ts"}; state holds only the keys that
+#             differ from the retained document with version `base` (None for
+#             a key that disappeared), so reported + the latest delta is the
+#             current state and a missed delta does not matter.
+# Only the desired keys that differ from the reported state are applied, and
+# a desired version is applied once (it is kept in the journal): a later local
+# change (keys, schedule, rule) is not undone by the retained document on the
+# next reconnect or reboot, only by a newer desired version.
+import time
+from core import clock
+from core import events
+from core.commands import apply_set
+from core.journal import get_journal
+from config import SHADOW_MIN_MS, SHADOW_FULL_S
+
+JOURNAL_KEY = 'shadow'
+DESIRED_KEYS = ('is_on', 'brightness', 'brightness_mode', 'color_mode', 'color_temp_k', 'rgb')
+
+
+def reported_state(lamp):
+    """从 lamp 提取 reported 状态（键名同 set 指令，另含只读的 animation）。"""
+    st = {
+        'is_on': lamp['is_on'],
+        'brightness_mode': lamp['brightness_mode'],
+        'color_mode': lamp['color_mode'],
+        'color_temp_k': lamp['color_temp_k'],
+        'rgb': list(lamp['custom_rgb']),
+        'animation': lamp.get('animation'),
+    }
+    if lamp['brightness_mode'] != 'auto':
+        # in auto mode daylight_task moves it every PI step: reporting it would stream deltas
+        st['brightness'] = lamp['brightness']
+    return st
+
+
+def diff(desired, reported):
+    """desired 中与 reported 不同的键（auto 亮度模式下忽略 brightness）。"""
+    out = {}
+    for k in DESIRED_KEYS:
+        if k in desired and desired[k] != reported.get(k):
+            out[k] = desired[k]
+    if desired.get('brightness_mode') == 'auto':
+        out.pop('brightness', None)
+    return out
+
+
+class Shadow:
+    """reported 版本与发布节奏；desired 文档的对账。"""
+
+    def __init__(self):
+        saved = get_journal().get(JOURNAL_KEY) or {}
+        self.version = saved.get('version', 0)
+        self.desired_version = saved.get('desired_version', 0)
+        self.sent = None            # state of the last full document or delta
+        self.sent_desired = None
+        self.base = None            # state of the retained document; None: publish it next
+        self.base_version = None
+        self.last_full = 0
+        self.last_pub = 0
+        self.seen = None            # events 'lamp' version at the last poll
+        self.held = False           # a change waits for SHADOW_MIN_MS
+        self.stats = {'full': 0, 'delta': 0, 'applied': 0}
+
+    def _save(self):
+        get_journal().put(JOURNAL_KEY, {'version': self.version, 'desired_version': self.desired_version})
+
+    def connected(self):
+        # a new session may have missed deltas and the retained copy may be old
+        self.base = None
+
+    def due(self, now=None):
+        """是否需要 poll()（不持锁的快速判断：lamp 未变化且无待发内容时为 False）。"""
+        if self.base is None or self.held or events.version('lamp') != self.seen:
+            return True
+        if now is None:
+            now = time.ticks_ms()
+        return self.base_version != self.version and time.ticks_diff(now, self.last_full) >= SHADOW_FULL_S * 1000
+
+    def on_desired(self, system_state, doc):
+        """应用 desired 文档中与当前状态不同的键；已应用过的版本忽略。返回应用的键（dict）或 None。"""
+        if not isinstance(doc, dict) or not isinstance(doc.get('state'), dict):
+            return None
+        version = int(doc.get('version', 0))
+        if version <= self.desired_version:
+            return None
+        changes = diff(doc['state'], reported_state(system_state['lamp']))
+        if changes:
+            apply_set(system_state, changes)
+        self.desired_version = version
+        self.stats['applied'] += 1
+        self._save()
+        return changes
+
+    def poll(self, lamp, now=None):
+        """返回此刻要发布的 (主题类型, 文档)：'full'、'delta' 或 None；变化在 SHADOW_MIN_MS 内合并。"""
+        if now is None:
+            now = time.ticks_ms()
+        self.seen = events.version('lamp')
+        self.held = False
+        cur = reported_state(lamp)
+        changed = cur != self.sent or self.desired_version != self.sent_desired
+        if changed:
+            if self.base is not None and time.ticks_diff(now, self.last_pub) < SHADOW_MIN_MS:
+                self.held = True    # a later poll carries the latest state
+                return None
+            self.version += 1
+            self.sent = cur
+            self.sent_desired = self.desired_version
+            self._save()
+        elif self.base is not None and (self.base_version == self.version
+                                        or time.ticks_diff(now, self.last_full) < SHADOW_FULL_S * 1000):
+            return None
+        doc = {'version': self.version, 'desired_version': self.desired_version, 'ts': clock.now_ms()}
+        self.last_pub = now
+        if self.base is None or time.ticks_diff(now, self.last_full) >= SHADOW_FULL_S * 1000:
+            # (re)connect, or refresh the retained copy so deltas stay small
+            doc['state'] = cur
+            self.base = cur
+            self.base_version = self.version
+            self.last_full = now
+            self.stats['full'] += 1
+            return 'full', doc
+        state = {}
+        for k, v in cur.items():
+            if self.base.get(k) != v:
+                state[k] = v
+        for k in self.base:
+            if k not in cur:
+                state[k] = None
+        doc['base'] = self.base_version
+        doc['state'] = state
+        self.stats['delta'] += 1
+        return 'delta', doc
+
+
+_shadow = None
+
+
+def get_shadow():
+    """返回全局 Shadow（首次调用时从日志读取版本号）。"""
+    global _shadow
+    if _shadow is None:
+        _shadow = Shadow()
+    return _shadow
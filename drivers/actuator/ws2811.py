@@ -2,6 +2,7 @@
 import time
 import neopixel
 from machine import Pin
+from core import log
 
 class WS2811:
     def __init__(self, pin, count, min_gap_ms=20):
@@ -17,16 +18,20 @@ class WS2811:
         now = time.ticks_ms()
         if time.ticks_diff(now, self._last_write) < self.min_gap_ms:
             return False
-        for i in range(min(self.count, len(pixels))):
-            self.np[i] = pixels[i]
+        self.load(pixels)
         try:
             self.np.write()
             self._last_write = time.ticks_ms()
             return True
         except Exception as e:
-            print('ws2811 write error', e)
+            log.msg(log.STRIP_WRITE, e)
             return False
 
+    def load(self, pixels):
+        """把像素写入 neopixel 缓冲区（不发送）。"""
+        for i in range(min(self.count, len(pixels))):
+            self.np[i] = pixels[i]
+
     def fill(self, color):
         pixels = [color] * self.count
         return self.write_pixels(pixels)
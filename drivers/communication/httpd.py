@@ -0,0 +1,181 @@
+# === FILE: drivers/communication/httpd.py ===
+# Minimal bounded HTTP/1.1 helpers for asyncio.start_server handlers.
+# Request heads and bodies are read into size-limited buffers and files are
+# streamed through one fixed chunk, so a misbehaving client cannot exhaust RAM.
+import os
+import uasyncio as asyncio
+
+MAX_HEAD = 1024      # request line + headers
+MAX_HEADERS = 24
+MAX_BODY = 1024
+READ_TIMEOUT_MS = 5000
+CHUNK = 512
+
+REASONS = {
+    200: 'OK',
+    204: 'No Content',
+    302: 'Found',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    408: 'Request Timeout',
+    413: 'Payload Too Large',
+    415: 'Unsupported Media Type',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+
+def urldecode(s):
+    """application/x-www-form-urlencoded 解码（线性时间，支持 UTF-8 多字节）。"""
+    if isinstance(s, str):
+        s = s.encode()
+    out = bytearray()
+    i = 0
+    n = len(s)
+    while i < n:
+        c = s[i]
+        if c == 0x2B:  # '+'
+            out.append(0x20)
+        elif c == 0x25 and i + 2 < n:  # '%XX'
+            try:
+                out.append(int(s[i + 1:i + 3], 16))
+                i += 2
+            except ValueError:
+                out.append(c)
+        else:
+            out.append(c)
+        i += 1
+    try:
+        return out.decode()
+    except UnicodeError:
+        return ''.join(chr(b) for b in out)
+
+
+def parse_form(body):
+    params = {}
+    if isinstance(body, (bytes, bytearray)):
+        body = bytes(body)
+    else:
+        body = body.encode()
+    for pair in body.split(b'&'):
+        if b'=' in pair:
+            k, v = pair.split(b'=', 1)
+            params[urldecode(k)] = urldecode(v)
+    return params
+
+
+async def _read_head(reader):
+    buf = b''
+    while True:
+        end = buf.find(b'\r\n\r\n')
+        if end >= 0:
+            return buf[:end], buf[end + 4:]
+        if len(buf) >= MAX_HEAD:
+            raise HttpError(431)
+        chunk = await reader.read(MAX_HEAD - len(buf))
+        if not chunk:
+            raise HttpError(400)
+        buf += chunk
+
+
+async def read_request(reader, max_body=MAX_BODY, timeout_ms=READ_TIMEOUT_MS):
+    """读取并解析一个请求，超出大小/时间限制时抛出 HttpError。"""
+    try:
+        head, rest = await asyncio.wait_for_ms(_read_head(reader), timeout_ms)
+    except asyncio.TimeoutError:
+        raise HttpError(408)
+    lines = head.split(b'\r\n')
+    try:
+        method, target, _ver = lines[0].decode().split(' ', 2)
+    except Exception:
+        raise HttpError(400)
+    if len(lines) - 1 > MAX_HEADERS:
+        raise HttpError(431)
+    headers = {}
+    for line in lines[1:]:
+        k, sep, v = line.decode().partition(':')
+        if sep:
+            headers[k.strip().lower()] = v.strip()
+    path, _, query = target.partition('?')
+    body = rest
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HttpError(400)
+    if length > max_body:
+        raise HttpError(413)
+    if length > len(body):
+        try:
+            body += await asyncio.wait_for_ms(reader.readexactly(length - len(body)), timeout_ms)
+        except asyncio.TimeoutError:
+            raise HttpError(408)
+    return Request(method, path, query, headers, body[:length])
+
+
+async def send(writer, status, body=b'', ctype='text/plain', headers=None):
+    if isinstance(body, str):
+        body = body.encode()
+    head = 'HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n'.format(
+        status, REASONS.get(status, ''), ctype, len(body))
+    if headers:
+        for k, v in headers.items():
+            head += '{}: {}\r\n'.format(k, v)
+    writer.write(head.encode() + b'\r\n')
+    if body:
+        writer.write(body)
+    await writer.drain()
+
+
+async def redirect(writer, location):
+    await send(writer, 302, b'', headers={'Location': location})
+
+
+async def send_file(writer, path, ctype, gzip=False, buf=None):
+    """以固定大小块流式发送闪存文件；buf 可传入预分配 bytearray 复用。返回是否成功。"""
+    try:
+        size = os.stat(path)[6]
+    except OSError:
+        return False
+    head = 'HTTP/1.1 200 OK\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n'.format(ctype, size)
+    if gzip:
+        head += 'Content-Encoding: gzip\r\n'
+    head += 'Cache-Control: max-age=3600\r\n\r\n'
+    writer.write(head.encode())
+    if buf is None:
+        buf = bytearray(CHUNK)
+    mv = memoryview(buf)
+    with open(path, 'rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            writer.write(mv[:n])
+            await writer.drain()
+    return True
+
+
+async def close(writer):
+    try:
+        writer.close()
+        await writer.wait_closed()
+    except Exception:
+        pass
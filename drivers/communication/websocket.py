@@ -0,0 +1,144 @@
+# === FILE: drivers/communication/websocket.py ===
+# Minimal server-side WebSocket (RFC 6455) on top of httpd requests.
+# Text frames only and no extensions. Client frames must be masked, must not
+# be fragmented and must fit in MAX_FRAME, so every message is one bounded read.
+import binascii
+import hashlib
+import uasyncio as asyncio
+from drivers.communication import httpd
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_FRAME = httpd.MAX_BODY
+
+OP_CONT = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL = 1002
+CLOSE_UNSUPPORTED = 1003
+CLOSE_TOO_BIG = 1009
+
+
+class WsClosed(Exception):
+    pass
+
+
+def accept_key(key):
+    """由 Sec-WebSocket-Key 计算 Sec-WebSocket-Accept。"""
+    digest = hashlib.sha1(key.encode() + GUID).digest()
+    return binascii.b2a_base64(digest).strip().decode()
+
+
+def is_upgrade(req):
+    return 'websocket' in req.headers.get('upgrade', '').lower()
+
+
+def same_origin(req):
+    """Origin 是否与请求的 Host 相同（同源页面）。"""
+    host = req.headers.get('host')
+    return bool(host) and req.headers.get('origin') in ('http://' + host, 'https://' + host)
+
+
+async def accept(reader, writer, req, origins=()):
+    """完成握手并返回 WebSocket；非法升级请求抛出 HttpError(400)，Origin 不被允许抛出 HttpError(403)。"""
+    key = req.headers.get('sec-websocket-key')
+    if req.method != 'GET' or not key or not is_upgrade(req):
+        raise httpd.HttpError(400)
+    # browsers send Origin and skip CORS on WebSockets: without this check any
+    # page on the LAN could open one. Non-browser clients send none.
+    origin = req.headers.get('origin')
+    if origin and origin not in origins and not same_origin(req):
+        raise httpd.HttpError(403)
+    writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                  'Sec-WebSocket-Accept: {}\r\n\r\n').format(accept_key(key)).encode())
+    await writer.drain()
+    return WebSocket(reader, writer)
+
+
+def frame(opcode, payload):
+    """服务端帧（不加掩码）。"""
+    n = len(payload)
+    if n < 126:
+        head = bytes((0x80 | opcode, n))
+    elif n < 65536:
+        head = bytes((0x80 | opcode, 126, n >> 8, n & 0xFF))
+    else:
+        head = bytes((0x80 | opcode, 127)) + n.to_bytes(8, 'big')
+    return head + payload
+
+
+class WebSocket:
+    """已握手的连接：recv() 返回文本消息，send() 发送文本帧；ping 自动应答。"""
+
+    def __init__(self, reader, writer, max_frame=MAX_FRAME):
+        self.reader = reader
+        self.writer = writer
+        self.max_frame = max_frame
+        self.closed = False
+
+    async def recv(self):
+        """读取下一条文本消息；对方关闭或违反协议时抛出 WsClosed。"""
+        while True:
+            try:
+                b0, b1 = await self.reader.readexactly(2)
+                fin = b0 & 0x80
+                op = b0 & 0x0F
+                n = b1 & 0x7F
+                if n == 126:
+                    ext = await self.reader.readexactly(2)
+                    n = (ext[0] << 8) | ext[1]
+                elif n == 127:
+                    n = self.max_frame + 1    # 64-bit lengths are never acceptable here
+                if not b1 & 0x80:
+                    await self.close(CLOSE_PROTOCOL)
+                    raise WsClosed('unmasked frame')
+                if n > self.max_frame:
+                    await self.close(CLOSE_TOO_BIG)
+                    raise WsClosed('frame too big')
+                mask = await self.reader.readexactly(4)
+                data = bytearray(await self.reader.readexactly(n)) if n else bytearray()
+            except (EOFError, OSError, ValueError):
+                # peer went away mid-frame (readexactly raises EOFError on MicroPython)
+                self.closed = True
+                raise WsClosed('connection lost')
+            for i in range(n):
+                data[i] ^= mask[i & 3]
+            if op == OP_PING:
+                await self._send(OP_PONG, bytes(data))
+            elif op == OP_PONG:
+                pass
+            elif op == OP_CLOSE:
+                await self.close(CLOSE_NORMAL)
+                raise WsClosed('closed by peer')
+            elif op != OP_TEXT or not fin:
+                await self.close(CLOSE_UNSUPPORTED)
+                raise WsClosed('binary or fragmented message')
+            else:
+                try:
+                    return bytes(data).decode()
+                except UnicodeError:
+                    await self.close(CLOSE_PROTOCOL)
+                    raise WsClosed('invalid UTF-8')
+
+    async def send(self, text):
+        await self._send(OP_TEXT, text.encode() if isinstance(text, str) else text)
+
+    async def _send(self, opcode, payload):
+        if self.closed:
+            raise WsClosed('closed')
+        # one write per frame: frames from different coroutines never interleave
+        self.writer.write(frame(opcode, payload))
+        await self.writer.drain()
+
+    async def close(self, code=CLOSE_NORMAL):
+        if self.closed:
+            return
+        try:
+            await asyncio.wait_for_ms(self._send(OP_CLOSE, bytes((code >> 8, code & 0xFF))), 1000)
+        except Exception:
+            pass
+        self.closed = True
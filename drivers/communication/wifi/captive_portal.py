@@ -0,0 +1,181 @@
+# === FILE: drivers/communication/wifi/captive_portal.py ===
+import socket
+import time
+import ujson
+import uasyncio as asyncio
+from drivers.communication import httpd
+from core import log
+
+PORTAL_GZ = 'www/portal.html.gz'
+MAX_CLIENTS = 4
+DNS_PORT = 53
+DNS_POLL_MS = 50
+DNS_TTL_S = 60
+SCAN_INTERVAL_S = 20
+
+# served when the precompressed page is missing or the client refuses gzip
+FALLBACK_HTML = """<html><body><h3>ESP32 WiFi Setup</h3>
+<form method='POST' action='/save'>
+SSID: <input name='ssid'/><br/>
+Password: <input name='password' type='password'/><br/>
+<input type='submit' value='Save & Reboot'/>
+</form></body></html>"""
+
+
+def dns_answer(query, ip4):
+    """对任意 DNS 查询构造一条指向 ip4（4 字节）的 A 记录应答；报文非法返回 None。"""
+    n = len(query)
+    if n < 12 or query[2] & 0x80:
+        return None
+    i = 12
+    while i < n and query[i] != 0:
+        i += query[i] + 1
+    end = i + 5  # zero label + QTYPE + QCLASS
+    if end > n:
+        return None
+    return (query[:2] + b'\x81\x80' + query[4:6] + b'\x00\x01\x00\x00\x00\x00' + query[12:end]
+            + b'\xc0\x0c\x00\x01\x00\x01' + DNS_TTL_S.to_bytes(4, 'big') + b'\x00\x04' + ip4)
+
+
+class CaptivePortal:
+    """AP 配网门户：DNS 劫持 + 多客户端 HTTP（gzip 预压缩页面、缓存扫描结果）。"""
+
+    def __init__(self, wm, ap_ip):
+        self.wm = wm
+        self.ap_ip = ap_ip
+        self.ip4 = bytes(int(x) for x in ap_ip.split('.'))
+        self.home = 'http://{}/'.format(ap_ip)
+        self.saved_conf = None
+        self.running = False
+        self.clients = 0
+        self.networks = []     # cached scan results [{'ssid', 'rssi'}]
+        self.buf = bytearray(httpd.CHUNK)
+
+    # ---------------- DNS -----------------
+    async def _dns(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('0.0.0.0', DNS_PORT))
+            sock.setblocking(False)
+            while self.running:
+                try:
+                    data, addr = sock.recvfrom(512)
+                except OSError:
+                    await asyncio.sleep_ms(DNS_POLL_MS)
+                    continue
+                resp = dns_answer(data, self.ip4)
+                if resp:
+                    try:
+                        sock.sendto(resp, addr)
+                    except OSError:
+                        pass
+        except Exception as e:
+            log.msg(log.PORTAL_DNS, e)
+        finally:
+            sock.close()
+
+    # ---------------- scan cache -----------------
+    async def _scan(self):
+        while self.running:
+            try:
+                wlan = self.wm.wlan
+                wlan.active(True)
+                best = {}
+                for ssid, _bssid, _ch, rssi, _sec, hidden in wlan.scan():
+                    if hidden or not ssid:
+                        continue
+                    try:
+                        name = ssid.decode()
+                    except Exception:
+                        continue
+                    if name not in best or rssi > best[name]:
+                        best[name] = rssi
+                nets = [{'ssid': k, 'rssi': v} for k, v in best.items()]
+                nets.sort(key=lambda n: n['rssi'], reverse=True)
+                self.networks = nets
+            except Exception as e:
+                log.msg(log.PORTAL_SCAN, e)
+            await asyncio.sleep(SCAN_INTERVAL_S)
+
+    # ---------------- HTTP -----------------
+    async def _route(self, req, writer):
+        if req.method == 'POST' and req.path.startswith('/save'):
+            params = httpd.parse_form(req.body)
+            ssid = params.get('ssid', '').strip()
+            pwd = params.get('password', '').strip()
+            if not ssid:
+                await httpd.send(writer, 400, 'SSID required.')
+            elif self.wm.add_network(ssid, pwd):
+                self.saved_conf = {'ssid': ssid, 'password': pwd}
+                await httpd.send(writer, 200, 'Saved, device will reconnect.')
+            else:
+                await httpd.send(writer, 500, 'Save failed.')
+        elif req.method != 'GET':
+            await httpd.send(writer, 405)
+        elif req.path == '/scan':
+            await httpd.send(writer, 200, ujson.dumps(self.networks), 'application/json')
+        elif req.path in ('/', '/index.html'):
+            gz = 'gzip' in req.headers.get('accept-encoding', '')
+            if not (gz and await httpd.send_file(writer, PORTAL_GZ, 'text/html; charset=utf-8', True, self.buf)):
+                await httpd.send(writer, 200, FALLBACK_HTML, 'text/html')
+        else:
+            # OS connectivity probes (generate_204, hotspot-detect...) and any
+            # other URL land on the portal, which triggers the sign-in popup
+            await httpd.redirect(writer, self.home)
+
+    async def _handle(self, reader, writer):
+        if self.clients >= MAX_CLIENTS:
+            try:
+                await httpd.send(writer, 503)
+            except Exception:
+                pass
+            await httpd.close(writer)
+            return
+        self.clients += 1
+        try:
+            try:
+                req = await httpd.read_request(reader)
+            except httpd.HttpError as e:
+                await httpd.send(writer, e.status, httpd.REASONS.get(e.status, ''))
+                return
+            await self._route(req, writer)
+        except Exception as e:
+            log.msg(log.PORTAL_CLIENT, e)
+        finally:
+            self.clients -= 1
+            await httpd.close(writer)
+
+    async def run(self, timeout_s=300):
+        """运行门户直到保存成功或超时；返回保存的配置 dict 或 None。"""
+        try:
+            srv = await asyncio.start_server(self._handle, '0.0.0.0', 80)
+            log.msg(log.PORTAL_STARTED)
+        except Exception as e:
+            log.msg(log.PORTAL_FAILED, e)
+            return None
+        self.running = True
+        dns = asyncio.create_task(self._dns())
+        scan = asyncio.create_task(self._scan())
+        start = time.time()
+        try:
+            while self.saved_conf is None:
+                if timeout_s and (time.time() - start) > timeout_s:
+                    break
+                await asyncio.sleep_ms(200)
+            if self.saved_conf is not None:
+                # let the browser receive the confirmation before the AP goes away
+                await asyncio.sleep_ms(500)
+        finally:
+            self.running = False
+            scan.cancel()
+            try:
+                srv.close()
+                await srv.wait_closed()
+            except Exception:
+                pass
+            try:
+                await asyncio.wait_for_ms(dns, 500)
+            except Exception:
+                pass
+        return self.saved_conf
@@ -1,52 +1,206 @@
 # === FILE: drivers/communication/wifi/wifi_manager.py ===
 import network
-import socket
-import ure
 import ujson
 import time
 import uasyncio as asyncio
 from machine import Pin
+from core import log
 
 WIFI_CONFIG_FILE = 'wifi.dat'
+MAX_NETWORKS = 5
+POLL_MS = 50
+FAST_CONNECT_TIMEOUT_MS = 4000
+
+
+def _bssid_str(b):
+    return ':'.join('{:02x}'.format(x) for x in b)
+
+
+def _bssid_bytes(s):
+    return bytes(int(x, 16) for x in s.split(':'))
+
 
 class WifiManager:
-    def __init__(self):
+    def __init__(self, reuse_ip=False):
         # keep separate interfaces; re-created when needed
         self.wlan = network.WLAN(network.STA_IF)
         self.ap = network.WLAN(network.AP_IF)
+        self.reuse_ip = reuse_ip
+        self.stats = {
+            'attempts': 0,
+            'fast_ok': 0,
+            'scan_ok': 0,
+            'failures': 0,
+            'last_ms': 0,
+            'last_method': None,
+            'avg_fast_ms': 0,
+            'avg_scan_ms': 0,
+        }
 
-    # ---------------- STA helpers -----------------
-    async def connect_saved(self, timeout=30):
-        """读取 wifi.dat 连接 STA，超时返回 False。"""
-        # try to load wifi.dat
+    # ---------------- saved networks -----------------
+    def load_config(self):
+        """读取 wifi.dat，返回 {'networks': [...], 'last': {...} 或 None}；兼容旧的单网络格式。"""
         try:
             with open(WIFI_CONFIG_FILE, 'r') as f:
                 j = ujson.loads(f.read())
-                ssid = j.get('ssid')
-                pwd = j.get('password')
         except Exception:
-            ssid = None
-            pwd = None
-        if not ssid:
-            return False
+            j = {}
+        if 'networks' not in j:
+            # legacy {"ssid": ..., "password": ...}
+            nets = [{'ssid': j['ssid'], 'password': j.get('password', '')}] if j.get('ssid') else []
+            j = {'networks': nets, 'last': None}
+        j.setdefault('last', None)
+        return j
+
+    def add_network(self, ssid, password):
+        """新增/更新一个网络并置为最高优先级，保留其它已保存网络。"""
+        conf = self.load_config()
+        nets = [n for n in conf['networks'] if n.get('ssid') != ssid]
+        nets.insert(0, {'ssid': ssid, 'password': password})
+        conf['networks'] = nets[:MAX_NETWORKS]
+        return self.save_config(conf)
+
+    # ---------------- STA helpers -----------------
+    def _activate(self, recreate=False):
+        if recreate:
+            try:
+                self.wlan.active(False)
+            except Exception:
+                pass
+            # fresh interface helps avoid "Wifi Internal Error"
+            self.wlan = network.WLAN(network.STA_IF)
+        self.wlan.active(True)
         try:
-            self.wlan.active(False)
+            if self.wlan.isconnected() or self.wlan.status() == network.STAT_CONNECTING:
+                self.wlan.disconnect()
         except Exception:
             pass
-        # fresh interface helps avoid "Wifi Internal Error"
+
+    async def _wait_connected(self, timeout_ms):
+        t0 = time.ticks_ms()
+        while not self.wlan.isconnected():
+            await asyncio.sleep_ms(POLL_MS)
+            if time.ticks_diff(time.ticks_ms(), t0) > timeout_ms:
+                try:
+                    self.wlan.disconnect()
+                except Exception:
+                    pass
+                return False
+        return True
+
+    async def _try(self, ssid, pwd, timeout_ms, bssid=None, channel=None, ifconfig=None):
         try:
-            self.wlan = network.WLAN(network.STA_IF)
-            self.wlan.active(True)
-            self.wlan.connect(ssid, pwd)
+            if channel:
+                try:
+                    self.wlan.config(channel=channel)
+                except Exception:
+                    pass
+            if ifconfig:
+                # static address skips the DHCP round trip
+                self.wlan.ifconfig(tuple(ifconfig))
+            else:
+                try:
+                    self.wlan.ifconfig('dhcp')
+                except Exception:
+                    pass
+            if bssid:
+                self.wlan.connect(ssid, pwd, bssid=_bssid_bytes(bssid))
+            else:
+                self.wlan.connect(ssid, pwd)
         except Exception as e:
-            print('STA start/connect error', e)
+            log.msg(log.STA_CONNECT, e)
+            self._activate(recreate=True)
             return False
-        t0 = time.time()
-        while not self.wlan.isconnected():
-            await asyncio.sleep_ms(500)
-            if time.time() - t0 > timeout:
+        return await self._wait_connected(timeout_ms)
+
+    def _rank(self, nets):
+        """扫描附近网络，按 RSSI 从强到弱排列已保存网络；扫描不到的（可能隐藏）排在最后。"""
+        seen = {}
+        try:
+            for ssid, bssid, channel, rssi, _sec, _hidden in self.wlan.scan():
+                try:
+                    name = ssid.decode()
+                except Exception:
+                    continue
+                if name not in seen or rssi > seen[name][2]:
+                    seen[name] = (_bssid_str(bssid), channel, rssi)
+        except Exception as e:
+            log.msg(log.STA_SCAN, e)
+        ranked = []
+        rest = []
+        for n in nets:
+            hit = seen.get(n.get('ssid'))
+            if hit:
+                ranked.append((hit[2], n, hit[0], hit[1]))
+            else:
+                rest.append((-999, n, None, None))
+        ranked.sort(key=lambda r: r[0], reverse=True)
+        return ranked + rest
+
+    def _record(self, method, ms):
+        st = self.stats
+        st['last_ms'] = ms
+        st['last_method'] = method
+        key = method + '_ok'
+        st[key] += 1
+        avg = 'avg_' + method + '_ms'
+        # running mean over successful connects of this kind
+        st[avg] = st[avg] + (ms - st[avg]) // st[key]
+
+    def _remember(self, conf, ssid, bssid, channel):
+        """记录本次成功连接的 BSSID/信道/IP，仅在变化时写闪存。"""
+        if not bssid:
+            return
+        try:
+            ifc = list(self.wlan.ifconfig())
+        except Exception:
+            ifc = None
+        last = {'ssid': ssid, 'bssid': bssid, 'channel': channel, 'ifconfig': ifc}
+        if conf.get('last') != last:
+            conf['last'] = last
+            self.save_config(conf)
+
+    async def connect_saved(self, timeout=30):
+        """连接已保存网络：先用缓存的 BSSID/信道（可选静态 IP）快速重连，失败再扫描按信号强度依次尝试。"""
+        conf = self.load_config()
+        nets = conf['networks']
+        if not nets:
+            return False
+        self.stats['attempts'] += 1
+        t0 = time.ticks_ms()
+        try:
+            self._activate()
+        except Exception as e:
+            log.msg(log.STA_ACTIVATE, e)
+            try:
+                self._activate(recreate=True)
+            except Exception:
                 return False
-        return True
+
+        last = conf.get('last')
+        if last:
+            net = None
+            for n in nets:
+                if n.get('ssid') == last.get('ssid'):
+                    net = n
+            if net and last.get('bssid'):
+                ifc = last.get('ifconfig') if self.reuse_ip else None
+                if await self._try(net['ssid'], net.get('password', ''), FAST_CONNECT_TIMEOUT_MS,
+                                   last['bssid'], last.get('channel'), ifc):
+                    self._record('fast', time.ticks_diff(time.ticks_ms(), t0))
+                    self._remember(conf, net['ssid'], last['bssid'], last.get('channel'))
+                    return True
+
+        for _rssi, net, bssid, channel in self._rank(nets):
+            left = timeout * 1000 - time.ticks_diff(time.ticks_ms(), t0)
+            if left <= 0:
+                break
+            if await self._try(net['ssid'], net.get('password', ''), left, bssid, channel):
+                self._record('scan', time.ticks_diff(time.ticks_ms(), t0))
+                self._remember(conf, net['ssid'], bssid, channel)
+                return True
+        self.stats['failures'] += 1
+        return False
 
     def is_connected(self):
         return self.wlan.isconnected()
@@ -69,39 +223,12 @@ class WifiManager:
             self.ap.active(True)
             # WPA2-PSK auth (MicroPython 1.26默认)；channel 默认 1
             self.ap.config(essid=ssid, password=password)
-            print('AP started', ssid)
+            log.msg(log.AP_STARTED, ssid)
             return True
         except Exception as e:
-            print('start_ap_and_captive failed', e)
+            log.msg(log.AP_FAILED, e)
             return False
 
-    def _parse_form(self, body):
-        # parse application/x-www-form-urlencoded payload
-        params = {}
-        for pair in body.split('&'):
-            if '=' in pair:
-                k, v = pair.split('=', 1)
-                params[self._urldecode(k)] = self._urldecode(v)
-        return params
-
-    def _urldecode(self, s):
-        res = ''
-        i = 0
-        while i < len(s):
-            c = s[i]
-            if c == '+':
-                res += ' '
-            elif c == '%' and i + 2 < len(s):
-                try:
-                    res += chr(int(s[i+1:i+3], 16))
-                    i += 2
-                except Exception:
-                    res += c
-            else:
-                res += c
-            i += 1
-        return res
-
     def save_config(self, conf):
         """将 Wi-Fi 配置写入 wifi.dat。"""
         try:
@@ -109,7 +236,7 @@ class WifiManager:
                 f.write(ujson.dumps(conf))
             return True
         except Exception as e:
-            print('save wifi config error', e)
+            log.msg(log.WIFI_SAVE_FAILED, e)
             return False
 
     async def stop_ap(self):
@@ -119,95 +246,12 @@ class WifiManager:
 
     async def captive_portal(self, timeout_s=300):
         """
-        在 AP 模式下开启一个极简 HTTP 服务器，POST /save 保存 ssid/password。
+        在 AP 模式下运行配网门户（DNS 劫持 + HTTP），POST /save 保存 ssid/password。
         成功返回保存的配置 dict，失败或超时返回 None。
         """
-        saved_conf = None
-
-        async def handle(reader, writer):
-            nonlocal saved_conf
-            try:
-                line = await reader.readline()
-                if not line:
-                    await writer.wait_closed()
-                    return
-                try:
-                    parts = line.decode().split()
-                    method, path = parts[0], parts[1]
-                except Exception:
-                    method, path = 'GET', '/'
-
-                headers = {}
-                while True:
-                    h = await reader.readline()
-                    if not h or h == b'\r\n':
-                        break
-                    try:
-                        k, v = h.decode().split(':', 1)
-                        headers[k.strip().lower()] = v.strip()
-                    except Exception:
-                        pass
-
-                body = b''
-                if 'content-length' in headers:
-                    try:
-                        length = int(headers['content-length'])
-                        if length > 0:
-                            body = await reader.readexactly(length)
-                    except Exception:
-                        pass
-
-                if method == 'POST' and path.startswith('/save'):
-                    try:
-                        params = self._parse_form(body.decode())
-                    except Exception:
-                        params = {}
-                    ssid = params.get('ssid', '').strip()
-                    pwd = params.get('password', '').strip()
-                    if ssid:
-                        conf = {'ssid': ssid, 'password': pwd}
-                        if self.save_config(conf):
-                            saved_conf = conf
-                            resp = 'HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\n\r\nSaved, device will reconnect.'
-                        else:
-                            resp = 'HTTP/1.0 500 Internal Server Error\r\nContent-Type: text/plain\r\n\r\nSave failed.'
-                    else:
-                        resp = 'HTTP/1.0 400 Bad Request\r\nContent-Type: text/plain\r\n\r\nSSID required.'
-                    await writer.awrite(resp)
-                else:
-                    html = """<html><body><h3>ESP32 WiFi Setup</h3>
-                    <form method='POST' action='/save'>
-                    SSID: <input name='ssid'/><br/>
-                    Password: <input name='password' type='password'/><br/>
-                    <input type='submit' value='Save & Reboot'/>
-                    </form></body></html>"""
-                    resp = 'HTTP/1.0 200 OK\r\nContent-Type: text/html\r\n\r\n' + html
-                    await writer.awrite(resp)
-            except Exception as e:
-                print('captive handler error', e)
-            try:
-                await writer.wait_closed()
-            except Exception:
-                pass
-
+        from drivers.communication.wifi.captive_portal import CaptivePortal
         try:
-            srv = await asyncio.start_server(handle, '0.0.0.0', 80)
-            print('Captive portal running on 0.0.0.0:80')
-        except Exception as e:
-            print('start_server failed', e)
-            return None
-
-        start = time.time()
-        try:
-            while saved_conf is None:
-                if timeout_s and (time.time() - start) > timeout_s:
-                    break
-                await asyncio.sleep_ms(200)
-        finally:
-            try:
-                srv.close()
-                await srv.wait_closed()
-            except Exception:
-                pass
-
-        return saved_conf
+            ap_ip = self.ap.ifconfig()[0]
+        except Exception:
+            ap_ip = '192.168.4.1'
+        return await CaptivePortal(self, ap_ip).run(timeout_s)
@@ -2,6 +2,7 @@
 # Simple one-pixel RGB indicator (GRB channel order, e.g. WS2812/NeoPixel)
 import neopixel
 from machine import Pin
+from core import log
 
 
 class IndicatorRGB:
@@ -19,7 +20,7 @@ class IndicatorRGB:
             self.np[0] = self._to_grb(rgb)
             self.np.write()
         except Exception as e:
-            print('IndicatorRGB set_color error', e)
+            log.msg(log.RGB_LED, e)
 
     def off(self):
         self.set_color((0, 0, 0))
@@ -1,17 +1,16 @@
 # === FILE: drivers/display/ssd1306.py ===
-from machine import I2C, Pin
+import uasyncio as asyncio
+import framebuf
 import ssd1306
 
 class SSD1306Display:
-    def __init__(self, width=128, height=64, scl_pin=None, sda_pin=None):
-        """封装 SSD1306 初始化，默认使用配置文件中的 I2C 引脚。"""
-        if scl_pin is None:
-            from config import OLED_SCL_PIN
-            scl_pin = OLED_SCL_PIN
-        if sda_pin is None:
-            from config import OLED_SDA_PIN
-            sda_pin = OLED_SDA_PIN
-        self.i2c = I2C(0, scl=Pin(scl_pin), sda=Pin(sda_pin))
+    def __init__(self, width=128, height=64, bus=None):
+        """封装 SSD1306 初始化；bus 默认为共享总线 core.i2c_bus.get_bus()。"""
+        if bus is None:
+            from core.i2c_bus import get_bus
+            bus = get_bus()
+        self.bus = bus
+        self.i2c = bus
         self.oled = ssd1306.SSD1306_I2C(width, height, self.i2c)
 
     def fill(self, col):
@@ -20,9 +19,51 @@ class SSD1306Display:
     def text(self, t, x, y):
         self.oled.text(t, x, y)
 
+    def pixel(self, x, y, col=1):
+        self.oled.pixel(x, y, col)
+
+    def hline(self, x, y, w, col=1):
+        self.oled.hline(x, y, w, col)
+
+    def vline(self, x, y, h, col=1):
+        self.oled.vline(x, y, h, col)
+
+    def rect(self, x, y, w, h, col=1):
+        self.oled.rect(x, y, w, h, col)
+
+    def fill_rect(self, x, y, w, h, col=1):
+        self.oled.fill_rect(x, y, w, h, col)
+
+    def blit(self, fb, x, y):
+        self.oled.blit(fb, x, y)
+
+    @staticmethod
+    def label(t):
+        """预渲染一段静态文字为 8 像素高的 FrameBuffer，供 blit 复用。"""
+        w = len(t) * 8
+        fb = framebuf.FrameBuffer(bytearray(w), w, 8, framebuf.MONO_VLSB)
+        fb.text(t, 0, 0)
+        return fb
+
     def show(self):
-        self.oled.show()
+        """只发送与上次传输不同的页/列窗口，返回发送字节数。"""
+        return self.oled.show()
+
+    async def show_async(self):
+        """按页刷新脏区，每页单独持有总线锁，避免整屏刷新阻塞 SGP30 时序。"""
+        sent = 0
+        for page in range(self.oled.pages):
+            span = self.oled.dirty_span(page)
+            if span is None:
+                continue
+            await self.bus.acquire()
+            try:
+                sent += self.oled.show_page(page, span)
+            finally:
+                self.bus.release()
+            await asyncio.sleep_ms(0)
+        return sent
 
     def clear(self):
+        """清空帧缓冲（不刷新屏幕），下次 show() 只发送变化部分。"""
         self.oled.fill(0)
-        self.oled.show()
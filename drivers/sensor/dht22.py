@@ -1,6 +1,7 @@
 # === FILE: drivers/sensor/dht22.py ===
 import dht
 from machine import Pin
+from core import log
 
 class DHT22:
     def __init__(self, pin):
@@ -16,5 +17,5 @@ class DHT22:
             return float(t), float(h)
         except Exception as e:
             # return None to indicate error; caller should handle
-            print('DHT22 read error', e)
+            log.msg(log.DHT_READ, e)
             return None, None
@@ -1,5 +1,6 @@
 # === FILE: drivers/sensor/light_sensor.py ===
 from machine import ADC, Pin
+from core import log
 
 class LightSensor:
     def __init__(self, pin):
@@ -15,5 +16,5 @@ class LightSensor:
         try:
             return self.adc.read()
         except Exception as e:
-            print('LightSensor read error', e)
+            log.msg(log.LIGHT_READ, e)
             return 0
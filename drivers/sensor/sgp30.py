@@ -1,15 +1,20 @@
 # === FILE: drivers/sensor/sgp30.py ===
-from machine import I2C
-from machine import Pin
+import uasyncio as asyncio
 import time
 import math
+from core import log
 
 SGP30_ADDR = 0x58
+MEASURE_DELAY_MS = 12
 
 class SGP30:
-    def __init__(self, sda, scl, id=0):
-        # create I2C instance id 0
-        self.i2c = I2C(id, scl=Pin(scl), sda=Pin(sda))
+    def __init__(self, bus=None):
+        """bus: 共享的 core.i2c_bus.I2CBus，默认 get_bus()。"""
+        if bus is None:
+            from core.i2c_bus import get_bus
+            bus = get_bus()
+        self.bus = bus
+        self.i2c = bus
         time.sleep_ms(10)
         try:
             # init air quality
@@ -19,19 +24,40 @@ class SGP30:
             self.i2c.writeto(SGP30_ADDR, b"\x20\x08")
             time.sleep_ms(10)
         except Exception as e:
-            print('SGP30 init error', e)
+            log.msg(log.SGP30_INIT, e)
 
     def read(self):
         try:
             # request measurement
             self.i2c.writeto(SGP30_ADDR, b"\x20\x08")
-            time.sleep_ms(12)
+            time.sleep_ms(MEASURE_DELAY_MS)
             data = self.i2c.readfrom(SGP30_ADDR, 6)
             eco2 = (data[0] << 8) | data[1]
             tvoc = (data[3] << 8) | data[4]
             return int(eco2), int(tvoc)
         except Exception as e:
-            print('SGP30 read error', e)
+            log.msg(log.SGP30_READ, e)
+            return None, None
+
+    async def read_async(self):
+        """异步读取 eCO2/TVOC：测量等待期间释放总线，供 OLED 等设备使用。"""
+        try:
+            await self.bus.acquire()
+            try:
+                self.i2c.writeto(SGP30_ADDR, b"\x20\x08")
+            finally:
+                self.bus.release()
+            await asyncio.sleep_ms(MEASURE_DELAY_MS)
+            await self.bus.acquire()
+            try:
+                data = self.i2c.readfrom(SGP30_ADDR, 6)
+            finally:
+                self.bus.release()
+            eco2 = (data[0] << 8) | data[1]
+            tvoc = (data[3] << 8) | data[4]
+            return int(eco2), int(tvoc)
+        except Exception as e:
+            log.msg(log.SGP30_READ, e)
             return None, None
 
     def _abs_humidity_gm3(self, t_c, rh):
@@ -43,7 +69,7 @@ class SGP30:
             vap = (rh / 100.0) * sat
             return 216.7 * vap / (273.15 + t_c)  # g/m^3
         except Exception as e:
-            print('SGP30 abs humidity error', e)
+            log.msg(log.SGP30_HUMIDITY, e)
             return None
 
     def set_humidity(self, t_c, rh):
@@ -64,7 +90,15 @@ class SGP30:
             self.i2c.writeto(SGP30_ADDR, buf)
             return True
         except Exception as e:
-            print('SGP30 set_humidity error', e)
+            log.msg(log.SGP30_HUMIDITY, e)
             return False
 
+    async def set_humidity_async(self, t_c, rh):
+        """在总线锁内写入湿度补偿。"""
+        await self.bus.acquire()
+        try:
+            return self.set_humidity(t_c, rh)
+        finally:
+            self.bus.release()
+
 
@@ -34,6 +34,11 @@ class SSD1306(framebuf.FrameBuffer):
         self.external_vcc = external_vcc
         self.pages = self.height // 8
         self.buffer = bytearray(self.pages * self.width)
+        # shadow of what the panel's GDDRAM holds; show() only sends differences
+        self.shadow = bytearray(self.pages * self.width)
+        self._stale = (1 << self.pages) - 1  # pages whose GDDRAM content is unknown
+        self._win = bytearray(6)
+        self.bytes_sent = 0
         super().__init__(self.buffer, self.width, self.height, framebuf.MONO_VLSB)
         self.init_display()
 
@@ -93,21 +98,62 @@ class SSD1306(framebuf.FrameBuffer):
         self.write_cmd(SET_COM_OUT_DIR | ((rotate & 1) << 3))
         self.write_cmd(SET_SEG_REMAP | (rotate & 1))
 
-    def show(self):
-        x0 = 0
-        x1 = self.width - 1
+    def invalidate(self):
+        # force the next show() to resend every page
+        self._stale = (1 << self.pages) - 1
+
+    def dirty_span(self, page):
+        # (first, last) changed column of a page versus the shadow, or None
+        w = self.width
+        if self._stale & (1 << page):
+            return 0, w - 1
+        buf = self.buffer
+        shadow = self.shadow
+        start = page * w
+        end = start + w
+        i = start
+        while i < end and buf[i] == shadow[i]:
+            i += 1
+        if i == end:
+            return None
+        j = end - 1
+        while buf[j] == shadow[j]:
+            j -= 1
+        return i - start, j - start
+
+    def show_page(self, page, span=None):
+        # send only the changed column window of one page; returns bytes sent
+        if span is None:
+            span = self.dirty_span(page)
+            if span is None:
+                return 0
+        c0, c1 = span
+        col_offset = 0
         if self.width != 128:
             # narrow displays use centred columns
             col_offset = (128 - self.width) // 2
-            x0 += col_offset
-            x1 += col_offset
-        self.write_cmd(SET_COL_ADDR)
-        self.write_cmd(x0)
-        self.write_cmd(x1)
-        self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
-        self.write_data(self.buffer)
+        win = self._win
+        win[0] = SET_COL_ADDR
+        win[1] = col_offset + c0
+        win[2] = col_offset + c1
+        win[3] = SET_PAGE_ADDR
+        win[4] = page
+        win[5] = page
+        self.write_cmds(win)
+        a = page * self.width + c0
+        b = page * self.width + c1 + 1
+        mv = memoryview(self.buffer)
+        self.write_data(mv[a:b])
+        self.shadow[a:b] = mv[a:b]
+        self._stale &= ~(1 << page)
+        self.bytes_sent += b - a
+        return b - a
+
+    def show(self):
+        sent = 0
+        for page in range(self.pages):
+            sent += self.show_page(page)
+        return sent
 
 
 class SSD1306_I2C(SSD1306):
@@ -116,6 +162,7 @@ class SSD1306_I2C(SSD1306):
         self.addr = addr
         self.temp = bytearray(2)
         self.write_list = [b"\x40", None]  # Co=0, D/C#=1
+        self.cmd_list = [b"\x00", None]  # Co=0, D/C#=0
         super().__init__(width, height, external_vcc)
 
     def write_cmd(self, cmd):
@@ -123,6 +170,11 @@ class SSD1306_I2C(SSD1306):
         self.temp[1] = cmd
         self.i2c.writeto(self.addr, self.temp)
 
+    def write_cmds(self, cmds):
+        # several command bytes in one transaction (Co=0, D/C#=0)
+        self.cmd_list[1] = cmds
+        self.i2c.writevto(self.addr, self.cmd_list)
+
     def write_data(self, buf):
         self.write_list[1] = buf
         self.i2c.writevto(self.addr, self.write_list)
@@ -155,6 +207,14 @@ class SSD1306_SPI(SSD1306):
         self.spi.write(bytearray([cmd]))
         self.cs(1)
 
+    def write_cmds(self, cmds):
+        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+        self.cs(1)
+        self.dc(0)
+        self.cs(0)
+        self.spi.write(cmds)
+        self.cs(1)
+
     def write_data(self, buf):
         self.spi.init(baudrate=self.rate, polarity=0, phase=0)
         self.cs(1)
@@ -5,16 +5,41 @@ Main entry for ESP32-S3 MicroPython Sun Lamp
 Place this file at the project root as main.py
 Requires: config.py and drivers/ and tasks/ as per project structure
 """
+from core import bootlog  # first: starts the boot stopwatch
+bootlog.profile_imports()
 import uasyncio as asyncio
 import sys
 import gc
-from tasks.wifi_task import wifi_manager_task
-from tasks.mqtt_task import mqtt_client_task
-from tasks.sensor_task import sensor_reader_task
-from tasks.display_task import display_task
-from tasks.input_task import input_handler_task
-from tasks.actuator_task import actuator_controller_task
-from config import *
+from core import log
+from config import DAYLIGHT_TARGET, DAYLIGHT_KP, DAYLIGHT_KI, DAYLIGHT_DEADBAND
+from config import BOOT_PROFILE, BOOT_PROFILE_FILE
+
+# task name -> (module under tasks/, coroutine function); modules are imported
+# when their boot stage starts so the lamp does not wait for network imports
+TASKS = {
+    'actuator': ('actuator_task', 'actuator_controller_task'),
+    'input': ('input_task', 'input_handler_task'),
+    'scheduler': ('scheduler_task', 'scheduler_task'),
+    'clock': ('time_task', 'clock_task'),
+    'wifi': ('wifi_task', 'wifi_manager_task'),
+    'mqtt': ('mqtt_task', 'mqtt_client_task'),
+    'api': ('api_task', 'local_api_task'),
+    'sensor': ('sensor_task', 'sensor_reader_task'),
+    'daylight': ('daylight_task', 'daylight_task'),
+    'display': ('display_task', 'display_task'),
+    'power': ('power_task', 'power_governor_task'),
+}
+
+# boot stages in priority order; stage one lights the strip from saved state
+STAGES = (
+    ('lamp', ('actuator',)),
+    ('input', ('input', 'scheduler')),
+    ('network', ('wifi', 'mqtt', 'clock', 'api')),
+    ('sensors', ('sensor', 'daylight')),
+    ('display', ('display',)),
+    # last: boot runs at full clock, then the governor takes over
+    ('power', ('power',)),
+)
 
 # shared state (single source of truth)
 system_state = {
@@ -25,26 +50,51 @@ system_state = {
         "tvoc": 0,
         "light": 0
     },
+    # smoothed readings and per-minute trends from core/filters.py
+    "filtered": {},
+    "trend": {},
     "lamp": {
         "is_on": False,
         "brightness": 50,
         "color_mode": "temp",  # 'temp' (color_temp_k) or 'custom'
+        "brightness_mode": "manual",  # 'manual' or 'auto' (daylight harvesting)
         "color_temp_k": 4000,
         "custom_rgb": (255, 220, 200),
         "animation": None,
-        "animation_start_ts": 0,
+        "animation_start_ms": 0,  # core.clock.now_ms() when the animation began
+        "animation_sync": None,  # absolute group start (Unix ms) or None for a local start
+        "animation_seq": None,  # seq of the last group anim command applied
         "animation_duration_s": 0,
         "animation_progress": 0.0
     },
+    "daylight": {
+        "target": DAYLIGHT_TARGET,
+        "kp": DAYLIGHT_KP,
+        "ki": DAYLIGHT_KI,
+        "deadband": DAYLIGHT_DEADBAND,
+        "measured": 0,
+        "output": None
+    },
     "network": {
         "wifi_status": "offline",
         "mqtt_status": "offline",
         "last_mqtt_pub_ts": 0
     },
-    "meta": {
-        "frame_interval_ms": 100,
-        "neopixel_min_write_gap_ms": 20
-    }
+    # NTP sync state from tasks/time_task.py (core.clock.stats + synced)
+    "clock": {"synced": False},
+    # next local alarm from tasks/scheduler_task.py
+    "schedule": None,
+    # rule count, active rules and recent firings from core/rules.py (sensor_task)
+    "rules": None,
+    # governor state and time in each power state from tasks/power_task.py
+    "power": None,
+    "ui": {
+        "screen": 0  # index into display_task.SCREENS
+    },
+    # per-field core.history.History ring buffers, created by sensor_task
+    "history": None,
+    # boot_ms from core/bootlog.py; tunables live in core/settings.py
+    "meta": {}
 }
 
 # simple lock compatibility for older uasyncio
@@ -63,6 +113,12 @@ except AttributeError:
 
 state_lock = Lock()
 
+def start_task(tasks, name):
+    """按需导入任务模块并创建协程任务。"""
+    mod_name, fn_name = TASKS[name]
+    mod = __import__('tasks.' + mod_name, None, None, [fn_name])
+    tasks[name] = asyncio.create_task(getattr(mod, fn_name)(system_state, state_lock))
+
 async def monitor_tasks(tasks):
     """监控所有子任务，若异常退出则尝试重启一次。
 
@@ -77,38 +133,51 @@ async def monitor_tasks(tasks):
                     exc = task.exception()
                 except Exception:
                     exc = None
-                print('Task', tname, 'finished unexpectedly,', exc)
+                log.msg(log.TASK_DIED, '{} {}'.format(tname, exc))
                 # attempt restart once
-                if tname == 'wifi':
-                    tasks[tname] = asyncio.create_task(wifi_manager_task(system_state, state_lock))
-                elif tname == 'mqtt':
-                    tasks[tname] = asyncio.create_task(mqtt_client_task(system_state, state_lock))
-                elif tname == 'sensor':
-                    tasks[tname] = asyncio.create_task(sensor_reader_task(system_state, state_lock))
-                elif tname == 'display':
-                    tasks[tname] = asyncio.create_task(display_task(system_state, state_lock))
-                elif tname == 'input':
-                    tasks[tname] = asyncio.create_task(input_handler_task(system_state, state_lock))
-                elif tname == 'actuator':
-                    tasks[tname] = asyncio.create_task(actuator_controller_task(system_state, state_lock))
+                if tname in TASKS:
+                    start_task(tasks, tname)
         await asyncio.sleep(5)
 
 async def main():
-    """系统入口：创建全局任务并启动调度。"""
-    print('Starting main...')
-    gc.collect()
+    """系统入口：分阶段启动任务。先恢复灯状态并点亮灯带，再依次启动输入、网络、传感器、显示。"""
+    log.msg(log.BOOT)
+    bootlog.mark('main')
+
+    from core import persist
+    if persist.load_lamp(system_state['lamp']):
+        log.msg(log.LAMP_RESTORED, '{} {}'.format('on' if system_state['lamp']['is_on'] else 'off',
+                                                  system_state['lamp'].get('animation') or ''))
+    bootlog.mark('restore')
 
-    # start tasks
     tasks = {}
-    tasks['wifi'] = asyncio.create_task(wifi_manager_task(system_state, state_lock))
-    # mqtt depends on wifi but task can run and wait for network
-    tasks['mqtt'] = asyncio.create_task(mqtt_client_task(system_state, state_lock))
-    tasks['sensor'] = asyncio.create_task(sensor_reader_task(system_state, state_lock))
-    tasks['display'] = asyncio.create_task(display_task(system_state, state_lock))
-    tasks['input'] = asyncio.create_task(input_handler_task(system_state, state_lock))
-    tasks['actuator'] = asyncio.create_task(actuator_controller_task(system_state, state_lock))
+    for stage, names in STAGES:
+        if stage == 'sensors':
+            # shared I2C bus for SGP30 + OLED; report missing devices once at boot
+            try:
+                from core.i2c_bus import get_bus
+                get_bus().scan()
+            except Exception as e:
+                log.msg(log.I2C_INIT, e)
+        for name in names:
+            start_task(tasks, name)
+        # let the new tasks run up to their first await before the next stage
+        await asyncio.sleep_ms(0)
+        bootlog.mark(stage)
+        gc.collect()
 
+    tasks['persist'] = asyncio.create_task(persist.persist_task(system_state, state_lock))
     tasks['monitor'] = asyncio.create_task(monitor_tasks(tasks))
+    import ota_boot
+    ota_state = ota_boot.load_state()
+    if ota_state and ota_state.get('state') == 'trial':
+        # new firmware on trial: confirm it once healthy, otherwise roll back
+        from core import ota
+        tasks['ota'] = asyncio.create_task(ota.supervise(system_state, tasks))
+    bootlog.stop_profile()
+    system_state['meta']['boot_ms'] = bootlog.report()
+    if BOOT_PROFILE:
+        bootlog.save(BOOT_PROFILE_FILE)
 
     await asyncio.gather(*tasks.values())
 
@@ -116,7 +185,7 @@ if __name__ == '__main__':
     try:
         asyncio.run(main())
     except Exception as e:
-        print('Fatal in main', e)
+        log.msg(log.FATAL, e)
         sys.print_exception(e)
         # optionally reset
         try:
@@ -124,5 +193,3 @@ if __name__ == '__main__':
             machine.reset()
         except Exception:
             pass
-
-
@@ -0,0 +1,161 @@
+# === FILE: ota_boot.py ===
+# Boot-time half of the OTA update (core/ota.py is the receiving half).
+# boot.py calls check() before main.py imports anything, so a bad update is
+# undone before it can run again. This file is never replaced over the air
+# and imports nothing from the firmware: it must keep working whatever an
+# update did to the rest of the tree.
+#
+# State file (STATE_FILE), written atomically (temp file + rename):
+#   swapping     verified files wait in STAGE_DIR; swap() moves them in, the
+#                replaced originals go to BACKUP_DIR. Safe to repeat after a
+#                reset at any point.
+#   trial        new version running; boots counts boots since the swap.
+#                The supervisor in core/ota.py confirms a healthy boot, or
+#                marks the trial unhealthy and resets.
+#   confirmed    backups deleted, new hashes merged into MANIFEST_FILE.
+#   rolled_back  originals restored (too many trial boots or unhealthy).
+import os
+import ujson
+
+STATE_FILE = 'ota_state.json'
+MANIFEST_FILE = 'ota_manifest.json'     # installed version + sha256 per file
+STAGE_DIR = 'ota_stage'
+BACKUP_DIR = 'ota_backup'
+MAX_TRIAL_BOOTS = 3                     # boots without confirmation before rollback
+# never written by an update
+PROTECTED = ('boot.py', 'ota_boot.py', 'wifi.dat', STATE_FILE, MANIFEST_FILE)
+PROTECTED_DIRS = (STAGE_DIR, BACKUP_DIR)
+
+
+def exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def is_dir(path):
+    try:
+        return os.stat(path)[0] & 0x4000 != 0
+    except OSError:
+        return False
+
+
+def makedirs(path):
+    """逐级创建目录（MicroPython 没有 os.makedirs）。"""
+    cur = ''
+    for part in path.split('/'):
+        if not part:
+            continue
+        cur = cur + '/' + part if cur else part
+        if not exists(cur):
+            os.mkdir(cur)
+
+
+def dirname(path):
+    i = path.rfind('/')
+    return path[:i] if i > 0 else ''
+
+
+def rmtree(path):
+    if not exists(path):
+        return
+    if is_dir(path):
+        for name in os.listdir(path):
+            rmtree(path + '/' + name)
+        os.rmdir(path)
+    else:
+        os.remove(path)
+
+
+def replace(src, dst):
+    """原子替换 dst（LittleFS 的 rename 覆盖目标；其它文件系统先删除）。"""
+    try:
+        os.rename(src, dst)
+    except OSError:
+        os.remove(dst)
+        os.rename(src, dst)
+
+
+def load_json(path):
+    try:
+        with open(path) as f:
+            return ujson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def save_json(path, obj):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(ujson.dumps(obj))
+    replace(tmp, path)
+
+
+def load_state():
+    return load_json(STATE_FILE)
+
+
+def save_state(st):
+    save_json(STATE_FILE, st)
+
+
+def swap(st):
+    """把暂存区文件换入（原文件移入备份区）；可在任意时刻断电后重复执行。"""
+    for path in st['files']:
+        staged = STAGE_DIR + '/' + path
+        if not exists(staged):
+            continue                # already moved in
+        bak = BACKUP_DIR + '/' + path
+        if exists(path):
+            if exists(bak):
+                os.remove(path)     # backup taken on an earlier, interrupted pass
+            else:
+                makedirs(dirname(bak))
+                os.rename(path, bak)
+        makedirs(dirname(path))
+        os.rename(staged, path)
+    for path in st.get('delete', ()):
+        bak = BACKUP_DIR + '/' + path
+        if exists(path) and not exists(bak):
+            makedirs(dirname(bak))
+            os.rename(path, bak)
+    rmtree(STAGE_DIR)
+
+
+def rollback(st):
+    """从备份区恢复被替换/删除的文件，删除新增文件；可重复执行。"""
+    for path in list(st['files']) + list(st.get('delete', ())):
+        bak = BACKUP_DIR + '/' + path
+        if exists(bak):
+            if exists(path):
+                os.remove(path)
+            os.rename(bak, path)
+        elif path in st.get('new', ()) and exists(path):
+            os.remove(path)
+    rmtree(BACKUP_DIR)
+
+
+def check():
+    """启动时调用（boot.py）：完成中断的换入、累计试运行次数、必要时回滚；返回状态 dict 或 None。"""
+    st = load_state()
+    if not st:
+        return None
+    if st.get('state') == 'swapping':
+        print('OTA: installing', st.get('version'))
+        swap(st)
+        st['state'] = 'trial'
+        st['boots'] = 0
+        save_state(st)
+    if st.get('state') == 'trial':
+        st['boots'] = st.get('boots', 0) + 1
+        if st.get('unhealthy') or st['boots'] > MAX_TRIAL_BOOTS:
+            print('OTA: rolling back', st.get('version'), 'to', st.get('prev'),
+                  '(' + (st.get('unhealthy') or 'no healthy boot') + ')')
+            rollback(st)
+            st['state'] = 'rolled_back'
+        else:
+            print('OTA: trial boot', st['boots'], 'of', st.get('version'))
+        save_state(st)
+    return st
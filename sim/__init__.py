@@ -0,0 +1,42 @@
+"""Host-side simulation of the sun lamp: the unmodified firmware runs on
+CPython against stand-ins for the MicroPython hardware modules, with time
+driven by a virtual clock so long scenarios finish in seconds.
+
+    from sim.harness import Simulation
+    sim = Simulation()
+    sim.run(scenario)           # async def scenario(sim): ...
+
+or from the command line: python -m sim.run --list
+"""
+import json
+import sys
+import traceback
+
+# MicroPython module name -> simulation module
+STANDINS = {
+    'machine': 'sim.machine',
+    'neopixel': 'sim.neopixel',
+    'dht': 'sim.dht',
+    'network': 'sim.network',
+    'framebuf': 'sim.framebuf',
+    'micropython': 'sim.micropython',
+    'uasyncio': 'sim.uasyncio',
+    'umqtt': 'sim.umqtt',
+    'umqtt.simple': 'sim.umqtt.simple',
+}
+
+
+def _print_exception(e, file=None):
+    traceback.print_exception(type(e), e, e.__traceback__, file=file or sys.stdout)
+
+
+def install(clock):
+    """Register the stand-ins under their MicroPython names and patch `time`."""
+    import importlib
+    from sim.vclock import patch_time
+    for name, target in STANDINS.items():
+        sys.modules[name] = importlib.import_module(target)
+    sys.modules['ujson'] = json
+    if not hasattr(sys, 'print_exception'):
+        sys.print_exception = _print_exception
+    patch_time(clock)
@@ -0,0 +1,108 @@
+"""In-process MQTT broker for the simulation: topic wildcards, retained
+messages, per-session queues and scriptable outages."""
+from collections import deque
+
+
+def topic_matches(pattern, topic):
+    """MQTT filter match with '+' (one level) and '#' (rest)."""
+    p = pattern.split('/')
+    t = topic.split('/')
+    for i, part in enumerate(p):
+        if part == '#':
+            return True
+        if i >= len(t) or (part != '+' and part != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+def _s(v):
+    return v.decode() if isinstance(v, (bytes, bytearray)) else str(v)
+
+
+def _b(v):
+    return bytes(v) if isinstance(v, (bytes, bytearray)) else str(v).encode()
+
+
+class Session:
+    def __init__(self, broker, client_id):
+        self.broker = broker
+        self.client_id = client_id
+        self.subs = []
+        self.queue = deque()
+        self.alive = True
+
+    def subscribe(self, topic):
+        topic = _s(topic)
+        if topic not in self.subs:
+            self.subs.append(topic)
+        for t, payload in self.broker.retained.items():
+            if topic_matches(topic, t):
+                self.queue.append((t.encode(), payload))
+
+    def publish(self, topic, msg, retain=False):
+        self.broker.publish(_s(topic), msg, retain, sender=self)
+
+    def next_message(self):
+        return self.queue.popleft() if self.queue else None
+
+    def close(self, clean=False):
+        if self.alive:
+            self.alive = False
+            if self in self.broker.sessions:
+                self.broker.sessions.remove(self)
+
+
+class Broker:
+    def __init__(self, clock, users=None, max_queue=100):
+        self.clock = clock
+        self.users = users          # {user: password} or None for anonymous
+        self.max_queue = max_queue
+        self.up = True
+        self.sessions = []
+        self.retained = {}
+        self.log = []               # (ms since reset, topic, payload bytes, client id)
+        self.subscribers = []       # scenario-side callbacks fn(topic, payload)
+        self.connects = 0
+        self.refused = 0
+
+    def connect(self, client, user, password):
+        if not self.up:
+            self.refused += 1
+            raise OSError(111, 'ECONNREFUSED')
+        if self.users is not None and self.users.get(_s(user or b'')) != _s(password or b''):
+            self.refused += 1
+            raise OSError(111, 'not authorised')
+        # a reconnect with the same client id takes over the old session
+        for s in list(self.sessions):
+            if s.client_id == client.client_id:
+                s.close()
+        s = Session(self, client.client_id)
+        self.sessions.append(s)
+        self.connects += 1
+        return s
+
+    def publish(self, topic, payload, retain=False, sender=None):
+        payload = _b(payload)
+        self.log.append((int(self.clock.mono * 1000), topic, payload,
+                         sender.client_id if sender else None))
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        for s in self.sessions:
+            if any(topic_matches(f, topic) for f in s.subs):
+                if len(s.queue) < self.max_queue:
+                    s.queue.append((topic.encode(), payload))
+        for fn in self.subscribers:
+            fn(topic, payload)
+
+    def outage(self, down=True):
+        """Take the broker down (dropping every session) or bring it back."""
+        self.up = not down
+        if down:
+            for s in list(self.sessions):
+                s.close()
+
+    def messages(self, topic_filter):
+        return [(t_ms, t, p) for t_ms, t, p, _c in self.log if topic_matches(topic_filter, t)]
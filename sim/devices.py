@@ -0,0 +1,174 @@
+"""I2C bus and device models used behind sim.machine.I2C."""
+
+
+def crc8(data):
+    """Sensirion CRC-8 (poly 0x31, init 0xFF)."""
+    crc = 0xFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x31) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+class I2CBusModel:
+    def __init__(self, clock, freq=400000):
+        self.clock = clock
+        self.freq = freq
+        self.devices = {}
+        self.transactions = 0
+        self.bytes = 0
+
+    def attach(self, addr, dev):
+        self.devices[addr] = dev
+        return dev
+
+    def _dev(self, addr):
+        dev = self.devices.get(addr)
+        if dev is None or not dev.present:
+            raise OSError(19, 'ENODEV')     # address NACK
+        return dev
+
+    def _airtime(self, nbytes):
+        # 9 clocks per byte plus the address byte
+        self.clock.advance((nbytes + 1) * 9.0 / self.freq)
+
+    def scan(self):
+        return sorted(a for a, d in self.devices.items() if d.present)
+
+    def write(self, addr, data):
+        dev = self._dev(addr)
+        self.transactions += 1
+        self.bytes += len(data)
+        self._airtime(len(data))
+        dev.write(data)
+
+    def read(self, addr, n):
+        dev = self._dev(addr)
+        self.transactions += 1
+        self.bytes += n
+        self._airtime(n)
+        return dev.read(n)
+
+
+class SGP30Model:
+    """Sensirion SGP30: init / measure (12 ms conversion) / set humidity."""
+
+    MEASURE_MS = 12
+
+    def __init__(self, clock, env):
+        self.clock = clock
+        self.env = env
+        self.present = True
+        self.initialised = False
+        self.ready_at = None
+        self.result = b''
+        self.abs_humidity = None
+        self.measurements = 0
+
+    def write(self, data):
+        cmd = (data[0] << 8) | data[1] if len(data) >= 2 else None
+        if cmd == 0x2003:
+            self.initialised = True
+        elif cmd == 0x2008:
+            self.ready_at = self.clock.mono + self.MEASURE_MS / 1000.0
+            eco2 = self.env.read_eco2() if self.initialised else 400
+            tvoc = self.env.read_tvoc() if self.initialised else 0
+            words = [eco2, tvoc]
+            out = bytearray()
+            for w in words:
+                pair = bytes([(w >> 8) & 0xFF, w & 0xFF])
+                out += pair + bytes([crc8(pair)])
+            self.result = bytes(out)
+        elif cmd == 0x2061 and len(data) >= 4:
+            self.abs_humidity = ((data[2] << 8) | data[3]) / 256.0
+
+    def read(self, n):
+        if self.ready_at is None or self.clock.mono < self.ready_at:
+            # the chip NACKs reads while a conversion is running
+            raise OSError(19, 'ENODEV')
+        self.measurements += 1
+        return self.result[:n]
+
+
+class SSD1306Model:
+    """SSD1306 GDDRAM with horizontal addressing and column/page windows."""
+
+    ARGS = {0x20: 1, 0x21: 2, 0x22: 2, 0x81: 1, 0xA8: 1, 0xD3: 1, 0xD5: 1, 0xD9: 1,
+            0xDA: 1, 0xDB: 1, 0x8D: 1, 0xAD: 1}
+
+    def __init__(self, width=128, height=64):
+        self.width = width
+        self.pages = height // 8
+        self.present = True
+        self.ram = bytearray(width * self.pages)
+        self.on = False
+        self.contrast = 0x7F
+        self.col0, self.col1 = 0, width - 1
+        self.page0, self.page1 = 0, self.pages - 1
+        self.col = 0
+        self.page = 0
+        self.data_bytes = 0
+        self.cmd_bytes = 0
+        self._pending = None
+
+    def _command(self, cmd, args):
+        if cmd == 0x21:
+            self.col0, self.col1 = args[0], args[1]
+            self.col = self.col0
+        elif cmd == 0x22:
+            self.page0, self.page1 = args[0], args[1]
+            self.page = self.page0
+        elif cmd == 0x81:
+            self.contrast = args[0]
+        elif cmd in (0xAE, 0xAF):
+            self.on = cmd == 0xAF
+
+    def _data(self, data):
+        for b in data:
+            self.ram[self.page * self.width + self.col] = b
+            self.data_bytes += 1
+            self.col += 1
+            if self.col > self.col1:
+                self.col = self.col0
+                self.page += 1
+                if self.page > self.page1:
+                    self.page = self.page0
+
+    def _feed(self, b):
+        # the controller parses a command byte stream; arguments may arrive
+        # in later transactions (one Co=1 write per byte, as write_cmd does)
+        if self._pending is None:
+            if self.ARGS.get(b, 0):
+                self._pending = (b, [])
+            else:
+                self._command(b, ())
+            return
+        cmd, args = self._pending
+        args.append(b)
+        if len(args) == self.ARGS[cmd]:
+            self._pending = None
+            self._command(cmd, args)
+
+    def write(self, data):
+        ctrl = data[0]
+        payload = data[1:]
+        if ctrl & 0x40:
+            self._data(payload)
+            return
+        self.cmd_bytes += len(payload)
+        for b in payload[:1] if ctrl & 0x80 else payload:
+            self._feed(b)
+
+    def read(self, n):
+        return bytes(n)
+
+    def pixel(self, x, y):
+        return self.ram[(y >> 3) * self.width + x] >> (y & 7) & 1
+
+    def render(self):
+        """ASCII dump of the panel (for debugging scenarios)."""
+        rows = []
+        for y in range(self.pages * 8):
+            rows.append(''.join('#' if self.pixel(x, y) else '.' for x in range(self.width)))
+        return '\n'.join(rows)
@@ -0,0 +1,33 @@
+"""Stand-in for `dht`: readings come from the simulated room."""
+from sim import world as _world
+
+
+class _DHTBase:
+    def __init__(self, pin):
+        self.pin = pin
+        self._t = None
+        self._h = None
+
+    def measure(self):
+        env = _world.get().env
+        if env.dht_fail:
+            raise OSError(116, 'ETIMEDOUT')
+        self._t = env.read_temperature()
+        self._h = env.read_humidity()
+
+    def temperature(self):
+        return self._t
+
+    def humidity(self):
+        return self._h
+
+
+class DHT22(_DHTBase):
+    pass
+
+
+class DHT11(_DHTBase):
+    def measure(self):
+        super().measure()
+        self._t = int(self._t)
+        self._h = int(self._h)
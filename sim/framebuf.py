@@ -0,0 +1,120 @@
+"""Stand-in for `framebuf` (MONO_VLSB and MONO_HLSB), enough for the SSD1306
+driver and the UI. text() draws into the same 8x8 cells as the firmware
+font; glyph shapes are synthetic but deterministic, so a text change still
+changes exactly the pixels of the affected cells."""
+
+MONO_VLSB = 0
+RGB565 = 1
+GS4_HMSB = 2
+MONO_HLSB = 3
+MONO_HMSB = 4
+GS2_HMSB = 5
+GS8 = 6
+
+
+def _glyph(ch):
+    if ch == ' ':
+        return (0,) * 8
+    c = ord(ch)
+    # 6 columns of 7 rows, one blank column each side like the ROM font
+    cols = [0]
+    for i in range(6):
+        v = (c * 2654435761 >> (i * 5)) & 0x7F
+        cols.append(v | 0x01 if i in (0, 5) else v)
+    cols.append(0)
+    return tuple(cols)
+
+
+class FrameBuffer:
+    def __init__(self, buf, width, height, format=MONO_VLSB, stride=None):
+        self._buf = buf
+        self._w = width
+        self._h = height
+        self._fmt = format
+        self._stride = stride or width
+        if format not in (MONO_VLSB, MONO_HLSB):
+            raise ValueError('format not supported by the simulator')
+
+    # ---------------- pixels -----------------
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self._w and 0 <= y < self._h):
+            return None
+        if self._fmt == MONO_VLSB:
+            idx = (y >> 3) * self._stride + x
+            bit = 1 << (y & 7)
+        else:
+            idx = (y * self._stride + x) >> 3
+            bit = 0x80 >> (x & 7)
+        if c is None:
+            return 1 if self._buf[idx] & bit else 0
+        if c:
+            self._buf[idx] |= bit
+        else:
+            self._buf[idx] &= ~bit & 0xFF
+
+    def fill(self, c):
+        v = 0xFF if c else 0x00
+        for i in range(len(self._buf)):
+            self._buf[i] = v
+
+    def fill_rect(self, x, y, w, h, c):
+        for yy in range(max(0, y), min(self._h, y + h)):
+            for xx in range(max(0, x), min(self._w, x + w)):
+                self.pixel(xx, yy, c)
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+            return
+        self.hline(x, y, w, c)
+        self.hline(x, y + h - 1, w, c)
+        self.vline(x, y, h, c)
+        self.vline(x + w - 1, y, h, c)
+
+    def line(self, x0, y0, x1, y1, c):
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx + dy
+        while True:
+            self.pixel(x0, y0, c)
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+    def text(self, s, x, y, c=1):
+        for ch in s:
+            for col, bits in enumerate(_glyph(ch)):
+                for row in range(8):
+                    if bits >> row & 1:
+                        self.pixel(x + col, y + row, c)
+            x += 8
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        for yy in range(fbuf._h):
+            for xx in range(fbuf._w):
+                v = fbuf.pixel(xx, yy)
+                if v != key:
+                    self.pixel(x + xx, y + yy, v)
+
+    def scroll(self, dx, dy):
+        w, h = self._w, self._h
+        snap = [[self.pixel(x, y) for x in range(w)] for y in range(h)]
+        for y in range(h):
+            for x in range(w):
+                sx, sy = x - dx, y - dy
+                if 0 <= sx < w and 0 <= sy < h:
+                    self.pixel(x, y, snap[sy][sx])
@@ -0,0 +1,172 @@
+"""Group animation phase test: python -m sim.group [--lamps N] [--seed S] [-v]
+
+Several lamps in one group receive the same anim commands. Each lamp is
+its own Simulation on the same true-time axis. Lamps never talk to each
+other, so running them one after another is equivalent to running them
+side by side. Lamps differ in crystal drift, NTP error, power-on time
+and per-command delivery delay (broker + Wi-Fi). Every frame a lamp
+shows is matched against the identical frame on the reference lamp; the
+time difference is the phase error.
+
+Group commands (topic MQTT_TOPIC_GROUP, start_ms + seq) must keep every
+lamp within a few milliseconds. The same warning sent the old way (device
+topic, no start_ms: each lamp starts on arrival) is measured for
+comparison and reported but not checked. Each lamp finally gets the breathe
+command again without start_ms: seq alone must drop the duplicate.
+
+Exits non-zero if a check fails.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from sim.harness import Simulation, DEFAULT_UNIX
+
+GROUP = 'room1'
+LEAD_MS = 437           # start_ms lead over the publish time; covers delivery
+MAX_PHASE_MS = 10       # "same frame within a few milliseconds"
+MATCH_WINDOW_MS = 240   # frames further apart than this are not the same frame
+SETTLE_MS = 1000        # ignore the first second after a start
+
+# (seconds after DEFAULT_UNIX, label, group command?, command)
+PLAN = (
+    (60, 'group warning', True, {'cmd': 'anim', 'type': 'warning', 'seq': 1}),
+    (80, 'group breathe', True, {'cmd': 'anim', 'type': 'breathe', 'duration_s': 3, 'seq': 2}),
+    (100, 'arrival-time warning', False, {'cmd': 'anim', 'type': 'warning'}),
+)
+END_S = 120
+
+
+def profiles(n, seed):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        out.append({
+            'drift_ppm': rng.uniform(-30, 30),
+            'ntp_error_ms': rng.uniform(-2, 2),
+            'boot_s': rng.uniform(0, 8),
+            'delivery_ms': [rng.uniform(5, 250) for _ in PLAN],
+        })
+    return out
+
+
+def _lamp_script(prof, frames):
+    async def script(sim):
+        clock = sim.clock
+        clock.drift_ppm = prof['drift_ppm']
+        sim.ntp.error_ms = prof['ntp_error_ms']
+
+        def mono_at(true_s):
+            return (true_s - clock.true_offset) * (1.0 + clock.drift_ppm * 1e-6)
+
+        async def sleep_until_true(true_s):
+            await sim.sleep(max(0.0, mono_at(true_s) - clock.mono))
+
+        await sim.sleep(prof['boot_s'])
+        sim.boot()
+        ok = await sim.until(lambda: sim.state['network']['mqtt_status'] == 'connected'
+                             and sim.state['clock'].get('synced'), 45)
+        sim.check('online and synced', ok)
+        for (at, _label, group, cmd), delay in zip(PLAN, prof['delivery_ms']):
+            await sleep_until_true(DEFAULT_UNIX + at + delay / 1000.0)
+            msg = dict(cmd)
+            if group:
+                msg['start_ms'] = (DEFAULT_UNIX + at) * 1000 + LEAD_MS
+                topic = sim.config.MQTT_TOPIC_GROUP.format(GROUP)
+            else:
+                topic = sim.config.MQTT_TOPIC_SUB
+            sim.broker.publish(topic, json.dumps(msg))
+        await sleep_until_true(DEFAULT_UNIX + END_S)
+        # frames on the true-time axis (ms)
+        scale = 1.0 + clock.drift_ppm * 1e-6
+        frames.extend((clock.true_offset * 1000.0 + t / scale, f) for t, f in sim.strip.frames)
+        # the breathe command resent without start_ms (as a lamp with an unsynced
+        # clock treats it): its seq alone must mark it as already applied
+        sim.broker.publish(sim.config.MQTT_TOPIC_SUB, json.dumps(PLAN[1][3]))
+        await sim.sleep(1)
+        sim.check('resent seq without start_ms dropped', sim.state['lamp']['animation'] == 'warning',
+                  str(sim.state['lamp']['animation']))
+    return script
+
+
+def phase_errors(ref, other, lo, hi):
+    """Match each frame of `other` in [lo, hi) to the nearest identical frame of `ref`; returns (errors, unmatched)."""
+    index = {}
+    for t, f in ref:
+        if lo - MATCH_WINDOW_MS <= t < hi + MATCH_WINDOW_MS:
+            index.setdefault(f, []).append(t)
+    errs = []
+    unmatched = 0
+    for t, f in other:
+        if not lo <= t < hi:
+            continue
+        best = None
+        for r in index.get(f, ()):
+            if best is None or abs(t - r) < abs(t - best):
+                best = r
+        if best is None or abs(t - best) > MATCH_WINDOW_MS:
+            unmatched += 1
+        else:
+            errs.append(t - best)
+    return errs, unmatched
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m sim.group', description=__doc__.splitlines()[0])
+    ap.add_argument('--lamps', type=int, default=4)
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('-v', '--verbose', action='store_true', help='echo firmware output')
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    timelines = []
+    failed = []
+    for i, prof in enumerate(profiles(args.lamps, args.seed)):
+        print('== lamp {}: drift {:+.1f} ppm, NTP error {:+.2f} ms, power-on at {:.1f} s'.format(
+            i, prof['drift_ppm'], prof['ntp_error_ms'], prof['boot_s']))
+        frames = []
+        sim = Simulation(echo=args.verbose,
+                         config={'MQTT_GROUP': GROUP, 'MQTT_TOPIC_GROUP': 'esp32/sunlamp/group/{}/cmd'})
+        try:
+            sim.run(_lamp_script(prof, frames))
+        except Exception as e:
+            sim.check('lamp script ran to completion', False, repr(e))
+        if not sim.ok:
+            failed.append('lamp {}'.format(i))
+        timelines.append(frames)
+
+    print('== phase error vs lamp 0')
+    ok = not failed
+    bounds = [DEFAULT_UNIX + p[0] for p in PLAN] + [DEFAULT_UNIX + END_S]
+    for k, (_at, label, group, _cmd) in enumerate(PLAN):
+        lo = bounds[k] * 1000 + LEAD_MS + SETTLE_MS
+        hi = bounds[k + 1] * 1000
+        errs = []
+        unmatched = total = 0
+        for other in timelines[1:]:
+            e, u = phase_errors(timelines[0], other, lo, hi)
+            errs.extend(e)
+            unmatched += u
+            total += len(e) + u
+        worst = max(abs(e) for e in errs) if errs else None
+        p50 = sorted(abs(e) for e in errs)[len(errs) // 2] if errs else None
+        detail = '{} frames, {} unmatched, |error| p50 {} ms, max {} ms'.format(
+            total, unmatched, '-' if p50 is None else round(p50, 1),
+            '-' if worst is None else round(worst, 1))
+        if not group:
+            print('  info {} ({})'.format(label, detail))
+            continue
+        good = total > 0 and worst is not None and worst <= MAX_PHASE_MS and unmatched <= total * 0.02
+        ok = ok and good
+        print('  {} {} within {} ms ({})'.format('PASS' if good else 'FAIL', label, MAX_PHASE_MS, detail))
+    print('   {} lamps in {:.2f} wall s: {}'.format(args.lamps, time.perf_counter() - t0,
+                                                   'ok' if ok else 'FAILED'))
+    if failed:
+        print('failed: {}'.format(', '.join(failed)))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
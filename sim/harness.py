@@ -0,0 +1,297 @@
+"""Boot the firmware (main.main) inside a simulated world on virtual time.
+
+A Simulation owns one world, one event loop and a temporary flash
+directory. With flash_firmware=True the firmware itself is copied onto the
+flash and imported from there, so an OTA update can replace it. Scenarios are coroutines `async def scenario(sim)` that script
+the world (broker outages, Wi-Fi drops, button presses, power cuts) and
+record pass/fail checks; sim.run(scenario) drives them to completion.
+"""
+import asyncio
+import importlib
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+
+import sim
+from sim import world as _world
+from sim import ntp
+from sim import uasyncio
+from sim.broker import Broker
+from sim.devices import I2CBusModel, SGP30Model, SSD1306Model
+from sim.network import Radio
+from sim.vclock import VirtualTimeLoop
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRMWARE_PACKAGES = ('boot', 'ota_boot', 'config', 'main', 'core', 'drivers', 'tasks', 'ssd1306')
+FIRMWARE_FILES = ('boot.py', 'ota_boot.py', 'config.py', 'main.py', 'core', 'drivers', 'lib', 'tasks')
+
+DEFAULT_UNIX = 1781244000       # 2026-06-12 06:00 UTC (14:00 local at TZ_OFFSET_S=8h)
+SSID = 'SimNet'
+PASSWORD = 'sim-pass-123'
+BSSID = b'\x02\x00\x5e\x10\x20\x30'
+
+
+class _Console:
+    """stdout replacement that stamps firmware output with virtual time."""
+
+    def __init__(self, clock, out, echo):
+        self.clock = clock
+        self.out = out
+        self.echo = echo
+        self.lines = []
+        self._partial = ''
+
+    def write(self, s):
+        self._partial += s
+        while '\n' in self._partial:
+            line, self._partial = self._partial.split('\n', 1)
+            self.lines.append((int(self.clock.mono * 1000), line))
+            if self.echo:
+                self.out.write('[{:9.3f}] {}\n'.format(self.clock.mono, line))
+        return len(s)
+
+    def flush(self):
+        self.out.flush()
+
+
+def power_on_hardware(w, cfg):
+    """Fresh peripherals wired as in config (I2C devices, LDR, lamp strip); returns (sgp30, oled)."""
+    w.pins.clear()
+    w.strips.clear()
+    if w.wifi is not None:
+        w.wifi.sta = None
+        w.wifi.ap = None
+    bus = I2CBusModel(w.clock, cfg.I2C_FREQ_HZ)
+    sgp30 = bus.attach(cfg.I2C_DEVICES['sgp30'], SGP30Model(w.clock, w.env))
+    oled = bus.attach(cfg.I2C_DEVICES['oled'], SSD1306Model())
+    w.i2c = {cfg.I2C_BUS_ID: bus}
+    w.adc = {cfg.LIGHT_SENSOR_PIN: w.env.read_light}
+    w.lamp_pins = {cfg.SUN_LAMP_PIN}
+    return sgp30, oled
+
+
+def _free_port():
+    """A localhost TCP port for the firmware's local API (port 80 needs root)."""
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def purge_firmware():
+    """Forget every firmware module so the next import is a cold boot."""
+    for name in list(sys.modules):
+        if name.split('.')[0] in FIRMWARE_PACKAGES:
+            del sys.modules[name]
+
+
+class Simulation:
+    def __init__(self, true_unix=DEFAULT_UNIX, config=None, echo=True, speed=0.0, flash_dir=None,
+                 flash_firmware=False):
+        self.world = _world.create(true_unix=true_unix)
+        self.clock = self.world.clock
+        self.clock.speed = speed
+        self.env = self.world.env
+        self.config_overrides = dict(config or {})
+        self.echo = echo
+        self.checks = []            # (name, ok, detail)
+        self.cleanup = []           # scratch directories removed after the run
+        self.boots = 0
+        self.main_task = None
+        self.ntp = None
+        self._driver = None
+        self.flash_firmware = flash_firmware
+        self._own_flash = flash_dir is None
+        self.flash = flash_dir or tempfile.mkdtemp(prefix='sunlamp-flash-')
+        self.loop = VirtualTimeLoop(self.clock)
+        self.loop.set_exception_handler(self._loop_error)
+        self.console = _Console(self.clock, sys.stdout, echo)
+
+        sim.install(self.clock)
+        for p in (os.path.join(ROOT, 'lib'), ROOT):
+            if p not in sys.path:
+                sys.path.insert(0, p)
+
+        self.radio = self.world.wifi = Radio(self.clock)
+        self.ap = self.radio.add_ap(SSID, PASSWORD, BSSID)
+        self.broker = self.world.broker = Broker(self.clock, users={'esp32': 'esp32'})
+        self.world.on_reset = self._on_reset
+        self._write_flash()
+        self.api_port = _free_port()
+
+    # ---------------- world setup -----------------
+    def _write_flash(self):
+        with open(os.path.join(self.flash, 'wifi.dat'), 'w') as f:
+            json.dump({'networks': [{'ssid': SSID, 'password': PASSWORD}], 'last': None}, f)
+        www = os.path.join(ROOT, 'www')
+        if os.path.isdir(www) and not os.path.exists(os.path.join(self.flash, 'www')):
+            shutil.copytree(www, os.path.join(self.flash, 'www'))
+        if self.flash_firmware and not os.path.exists(os.path.join(self.flash, 'main.py')):
+            skip = shutil.ignore_patterns('__pycache__')
+            for name in FIRMWARE_FILES:
+                src = os.path.join(ROOT, name)
+                if os.path.isdir(src):
+                    shutil.copytree(src, os.path.join(self.flash, name), ignore=skip)
+                else:
+                    shutil.copy2(src, self.flash)
+
+    def _loop_error(self, loop, context):
+        exc = context.get('exception')
+        if isinstance(exc, asyncio.CancelledError):
+            # asyncio.start_server's done-callback (< 3.12) trips over handlers killed by a power cut
+            return
+        self.console.write('[sim] loop error: {} {}\n'.format(context.get('message'), exc or ''))
+
+    # ---------------- firmware lifecycle -----------------
+    def boot(self):
+        """Cold-boot the firmware: run boot.py, import config/main fresh and start main.main()."""
+        purge_firmware()
+        os.chdir(self.flash)
+        if self.flash_firmware:
+            for p in (os.path.join(self.flash, 'lib'), self.flash):
+                if p in sys.path:
+                    sys.path.remove(p)
+                sys.path.insert(0, p)
+            importlib.invalidate_caches()
+        import boot  # noqa: F401  (ota_boot.check(): swap / rollback)
+        import config
+        config.NTP_HOST = '127.0.0.1'
+        config.NTP_PORT = self.ntp_port
+        config.API_PORT = self.api_port
+        for k, v in self.config_overrides.items():
+            setattr(config, k, v)
+        self.config = config
+        self.sgp30, self.oled = power_on_hardware(self.world, config)
+        import main
+        self.main = main
+        self.boots += 1
+        self.main_task = asyncio.get_running_loop().create_task(main.main())
+
+    async def power_cut(self, off_s=2.0, keep_rtc=False):
+        """Pull the plug: every firmware task dies where it stands, nothing is flushed."""
+        me = asyncio.current_task()
+        victims = [t for t in asyncio.all_tasks() if t is not me and t is not self._driver]
+        while victims:
+            # repeat: asyncio.wait_for (< 3.12) can swallow a cancel that lands
+            # just as its inner wait completes, and the task carries on
+            for t in victims:
+                t.cancel()
+            await asyncio.sleep(0)
+            for t in victims:
+                if t.done() and not t.cancelled():
+                    t.exception()       # retrieved: a dying task is not a loop error
+            victims = [t for t in victims if not t.done()]
+        for s in list(self.broker.sessions):
+            s.close()
+        uasyncio.close_servers()
+        self.main_task = None
+        await asyncio.sleep(off_s)
+        self.clock.power_cycle(keep_rtc)
+
+    async def power_cycle(self, off_s=2.0):
+        await self.power_cut(off_s)
+        self.boot()
+
+    def _on_reset(self):
+        """machine.reset(): reboot in a fresh task once the calling task has unwound."""
+        caller = asyncio.current_task()
+        if caller is not None:
+            # the SimReset that ends the caller is expected, not a loop error
+            caller.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.loop.create_task(self._reboot())
+
+    async def _reboot(self):
+        await self.power_cut(0, keep_rtc=True)
+        self.boot()
+
+    # ---------------- scenario helpers -----------------
+    @property
+    def state(self):
+        return self.main.system_state
+
+    @property
+    def strip(self):
+        return self.world.strips.get(self.config.SUN_LAMP_PIN)
+
+    def fw(self, name):
+        """A loaded firmware module, e.g. sim.fw('core.bootlog')."""
+        return sys.modules[name]
+
+    async def sleep(self, s):
+        await asyncio.sleep(s)
+
+    async def until(self, pred, timeout_s, step_s=0.1):
+        """Advance virtual time until pred() holds; False on timeout."""
+        end = self.clock.mono + timeout_s
+        while not pred():
+            if self.clock.mono >= end:
+                return False
+            await asyncio.sleep(step_s)
+        return True
+
+    def cmd(self, j):
+        """Publish a command on the device's command topic."""
+        self.broker.publish(self.config.MQTT_TOPIC_SUB, json.dumps(j))
+
+    def statuses(self, since_ms=0):
+        out = []
+        for t_ms, _t, p in self.broker.messages(self.config.MQTT_TOPIC_PUB):
+            if t_ms >= since_ms:
+                out.append((t_ms, json.loads(p)))
+        return out
+
+    async def press(self, pin, hold_ms=80):
+        st = self.world.pins.get(pin)
+        if st is None:
+            raise KeyError('pin {} not configured by the firmware'.format(pin))
+        st.drive(0)
+        await asyncio.sleep(hold_ms / 1000.0)
+        st.drive(1)
+
+    def grep(self, text):
+        return [(t, line) for t, line in self.console.lines if text in line]
+
+    def check(self, name, ok, detail=''):
+        self.checks.append((name, bool(ok), detail))
+        self.console.out.write('  {} {}{}\n'.format('PASS' if ok else 'FAIL', name,
+                                                    ' ({})'.format(detail) if detail else ''))
+        return ok
+
+    @property
+    def ok(self):
+        return bool(self.checks) and all(c[1] for c in self.checks)
+
+    # ---------------- driver -----------------
+    async def _drive(self, scenario):
+        self.ntp, self.ntp_port = await ntp.start(self.clock)
+        self._driver = asyncio.current_task()
+        try:
+            return await scenario(self)
+        finally:
+            await self.power_cut(0)
+            self.ntp.transport.close()
+
+    def run(self, scenario):
+        cwd = os.getcwd()
+        real_stdout = sys.stdout
+        sys.stdout = self.console
+        asyncio.set_event_loop(self.loop)
+        try:
+            return self.loop.run_until_complete(self._drive(scenario))
+        finally:
+            sys.stdout = real_stdout
+            asyncio.set_event_loop(None)
+            self.loop.close()
+            os.chdir(cwd)
+            purge_firmware()
+            for p in (self.flash, os.path.join(self.flash, 'lib')):
+                if p in sys.path:
+                    sys.path.remove(p)
+            if self._own_flash:
+                shutil.rmtree(self.flash, ignore_errors=True)
+            for d in self.cleanup:
+                shutil.rmtree(d, ignore_errors=True)
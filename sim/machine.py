@@ -0,0 +1,221 @@
+"""Stand-in for MicroPython's `machine` module (ESP32 flavour)."""
+from sim import world as _world
+
+
+def _w():
+    return _world.get()
+
+
+class PinState:
+    """Electrical state of one GPIO shared by every Pin object for that id."""
+
+    def __init__(self, pid):
+        self.id = pid
+        self.mode = None
+        self.pull = None
+        self.driven = None          # level forced from outside (button, sensor)
+        self.out = 0
+        self.handler = None
+        self.trigger = 0
+        self.edges = 0
+
+    def level(self):
+        if self.mode == Pin.OUT:
+            return self.out
+        if self.driven is not None:
+            return self.driven
+        return 1 if self.pull == Pin.PULL_UP else 0
+
+    def drive(self, level):
+        """Force the input level from outside (button pressed = 0) and fire the IRQ."""
+        old = self.level()
+        self.driven = level
+        new = self.level()
+        if old == new or self.handler is None:
+            return
+        self.edges += 1
+        if (new == 0 and self.trigger & Pin.IRQ_FALLING) or (new == 1 and self.trigger & Pin.IRQ_RISING):
+            self.handler(Pin(self.id))
+
+
+def pin_state(pid):
+    pins = _w().pins
+    st = pins.get(pid)
+    if st is None:
+        st = pins[pid] = PinState(pid)
+    return st
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, pid, mode=-1, pull=-1, value=None, **kw):
+        self.id = pid.id if isinstance(pid, Pin) else pid
+        self._st = pin_state(self.id)
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None, **kw):
+        if mode != -1:
+            self._st.mode = mode
+        if pull != -1:
+            self._st.pull = pull
+        if value is not None:
+            self._st.out = 1 if value else 0
+
+    def value(self, v=None):
+        if v is None:
+            return self._st.level()
+        self._st.out = 1 if v else 0
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False, **kw):
+        self._st.handler = handler
+        self._st.trigger = trigger
+        return self
+
+    def __repr__(self):
+        return 'Pin({})'.format(self.id)
+
+
+class ADC:
+    ATTN_0DB = 0
+    ATTN_2_5DB = 1
+    ATTN_6DB = 2
+    ATTN_11DB = 3
+    WIDTH_12BIT = 3
+
+    def __init__(self, pin, atten=None):
+        self.pin = pin.id if isinstance(pin, Pin) else pin
+
+    def atten(self, a):
+        pass
+
+    def width(self, w):
+        pass
+
+    def read(self):
+        src = _w().adc.get(self.pin)
+        return int(src()) if src else 0
+
+    def read_u16(self):
+        return self.read() << 4
+
+    def read_uv(self):
+        return self.read() * 3300000 // 4095
+
+
+class I2C:
+    def __init__(self, id=0, scl=None, sda=None, freq=400000, **kw):
+        self.id = id
+        self.freq = freq
+        self.bus = _w().i2c.get(id)
+        if self.bus is None:
+            raise OSError(19, 'ENODEV')
+
+    def scan(self):
+        return self.bus.scan()
+
+    def writeto(self, addr, buf, stop=True):
+        self.bus.write(addr, bytes(buf))
+        return len(buf)
+
+    def writevto(self, addr, vector, stop=True):
+        self.bus.write(addr, b''.join(bytes(v) for v in vector))
+        return sum(len(v) for v in vector)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return self.bus.read(addr, nbytes)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        data = self.bus.read(addr, len(buf))
+        buf[:len(data)] = data
+
+
+SoftI2C = I2C
+
+
+class RTC:
+    def datetime(self, dt=None):
+        clock = _w().clock
+        if dt is None:
+            tm = clock.gmtime()
+            return (tm[0], tm[1], tm[2], tm[6], tm[3], tm[4], tm[5], 0)
+        # (year, month, day, weekday, hours, minutes, seconds, subseconds)
+        sub = dt[7] / 1000000.0 if len(dt) > 7 else 0.0
+        clock.set_rtc(clock.mktime((dt[0], dt[1], dt[2], dt[4], dt[5], dt[6])) + sub)
+
+    def init(self, dt):
+        self.datetime(dt)
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+
+    def feed(self):
+        pass
+
+
+class SimReset(BaseException):
+    """Unwinds the task that called machine.reset(); firmware `except Exception` does not catch it."""
+
+
+def reset():
+    w = _w()
+    w.resets += 1
+    if w.on_reset is not None:
+        w.on_reset()        # the harness reboots the firmware (RTC keeps its time)
+    raise SimReset('machine.reset()')
+
+
+def soft_reset():
+    reset()
+
+
+def freq(hz=None):
+    w = _w()
+    if hz is None:
+        return w.cpu_freq
+    w.cpu_freq = hz
+
+
+def lightsleep(ms=None):
+    if ms:
+        _w().clock.sleep_ms(ms)
+
+
+def deepsleep(ms=None):
+    reset()
+
+
+def idle():
+    pass
+
+
+def unique_id():
+    return b'\x24\x6f\x28\x00\x00\x01'
+
+
+def reset_cause():
+    return 1    # PWRON_RESET
+
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
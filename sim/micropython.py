@@ -0,0 +1,41 @@
+"""Stand-in for the `micropython` module."""
+import asyncio
+
+
+def const(x):
+    return x
+
+
+def native(f):
+    return f
+
+
+viper = native
+
+
+def schedule(fn, arg):
+    # soft-IRQ callbacks run on the next loop iteration, like the MicroPython scheduler
+    try:
+        asyncio.get_running_loop().call_soon(fn, arg)
+    except RuntimeError:
+        fn(arg)
+
+
+def alloc_emergency_exception_buf(n):
+    pass
+
+
+def mem_info(*args):
+    pass
+
+
+def qstr_info(*args):
+    pass
+
+
+def heap_lock():
+    pass
+
+
+def heap_unlock():
+    return 0
@@ -0,0 +1,50 @@
+"""Stand-in for `neopixel`: a strip that records every frame it is asked to show."""
+from sim import world as _world
+
+MAX_FRAMES = 200000
+
+
+class NeoPixel:
+    ORDER = (1, 0, 2, 3)
+
+    def __init__(self, pin, n, bpp=3, timing=1):
+        self.pin = pin.id if hasattr(pin, 'id') else pin
+        self.n = n
+        self.bpp = bpp
+        self.buf = [(0,) * bpp] * n
+        self.frames = []        # (ms since reset, tuple of pixels) for frames that changed
+        self.writes = 0
+        self.last = None
+        _world.get().strips[self.pin] = self
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, i, v):
+        self.buf[i] = tuple(int(c) & 0xFF for c in v)
+
+    def __getitem__(self, i):
+        return self.buf[i]
+
+    def fill(self, v):
+        for i in range(self.n):
+            self[i] = v
+
+    def write(self):
+        w = _world.get()
+        frame = tuple(self.buf)
+        self.writes += 1
+        if frame != self.last:
+            self.last = frame
+            if len(self.frames) < MAX_FRAMES:
+                self.frames.append((w.ms(), frame))
+        if self.pin in w.lamp_pins:
+            # the LDR sees the lamp: average channel value across the strip
+            w.env.lamp_level = sum(sum(p[:3]) for p in frame) / (3.0 * max(1, self.n))
+
+    # ---------------- simulation helpers -----------------
+    def level(self):
+        """Average channel value (0..255) of the current frame."""
+        if not self.last:
+            return 0.0
+        return sum(sum(p[:3]) for p in self.last) / (3.0 * self.n)
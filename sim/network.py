@@ -0,0 +1,185 @@
+"""Stand-in for `network` (ESP32 WLAN): access points with association and
+DHCP delays on the virtual clock, scans that take airtime, and link drops."""
+from sim import world as _world
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+STAT_NO_AP_FOUND = 201
+STAT_WRONG_PASSWORD = 202
+STAT_BEACON_TIMEOUT = 200
+STAT_ASSOC_FAIL = 203
+STAT_HANDSHAKE_TIMEOUT = 204
+
+AUTH_OPEN = 0
+AUTH_WPA2_PSK = 3
+
+
+class AccessPoint:
+    def __init__(self, ssid, password, bssid, channel=6, rssi=-55, subnet='192.168.1'):
+        self.ssid = ssid
+        self.password = password
+        self.bssid = bssid          # 6 bytes
+        self.channel = channel
+        self.rssi = rssi
+        self.subnet = subnet
+        self.up = True
+
+
+class Radio:
+    """Shared RF state: the APs in range and the timing of association."""
+
+    SCAN_MS = 2200          # full active scan over all channels
+    ASSOC_MS = 350          # auth + assoc + 4-way handshake
+    CHANNEL_SEARCH_MS = 1800  # connect() without a channel hint scans first
+    DHCP_MS = 900
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.aps = []
+        self.sta = None
+        self.ap = None
+        self.connects = 0
+        self.drops = 0
+
+    def add_ap(self, *args, **kw):
+        ap = AccessPoint(*args, **kw)
+        self.aps.append(ap)
+        return ap
+
+    def find(self, ssid, bssid=None):
+        best = None
+        for ap in self.aps:
+            if ap.up and ap.ssid == ssid and (bssid is None or ap.bssid == bssid):
+                if best is None or ap.rssi > best.rssi:
+                    best = ap
+        return best
+
+    def sta_connected(self):
+        return self.sta is not None and self.sta.isconnected()
+
+    def drop(self):
+        """Lose the STA link (AP reboot, interference)."""
+        if self.sta is not None and self.sta._link is not None:
+            self.sta._link = None
+            self.sta._status = STAT_BEACON_TIMEOUT
+            self.drops += 1
+
+
+def _radio():
+    return _world.get().wifi
+
+
+class WLAN:
+    def __new__(cls, interface=STA_IF):
+        # like the ESP32 port, one object per interface
+        radio = _radio()
+        attr = 'sta' if interface == STA_IF else 'ap'
+        obj = getattr(radio, attr)
+        if obj is None:
+            obj = super().__new__(cls)
+            obj._init(interface)
+            setattr(radio, attr, obj)
+        return obj
+
+    def _init(self, interface):
+        self.interface = interface
+        self._active = False
+        self._status = STAT_IDLE
+        self._link = None           # AccessPoint once associated
+        self._ready_at = None       # virtual time the pending connect completes
+        self._pending = None
+        self._static = None
+        self._cfg = {'essid': 'ESP_SIM', 'password': '', 'channel': 1, 'pm': 1, 'txpower': 20,
+                     'reconnects': -1, 'mac': b'\x24\x6f\x28\x00\x00\x01', 'hostname': 'esp32'}
+
+    def active(self, v=None):
+        if v is None:
+            return self._active
+        self._active = bool(v)
+        if not v:
+            self._link = None
+            self._pending = None
+            self._status = STAT_IDLE
+
+    def _poll(self):
+        if self._pending is not None and _radio().clock.mono >= self._ready_at:
+            ap, ok, status = self._pending
+            self._pending = None
+            if ok and ap.up:
+                self._link = ap
+                self._status = STAT_GOT_IP
+                _radio().connects += 1
+            else:
+                self._status = status
+
+    def connect(self, ssid=None, key=None, bssid=None, **kw):
+        if self.interface != STA_IF:
+            raise OSError('AP interface cannot connect')
+        if not self._active:
+            raise OSError('Wifi Not Started')
+        radio = _radio()
+        ssid = ssid.decode() if isinstance(ssid, bytes) else ssid
+        ap = radio.find(ssid, bytes(bssid) if bssid else None)
+        hinted = bssid is not None and self._cfg.get('channel') == (ap.channel if ap else None)
+        delay = Radio.ASSOC_MS + (0 if hinted else Radio.CHANNEL_SEARCH_MS)
+        delay += 0 if self._static else Radio.DHCP_MS
+        if ap is None:
+            self._pending = (None, False, STAT_NO_AP_FOUND)
+            delay = Radio.CHANNEL_SEARCH_MS
+        elif (key or '') != ap.password:
+            self._pending = (ap, False, STAT_WRONG_PASSWORD)
+        else:
+            self._pending = (ap, True, STAT_GOT_IP)
+        self._link = None
+        self._status = STAT_CONNECTING
+        self._ready_at = radio.clock.mono + delay / 1000.0
+
+    def disconnect(self):
+        self._link = None
+        self._pending = None
+        self._status = STAT_IDLE
+
+    def isconnected(self):
+        self._poll()
+        if self.interface == AP_IF:
+            return self._active
+        return self._link is not None and self._link.up
+
+    def status(self, param=None):
+        self._poll()
+        if param == 'rssi':
+            return self._link.rssi if self._link else 0
+        if self._link is not None and not self._link.up:
+            self._link = None
+            self._status = STAT_BEACON_TIMEOUT
+        return self._status
+
+    def scan(self):
+        radio = _radio()
+        if not self._active:
+            raise OSError('Wifi Not Started')
+        # a scan blocks the caller for the whole sweep
+        radio.clock.advance(Radio.SCAN_MS / 1000.0)
+        return [(ap.ssid.encode(), ap.bssid, ap.channel, ap.rssi, AUTH_WPA2_PSK, False)
+                for ap in radio.aps if ap.up]
+
+    def ifconfig(self, cfg=None):
+        if cfg is None:
+            if self.interface == AP_IF:
+                return ('192.168.4.1', '255.255.255.0', '192.168.4.1', '192.168.4.1')
+            if self._link is None:
+                return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+            if self._static:
+                return tuple(self._static)
+            net = self._link.subnet
+            return (net + '.57', '255.255.255.0', net + '.1', net + '.1')
+        self._static = None if cfg == 'dhcp' else tuple(cfg)
+
+    def config(self, *args, **kw):
+        if args:
+            return self._cfg.get(args[0])
+        self._cfg.update(kw)
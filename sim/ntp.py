@@ -0,0 +1,44 @@
+"""Stand-in NTP server on 127.0.0.1 that answers with the world's true time."""
+import asyncio
+import struct
+
+NTP_DELTA_S = 2208988800
+
+
+def _stamp(unix):
+    t = unix + NTP_DELTA_S
+    sec = int(t)
+    return struct.pack('!II', sec, int((t - sec) * (1 << 32)) & 0xFFFFFFFF)
+
+
+class NTPServer(asyncio.DatagramProtocol):
+    def __init__(self, clock, stratum=2):
+        self.clock = clock
+        self.stratum = stratum
+        self.requests = 0
+        self.enabled = True
+        self.error_ms = 0.0     # served time minus true time (path asymmetry, bad upstream)
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if not self.enabled or len(data) < 48:
+            return
+        self.requests += 1
+        now = self.clock.true_time() + self.error_ms / 1000.0
+        resp = bytearray(48)
+        resp[0] = 0x24          # LI=0, VN=4, mode=4 (server)
+        resp[1] = self.stratum
+        resp[24:32] = data[40:48]   # originate = client's transmit
+        resp[32:40] = _stamp(now)
+        resp[40:48] = _stamp(now)
+        self.transport.sendto(bytes(resp), addr)
+
+
+async def start(clock, host='127.0.0.1'):
+    """Bind on an ephemeral port; returns (server, port)."""
+    loop = asyncio.get_running_loop()
+    transport, proto = await loop.create_datagram_endpoint(lambda: NTPServer(clock), local_addr=(host, 0))
+    return proto, transport.get_extra_info('sockname')[1]
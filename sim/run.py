@@ -0,0 +1,54 @@
+"""Run simulation scenarios: python -m sim.run [name ...] [--list] [--verbose] [--speed N]
+
+Exits non-zero if any check fails, so it can gate CI.
+"""
+import argparse
+import sys
+import time
+
+from sim.harness import Simulation
+from sim.scenarios import SCENARIOS
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m sim.run', description=__doc__.splitlines()[0])
+    ap.add_argument('names', nargs='*', help='scenarios to run (default: all)')
+    ap.add_argument('--list', action='store_true', help='list scenarios and exit')
+    ap.add_argument('-v', '--verbose', action='store_true', help='echo firmware output')
+    ap.add_argument('--speed', type=float, default=0.0,
+                    help='pace virtual time at N x real time (default: as fast as possible)')
+    args = ap.parse_args(argv)
+
+    if args.list:
+        for name, fn in SCENARIOS.items():
+            print('{:18s} {}'.format(name, (fn.__doc__ or '').strip()))
+        return 0
+    unknown = [n for n in args.names if n not in SCENARIOS]
+    if unknown:
+        ap.error('unknown scenario(s): {}'.format(', '.join(unknown)))
+
+    failed = []
+    for name in args.names or list(SCENARIOS):
+        print('== {}'.format(name))
+        sim = Simulation(echo=args.verbose, speed=args.speed, **SCENARIOS[name].options)
+        t0 = time.perf_counter()
+        try:
+            sim.run(SCENARIOS[name])
+        except Exception as e:
+            sim.check('scenario ran to completion', False, repr(e))
+        wall = time.perf_counter() - t0
+        print('   {} virtual s in {:.2f} wall s: {}'.format(int(sim.clock.mono), wall,
+                                                          'ok' if sim.ok else 'FAILED'))
+        if not sim.ok:
+            failed.append(name)
+            if not args.verbose:
+                for t_ms, line in sim.console.lines[-15:]:
+                    print('   [{:9.3f}] {}'.format(t_ms / 1000.0, line))
+    if failed:
+        print('failed: {}'.format(', '.join(failed)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
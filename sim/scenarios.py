@@ -0,0 +1,891 @@
+"""Scenarios run by `python -m sim.run`. Each one boots the firmware in a
+fresh Simulation, scripts the world and records checks with sim.check()."""
+import time
+
+SCENARIOS = {}
+
+
+def scenario(fn=None, **options):
+    """Register a scenario; keyword options go to Simulation (e.g. flash_firmware=True)."""
+    def register(fn):
+        fn.options = options
+        SCENARIOS[fn.__name__] = fn
+        return fn
+    return register(fn) if fn is not None else register
+
+
+def _local_hhmm(unix_s, tz_s):
+    tm = time.gmtime(int(unix_s + tz_s))
+    return tm[3], tm[4]
+
+
+async def _online(sim, timeout_s=30):
+    """Boot and wait until MQTT is connected and the clock is synced."""
+    sim.boot()
+    ok = await sim.until(lambda: sim.state['network']['mqtt_status'] == 'connected'
+                         and sim.state['clock'].get('synced'), timeout_s)
+    sim.check('online within {} s'.format(timeout_s), ok,
+              '{:.1f} s'.format(sim.clock.mono - sim.clock.boot_at))
+    return ok
+
+
+@scenario
+async def boot(sim):
+    """Cold boot: lamp first, then Wi-Fi, MQTT, NTP, sensors and OLED come up."""
+    await _online(sim)
+    await sim.sleep(20)
+    marks = dict((m[0], m[2]) for m in sim.fw('core.bootlog').marks)
+    sim.check('first frame before network stage', marks.get('first_frame', 1e9) < marks.get('network', 0),
+              'first_frame {} ms, network {} ms'.format(marks.get('first_frame'), marks.get('network')))
+    st = sim.statuses()
+    sim.check('status published every 5 s', len(st) >= 4, '{} messages'.format(len(st)))
+    sim.check('status timestamps are synced Unix ms', st and st[-1][1]['synced']
+              and abs(st[-1][1]['ts'] - sim.clock.true_time() * 1000) < 6000)
+    sim.check('SGP30 measured', sim.sgp30.measurements > 0, '{} reads'.format(sim.sgp30.measurements))
+    sim.check('OLED on and drawn', sim.oled.on and sim.oled.data_bytes > 0,
+              '{} data bytes'.format(sim.oled.data_bytes))
+    sim.check('no task crashed', not sim.grep('finished unexpectedly'))
+
+
+@scenario
+async def sunset(sim):
+    """Full 15 minute sunset from MQTT: monotonic fade that ends with the lamp off."""
+    await _online(sim)
+    sim.cmd({'cmd': 'set', 'is_on': True, 'brightness': 80})
+    await sim.sleep(2)
+    t0 = sim.clock.mono
+    sim.cmd({'cmd': 'anim', 'type': 'sunset', 'duration_s': 900})
+    await sim.sleep(0.5)
+    first = len(sim.strip.frames)
+    done = await sim.until(lambda: not sim.state['lamp']['is_on'], 960, step_s=1)
+    elapsed = sim.clock.mono - t0
+    sim.check('sunset ends after ~900 s', done and 895 <= elapsed <= 905, '{:.1f} s'.format(elapsed))
+    levels = [sum(sum(p) for p in f) / (3.0 * len(f)) for _t, f in sim.strip.frames[first:]]
+    rises = [i for i in range(1, len(levels)) if levels[i] > levels[i - 1] + 0.5]
+    sim.check('fade is monotonic', not rises, '{} frames, {} rises'.format(len(levels), len(rises)))
+    sim.check('strip dark at the end', sim.strip.level() == 0)
+    await sim.sleep(10)
+    last = sim.statuses()[-1][1]['lamp']
+    sim.check('status reports lamp off', not last['is_on'] and last['animation'] is None)
+
+
+@scenario
+async def reconnect_storm(sim):
+    """Ten broker outages and Wi-Fi drops in a row; the device recovers from each."""
+    await _online(sim)
+    connects0 = sim.broker.connects
+    for i in range(10):
+        sim.broker.outage(True)
+        if i % 3 == 0:
+            sim.radio.drop()
+        await sim.sleep(10 + 3 * i)
+        sim.broker.outage(False)
+        ok = await sim.until(lambda: sim.state['network']['mqtt_status'] == 'connected', 60)
+        if not ok:
+            sim.check('reconnect after outage {}'.format(i + 1), False)
+            return
+        await sim.sleep(2)
+    sim.check('reconnected after every outage', sim.broker.connects - connects0 == 10,
+              '{} connects'.format(sim.broker.connects - connects0))
+    t = sim.world.ms()
+    await sim.sleep(12)
+    sim.check('status publishing resumed', len(sim.statuses(t)) >= 2)
+    sim.cmd({'cmd': 'set', 'is_on': True, 'brightness': 30})
+    await sim.sleep(2)
+    sim.check('commands accepted after the storm', sim.state['lamp']['brightness'] == 30
+              and sim.strip.level() > 0)
+    sim.check('no task crashed', not sim.grep('finished unexpectedly'))
+
+
+@scenario
+async def offline_schedule(sim):
+    """A wakeup alarm fires locally while Wi-Fi and the broker are down."""
+    await _online(sim)
+    cfg = sim.config
+    fire = (int(sim.clock.true_time()) // 60 + 3) * 60
+    h, m = _local_hhmm(fire, cfg.TZ_OFFSET_S)
+    sim.cmd({'cmd': 'schedule', 'op': 'add', 'id': 'wk', 'anim': 'wakeup',
+             'at': '{:02d}:{:02d}'.format(h, m), 'days': 'daily', 'duration_s': 300, 'req': 1})
+    await sim.sleep(7)
+    sim.check('schedule acknowledged', sim.broker.messages(cfg.MQTT_TOPIC_REPLY))
+    sim.broker.outage(True)
+    sim.ap.up = False
+    await sim.until(lambda: sim.state['lamp']['animation'] == 'wakeup', 300, step_s=0.5)
+    lamp = sim.state['lamp']
+    late_ms = sim.fw('core.clock').now_ms() - fire * 1000
+    sim.check('wakeup fired offline', lamp['animation'] == 'wakeup'
+              and sim.state['network']['wifi_status'] != 'connected')
+    sim.check('fired on time', -500 <= late_ms <= 2000, '{} ms late'.format(late_ms))
+    await sim.sleep(60)
+    sim.check('strip brightening', sim.strip.level() > 0, 'level {:.1f}'.format(sim.strip.level()))
+
+
+@scenario
+async def power_loss(sim):
+    """Power cut halfway through a sunset: the next boot resumes it from flash."""
+    await _online(sim)
+    sim.cmd({'cmd': 'set', 'is_on': True, 'brightness': 90})
+    await sim.sleep(1)
+    sim.cmd({'cmd': 'anim', 'type': 'sunset', 'duration_s': 600})
+    await sim.sleep(300)
+    await sim.power_cycle(off_s=3)
+    await sim.sleep(0.5)
+    lamp = sim.state['lamp']
+    elapsed_s = (sim.fw('core.clock').now_ms() - lamp['animation_start_ms']) / 1000.0
+    sim.check('sunset restored before networking', lamp['animation'] == 'sunset'
+              and sim.state['network']['wifi_status'] != 'connected')
+    sim.check('resumed near the cut', 265 <= elapsed_s <= 301, '{:.1f} s in'.format(elapsed_s))
+    sim.check('strip lit within 0.5 s of power-on', sim.strip.level() > 0)
+    await sim.until(lambda: sim.state['clock'].get('synced'), 30)
+    left = 600 - elapsed_s
+    t0 = sim.clock.mono
+    done = await sim.until(lambda: not sim.state['lamp']['is_on'], left + 60, step_s=1)
+    took = sim.clock.mono - t0
+    sim.check('sunset completes on schedule after NTP step', done and abs(took - left) < 5,
+              'took {:.1f} s, expected {:.1f} s'.format(took, left))
+
+
+def _journal_records(journal, data):
+    """(offset, end, key, value) of every intact record in a segment."""
+    import json
+    import struct
+    out, pos = [], 0
+    while pos + journal.HEADER_LEN <= len(data):
+        _magic, size, _crc = struct.unpack_from(journal.HEADER, data, pos)
+        end = pos + journal.HEADER_LEN + size
+        if end > len(data):
+            break
+        key, value = json.loads(data[pos + journal.HEADER_LEN:end])
+        out.append((pos, end, key, value))
+        pos = end
+    return out
+
+
+def _journal_files(root):
+    import os
+    return sorted(n for n in os.listdir(root) if n.startswith('state') and n.endswith('.jnl'))
+
+
+@scenario
+async def journal(sim):
+    """Flash journal after power loss: torn tail, flipped payload byte, half-finished compaction."""
+    import os
+    await _online(sim)
+    sim.cmd({'cmd': 'set', 'is_on': True, 'brightness': 40})
+    await sim.sleep(8)      # debounce + persist wake
+    sim.cmd({'cmd': 'set', 'brightness': 80})
+    await sim.sleep(8)
+    jr = sim.fw('core.journal')
+    await sim.power_cut(1)
+
+    # reset in the middle of appending the brightness-80 record
+    name = _journal_files(sim.flash)[-1]
+    path = os.path.join(sim.flash, name)
+    with open(path, 'rb') as f:
+        data = f.read()
+    recs = _journal_records(jr, data)
+    cut = [r for r in recs if r[2] == 'lamp' and r[3].get('brightness') == 80]
+    good = [r for r in recs if r[2] == 'lamp' and r[3].get('brightness') == 40 and (not cut or r[0] < cut[-1][0])]
+    sim.check('both values on flash before the cut', cut and good, name)
+    if not (cut and good):
+        return
+    start, end = cut[-1][0], cut[-1][1]
+    with open(path, 'wb') as f:
+        f.write(data[:start + (end - start) // 2])
+    sim.boot()
+    await sim.sleep(1)
+    j = sim.fw('core.journal').get_journal()
+    sim.check('last good value restored from a torn tail', sim.state['lamp']['brightness'] == 40
+              and sim.state['lamp']['is_on'], str(sim.state['lamp']['brightness']))
+    sim.check('torn record counted', j.stats['torn'] == 1, str(j.stats))
+    files = _journal_files(sim.flash)
+    sim.check('damaged segment replaced by a fresh snapshot', files == ['state{}.jnl'.format(j.seq)]
+              and name not in files, str(files))
+    await _online(sim)
+    sim.cmd({'cmd': 'set', 'brightness': 55})
+    await sim.sleep(8)
+    await sim.power_cycle(1)
+    await sim.sleep(1)
+    sim.check('appends after recovery survive the next reboot', sim.state['lamp']['brightness'] == 55,
+              str(sim.state['lamp']['brightness']))
+
+    # the same module against scratch directories
+    def fresh(sub):
+        root = os.path.join(sim.flash, sub)
+        os.mkdir(root)
+        return root
+
+    def write(root, seq, *records):
+        with open(os.path.join(root, 'state{}.jnl'.format(seq)), 'wb') as f:
+            f.write(b''.join(jr.encode(k, v) for k, v in records))
+
+    root = fresh('jnl_flip')
+    write(root, 3, ('a', 1), ('b', 2), ('a', 3), ('c', 4))
+    seg = os.path.join(root, 'state3.jnl')
+    with open(seg, 'rb') as f:
+        data = bytearray(f.read())
+    third = _journal_records(jr, bytes(data))[2]
+    data[third[1] - 2] ^= 0x01     # bit rot inside the ('a', 3) payload
+    with open(seg, 'wb') as f:
+        f.write(data)
+    j = jr.Journal('state', 4096, root)
+    sim.check('flipped payload byte: replay stops before it', j.state == {'a': 1, 'b': 2}
+              and j.stats['torn'] == 1, str(j.state))
+    sim.check('never appends behind a damaged record', _journal_files(root) == ['state4.jnl'],
+              str(_journal_files(root)))
+    j.put('c', 5)
+    j.flush()
+    j = jr.Journal('state', 4096, root)
+    sim.check('later appends replay', j.state == {'a': 1, 'b': 2, 'c': 5} and j.stats['torn'] == 0, str(j.state))
+
+    # _compact cut between writing the new snapshot and deleting the old segment
+    root = fresh('jnl_compact')
+    write(root, 7, ('a', 1), ('b', 2), ('a', 3))
+    write(root, 8, ('a', 3), ('b', 2))
+    j = jr.Journal('state', 4096, root)
+    sim.check('old and new segment: state from both', j.state == {'a': 3, 'b': 2} and j.stats['torn'] == 0,
+              str(j.state))
+    sim.check('leftover segments folded into one', _journal_files(root) == ['state9.jnl'],
+              str(_journal_files(root)))
+
+    # ... and cut while the snapshot itself was being written
+    root = fresh('jnl_compact_torn')
+    write(root, 7, ('a', 1), ('b', 2), ('a', 3))
+    write(root, 8, ('a', 3), ('b', 2))
+    seg = os.path.join(root, 'state8.jnl')
+    with open(seg, 'rb') as f:
+        data = f.read()
+    with open(seg, 'wb') as f:
+        f.write(data[:len(data) - 3])
+    j = jr.Journal('state', 4096, root)
+    sim.check('torn snapshot: old segment still wins', j.state == {'a': 3, 'b': 2} and j.stats['torn'] == 1,
+              str(j.state))
+    j.put('b', 6)
+    j.flush()
+    j = jr.Journal('state', 4096, root)
+    sim.check('appends after a torn compaction replay', j.state == {'a': 3, 'b': 6}
+              and _journal_files(root) == ['state9.jnl'], str(j.state))
+
+
+# ---------------- OTA -----------------
+def _ota_package(sim, version, edits):
+    """Firmware tree with edits {path: (old, new)} packaged by tools/ota_manifest.py; returns (dir, manifest)."""
+    import importlib.util
+    import os
+    import shutil
+    import tempfile
+    from sim.harness import ROOT, FIRMWARE_FILES
+    spec = importlib.util.spec_from_file_location('ota_manifest', os.path.join(ROOT, 'tools', 'ota_manifest.py'))
+    tool = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tool)
+    base = tempfile.mkdtemp(prefix='sunlamp-ota-')
+    src, out = os.path.join(base, 'src'), os.path.join(base, 'out')
+    for name in FIRMWARE_FILES:
+        if os.path.isdir(os.path.join(ROOT, name)):
+            shutil.copytree(os.path.join(ROOT, name), os.path.join(src, name),
+                            ignore=shutil.ignore_patterns('__pycache__'))
+        else:
+            os.makedirs(src, exist_ok=True)
+            shutil.copy2(os.path.join(ROOT, name), src)
+    for path, (old, new) in edits.items():
+        with open(os.path.join(src, path)) as f:
+            text = f.read()
+        assert old in text, path
+        with open(os.path.join(src, path), 'w') as f:
+            f.write(text.replace(old, new, 1))
+    sim.cleanup.append(base)
+    return out, tool.build(src, out, version)
+
+
+async def _ota_request(sim, j, timeout_s=5):
+    return await _request(sim, dict(j, cmd='ota'), timeout_s)
+
+
+async def _request(sim, j, timeout_s=5):
+    """Send a command and wait for the reply with the same req."""
+    import json
+    sim.req = getattr(sim, 'req', 0) + 1
+    sim.cmd(dict(j, req=sim.req))
+    end = sim.clock.mono + timeout_s
+    while sim.clock.mono < end:
+        for _t, _topic, p in sim.broker.messages(sim.config.MQTT_TOPIC_REPLY):
+            reply = json.loads(p)
+            if reply.get('req') == sim.req:
+                return reply
+        await sim.sleep(0.1)
+    return None
+
+
+async def _ota_push(sim, pkg, nxt, limit=None):
+    """Stream chunks the lamp asks for (like sunlamp_backend.ota_push); returns the last reply."""
+    import base64
+    import os
+    reply = None
+    while nxt and limit != 0:
+        with open(os.path.join(pkg, nxt['path']), 'rb') as f:
+            f.seek(nxt['off'])
+            data = f.read(512)
+        reply = await _ota_request(sim, {'op': 'chunk', 'path': nxt['path'], 'off': nxt['off'],
+                                         'data': base64.b64encode(data).decode()})
+        if reply is None:
+            return None
+        nxt = reply['next']
+        limit = None if limit is None else limit - 1
+    return reply
+
+
+def _ota_state(sim):
+    import json
+    import os
+    try:
+        with open(os.path.join(sim.flash, 'ota_state.json')) as f:
+            return json.load(f)
+    except OSError:
+        return {}
+
+
+@scenario(flash_firmware=True)
+async def ota(sim):
+    """OTA: delta push over MQTT with a resumed transfer, confirm; then a bad build over HTTP rolls back."""
+    import asyncio
+    import os
+    await _online(sim)
+    good_dir, good = _ota_package(sim, '1.1-sim', {
+        'core/bootlog.py': ('import time', "import time\nOTA_MARK = '1.1-sim'  # padding " + 'x' * 600)})
+    reply = await _ota_request(sim, {'op': 'begin', 'manifest': good})
+    sim.check('delta: only the changed file is requested', reply and reply['need'] == ['core/bootlog.py'],
+              '{} of {} files'.format(len(reply['need']) if reply else '-', len(good['files'])))
+    await _ota_push(sim, good_dir, reply['next'], limit=1)
+    await sim.power_cycle()
+    await sim.until(lambda: sim.state['network']['mqtt_status'] == 'connected', 30)
+    reply = await _ota_request(sim, {'op': 'begin', 'manifest': good})
+    sim.check('transfer resumes after a reboot', reply and reply['next'] == {'path': 'core/bootlog.py', 'off': 512},
+              str(reply and reply['next']))
+    reply = await _ota_push(sim, good_dir, reply['next'])
+    sim.check('all chunks verified', reply and reply['ok'] and reply['next'] is None)
+    boots = sim.boots
+    reply = await _ota_request(sim, {'op': 'commit'})
+    sim.check('commit accepted', reply and reply['ok'])
+    await sim.until(lambda: sim.boots > boots, 10)
+    await sim.sleep(1)
+    sim.check('new version runs on trial', getattr(sim.fw('core.bootlog'), 'OTA_MARK', None) == '1.1-sim'
+              and _ota_state(sim).get('state') == 'trial')
+    await sim.until(lambda: _ota_state(sim).get('state') == 'confirmed', 120, step_s=1)
+    reply = await _ota_request(sim, {'op': 'status'})
+    sim.check('confirmed after a healthy trial', reply and reply['installed'] == '1.1-sim'
+              and not os.path.exists(os.path.join(sim.flash, 'ota_backup')),
+              'state {}'.format(_ota_state(sim).get('state')))
+
+    # a build whose display task dies, pulled over HTTP with a Range resume server
+    bad_dir, bad = _ota_package(sim, '1.2-bad', {
+        'core/bootlog.py': ('import time', "import time\nOTA_MARK = '1.1-sim'  # padding " + 'x' * 600),
+        'tasks/display_task.py': ('async def display_task(system_state, lock):\n',
+                                  'async def display_task(system_state, lock):\n'
+                                  "    raise RuntimeError('broken build')\n")})
+    served = []
+
+    async def http(reader, writer):
+        line = await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        path = os.path.join(bad_dir, line.split()[1].decode().lstrip('/'))
+        served.append(os.path.relpath(path, bad_dir))
+        with open(path, 'rb') as f:
+            data = f.read()
+        writer.write('HTTP/1.0 200 OK\r\nContent-Length: {}\r\n\r\n'.format(len(data)).encode() + data)
+        await writer.drain()
+        writer.close()
+    server = await asyncio.start_server(http, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    with open(os.path.join(sim.flash, 'tasks', 'display_task.py'), 'rb') as f:
+        display_before = f.read()
+    boots = sim.boots
+    reply = await _ota_request(sim, {'op': 'fetch', 'url': 'http://127.0.0.1:{}/'.format(port)})
+    sim.check('fetch started', reply and reply['ok'])
+    await sim.until(lambda: sim.boots > boots, 30)
+    sim.check('HTTP pull downloads only the delta', sorted(served) == ['manifest.json', 'tasks/display_task.py'],
+              ', '.join(served))
+    await sim.until(lambda: _ota_state(sim).get('state') == 'rolled_back', 60, step_s=1)
+    rolled_back_ms = int(sim.clock.mono * 1000)
+    server.close()
+    st = _ota_state(sim)
+    with open(os.path.join(sim.flash, 'tasks', 'display_task.py'), 'rb') as f:
+        restored = f.read() == display_before
+    sim.check('bad build rolled back', st.get('state') == 'rolled_back' and restored,
+              '{} ({})'.format(st.get('state'), st.get('unhealthy')))
+    await sim.sleep(20)
+    reply = await _ota_request(sim, {'op': 'status'})
+    crashes = [t for t, _line in sim.grep('finished unexpectedly') if t > rolled_back_ms]
+    sim.check('previous version keeps running', reply and reply['installed'] == '1.1-sim' and not crashes
+              and sim.state['network']['mqtt_status'] == 'connected',
+              '{} boots, {} resets'.format(sim.boots, sim.world.resets))
+
+
+@scenario
+async def power(sim):
+    """Power governor: idle at economy clock with few wakeups; key press and MQTT wake it at once."""
+    import asyncio
+    await _online(sim)
+    cfg = sim.config
+    gov = lambda: sim.fw('core.power').get_governor()
+    ok = await sim.until(lambda: gov().state == 'idle', cfg.POWER_IDLE_S + 15)
+    sim.check('idle after {} s without activity'.format(cfg.POWER_IDLE_S), ok,
+              'freq {} MHz, WLAN pm {}'.format(sim.world.cpu_freq // 1000000, sim.radio.sta.config('pm')))
+    sim.check('economy clock and Wi-Fi power save while idle',
+              sim.world.cpu_freq == cfg.POWER_FREQ_ECO and sim.radio.sta.config('pm') == 2)
+    writes = sim.strip.writes
+    await sim.sleep(40)
+    n = sim.strip.writes - writes
+    sim.check('static strip is only refreshed while idle', 1 <= n <= 3, '{} writes in 40 s'.format(n))
+
+    t0 = sim.clock.mono
+    press = asyncio.ensure_future(sim.press(cfg.KEY_SET_PIN))
+    woke = await sim.until(lambda: sim.world.cpu_freq == cfg.POWER_FREQ_PERF, 1, step_s=0.001)
+    dt_ms = (sim.clock.mono - t0) * 1000
+    await press
+    sim.check('key press restores full clock at once', woke and gov().state == 'perf' and dt_ms < 20,
+              '{:.0f} ms'.format(dt_ms))
+    lit = await sim.until(lambda: sim.strip.level() > 0, 1, step_s=0.01)
+    sim.check('night light on within 1 s of the press', lit)
+
+    sim.cmd({'cmd': 'set', 'is_on': False})
+    await sim.until(lambda: gov().state == 'idle', cfg.POWER_IDLE_S + 15)
+    t0 = sim.clock.mono
+    sim.cmd({'cmd': 'anim', 'type': 'sunset', 'duration_s': 5})
+    started = await sim.until(lambda: sim.state['lamp']['animation'] == 'sunset', 2, step_s=0.01)
+    sim.check('MQTT command applied promptly while idle', started and sim.clock.mono - t0 < 0.6,
+              '{:.0f} ms'.format((sim.clock.mono - t0) * 1000))
+    await sim.sleep(2)
+    sim.check('perf while animating', gov().state == 'perf' and sim.world.cpu_freq == cfg.POWER_FREQ_PERF)
+    await sim.until(lambda: sim.state['lamp']['animation'] is None, 10)
+    await sim.sleep(cfg.POWER_BOOST_MS / 1000.0 + 2)
+    sim.check('back to economy after the animation', gov().state == 'eco'
+              and sim.world.cpu_freq == cfg.POWER_FREQ_ECO)
+    await sim.sleep(6)
+    p = sim.statuses()[-1][1].get('power') or {}
+    t = p.get('time_s', {})
+    sim.check('time in each state reported in status', t.get('idle', 0) > 30 and t.get('perf', 0) > 0
+              and t.get('eco', 0) > 0, str(p))
+
+
+@scenario
+async def config(sim):
+    """Live settings: publish and frame rate change within one cycle, bad updates are refused, overrides survive a reboot."""
+    await _online(sim)
+    await sim.sleep(1)
+    t0 = sim.clock.mono
+    base = len(sim.statuses())
+    await sim.sleep(20)
+    sim.check('default publish interval', 3 <= len(sim.statuses()) - base <= 5,
+              '{} statuses in 20 s'.format(len(sim.statuses()) - base))
+
+    reply = await _request(sim, {'cmd': 'config', 'set': {'publish_interval_s': 1}})
+    sim.check('config set acknowledged', reply and reply['ok']
+              and reply['changed'] == {'publish_interval_s': 1}, str(reply))
+    t0 = sim.clock.mono
+    base = len(sim.statuses())
+    await sim.until(lambda: len(sim.statuses()) > base, 5, step_s=0.05)
+    sim.check('new publish interval applies within one cycle', sim.clock.mono - t0 <= 1.2,
+              '{:.2f} s'.format(sim.clock.mono - t0))
+    base = len(sim.statuses())
+    await sim.sleep(10)
+    sim.check('status every second', 9 <= len(sim.statuses()) - base <= 11,
+              '{} statuses in 10 s'.format(len(sim.statuses()) - base))
+
+    reply = await _request(sim, {'cmd': 'config', 'set': {'publish_interval_s': 30, 'frame_interval_ms': 5}})
+    settings = sim.fw('core.settings').get_settings()
+    sim.check('out-of-range update refused as a whole', reply and not reply['ok']
+              and settings.get('publish_interval_s') == 1, reply and reply.get('error'))
+    reply = await _request(sim, {'cmd': 'config', 'set': {'no_such_thing': 1}})
+    sim.check('unknown setting refused', reply and not reply['ok'], reply and reply.get('error'))
+
+    sim.cmd({'cmd': 'anim', 'type': 'breathe', 'duration_s': 3})
+    await sim.sleep(1)
+    writes = sim.strip.writes
+    await sim.sleep(2)
+    before = sim.strip.writes - writes
+    await _request(sim, {'cmd': 'config', 'set': {'frame_interval_ms': 50}})
+    await sim.sleep(0.2)
+    writes = sim.strip.writes
+    await sim.sleep(2)
+    after = sim.strip.writes - writes
+    sim.check('frame interval change applies live', 18 <= before <= 22 and 36 <= after <= 44,
+              '{} -> {} frames in 2 s'.format(before, after))
+
+    await sim.power_cycle(off_s=2)
+    await sim.until(lambda: sim.state['network']['mqtt_status'] == 'connected', 30)
+    settings = sim.fw('core.settings').get_settings()
+    sim.check('overrides restored after reboot', settings.get('publish_interval_s') == 1
+              and settings.get('frame_interval_ms') == 50, str(settings.overrides()))
+    reply = await _request(sim, {'cmd': 'config', 'reset': True})
+    sim.check('reset to config.py defaults', reply and reply['ok'] and not reply['overrides']
+              and settings.get('publish_interval_s') == sim.config.PUBLISH_INTERVAL_S, str(reply))
+
+
+# ---------------- local API -----------------
+async def _http(sim, method, path, body=None, headers=None):
+    """One request to the firmware's local API; returns (status, body bytes)."""
+    import asyncio
+    import json
+    reader, writer = await asyncio.open_connection('127.0.0.1', sim.api_port)
+    data = json.dumps(body).encode() if body is not None else b''
+    head = '{} {} HTTP/1.1\r\nHost: lamp\r\nContent-Length: {}\r\n'.format(method, path, len(data))
+    headers = dict(headers or {})
+    if body is not None:
+        headers.setdefault('Content-Type', 'application/json')
+    for k, v in headers.items():
+        head += '{}: {}\r\n'.format(k, v)
+    writer.write(head.encode() + b'\r\n' + data)
+    resp = await reader.read()
+    writer.close()
+    head, _, payload = resp.partition(b'\r\n\r\n')
+    return int(head.split(b' ', 2)[1]), payload
+
+
+class _WsClient:
+    """Browser-side WebSocket: masked text frames out, JSON messages in."""
+
+    @classmethod
+    async def connect(cls, sim, path='/api/ws', origin='http://lamp'):
+        import asyncio
+        self = cls()
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', sim.api_port)
+        self.writer.write(('GET {} HTTP/1.1\r\nHost: lamp\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                           'Origin: {}\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                           'Sec-WebSocket-Version: 13\r\n\r\n').format(path, origin).encode())
+        self.head = await self.reader.readuntil(b'\r\n\r\n')
+        return self
+
+    def send(self, obj):
+        import json
+        import os
+        payload = json.dumps(obj).encode()
+        mask = os.urandom(4)
+        n = len(payload)
+        head = bytes((0x81, 0x80 | n)) if n < 126 else bytes((0x81, 0x80 | 126)) + n.to_bytes(2, 'big')
+        self.writer.write(head + mask + bytes(b ^ mask[i & 3] for i, b in enumerate(payload)))
+
+    async def recv(self, timeout_s=2):
+        import asyncio
+        import json
+        b0, b1 = await asyncio.wait_for(self.reader.readexactly(2), timeout_s)
+        n = b1 & 0x7F
+        if n == 126:
+            n = int.from_bytes(await self.reader.readexactly(2), 'big')
+        data = await self.reader.readexactly(n)
+        return json.loads(data) if b0 & 0x0F == 1 else None
+
+    def close(self):
+        self.writer.close()
+
+
+@scenario
+async def local_api(sim):
+    """LAN API: REST state/command, WebSocket slider stream and pushes while the broker is down, client cap."""
+    import asyncio
+    import json
+    await _online(sim)
+    await sim.sleep(2)
+    status, body = await _http(sim, 'GET', '/api/state')
+    doc = json.loads(body) if status == 200 else {}
+    sim.check('GET /api/state returns the status document', 'lamp' in doc and 'sensor' in doc, str(status))
+    status, body = await _http(sim, 'POST', '/api/cmd', {'cmd': 'set', 'is_on': True, 'brightness': 70})
+    sim.check('POST /api/cmd applies a command', status == 200 and json.loads(body).get('ok')
+              and sim.state['lamp']['brightness'] == 70, body.decode())
+    await sim.sleep(0.5)
+    level70 = sim.strip.level()
+    status, body = await _http(sim, 'POST', '/api/cmd', {'cmd': 'schedule', 'op': 'list'})
+    sim.check('command replies come back in the response', json.loads(body).get('schedules') == [], body.decode())
+    status, _ = await _http(sim, 'POST', '/api/cmd', None, {'Content-Type': 'application/json'})
+    sim.check('malformed body refused', status == 400, str(status))
+
+    # what a foreign page in the user's browser could send
+    evil = 'http://evil.example'
+    status, _ = await _http(sim, 'POST', '/api/cmd', {'cmd': 'set', 'brightness': 5},
+                            {'Content-Type': 'text/plain'})
+    sim.check('text/plain command refused (no preflight-free writes)', status == 415
+              and sim.state['lamp']['brightness'] == 70, str(status))
+    status, _ = await _http(sim, 'POST', '/api/cmd', {'cmd': 'set', 'brightness': 5}, {'Origin': evil})
+    sim.check('foreign Origin refused', status == 403 and sim.state['lamp']['brightness'] == 70, str(status))
+    status, _ = await _http(sim, 'OPTIONS', '/api/cmd', None, {'Origin': evil})
+    sim.check('no preflight for a foreign Origin', status == 403, str(status))
+    status, _ = await _http(sim, 'POST', '/api/cmd', {'cmd': 'set', 'brightness': 70}, {'Origin': 'http://lamp'})
+    sim.check('same-origin page accepted', status == 200, str(status))
+    for j in ({'cmd': 'ota', 'op': 'fetch', 'url': 'http://evil.example/fw'},
+              {'cmd': 'config', 'op': 'set', 'key': 'STATUS_PUBLISH_S', 'value': 1}):
+        status, body = await _http(sim, 'POST', '/api/cmd', j)
+        sim.check('{} refused without API_TOKEN'.format(j['cmd']), status == 403
+                  and json.loads(body).get('ok') is False, body.decode())
+    ws = await _WsClient.connect(sim, origin=evil)
+    sim.check('WebSocket from a foreign Origin refused', b' 403 ' in ws.head, ws.head.split(b'\r\n')[0].decode())
+    ws.close()
+
+    sim.broker.outage(True)
+    await sim.until(lambda: sim.state['network']['mqtt_status'] != 'connected', 30)
+    ws = await _WsClient.connect(sim)
+    sim.check('WebSocket handshake', b' 101 ' in ws.head, ws.head.split(b'\r\n')[0].decode())
+    first = await ws.recv()
+    sim.check('first push carries the full state', first.get('type') == 'state' and 'lamp' in first
+              and 'sensor' in first)
+
+    # slider drag: 30 updates 10 ms apart while the cloud broker is unreachable
+    for i in range(30):
+        ws.send({'cmd': 'set', 'brightness': 20 + 2 * i, 'req': i})
+        t0 = sim.clock.mono
+        await asyncio.sleep(0.01)
+    applied = await sim.until(lambda: sim.state['lamp']['brightness'] == 78, 1, step_s=0.001)
+    sim.check('slider stream applied without the broker', applied,
+              '{:.0f} ms after the last update'.format((sim.clock.mono - t0) * 1000))
+    replies, pushes, last_lamp = [], 0, None
+    end = sim.clock.mono + 1.0
+    while sim.clock.mono < end:
+        try:
+            msg = await ws.recv(0.5)
+        except asyncio.TimeoutError:
+            break
+        if msg.get('type') == 'reply':
+            replies.append(msg.get('req'))
+        elif msg.get('type') == 'state':
+            pushes += 1
+            last_lamp = msg.get('lamp', last_lamp)
+    sim.check('every command acknowledged', sorted(replies) == list(range(30)), '{} replies'.format(len(replies)))
+    sim.check('state pushes coalesced', 1 <= pushes < 15 and last_lamp and last_lamp['brightness'] == 78,
+              '{} pushes'.format(pushes))
+    sim.check('strip follows the local API', sim.strip.level() > level70,
+              'level {} -> {}'.format(level70, sim.strip.level()))
+
+    others = [await _WsClient.connect(sim) for _ in range(3)]
+    try:
+        status, _ = await _http(sim, 'GET', '/api/state')
+    except ConnectionResetError:
+        status = 'reset'    # the 503 can race the unread request into a TCP reset
+    sim.check('client cap enforced', status in (503, 'reset'), str(status))
+    for c in others:
+        c.close()
+    ws.close()
+    await sim.sleep(0.5)
+    status, _ = await _http(sim, 'GET', '/api/state')
+    sim.check('slots freed when clients leave', status == 200, str(status))
+    sim.broker.outage(False)
+
+
+@scenario
+async def rules(sim):
+    """Local rules: CO2 warning with duration and hysteresis, dusk sunset, all while the broker is down."""
+    await _online(sim)
+    reply = await _request(sim, {'cmd': 'rule', 'op': 'add', 'id': 'co2', 'field': 'eco2', 'above': 1500,
+                                 'hysteresis': 200, 'for_s': 10, 'do': {'cmd': 'anim', 'type': 'warning'},
+                                 'release': {'cmd': 'set', 'is_on': False}})
+    sim.check('rule added', reply and reply['ok'], reply and reply.get('error'))
+    reply = await _request(sim, {'cmd': 'rule', 'op': 'add', 'id': 'dusk', 'field': 'light', 'below': 600,
+                                 'for_s': 5, 'do': {'cmd': 'anim', 'type': 'sunset', 'duration_s': 60}})
+    reply = await _request(sim, {'cmd': 'rule', 'op': 'add', 'id': 'bad', 'field': 'eco2', 'above': 1,
+                                 'below': 2, 'do': {'cmd': 'anim', 'type': 'warning'}})
+    sim.check('invalid rule refused', reply and not reply['ok'] and len(reply['rules']) == 2,
+              reply and reply.get('error'))
+    for bad in ({'brightness': 'high'}, {'color_temp_k': 50}, {'rgb': [255, 0]}, {'color_hex': 'zz0000'}):
+        do = dict(bad, cmd='set')
+        reply = await _request(sim, {'cmd': 'rule', 'op': 'add', 'id': 'badset', 'field': 'eco2', 'above': 1,
+                                     'do': do})
+        sim.check('rule with set {} refused'.format(bad), reply and not reply['ok'] and len(reply['rules']) == 2,
+                  reply and reply.get('error'))
+    sim.cmd({'cmd': 'set', 'is_on': True, 'brightness': 50})
+    await sim.sleep(5)
+    sim.broker.outage(True)
+    lamp = sim.state['lamp']
+
+    sim.env.eco2 = 1800
+    t0 = sim.clock.mono
+    await sim.sleep(6)
+    sim.check('duration condition holds the rule back', lamp['animation'] is None)
+    fired = await sim.until(lambda: lamp['animation'] == 'warning', 20)
+    sim.check('eCO2 rule fires offline after for_s', fired and sim.clock.mono - t0 >= 10,
+              '{:.1f} s after the rise'.format(sim.clock.mono - t0))
+    sim.check('active rule reported', sim.state['rules']['active'] == ['co2'], str(sim.state['rules']))
+    sim.env.eco2 = 1400
+    await sim.sleep(15)
+    sim.check('hysteresis keeps it active', lamp['animation'] == 'warning'
+              and sim.state['rules']['active'] == ['co2'])
+    sim.env.eco2 = 900
+    released = await sim.until(lambda: not lamp['is_on'], 20)
+    sim.check('release action runs below threshold - hysteresis', released and lamp['animation'] is None)
+
+    sim.env.eco2 = 1800
+    await sim.sleep(4)
+    sim.env.eco2 = 600
+    await sim.sleep(15)
+    engine = sim.fw('core.rules').get_engine()
+    sim.check('short excursion ignored', engine.counts.get('co2') == 1, str(engine.counts))
+
+    sim.env.daylight = 300
+    dusk = await sim.until(lambda: lamp['animation'] == 'sunset', 20)
+    sim.check('dusk rule starts a sunset', dusk)
+
+    sim.broker.outage(False)
+    await sim.until(lambda: sim.state['network']['mqtt_status'] == 'connected', 30)
+    await sim.sleep(6)
+    st = sim.statuses()[-1][1].get('rules') or {}
+    sim.check('firings reported in status', [f[0] for f in st.get('fired', [])] == ['co2', 'dusk'], str(st))
+    await sim.power_cycle()
+    await sim.sleep(3)
+    engine = sim.fw('core.rules').get_engine()
+    sim.check('rules persisted across reboot', sorted(engine.rules) == ['co2', 'dusk'], str(sorted(engine.rules)))
+
+    # a rule saved before set actions were validated must not stop the others
+    engine.add({'id': 'a_legacy', 'field': 'tvoc', 'above': 200.0, 'hysteresis': 0.0, 'for_s': 0,
+                'do': {'cmd': 'set', 'brightness': 'high'}, 'enabled': True})
+    engine.add({'id': 'voc', 'field': 'tvoc', 'above': 200.0, 'hysteresis': 0.0, 'for_s': 0,
+                'do': {'cmd': 'anim', 'type': 'warning'}, 'enabled': True})
+    sim.env.tvoc = 500
+    fired = await sim.until(lambda: sim.state['lamp']['animation'] == 'warning', 20)
+    sim.check('a failing action does not drop the next one', fired, str(sim.state['lamp']['animation']))
+    sim.check('failing action logged', sim.grep('rule action error'), str(sim.grep('rule')))
+    sim.check('sensor state still updated', sim.state['sensor']['tvoc'] > 200
+              and 'voc' in sim.state['rules']['active'], str(sim.state['rules']))
+
+
+@scenario
+async def logs(sim):
+    """Logger: a failing sensor is rate limited and counted, the ring is paged over MQTT and wraps."""
+    await _online(sim)
+    log = sim.fw('core.log')
+    sim.env.dht_fail = True
+    await sim.sleep(30)
+    sim.check('repeated error stored and printed once', len(sim.grep('W{} '.format(log.DHT_READ))) == 1,
+              '{} console lines'.format(len(sim.grep('W{} '.format(log.DHT_READ)))))
+    summary = log.summary()
+    sim.check('repeats counted', summary['warn'] >= 15 and summary['suppressed'] >= 15, str(summary))
+    await sim.sleep(40)
+    sim.env.dht_fail = False
+    lines = sim.grep('W{} '.format(log.DHT_READ))
+    sim.check('next record after LOG_REPEAT_MS carries the repeat count',
+              len(lines) == 2 and 'repeats' in lines[-1][1], lines and lines[-1][1])
+
+    entries = []
+    pages = 0
+    since = 0
+    while True:
+        reply = await _request(sim, {'cmd': 'logs', 'since': since, 'max': 5})
+        if not reply or not reply['ok']:
+            break
+        pages += 1
+        entries.extend(reply['entries'])
+        since = reply['next']
+        if not reply['more'] or pages > 50:
+            break
+    seqs = [e['seq'] for e in entries]
+    sim.check('ring paged in chunks over MQTT', pages > 1 and seqs == list(range(len(seqs)))
+              and len(seqs) == log.summary()['seq'], '{} entries in {} pages'.format(len(seqs), pages))
+    dht = [e for e in entries if e['code'] == log.DHT_READ]
+    sim.check('entries decoded with level, text and detail', len(dht) == 2 and dht[0]['level'] == 'W'
+              and dht[0]['msg'] == 'DHT22 read error' and dht[0]['detail'], str(dht[:1]))
+    sim.check('repeat count and timestamp exported', dht and dht[-1]['repeats'] >= 20
+              and abs(dht[-1]['ts'] - (sim.clock.true_time() - 10) * 1000) < 30000,
+              dht and '{} repeats'.format(dht[-1]['repeats']))
+    reply = await _request(sim, {'cmd': 'logs', 'since': 0, 'level': 'warn'})
+    sim.check('level filter', reply and reply['entries'] and all(e['level'] in 'WE' for e in reply['entries']))
+    reply = await _request(sim, {'cmd': 'logs', 'level': 'loud'})
+    sim.check('bad request refused', reply and not reply['ok'], reply and reply.get('error'))
+
+    # info messages are never rate limited: flood the ring past its size
+    for i in range(200):
+        log.msg(log.SCHEDULE_FIRED, 'flood {}'.format(i))
+    reply = await _request(sim, {'cmd': 'logs', 'since': 0, 'max': 100})
+    first = log.summary()['seq'] - sim.config.LOG_ENTRIES
+    sim.check('ring wraps in fixed memory', len(log._buf) == sim.config.LOG_ENTRIES * log.RECORD
+              and reply and reply.get('lost') == first and reply['entries'][0]['seq'] == first
+              and len(reply['entries']) == sim.config.LOG_PAGE_MAX,
+              reply and 'lost {}'.format(reply.get('lost')))
+    await sim.sleep(6)
+    st = sim.statuses()[-1][1].get('log') or {}
+    sim.check('summary in status', st.get('warn', 0) >= 30 and st.get('seq', 0) > 200, str(st))
+
+
+@scenario
+async def shadow(sim):
+    """Device shadow: retained desired applied on (re)connect, versioned reported doc plus diff-only deltas."""
+    import json
+
+    def desired(version, **state):
+        sim.broker.publish(cfg.MQTT_TOPIC_DESIRED, json.dumps({'version': version, 'state': state}), retain=True)
+
+    def reported():
+        full = json.loads(sim.broker.retained[cfg.MQTT_TOPIC_REPORTED])
+        deltas = [json.loads(p) for _t, _topic, p in sim.broker.messages(cfg.MQTT_TOPIC_REPORTED_DELTA)]
+        state = dict(full['state'])
+        if deltas and deltas[-1]['base'] == full['version'] and deltas[-1]['version'] > full['version']:
+            state.update(deltas[-1]['state'])
+            return deltas[-1]['version'], deltas[-1]['desired_version'], state
+        return full['version'], full['desired_version'], state
+
+    await _online(sim)
+    cfg = sim.config
+    await sim.sleep(1)
+    sim.check('retained reported document on connect', cfg.MQTT_TOPIC_REPORTED in sim.broker.retained)
+    lamp = sim.state['lamp']
+    desired(1, is_on=True, brightness=40)
+    ok = await sim.until(lambda: lamp['is_on'] and lamp['brightness'] == 40, 2)
+    await sim.sleep(1)
+    _v, dv, st = reported()
+    sim.check('desired applied and acknowledged', ok and dv == 1 and st['brightness'] == 40, str(st))
+
+    # the backend changes its mind while the lamp is cut off from the broker
+    sim.broker.outage(True)
+    await sim.until(lambda: sim.state['network']['mqtt_status'] != 'connected', 10)
+    desired(2, is_on=True, brightness=70, color_temp_k=2700)
+    await sim.sleep(8)
+    sim.check('offline lamp keeps its state', lamp['brightness'] == 40)
+    sim.broker.outage(False)
+    await sim.until(lambda: sim.state['network']['mqtt_status'] == 'connected', 30)
+    t0 = sim.clock.mono
+    ok = await sim.until(lambda: lamp['brightness'] == 70 and lamp['color_temp_k'] == 2700, 5)
+    sim.check('reconnect reconciles from the retained desired document', ok and sim.clock.mono - t0 < 1,
+              '{:.0f} ms after connect'.format((sim.clock.mono - t0) * 1000))
+    await sim.sleep(1)
+    v, dv, st = reported()
+    sim.check('reported catches up (full + latest delta)', dv == 2 and st['brightness'] == 70
+              and st['color_temp_k'] == 2700, 'version {} {}'.format(v, st))
+
+    # within SHADOW_FULL_S the retained copy is refreshed once, then the topic stays quiet
+    await sim.sleep(cfg.SHADOW_FULL_S + 2)
+    full = json.loads(sim.broker.retained[cfg.MQTT_TOPIC_REPORTED])
+    sim.check('retained document refreshed to the latest version', full['version'] == v
+              and full['state']['brightness'] == 70, 'version {}'.format(full['version']))
+    t = sim.world.ms()
+    await sim.sleep(90)
+    idle = [m for m in sim.broker.messages('esp32/sunlamp/shadow/#') if m[0] > t]
+    sim.check('nothing sent while the state holds', not idle, '{} messages'.format(len(idle)))
+
+    t = sim.world.ms()
+    for b in range(20, 61, 2):
+        sim.cmd({'cmd': 'set', 'brightness': b})
+        await sim.sleep(0.05)
+    await sim.sleep(2)
+    deltas = [json.loads(p) for t_ms, _topic, p in sim.broker.messages(cfg.MQTT_TOPIC_REPORTED_DELTA) if t_ms > t]
+    sim.check('slider burst coalesced into fewer deltas', 0 < len(deltas) <= 10,
+              '{} deltas for 21 commands'.format(len(deltas)))
+    sim.check('deltas carry only the changed keys', all(set(d['state']) == {'brightness'} for d in deltas),
+              str(deltas[-1] if deltas else None))
+    v, _dv, st = reported()
+    sim.check('state rebuilt from retained + latest delta', st['brightness'] == 60 == lamp['brightness'],
+              'version {}'.format(v))
+    vs = [d['version'] for d in deltas]
+    sim.check('versions increase', vs == sorted(set(vs)))
+
+    # a local change survives the retained (already applied) desired doc on reboot
+    sim.cmd({'cmd': 'set', 'brightness': 25})
+    await sim.sleep(8)    # journal debounce
+    await sim.power_cycle()
+    await sim.until(lambda: sim.state['network']['mqtt_status'] == 'connected', 30)
+    await sim.sleep(2)
+    lamp = sim.state['lamp']
+    v2, dv, st = reported()
+    sim.check('applied desired version not re-applied after reboot', lamp['brightness'] == 25 and dv == 2,
+              'brightness {}'.format(lamp['brightness']))
+    sim.check('reported version survives reboot', v2 > v, '{} -> {}'.format(v, v2))
+    desired(3, brightness_mode='auto', brightness=90)
+    ok = await sim.until(lambda: lamp['brightness_mode'] == 'auto', 2)
+    await sim.sleep(1)
+    _v, dv, st = reported()
+    sim.check('auto brightness: brightness neither applied nor reported', ok and dv == 3 and st.get('brightness') is None,
+              str(st))
@@ -0,0 +1,53 @@
+"""Stand-in for `uasyncio`: CPython asyncio plus the MicroPython extensions
+(sleep_ms, wait_for_ms, ThreadSafeFlag)."""
+import asyncio
+from asyncio import *  # noqa: F401,F403
+
+TimeoutError = asyncio.TimeoutError
+CancelledError = asyncio.CancelledError
+
+_servers = []   # listening sockets opened by the firmware; a power cut closes them
+
+
+async def start_server(client_connected_cb, host, port, backlog=5):
+    srv = await asyncio.start_server(client_connected_cb, host, port, backlog=backlog)
+    _servers.append(srv)
+    return srv
+
+
+def close_servers():
+    while _servers:
+        _servers.pop().close()
+
+
+def sleep_ms(ms):
+    return asyncio.sleep(ms / 1000.0)
+
+
+def wait_for_ms(aw, timeout_ms):
+    return asyncio.wait_for(aw, timeout_ms / 1000.0)
+
+
+class ThreadSafeFlag:
+    """Single-waiter flag that may be set from (simulated) IRQ context."""
+
+    def __init__(self):
+        self._ev = asyncio.Event()
+
+    def set(self):
+        self._ev.set()
+
+    def clear(self):
+        self._ev.clear()
+
+    async def wait(self):
+        await self._ev.wait()
+        self._ev.clear()
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+def get_event_loop():
+    return asyncio.get_event_loop()
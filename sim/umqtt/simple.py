@@ -0,0 +1,61 @@
+"""Stand-in for `umqtt.simple`, connected to the in-process broker."""
+from sim import world as _world
+
+
+class MQTTException(Exception):
+    pass
+
+
+class MQTTClient:
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0,
+                 ssl=False, ssl_params=None):
+        self.client_id = client_id if isinstance(client_id, bytes) else str(client_id).encode()
+        self.server = server
+        self.port = port or 1883
+        self.user = user
+        self.pswd = password
+        self.keepalive = keepalive
+        self.cb = None
+        self.lw = None
+        self.session = None
+
+    def set_callback(self, f):
+        self.cb = f
+
+    def set_last_will(self, topic, msg, retain=False, qos=0):
+        self.lw = (topic, msg, retain)
+
+    def connect(self, clean_session=True):
+        w = _world.get()
+        if w.wifi is None or not w.wifi.sta_connected():
+            raise OSError(113, 'EHOSTUNREACH')
+        self.session = w.broker.connect(self, self.user, self.pswd)
+        return 0
+
+    def _live(self):
+        if self.session is None or not self.session.alive:
+            raise OSError(104, 'ECONNRESET')
+        return self.session
+
+    def disconnect(self):
+        if self.session is not None:
+            self.session.close(clean=True)
+            self.session = None
+
+    def ping(self):
+        self._live()
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self._live().publish(topic, msg, retain)
+
+    def subscribe(self, topic, qos=0):
+        self._live().subscribe(topic)
+
+    def check_msg(self):
+        msg = self._live().next_message()
+        if msg is not None and self.cb is not None:
+            self.cb(msg[0], msg[1])
+        return None
+
+    def wait_msg(self):
+        return self.check_msg()
@@ -0,0 +1,159 @@
+"""Virtual time for the simulation: a clock shared by the MicroPython `time`
+functions and an asyncio event loop that jumps to the next timer instead of
+waiting for it."""
+import asyncio
+import selectors
+import time as _time
+
+# originals, kept before patch_time() replaces them on the module
+_real_sleep = _time.sleep
+_real_gmtime = _time.gmtime
+
+TICKS_PERIOD = 1 << 30          # MicroPython ticks_ms/ticks_us wrap at 2**30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALF = TICKS_PERIOD // 2
+
+
+class VirtualClock:
+    """Seconds since (virtual) reset plus the wall-clock offsets of the world."""
+
+    def __init__(self, true_unix=1781244000.0, rtc_unix=0.0, drift_ppm=0.0):
+        self.mono = 0.0                 # seconds since the simulation started (loop time)
+        self.boot_at = 0.0              # mono at the last (simulated) power-on
+        self.true_offset = true_unix    # real Unix time at mono 0 (what NTP serves)
+        self.rtc_offset = rtc_unix      # device RTC at mono 0; unset RTC counts from the epoch
+        self.drift_ppm = drift_ppm      # local oscillator error vs. true time
+        self.speed = 0.0                # 0: as fast as possible, N: N x real time
+
+    def advance(self, dt):
+        if dt > 0:
+            if self.speed:
+                _real_sleep(dt / self.speed)
+            self.mono += dt
+
+    def true_time(self):
+        """Real Unix time, as an NTP server would report it."""
+        return self.true_offset + self.mono / (1.0 + self.drift_ppm * 1e-6)
+
+    def rtc_time(self):
+        return self.rtc_offset + self.mono
+
+    def set_rtc(self, unix):
+        self.rtc_offset = unix - self.mono
+
+    def power_cycle(self, keep_rtc=False):
+        """ticks restart from 0; the RTC loses its time on a power loss but not on machine.reset()."""
+        self.boot_at = self.mono
+        if not keep_rtc:
+            self.rtc_offset = -self.mono
+
+    # ---------------- MicroPython time API -----------------
+    def ticks_ms(self):
+        return int((self.mono - self.boot_at) * 1000) & TICKS_MAX
+
+    def ticks_us(self):
+        return int((self.mono - self.boot_at) * 1000000) & TICKS_MAX
+
+    def ticks_cpu(self):
+        return self.ticks_us()
+
+    @staticmethod
+    def ticks_diff(a, b):
+        return ((a - b + TICKS_HALF) & TICKS_MAX) - TICKS_HALF
+
+    @staticmethod
+    def ticks_add(t, delta):
+        return (t + delta) & TICKS_MAX
+
+    def time(self):
+        return int(self.rtc_time())
+
+    def time_ns(self):
+        return int(self.rtc_time() * 1e9)
+
+    def sleep(self, s):
+        self.advance(s)
+
+    def sleep_ms(self, ms):
+        self.advance(ms / 1000.0)
+
+    def sleep_us(self, us):
+        self.advance(us / 1000000.0)
+
+    def gmtime(self, secs=None):
+        return _real_gmtime(self.time() if secs is None else secs)
+
+    def localtime(self, secs=None):
+        # the device RTC runs in UTC; localtime == gmtime like on the board
+        return self.gmtime(secs)
+
+    def mktime(self, tm):
+        import calendar
+        return calendar.timegm(tuple(tm[:6]) + (0, 0, 0))
+
+
+class WallClock(VirtualClock):
+    """Real elapsed time behind the same API, for benchmarks that need true ticks_us."""
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self._t0 = _time.perf_counter()
+
+    @property
+    def mono(self):
+        return _time.perf_counter() - self._t0
+
+    @mono.setter
+    def mono(self, v):
+        pass    # advance() cannot move real time; scripted waits become no-ops
+
+
+def patch_time(clock):
+    """Point the process-wide `time` module at the virtual clock."""
+    for name in ('ticks_ms', 'ticks_us', 'ticks_cpu', 'ticks_diff', 'ticks_add', 'time', 'time_ns',
+                 'sleep', 'sleep_ms', 'sleep_us', 'gmtime', 'localtime', 'mktime'):
+        setattr(_time, name, getattr(clock, name))
+
+
+class _VirtualSelector(selectors.BaseSelector):
+    """Polls real file descriptors without blocking; a wait for timers advances the clock."""
+
+    def __init__(self, clock):
+        self._sel = selectors.DefaultSelector()
+        self.clock = clock
+
+    def register(self, fileobj, events, data=None):
+        return self._sel.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._sel.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._sel.modify(fileobj, events, data)
+
+    def select(self, timeout=None):
+        ready = self._sel.select(0)
+        if ready or timeout == 0:
+            return ready
+        if timeout is None:
+            # nothing scheduled and nothing readable: only real I/O can wake us
+            return self._sel.select(0.05)
+        self.clock.advance(timeout)
+        return self._sel.select(0)
+
+    def get_map(self):
+        return self._sel.get_map()
+
+    def close(self):
+        self._sel.close()
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop whose time() is the virtual clock."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        super().__init__(_VirtualSelector(clock))
+
+    def time(self):
+        return self.clock.mono
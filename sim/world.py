@@ -0,0 +1,75 @@
+"""Everything outside the firmware: clock, room environment, radio, broker and
+the hardware attached to each pin or bus. The stand-in modules (sim.machine,
+sim.network, ...) read and write this state; scenarios script it."""
+import math
+
+from sim.vclock import VirtualClock
+
+
+class Environment:
+    """Room model: slow temperature/humidity/CO2 drift and daylight + lamp light on the LDR."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.temperature = 22.5
+        self.humidity = 45.0
+        self.eco2 = 600
+        self.tvoc = 40
+        self.daylight = 1200        # ADC counts from ambient light
+        self.lamp_gain = 12.0       # ADC counts per unit of average strip channel value
+        self.lamp_level = 0.0       # updated from the strip's last frame
+        self.noise = 0.0
+        self.dht_fail = False
+
+    def _wobble(self, period_s, amp):
+        return amp * math.sin(2 * math.pi * self.clock.mono / period_s)
+
+    def read_temperature(self):
+        return round(self.temperature + self._wobble(1800, 0.3), 1)
+
+    def read_humidity(self):
+        return round(self.humidity + self._wobble(2400, 1.5), 1)
+
+    def read_eco2(self):
+        return max(400, int(self.eco2 + self._wobble(900, 40)))
+
+    def read_tvoc(self):
+        return max(0, int(self.tvoc + self._wobble(700, 10)))
+
+    def read_light(self):
+        v = self.daylight + self.lamp_gain * self.lamp_level
+        if self.noise:
+            v += self._wobble(7.3, self.noise)
+        return int(max(0, min(4095, v)))
+
+
+class World:
+    def __init__(self, true_unix=1781244000.0, clock=None):
+        self.clock = clock or VirtualClock(true_unix=true_unix)
+        self.env = Environment(self.clock)
+        self.pins = {}          # pin id -> sim.machine.PinState
+        self.adc = {}           # pin id -> callable returning 0..4095
+        self.i2c = {}           # bus id -> sim.devices.I2CBusModel
+        self.strips = {}        # pin id -> sim.neopixel.NeoPixel (last created)
+        self.lamp_pins = set()  # strips whose light reaches the LDR
+        self.wifi = None        # sim.network.Radio
+        self.broker = None      # sim.broker.Broker
+        self.cpu_freq = 160000000
+        self.resets = 0
+        self.on_reset = None    # set by the harness: reboots the firmware
+
+    def ms(self):
+        return int(self.clock.mono * 1000)
+
+
+world = None
+
+
+def get():
+    return world
+
+
+def create(**kw):
+    global world
+    world = World(**kw)
+    return world
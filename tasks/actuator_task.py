@@ -3,8 +3,15 @@ import uasyncio as asyncio
 import time
 from drivers.actuator.ws2811 import WS2811
 from config import SUN_LAMP_PIN, SUN_LAMP_COUNT
+from core import events
+from core import clock
+from core import log
+from core import bootlog
+from core.power import get_governor
+from core.settings import get_settings
 
 NUM_PIXELS = SUN_LAMP_COUNT
+STATIC_REFRESH_MS = 5000    # rewrite an unchanged static frame this often (stretched while idle)
 
 def clamp(v, a, b):
     return max(a, min(v, b))
@@ -55,86 +62,105 @@ def color_temp_to_rgb(k):
 
 import math
 
+END_STATE = {'wakeup': {'animation': None, 'animation_progress': 1.0},
+             'sunset': {'animation': None, 'animation_progress': 1.0, 'is_on': False}}
+
+def render_frame(lamp, now, count):
+    """由灯状态计算一帧像素（纯函数，便于基准测试）；返回 (pixels, 定时动画是否结束)。"""
+    if not lamp['is_on']:
+        return [(0, 0, 0)] * count, False
+    anim = lamp['animation']
+    if anim == 'wakeup':
+        start = lamp.get('animation_start_ms', now)
+        dur = max(1, lamp.get('animation_duration_s', 600))
+        progress = clamp((now - start) / (dur * 1000), 0.0, 1.0)
+        e = ease_in_out(progress)
+        col = wakeup_palette(e)
+        b = clamp(lamp.get('brightness', 100) * e, 0, 100) / 100.0
+        return [scale_color(col, b)] * count, progress >= 1.0
+    if anim == 'sunset':
+        start = lamp.get('animation_start_ms', now)
+        dur = max(1, lamp.get('animation_duration_s', 900))
+        progress = clamp((now - start) / (dur * 1000), 0.0, 1.0)
+        e = ease_in_out(progress)
+        col = sunset_palette(e)
+        start_b = clamp(lamp.get('brightness', 100), 0, 100)
+        b = clamp(start_b * (1.0 - e), 0, 100) / 100.0
+        return [scale_color(col, b)] * count, progress >= 1.0
+    if anim == 'breathe':
+        period_ms = max(1, int(lamp.get('animation_duration_s', 3) * 1000))
+        phase = (now % period_ms) / period_ms
+        wave = ease_in_out(0.5 + 0.5 * math.sin(2 * math.pi * phase))
+        base = breathe_palette(phase)
+        b = clamp(lamp.get('brightness', 60) * (0.3 + 0.7 * wave), 0, 100) / 100.0
+        return [scale_color(base, b)] * count, False
+    if anim == 'warning':
+        period_ms = 500
+        elapsed = now - lamp.get('animation_start_ms', now)
+        on = (elapsed // period_ms) % 2 == 0
+        return [(255, 0, 0) if on else (0, 0, 0)] * count, False
+    b = lamp['brightness'] / 100.0
+    if lamp.get('color_mode') == 'custom':
+        base = tuple(lamp.get('custom_rgb') or (255, 200, 120))
+    else:  # 'temp' or fallback
+        base = color_temp_to_rgb(lamp.get('color_temp_k', 4000))
+    return [scale_color(base, b)] * count, False
+
 async def actuator_controller_task(system_state, lock):
     """灯带控制：根据灯状态/动画计算 WS2812 像素输出。"""
-    strip = WS2811(SUN_LAMP_PIN, NUM_PIXELS, min_gap_ms=system_state['meta'].get('neopixel_min_write_gap_ms', 20))
+    settings = get_settings()
+    strip = WS2811(SUN_LAMP_PIN, NUM_PIXELS, min_gap_ms=settings.get('strip_min_gap_ms'))
+    gov = get_governor()
+    sub = events.subscribe()
+    first_frame = True
+    shown = None    # static lamp state currently on the strip
+    shown_at = 0
     while True:
         try:
             await lock.acquire()
             lamp = dict(system_state['lamp'])
-            meta = dict(system_state['meta'])
             try:
                 lock.release()
             except:
                 pass
 
-            pixels = [(0,0,0)] * NUM_PIXELS
-            if lamp['is_on']:
-                if lamp['animation'] == 'wakeup':
-                    now = time.time()
-                    start = lamp.get('animation_start_ts', now)
-                    dur = max(1, lamp.get('animation_duration_s', 600))
-                    progress = clamp((now - start) / dur, 0.0, 1.0)
-                    e = ease_in_out(progress)
-                    col = wakeup_palette(e)
-                    b = clamp(lamp.get('brightness', 100) * e, 0, 100) / 100.0
-                    col = scale_color(col, b)
-                    pixels = [col] * NUM_PIXELS
-                    if progress >= 1.0:
-                        await lock.acquire()
-                        system_state['lamp']['animation'] = None
-                        system_state['lamp']['animation_progress'] = 1.0
-                        try:
-                            lock.release()
-                        except:
-                            pass
-                elif lamp['animation'] == 'sunset':
-                    now = time.time()
-                    start = lamp.get('animation_start_ts', now)
-                    dur = max(1, lamp.get('animation_duration_s', 900))
-                    progress = clamp((now - start) / dur, 0.0, 1.0)
-                    e = ease_in_out(progress)
-                    col = sunset_palette(e)
-                    start_b = clamp(lamp.get('brightness', 100), 0, 100)
-                    b = clamp(start_b * (1.0 - e), 0, 100) / 100.0
-                    col = scale_color(col, b)
-                    pixels = [col] * NUM_PIXELS
-                    if progress >= 1.0:
-                        await lock.acquire()
-                        system_state['lamp']['animation'] = None
-                        system_state['lamp']['animation_progress'] = 1.0
-                        system_state['lamp']['is_on'] = False
-                        try:
-                            lock.release()
-                        except:
-                            pass
-                elif lamp['animation'] == 'breathe':
-                    period = lamp.get('animation_duration_s', 3)
-                    phase = (time.time() % period) / period
-                    wave = ease_in_out(0.5 + 0.5 * math.sin(2 * math.pi * phase))
-                    base = breathe_palette(phase)
-                    b = clamp(lamp.get('brightness', 60) * (0.3 + 0.7 * wave), 0, 100) / 100.0
-                    col = scale_color(base, b)
-                    pixels = [col] * NUM_PIXELS
-                elif lamp['animation'] == 'warning':
-                    period_ms = 500
-                    elapsed = int((time.time() - lamp.get('animation_start_ts', time.time())) * 1000)
-                    on = (elapsed // period_ms) % 2 == 0
-                    if on:
-                        pixels = [(255,0,0)] * NUM_PIXELS
-                    else:
-                        pixels = [(0,0,0)] * NUM_PIXELS
-                else:
-                    b = lamp['brightness'] / 100.0
-                    if lamp.get('color_mode') == 'custom':
-                        base = tuple(lamp.get('custom_rgb') or (255, 200, 120))
-                    else:  # 'temp' or fallback
-                        base = color_temp_to_rgb(lamp.get('color_temp_k', 4000))
-                    col = scale_color(base, b)
-                    pixels = [col] * NUM_PIXELS
-
-            strip.write_pixels(pixels)
+            static = lamp['animation'] is None
+            if static and lamp == shown:
+                # nothing to animate: sleep until the lamp changes instead of re-rendering
+                left = gov.stretch(STATIC_REFRESH_MS) - time.ticks_diff(time.ticks_ms(), shown_at)
+                if left > 0:
+                    await events.wait(sub, left)
+                    continue
+
+            # render an animation frame for the next boundary of the shared clock's frame
+            # grid and show it on that boundary: synced lamps then display identical frames
+            # together. Static output and the first frame after boot go out at once.
+            frame_ms = settings.get('frame_interval_ms')
+            strip.min_gap_ms = settings.get('strip_min_gap_ms')
+            now = clock.now_ms()
+            tick = now if first_frame or static else now - now % frame_ms + frame_ms
+            pixels, ended = render_frame(lamp, tick, NUM_PIXELS)
+            wait = tick - clock.now_ms()
+            await asyncio.sleep_ms(wait if wait > 0 else 0)
+            wrote = strip.write_pixels(pixels)
+            if wrote and first_frame:
+                first_frame = False
+                bootlog.mark('first_frame')
+            shown = lamp if static and wrote else None
+            shown_at = time.ticks_ms()
+            if static and not wrote:
+                await asyncio.sleep_ms(strip.min_gap_ms)
+
+            if ended:
+                # wakeup stays on at full brightness; sunset turns the lamp off
+                await lock.acquire()
+                system_state['lamp'].update(END_STATE[lamp['animation']])
+                try:
+                    lock.release()
+                except:
+                    pass
+                events.notify('lamp')
 
         except Exception as e:
-            print('actuator_task error', e)
-        await asyncio.sleep_ms(system_state['meta'].get('frame_interval_ms', 100))
+            log.msg(log.ACTUATOR_TASK, e)
+            await asyncio.sleep_ms(settings.get('frame_interval_ms'))
@@ -0,0 +1,300 @@
+# === FILE: tasks/api_task.py ===
+# Local LAN control API, served while the STA link is up (the AP captive
+# portal owns port 80 otherwise). Commands use the same JSON and the same
+# core.commands.run_command() as the MQTT path, so they work without the
+# cloud broker and skip its round trip:
+#   GET  /api/state   status document (as published on MQTT)
+#   POST /api/cmd     one JSON command; the reply (or {"ok": true}) is returned
+#   GET  /api/ws      WebSocket: JSON commands in, {"type": "reply"} and
+#                     {"type": "state"} pushes of changed sections out
+# API_PORT = None disables it. Clients are capped at API_MAX_CLIENTS. Every
+# WebSocket keeps at most API_OUTBOX replies, and state pushes always send
+# the latest snapshot, so a slow client drops data instead of growing a
+# queue. A send blocked longer than API_SEND_TIMEOUT_MS disconnects it.
+# Any web page the user opens can reach the LAN, so:
+#   - only API_COMMANDS run here (set/anim/schedule/rule); API_ADMIN_COMMANDS
+#     (config, ota, logs) also need API_TOKEN to be set, never without one
+#   - /api/cmd takes only Content-Type: application/json, which a cross-site
+#     page cannot send without a CORS preflight
+#   - a browser Origin must be the lamp itself or API_ALLOWED_ORIGIN, for
+#     REST and for the WebSocket handshake (WebSockets bypass CORS)
+#   - CORS headers name API_ALLOWED_ORIGIN only, never *
+import ujson
+import uasyncio as asyncio
+import time
+from drivers.communication import httpd
+from drivers.communication import websocket
+from core import events
+from core import log
+from core.commands import run_command
+from core.power import get_governor
+from core.lazy import lazy
+from config import API_PORT, API_TOKEN, API_MAX_CLIENTS, API_PUSH_MS
+from config import API_OUTBOX, API_SEND_TIMEOUT_MS
+from config import API_ALLOWED_ORIGIN, API_COMMANDS, API_ADMIN_COMMANDS
+
+# events section -> system_state keys pushed to WebSocket clients when it changes
+PUSH = (
+    ('lamp', ('lamp', 'daylight')),
+    ('sensor', ('sensor', 'filtered', 'trend')),
+    ('network', ('network',)),
+    ('schedule', ('schedule',)),
+    ('rules', ('rules',)),
+    ('clock', ('clock',)),
+)
+PUSH_SECTIONS = tuple(p[0] for p in PUSH)
+ORIGINS = (API_ALLOWED_ORIGIN,) if API_ALLOWED_ORIGIN else ()
+PREFLIGHT = {
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+    'Access-Control-Max-Age': '600',
+}
+
+mqtt_task = lazy('tasks.mqtt_task')
+i2c_bus = lazy('core.i2c_bus')
+
+
+def _authorized(req):
+    if not API_TOKEN:
+        return True
+    if req.headers.get('authorization', '') == 'Bearer ' + API_TOKEN:
+        return True
+    # browsers cannot set headers on a WebSocket: accept ?token= as well
+    return httpd.parse_form(req.query).get('token') == API_TOKEN
+
+
+def _origin_ok(req):
+    origin = req.headers.get('origin')
+    return not origin or origin in ORIGINS or websocket.same_origin(req)
+
+
+def _cors(req):
+    """跨域响应头：仅当 Origin 为 API_ALLOWED_ORIGIN 时返回。"""
+    origin = req.headers.get('origin')
+    if origin and origin in ORIGINS:
+        return {'Access-Control-Allow-Origin': origin, 'Vary': 'Origin'}
+    return None
+
+
+def _permitted(cmd):
+    return cmd in API_COMMANDS or bool(API_TOKEN) and cmd in API_ADMIN_COMMANDS
+
+
+def _is_json(req):
+    return req.headers.get('content-type', '').split(';')[0].strip().lower() == 'application/json'
+
+
+class WsClient:
+    """一个 WebSocket 连接：接收指令，并由单独的发送协程推送回复与状态。"""
+
+    def __init__(self, api, ws):
+        self.api = api
+        self.ws = ws
+        self.outbox = []
+        self.sub = events.subscribe()   # woken by state changes and by our own replies
+        self.pushed = None              # section versions of the last push
+
+    def queue(self, msg):
+        if len(self.outbox) >= API_OUTBOX:
+            self.outbox.pop(0)
+        self.outbox.append(msg)
+        self.sub.set()
+
+    async def _send(self, msg):
+        await asyncio.wait_for_ms(self.ws.send(ujson.dumps(msg)), API_SEND_TIMEOUT_MS)
+
+    async def sender(self):
+        last_push = time.ticks_ms()
+        try:
+            while not self.ws.closed:
+                while self.outbox:
+                    await self._send(self.outbox.pop(0))
+                vers = events.versions(PUSH_SECTIONS)
+                if vers != self.pushed:
+                    gap = API_PUSH_MS - time.ticks_diff(time.ticks_ms(), last_push)
+                    if gap > 0 and self.pushed is not None:
+                        # coalesce bursts (slider drags): the next push carries the latest
+                        # state; replies still go out meanwhile
+                        await events.wait(self.sub, gap)
+                        continue
+                    changed = []
+                    for i, (_section, keys) in enumerate(PUSH):
+                        if self.pushed is None or self.pushed[i] != vers[i]:
+                            changed.extend(keys)
+                    self.pushed = vers
+                    last_push = time.ticks_ms()
+                    await self._send(await self.api.snapshot(changed))
+                    continue
+                await events.wait(self.sub, 30000)
+        except Exception as e:
+            # send timeout or broken pipe: drop the client (ends the pending recv too)
+            log.msg(log.API_CLIENT, e)
+            await self.ws.close()
+            await httpd.close(self.ws.writer)
+
+    async def serve(self):
+        task = asyncio.create_task(self.sender())
+        try:
+            while True:
+                text = await self.ws.recv()
+                try:
+                    j = ujson.loads(text)
+                    if not isinstance(j, dict):
+                        raise ValueError('not an object')
+                except ValueError as e:
+                    self.queue({'type': 'reply', 'ok': False, 'error': 'bad json: {}'.format(e)})
+                    continue
+                reply = await self.api.command(j)
+                reply['type'] = 'reply'
+                self.queue(reply)
+        except websocket.WsClosed:
+            pass
+        finally:
+            events.unsubscribe(self.sub)
+            task.cancel()
+
+
+class LocalAPI:
+    """局域网 REST/WebSocket 服务：与 MQTT 共用指令处理，限制并发客户端数。"""
+
+    def __init__(self, system_state, lock):
+        self.system_state = system_state
+        self.lock = lock
+        self.server = None
+        self.clients = 0
+        self.writers = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, '0.0.0.0', API_PORT)
+        log.msg(log.API_STARTED, API_PORT)
+
+    async def stop(self):
+        self.server.close()
+        try:
+            await self.server.wait_closed()
+        except Exception:
+            pass
+        self.server = None
+        # a closed server keeps its accepted connections: end them too
+        for w in list(self.writers):
+            await httpd.close(w)
+        log.msg(log.API_STOPPED)
+
+    async def command(self, j):
+        """执行一条指令（与 on_mqtt_msg 相同路径）；总是返回回复 dict，不允许的指令返回 ok=false。"""
+        get_governor().kick('api')
+        if not _permitted(j.get('cmd')):
+            reply = {'cmd': j.get('cmd'), 'ok': False, 'error': 'not allowed on the local API'}
+            if 'req' in j:
+                reply['req'] = j['req']
+            return reply
+        reply = await run_command(self.system_state, self.lock, j)
+        if reply is None:
+            reply = {'cmd': j.get('cmd'), 'ok': True}
+            if 'req' in j:
+                reply['req'] = j['req']
+        return reply
+
+    async def snapshot(self, keys):
+        await self.lock.acquire()
+        try:
+            msg = {'type': 'state'}
+            for k in keys:
+                v = self.system_state.get(k)
+                msg[k] = dict(v) if isinstance(v, dict) else v
+            return msg
+        finally:
+            try:
+                self.lock.release()
+            except:
+                pass
+
+    async def _status(self):
+        await self.lock.acquire()
+        try:
+            return mqtt_task.build_status(self.system_state, i2c_bus.get_bus().report())
+        finally:
+            try:
+                self.lock.release()
+            except:
+                pass
+
+    async def _route(self, req, reader, writer):
+        cors = _cors(req)
+        if req.method == 'OPTIONS':
+            if cors:
+                cors.update(PREFLIGHT)
+                await httpd.send(writer, 204, headers=cors)
+            else:
+                await httpd.send(writer, 403)
+        elif not _origin_ok(req):
+            await httpd.send(writer, 403, 'origin not allowed')
+        elif not _authorized(req):
+            await httpd.send(writer, 401, 'token required', headers=cors)
+        elif req.path == '/api/ws':
+            ws = await websocket.accept(reader, writer, req, ORIGINS)
+            await WsClient(self, ws).serve()
+        elif req.path == '/api/state' and req.method == 'GET':
+            await httpd.send(writer, 200, ujson.dumps(await self._status()), 'application/json', cors)
+        elif req.path == '/api/cmd' and req.method == 'POST':
+            if not _is_json(req):
+                # text/plain and form bodies are "simple" requests a foreign page can send without preflight
+                await httpd.send(writer, 415, 'Content-Type must be application/json', headers=cors)
+                return
+            try:
+                j = ujson.loads(req.body)
+                if not isinstance(j, dict):
+                    raise ValueError('not an object')
+            except ValueError as e:
+                await httpd.send(writer, 400, 'bad json: {}'.format(e), headers=cors)
+                return
+            reply = await self.command(j)
+            status = 403 if not _permitted(j.get('cmd')) else 200
+            await httpd.send(writer, status, ujson.dumps(reply), 'application/json', cors)
+        elif req.path in ('/api/state', '/api/cmd'):
+            await httpd.send(writer, 405, headers=cors)
+        else:
+            await httpd.send(writer, 404, headers=cors)
+
+    async def _handle(self, reader, writer):
+        if self.clients >= API_MAX_CLIENTS:
+            try:
+                await httpd.send(writer, 503)
+            except Exception:
+                pass
+            await httpd.close(writer)
+            return
+        self.clients += 1
+        self.writers.append(writer)
+        try:
+            try:
+                req = await httpd.read_request(reader)
+                await self._route(req, reader, writer)
+            except httpd.HttpError as e:
+                await httpd.send(writer, e.status, httpd.REASONS.get(e.status, ''))
+        except Exception as e:
+            log.msg(log.API_CLIENT, e)
+        finally:
+            self.clients -= 1
+            self.writers.remove(writer)
+            await httpd.close(writer)
+
+
+async def local_api_task(system_state, lock):
+    """局域网控制 API：STA 连上时监听 API_PORT，断开（AP 配网）时关闭。"""
+    if not API_PORT:
+        # disabled: stay parked so monitor_tasks does not restart the task
+        await asyncio.Event().wait()
+    api = LocalAPI(system_state, lock)
+    sub = events.subscribe()
+    while True:
+        up = system_state['network']['wifi_status'] == 'connected'
+        try:
+            if up and api.server is None:
+                await api.start()
+            elif not up and api.server is not None:
+                await api.stop()
+        except Exception as e:
+            log.msg(log.API_SERVER, e)
+            await asyncio.sleep(5)
+        await events.wait(sub, 5000)
@@ -0,0 +1,91 @@
+# === FILE: tasks/daylight_task.py ===
+import uasyncio as asyncio
+import time
+from drivers.sensor.light_sensor import LightSensor
+from core.control import PIController
+from core.filters import Pipeline, hampel, ema
+from core import events
+from core import log
+from core.power import get_governor
+from config import LIGHT_SENSOR_PIN, LIGHT_SENSOR_INVERT, ADC_MAX
+from config import DAYLIGHT_LOOP_MS, DAYLIGHT_IDLE_MS, DAYLIGHT_MAX_STEP, DAYLIGHT_MIN_BRIGHTNESS
+from config import FILTER_WINDOW, FILTER_HAMPEL_K
+
+# faster smoothing than the 1 Hz telemetry filter so the loop reacts in a few hundred ms
+DAYLIGHT_EMA_ALPHA = 0.5
+
+async def daylight_task(system_state, lock):
+    """日光补偿：auto 亮度模式下按光敏读数闭环调节灯带亮度，逼近目标总照度。"""
+    light = LightSensor(LIGHT_SENSOR_PIN)
+    filt = Pipeline(hampel(FILTER_WINDOW, FILTER_HAMPEL_K), ema(DAYLIGHT_EMA_ALPHA))
+    pi = None
+    active = False
+    last = time.ticks_ms()
+
+    while True:
+        try:
+            raw = light.read()
+            if LIGHT_SENSOR_INVERT:
+                raw = ADC_MAX - raw
+            measured = filt.push(raw)
+
+            await lock.acquire()
+            try:
+                lamp = system_state['lamp']
+                cfg = system_state['daylight']
+                enabled = (lamp.get('brightness_mode') == 'auto' and lamp['is_on']
+                           and lamp['animation'] is None)
+                brightness = lamp['brightness']
+            finally:
+                try:
+                    lock.release()
+                except:
+                    pass
+
+            now = time.ticks_ms()
+            dt = time.ticks_diff(now, last) / 1000.0
+            last = now
+
+            if not enabled:
+                active = False
+                await get_governor().sleep_ms(DAYLIGHT_IDLE_MS)
+                continue
+
+            if pi is None:
+                pi = PIController(cfg['kp'], cfg['ki'], DAYLIGHT_MIN_BRIGHTNESS, 100, cfg['deadband'])
+            pi.kp = cfg['kp']
+            pi.ki = cfg['ki']
+            pi.deadband = cfg['deadband']
+            if not active:
+                # bumpless entry: continue from the brightness the user left
+                pi.reset(brightness)
+                active = True
+                dt = DAYLIGHT_LOOP_MS / 1000.0
+
+            out = pi.update(cfg['target'], measured, dt)
+            # slew limit: a bounded step per tick keeps the strip from pumping
+            step = out - brightness
+            if step > DAYLIGHT_MAX_STEP:
+                step = DAYLIGHT_MAX_STEP
+            elif step < -DAYLIGHT_MAX_STEP:
+                step = -DAYLIGHT_MAX_STEP
+            new_b = int(brightness + step + 0.5)
+
+            await lock.acquire()
+            try:
+                system_state['daylight']['measured'] = int(measured)
+                system_state['daylight']['output'] = round(out, 1)
+                changed = new_b != brightness and system_state['lamp'].get('brightness_mode') == 'auto'
+                if changed:
+                    # actuator picks this up on its next frame like any other brightness change
+                    system_state['lamp']['brightness'] = max(0, min(100, new_b))
+            finally:
+                try:
+                    lock.release()
+                except:
+                    pass
+            if changed:
+                events.notify('lamp')
+        except Exception as e:
+            log.msg(log.DAYLIGHT_TASK, e)
+        await asyncio.sleep_ms(DAYLIGHT_LOOP_MS)
@@ -1,28 +1,172 @@
 # === FILE: tasks/display_task.py ===
 import uasyncio as asyncio
+import time
 from drivers.display.ssd1306 import SSD1306Display
+from core.i2c_bus import get_bus
+from core import events
+from core import clock
+from core import log
+from core.power import get_governor
+from core.settings import get_settings
+
+SCREENS = ('readings', 'network', 'lamp')
+# state sections each screen depends on; 'ui' covers screen switches
+SECTIONS = {
+    'readings': ('ui', 'sensor'),
+    'network': ('ui', 'network'),
+    'lamp': ('ui', 'lamp'),
+}
+# (label, sensor field, value format) rows of the readings screen
+READING_ROWS = (
+    ('T', 'temperature', '{:.1f}'),
+    ('H', 'humidity', '{:.1f}'),
+    ('CO2', 'eco2', '{:.0f}'),
+    ('LX', 'light', '{:.0f}'),
+)
+SPARK_X = 66
+SPARK_W = 62
+SPARK_H = 14
+
+
+def sparkline(oled, hist, x, y, w, h):
+    """在 (x,y,w,h) 区域绘制 History 走势图（最新点在最右）。"""
+    n = len(hist)
+    if n < 2:
+        return
+    lo, hi = hist.bounds()
+    span = hi - lo
+    if span <= 0:
+        span = 1
+    n_draw = n if n < w else w
+    first = n - n_draw
+    x0 = x + w - n_draw
+    prev = None
+    for i in range(n_draw):
+        v = hist.get(first + i)
+        py = y + h - 1 - int((v - lo) * (h - 1) / span)
+        if prev is None or prev == py:
+            oled.pixel(x0 + i, py)
+        elif prev < py:
+            oled.vline(x0 + i, prev + 1, py - prev)
+        else:
+            oled.vline(x0 + i, py, prev - py)
+        prev = py
+
+
+def bar(oled, x, y, w, h, frac):
+    oled.rect(x, y, w, h)
+    fw = int((w - 2) * max(0.0, min(1.0, frac)))
+    if fw > 0:
+        oled.fill_rect(x + 1, y + 1, fw, h - 2)
+
+
+class Screens:
+    """预渲染静态标签并按屏幕绘制；每次重绘只改帧缓冲，由脏页刷新决定传输量。"""
+
+    def __init__(self, oled):
+        self.oled = oled
+        self.labels = {}
+        for text in ('T', 'H', 'CO2', 'LX', 'NETWORK', 'LAMP', 'WiFi', 'MQTT', 'IP', 'Pub', 'ANIM'):
+            self.labels[text] = oled.label(text)
+
+    def _title(self, name):
+        self.oled.blit(self.labels[name], 0, 0)
+        self.oled.hline(0, 10, 128)
+
+    def readings(self, s):
+        oled = self.oled
+        hist = s.get('history') or {}
+        sensor = s['sensor']
+        y = 0
+        for lab, field, fmt in READING_ROWS:
+            oled.blit(self.labels[lab], 0, y + 4)
+            oled.text(fmt.format(sensor[field]), 26, y + 4)
+            h = hist.get(field)
+            if h is not None:
+                sparkline(oled, h, SPARK_X, y + 1, SPARK_W, SPARK_H)
+            y += 16
+
+    def network(self, s):
+        oled = self.oled
+        net = s['network']
+        self._title('NETWORK')
+        oled.blit(self.labels['WiFi'], 0, 16)
+        oled.text(net['wifi_status'], 40, 16)
+        oled.blit(self.labels['MQTT'], 0, 28)
+        oled.text(net['mqtt_status'], 40, 28)
+        oled.blit(self.labels['IP'], 0, 40)
+        oled.text(net.get('ip') or '-', 24, 40)
+        oled.blit(self.labels['Pub'], 0, 52)
+        last = net.get('last_mqtt_pub_ts', 0)
+        if last:
+            oled.text('{}s ago'.format(max(0, int(time.time() - last))), 32, 52)
+        else:
+            oled.text('never', 32, 52)
+
+    def lamp(self, s):
+        oled = self.oled
+        lamp = s['lamp']
+        self._title('LAMP')
+        oled.text('ON' if lamp['is_on'] else 'OFF', 48, 0)
+        oled.text('A' if lamp.get('brightness_mode') == 'auto' else 'M', 120, 0)
+        oled.text('{:3d}%'.format(lamp['brightness']), 0, 16)
+        bar(oled, 40, 16, 88, 8, lamp['brightness'] / 100.0)
+        if lamp.get('color_mode') == 'custom':
+            r, g, b = lamp.get('custom_rgb') or (0, 0, 0)
+            oled.text('RGB {},{},{}'.format(r, g, b), 0, 30)
+        else:
+            oled.text('{}K'.format(lamp.get('color_temp_k', 0)), 0, 30)
+        anim = lamp.get('animation')
+        oled.blit(self.labels['ANIM'], 0, 44)
+        oled.text(anim or '-', 40, 44)
+        if anim in ('wakeup', 'sunset'):
+            dur = max(1, lamp.get('animation_duration_s', 1))
+            bar(oled, 0, 55, 128, 8, (clock.now_ms() - lamp.get('animation_start_ms', 0)) / (dur * 1000))
+
+    def draw(self, name, s):
+        self.oled.clear()
+        getattr(self, name)(s)
 
-DISPLAY_INTERVAL_MS = 500
 
 async def display_task(system_state, lock):
-    """OLED 刷新任务：定期渲染传感器与网络/灯状态。"""
-    oled = SSD1306Display()
+    """OLED 刷新任务：按需重绘当前屏幕（分区有变化或达到上限间隔时）。"""
+    oled = SSD1306Display(bus=get_bus())
+    screens = Screens(oled)
+    sub = events.subscribe()    # also woken by 'settings': a new ceiling applies at once
+    settings = get_settings()
+    drawn = None      # (screen, section versions) of the last redraw
+    last_draw = time.ticks_ms()
     while True:
         try:
             await lock.acquire()
-            s = system_state.copy()
             try:
-                lock.release()
-            except:
-                pass
-
-            oled.clear()
-            oled.text('T:{:.1f}C H:{:.1f}%'.format(s['sensor']['temperature'], s['sensor']['humidity']), 0, 0)
-            oled.text('eCO2:{} TVOC:{}'.format(s['sensor']['eco2'], s['sensor']['tvoc']), 0, 12)
-            oled.text('LUX:{}'.format(s['sensor']['light']), 0, 24)
-            oled.text('W:{} M:{}'.format(s['network']['wifi_status'][0], s['network']['mqtt_status'][0]), 0, 36)
-            oled.text('ON:{},B:{}'.format(s['lamp']['is_on'], s['lamp']['brightness']), 0, 48)
-            oled.show()
+                name = SCREENS[system_state['ui']['screen'] % len(SCREENS)]
+                s = {
+                    'sensor': dict(system_state['sensor']),
+                    'network': dict(system_state['network']),
+                    'lamp': dict(system_state['lamp']),
+                    'history': system_state.get('history'),
+                }
+            finally:
+                try:
+                    lock.release()
+                except:
+                    pass
+
+            animating = name == 'lamp' and s['lamp'].get('animation') is not None
+            if animating:
+                ceiling = settings.get('display_anim_refresh_ms')
+            else:
+                ceiling = get_governor().stretch(settings.get('display_ceiling_ms'))
+            key = (name, events.versions(SECTIONS[name]))
+            if key != drawn or time.ticks_diff(time.ticks_ms(), last_draw) >= ceiling:
+                screens.draw(name, s)
+                await oled.show_async()
+                drawn = key
+                last_draw = time.ticks_ms()
         except Exception as e:
-            print('display_task error', e)
-        await asyncio.sleep_ms(DISPLAY_INTERVAL_MS)
+            log.msg(log.DISPLAY_TASK, e)
+            ceiling = settings.get('display_ceiling_ms')
+        # sleep until something we might show changes, or the ceiling timer
+        remaining = ceiling - time.ticks_diff(time.ticks_ms(), last_draw)
+        await events.wait(sub, max(10, remaining))
@@ -2,13 +2,87 @@
 import uasyncio as asyncio
 import time
 from drivers.input.keys import FiveWaySwitch
+from core.interrupts import KeyIRQ, GestureRecognizer, CLICK, DOUBLE, LONG, REPEAT
 from config import KEY_MID_PIN, KEY_UP_PIN, KEY_DOWN_PIN, KEY_LEFT_PIN, KEY_RIGHT_PIN, KEY_SET_PIN
+from config import ADC_MAX, DAYLIGHT_TARGET_STEP
+from core import events
+from core import log
+from core.power import get_governor
+from core.settings import get_settings
 
-DEBOUNCE_MS = 20
 LONGPRESS_MS = 1500
+DOUBLE_CLICK_MS = 250
+REPEAT_DELAY_MS = 400       # hold this long before up/down start repeating
+REPEAT_START_MS = 200       # first repeat interval, shrinks 20% per step
+REPEAT_MIN_MS = 40
+CLICK_STEP = 5              # brightness % per click
+REPEAT_STEP = 2             # brightness % per repeat while holding
+
+PRESETS = [5000, 4000, 3000]  # color temperature presets (K)
+
+
+def _step_brightness(system_state, delta):
+    if system_state['lamp'].get('brightness_mode') == 'auto':
+        # in auto mode the keys nudge the illuminance target instead
+        dl = system_state['daylight']
+        step = DAYLIGHT_TARGET_STEP if delta > 0 else -DAYLIGHT_TARGET_STEP
+        dl['target'] = max(0, min(ADC_MAX, dl['target'] + step * abs(delta) // CLICK_STEP))
+    else:
+        system_state['lamp']['brightness'] = max(0, min(100, system_state['lamp']['brightness'] + delta))
+
+
+def _cycle_preset(system_state, direction):
+    cur = system_state['lamp'].get('color_temp_k', 4000)
+    try:
+        idx = PRESETS.index(cur)
+    except Exception:
+        idx = 0
+    system_state['lamp']['color_temp_k'] = PRESETS[(idx + direction) % len(PRESETS)]
+    system_state['lamp']['color_mode'] = 'temp'
+
+
+def apply_gesture(system_state, key, gesture, count):
+    """将一个手势映射为状态修改（调用方持锁），返回受影响的分区名或 None。"""
+    lamp = system_state['lamp']
+    if key == 'mid':
+        if gesture == CLICK:
+            lamp['is_on'] = not lamp['is_on']
+            return 'lamp'
+        if gesture == DOUBLE:
+            # double-click toggles daylight-harvesting auto brightness
+            lamp['brightness_mode'] = 'manual' if lamp.get('brightness_mode') == 'auto' else 'auto'
+            return 'lamp'
+    elif key in ('up', 'down'):
+        sign = 1 if key == 'up' else -1
+        if gesture == CLICK:
+            _step_brightness(system_state, sign * CLICK_STEP)
+            return 'lamp'
+        if gesture == REPEAT:
+            # the recognizer shortens the interval while held, so the ramp accelerates
+            _step_brightness(system_state, sign * REPEAT_STEP)
+            return 'lamp'
+    elif key in ('left', 'right'):
+        direction = -1 if key == 'left' else 1
+        if gesture == CLICK:
+            _cycle_preset(system_state, direction)
+            return 'lamp'
+        if gesture == LONG:
+            # long-press left/right flips OLED screens
+            system_state['ui']['screen'] += direction
+            return 'ui'
+    elif key == 'set' and gesture == CLICK:
+        # 专用夜灯键：琥珀色，低亮度
+        lamp['is_on'] = True
+        lamp['animation'] = None
+        lamp['color_mode'] = 'temp'
+        lamp['color_temp_k'] = 3200
+        lamp['brightness'] = max(15, min(lamp['brightness'], 30))
+        return 'lamp'
+    return None
+
 
 async def input_handler_task(system_state, lock):
-    """五向+SET按键处理：开关灯、亮度、色温、夜灯快捷键。"""
+    """五向+SET按键处理（中断驱动）：空闲时完全休眠，按边沿时间戳去抖并识别手势。"""
     keys = FiveWaySwitch(
         KEY_MID_PIN,
         KEY_UP_PIN,
@@ -17,79 +91,52 @@ async def input_handler_task(system_state, lock):
         KEY_RIGHT_PIN,
         set_pin=KEY_SET_PIN
     )
-
-    presets = [5000, 4000, 3000]  # color temperature presets (K)
+    irq = KeyIRQ(keys.pins)
+    settings = get_settings()
+    gestures = GestureRecognizer(
+        irq.names,
+        debounce_ms=settings.get('debounce_ms'),
+        longpress_ms=LONGPRESS_MS,
+        double_ms=DOUBLE_CLICK_MS,
+        double_keys=('mid',),
+        repeat_keys=('up', 'down'),
+        repeat_delay_ms=REPEAT_DELAY_MS,
+        repeat_start_ms=REPEAT_START_MS,
+        repeat_min_ms=REPEAT_MIN_MS,
+    )
+    out = []
 
     while True:
         try:
-            k = keys.read()  # returns None or 'mid','up','down','left','right'
-            if k:
-                # debounce
-                await asyncio.sleep_ms(DEBOUNCE_MS)
-                if not keys.is_pressed(k):
-                    await asyncio.sleep_ms(10)
-                    continue
-
-                # record press start
-                start = keys.press_time(k)
-
-                # wait for release
-                while keys.is_pressed(k):
-                    await asyncio.sleep_ms(50)
-
-                duration = keys.release_time(k) - start
-
-                # update global state
-                await lock.acquire()
+            await irq.wait(gestures.next_deadline(time.ticks_ms()))
+            if irq.pending():
+                get_governor().kick('key')   # full clock before the gesture is handled
+                # debounce only matters for new edges: pick up a live change here
+                gestures.debounce_ms = settings.get('debounce_ms')
+            while irq.pending():
+                t, idx, level = irq.pop()
+                gestures.feed(t, idx, level, out)
+            gestures.poll(time.ticks_ms(), out, irq.value)
+            if not out:
+                continue
+
+            touched = set()
+            await lock.acquire()
+            try:
+                for key, gesture, count in out:
+                    section = apply_gesture(system_state, key, gesture, count)
+                    if section:
+                        touched.add(section)
+            finally:
                 try:
-                    if k == 'mid':
-                        # single press toggle lamp (long按不再切夜灯)
-                        system_state['lamp']['is_on'] = not system_state['lamp']['is_on']
-
-                    elif k == 'up':
-                        system_state['lamp']['brightness'] = min(
-                            100, system_state['lamp']['brightness'] + 5
-                        )
-
-                    elif k == 'down':
-                        system_state['lamp']['brightness'] = max(
-                            0, system_state['lamp']['brightness'] - 5
-                        )
-
-                    elif k == 'left':
-                        cur = system_state['lamp'].get('color_temp_k', 4000)
-                        try:
-                            idx = presets.index(cur)
-                        except Exception:
-                            idx = 0
-                        system_state['lamp']['color_temp_k'] = presets[(idx - 1) % len(presets)]
-                        system_state['lamp']['color_mode'] = 'temp'
-
-                    elif k == 'right':
-                        cur = system_state['lamp'].get('color_temp_k', 4000)
-                        try:
-                            idx = presets.index(cur)
-                        except Exception:
-                            idx = 0
-                        system_state['lamp']['color_temp_k'] = presets[(idx + 1) % len(presets)]
-                        system_state['lamp']['color_mode'] = 'temp'
-
-                    elif k == 'set':
-                        # 专用夜灯键：琥珀色，低亮度
-                        system_state['lamp']['is_on'] = True
-                        system_state['lamp']['animation'] = None
-                        system_state['lamp']['color_mode'] = 'temp'
-                        system_state['lamp']['color_temp_k'] = 3200
-                        system_state['lamp']['brightness'] = max(15, min(system_state['lamp']['brightness'], 30))
-
-                finally:
-                    try:
-                        lock.release()
-                    except:
-                        pass
-
-            await asyncio.sleep_ms(50)
+                    lock.release()
+                except:
+                    pass
+            out.clear()
+            for section in touched:
+                events.notify(section)
 
         except Exception as e:
-            print("input_task error:", e)
+            log.msg(log.INPUT_TASK, e)
+            out.clear()
             await asyncio.sleep_ms(200)
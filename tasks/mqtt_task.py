@@ -2,52 +2,96 @@
 import ujson
 import uasyncio as asyncio
 import time
-from umqtt.simple import MQTTClient
-from config import MQTT_SERVER, MQTT_PORT, MQTT_USER, MQTT_PASSWORD, MQTT_TOPIC_PUB, MQTT_TOPIC_SUB
+from core import events
+from core import clock
+from core import log
+from core.lazy import lazy
+from core.commands import run_command
+from core.power import get_governor
+from core.settings import get_settings
+from core.shadow import get_shadow
+from config import MQTT_SERVER, MQTT_PORT, MQTT_USER, MQTT_PASSWORD, MQTT_TOPIC_PUB, MQTT_TOPIC_SUB, MQTT_TOPIC_REPLY
+from config import MQTT_GROUP, MQTT_TOPIC_GROUP
+from config import MQTT_TOPIC_DESIRED, MQTT_TOPIC_REPORTED, MQTT_TOPIC_REPORTED_DELTA
 
-PUBLISH_INTERVAL_S = 5
+OUTBOX_MAX = 4          # replies waiting for the publish loop; oldest dropped
+
+_outbox = []
+
+# not needed until Wi-Fi is up / the first status publish
+umqtt = lazy('umqtt.simple')
+i2c_bus = lazy('core.i2c_bus')
+
+def _set_status(system_state, status):
+    if system_state['network']['mqtt_status'] != status:
+        system_state['network']['mqtt_status'] = status
+        events.notify('network')
+
+def build_status(system_state, i2c_report=None):
+    """组装 status 上报内容（调用方持有状态锁）。"""
+    return {
+        'device_id': 'esp32_sunlamp',
+        'ts': clock.now_ms(),  # Unix ms; trust only when synced
+        'synced': clock.synced,
+        'sensor': dict(system_state['sensor']),
+        'filtered': dict(system_state['filtered']),
+        'trend': dict(system_state['trend']),
+        'network': {
+            'wifi': system_state['network']['wifi_status'],
+            'mqtt': system_state['network']['mqtt_status'],
+            'wifi_stats': system_state['network'].get('wifi_stats'),
+        },
+        'lamp': dict(system_state.get('lamp', {})),
+        'daylight': dict(system_state['daylight']),
+        'schedule': system_state.get('schedule'),
+        'rules': system_state.get('rules'),
+        'clock': system_state.get('clock'),
+        'power': system_state.get('power'),
+        'i2c': i2c_report,
+        'log': log.summary(),
+        'boot_ms': system_state['meta'].get('boot_ms'),
+    }
 
 async def mqtt_client_task(system_state, lock):
     """MQTT 客户端主循环：建立连接、发布状态、消费指令。"""
     client = None
     last_pub = 0
+    settings = get_settings()
+    shadow = get_shadow()
     while True:
         try:
             if system_state['network']['wifi_status'] != 'connected':
-                system_state['network']['mqtt_status'] = 'offline'
+                _set_status(system_state, 'offline')
                 await asyncio.sleep(1)
                 continue
             if client is None:
-                system_state['network']['mqtt_status'] = 'connecting'
+                _set_status(system_state, 'connecting')
                 try:
-                    client = MQTTClient('esp32_sunlamp', MQTT_SERVER, port=MQTT_PORT, user=MQTT_USER, password=MQTT_PASSWORD)
+                    client = umqtt.MQTTClient('esp32_sunlamp', MQTT_SERVER, port=MQTT_PORT, user=MQTT_USER, password=MQTT_PASSWORD)
                     client.set_callback(lambda t, m: asyncio.create_task(on_mqtt_msg(t, m, system_state, lock)))
                     client.connect()
                     client.subscribe(MQTT_TOPIC_SUB)
-                    system_state['network']['mqtt_status'] = 'connected'
+                    if MQTT_GROUP:
+                        client.subscribe(MQTT_TOPIC_GROUP.format(MQTT_GROUP))
+                    # the retained desired document arrives right away: reconciled on the next check_msg
+                    client.subscribe(MQTT_TOPIC_DESIRED)
+                    shadow.connected()
+                    _set_status(system_state, 'connected')
                 except Exception as e:
-                    print('MQTT connect failed', e)
-                    system_state['network']['mqtt_status'] = 'offline'
+                    log.msg(log.MQTT_CONNECT, e)
+                    _set_status(system_state, 'offline')
                     client = None
                     await asyncio.sleep(5)
                     continue
 
             now = time.time()
-            if now - last_pub >= PUBLISH_INTERVAL_S:
+            if now - last_pub >= settings.get('publish_interval_s'):
                 try:
                     await lock.acquire()
-                    payload = {
-                        'device_id': 'esp32_sunlamp',
-                        'ts': int(now),
-                        'sensor': dict(system_state['sensor']),
-                        'network': {
-                            'wifi': system_state['network']['wifi_status'],
-                            'mqtt': system_state['network']['mqtt_status']
-                        },
-                        'lamp': dict(system_state.get('lamp', {})),
-                    }
+                    payload = build_status(system_state, i2c_bus.get_bus().report())
                     client.publish(MQTT_TOPIC_PUB, ujson.dumps(payload))
                     system_state['network']['last_mqtt_pub_ts'] = int(now)
+                    events.notify('network')
                     last_pub = now
                 finally:
                     try:
@@ -55,11 +99,30 @@ async def mqtt_client_task(system_state, lock):
                     except:
                         pass
 
+            while _outbox:
+                client.publish(MQTT_TOPIC_REPLY, ujson.dumps(_outbox.pop(0)))
+
+            if shadow.due():
+                await lock.acquire()
+                try:
+                    out = shadow.poll(system_state['lamp'])
+                finally:
+                    try:
+                        lock.release()
+                    except:
+                        pass
+                if out is not None:
+                    kind, doc = out
+                    if kind == 'full':
+                        client.publish(MQTT_TOPIC_REPORTED, ujson.dumps(doc), True)
+                    else:
+                        client.publish(MQTT_TOPIC_REPORTED_DELTA, ujson.dumps(doc))
+
             try:
                 client.check_msg()
             except Exception as e:
-                print('MQTT check_msg error', e)
-                system_state['network']['mqtt_status'] = 'offline'
+                log.msg(log.MQTT_CHECK, e)
+                _set_status(system_state, 'offline')
                 try:
                     client.disconnect()
                 except:
@@ -68,85 +131,46 @@ async def mqtt_client_task(system_state, lock):
                 await asyncio.sleep(1)
                 continue
 
-            await asyncio.sleep_ms(100)
+            # stretched while idle; an incoming command kicks the governor back to 100 ms
+            await get_governor().sleep_ms(100)
         except Exception as e:
-            print('mqtt_client_task top error', e)
+            log.msg(log.MQTT_TASK, e)
             await asyncio.sleep(2)
 
 async def on_mqtt_msg(topic, msg, system_state, lock):
-    """处理 MQTT 下行：set（开关/亮度/色彩）与 anim（动画）。"""
+    """处理 MQTT 下行消息：desired 文档交给影子对账，指令（设备主题与组主题相同处理，见 core/commands.py）有回复时放入发件箱。"""
+    get_governor().kick('mqtt')
+    desired = (topic.decode() if isinstance(topic, bytes) else topic) == MQTT_TOPIC_DESIRED
+    if desired and not msg:
+        return      # retained desired document cleared
     try:
         s = msg.decode() if isinstance(msg, bytes) else str(msg)
         j = ujson.loads(s)
     except Exception as e:
-        print('Invalid mqtt payload', e)
+        log.msg(log.MQTT_PAYLOAD, e)
+        return
+    if desired:
+        await apply_desired(system_state, lock, j)
         return
+    reply = await run_command(system_state, lock, j)
+    if reply is not None:
+        if len(_outbox) >= OUTBOX_MAX:
+            _outbox.pop(0)
+        _outbox.append(reply)
+
+async def apply_desired(system_state, lock, doc):
+    """对账 desired 文档：在状态锁内只应用与当前状态不同的键（见 core/shadow.py）。"""
+    changes = None
     try:
         await lock.acquire()
-        if j.get('cmd') == 'set':
-            if 'is_on' in j:
-                system_state['lamp']['is_on'] = bool(j['is_on'])
-            if 'brightness' in j:
-                bv = int(j['brightness'])
-                system_state['lamp']['brightness'] = max(0, min(100, bv))
-            if 'color_mode' in j:
-                cm = j['color_mode']
-                if cm in ('temp', 'custom'):
-                    system_state['lamp']['color_mode'] = cm
-            if 'color_temp_k' in j:
-                try:
-                    system_state['lamp']['color_temp_k'] = int(j['color_temp_k'])
-                    system_state['lamp']['color_mode'] = 'temp'
-                except Exception:
-                    pass
-            # custom RGB from list or hex
-            if 'rgb' in j and isinstance(j['rgb'], (list, tuple)) and len(j['rgb']) == 3:
-                try:
-                    r, g, b = [max(0, min(255, int(x))) for x in j['rgb']]
-                    system_state['lamp']['custom_rgb'] = (r, g, b)
-                    system_state['lamp']['color_mode'] = 'custom'
-                except Exception:
-                    pass
-            elif 'color_hex' in j and isinstance(j['color_hex'], str) and len(j['color_hex']) in (6,7):
-                hx = j['color_hex'][1:] if j['color_hex'].startswith('#') else j['color_hex']
-                try:
-                    r = int(hx[0:2], 16); g = int(hx[2:4], 16); b = int(hx[4:6], 16)
-                    system_state['lamp']['custom_rgb'] = (r, g, b)
-                    system_state['lamp']['color_mode'] = 'custom'
-                except Exception:
-                    pass
-            system_state['lamp']['animation'] = None
-        elif j.get('cmd') == 'anim':
-            typ = j.get('type')
-            if typ == 'wakeup':
-                duration = int(j.get('duration_s', 600))
-                system_state['lamp']['animation'] = 'wakeup'
-                system_state['lamp']['animation_start_ts'] = time.time()
-                system_state['lamp']['animation_duration_s'] = duration
-                system_state['lamp']['animation_progress'] = 0.0
-                system_state['lamp']['is_on'] = True
-            elif typ == 'warning':
-                system_state['lamp']['animation'] = 'warning'
-                system_state['lamp']['animation_start_ts'] = time.time()
-                system_state['lamp']['animation_duration_s'] = 0
-                system_state['lamp']['is_on'] = True
-            elif typ == 'sunset':
-                duration = int(j.get('duration_s', 900))
-                system_state['lamp']['animation'] = 'sunset'
-                system_state['lamp']['animation_start_ts'] = time.time()
-                system_state['lamp']['animation_duration_s'] = duration
-                system_state['lamp']['animation_progress'] = 0.0
-                system_state['lamp']['is_on'] = True
-            elif typ == 'breathe':
-                duration = int(j.get('duration_s', 3))
-                system_state['lamp']['animation'] = 'breathe'
-                system_state['lamp']['animation_start_ts'] = time.time()
-                system_state['lamp']['animation_duration_s'] = duration  # used as period
-                system_state['lamp']['animation_progress'] = 0.0
-                system_state['lamp']['is_on'] = True
+        changes = get_shadow().on_desired(system_state, doc)
+    except Exception as e:
+        log.msg(log.SHADOW_ERROR, e)
     finally:
         try:
             lock.release()
         except:
             pass
-    
+    if changes is not None:
+        log.msg(log.SHADOW_APPLIED, '{} {}'.format(doc.get('version'), ','.join(sorted(changes)) or '-'))
+        events.notify('lamp')
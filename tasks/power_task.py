@@ -0,0 +1,40 @@
+# === FILE: tasks/power_task.py ===
+import uasyncio as asyncio
+from core import events
+from core import log
+from core.power import get_governor
+from config import POWER_TICK_MS
+
+# sections whose changes count as activity (sensor/network change on their own cadence)
+WATCHED = ('lamp', 'ui', 'schedule')
+
+
+async def power_governor_task(system_state, lock):
+    """功耗管理：根据动画、状态变化与网络情况切换性能/节能/空闲，并写入 system_state['power']。"""
+    gov = get_governor()
+    sub = events.subscribe()
+    seen = events.versions(WATCHED)
+    while True:
+        try:
+            await events.wait(sub, POWER_TICK_MS)
+            v = events.versions(WATCHED)
+            if v != seen:
+                seen = v
+                gov.activity()
+            await lock.acquire()
+            try:
+                lamp = system_state['lamp']
+                animating = lamp.get('animation') is not None
+                # the daylight loop regulates every 200 ms; a reconnect is work in progress
+                busy = ((lamp.get('brightness_mode') == 'auto' and lamp['is_on'])
+                        or system_state['network']['mqtt_status'] != 'connected')
+                gov.update(animating, busy)
+                system_state['power'] = gov.report()
+            finally:
+                try:
+                    lock.release()
+                except:
+                    pass
+        except Exception as e:
+            log.msg(log.POWER_TASK, e)
+            await asyncio.sleep_ms(POWER_TICK_MS)
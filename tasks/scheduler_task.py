@@ -0,0 +1,50 @@
+# === FILE: tasks/scheduler_task.py ===
+import uasyncio as asyncio
+import time
+from core import events
+from core import clock
+from core import log
+from core.commands import start_animation
+from core.scheduler import get_scheduler, clock_valid
+from config import SCHEDULE_MAX_SLEEP_S
+
+CLOCK_RETRY_MS = 10000      # how often to re-check an unset RTC
+
+
+async def scheduler_task(system_state, lock):
+    """本地定时：睡眠到堆顶（最早）触发时间，到期后在本地启动 wakeup/sunset 动画。"""
+    sched = get_scheduler()
+    # an NTP step moves every wall-clock fire time
+    clock.add_step_listener(sched.invalidate)
+    while True:
+        try:
+            now = time.time()
+            if not clock_valid(now):
+                # without a real time of day there is nothing sensible to fire
+                sched.dirty = True
+                await events.wait(sched.wake, CLOCK_RETRY_MS)
+                continue
+            if sched.dirty:
+                sched.rebuild(now)
+            due = sched.pop_due(now)
+            if due:
+                await lock.acquire()
+                try:
+                    for e in due:
+                        log.msg(log.SCHEDULE_FIRED, '{} {}'.format(e['id'], e['anim']))
+                        start_animation(system_state['lamp'], e['anim'], e['duration_s'])
+                finally:
+                    try:
+                        lock.release()
+                    except:
+                        pass
+                events.notify('lamp')
+            nxt = sched.next_ts()
+            system_state['schedule'] = {'count': len(sched.entries), 'next_ts': nxt,
+                                        'next_id': sched.heap[0][1] if sched.heap else None}
+            # the cap bounds the effect of RTC drift on a long sleep
+            wait_s = SCHEDULE_MAX_SLEEP_S if nxt is None else min(max(0, nxt - now), SCHEDULE_MAX_SLEEP_S)
+            await events.wait(sched.wake, wait_s * 1000)
+        except Exception as e:
+            log.msg(log.SCHEDULER_TASK, e)
+            await asyncio.sleep(5)
@@ -4,25 +4,66 @@ import time
 from drivers.sensor.dht22 import DHT22
 from drivers.sensor.sgp30 import SGP30
 from drivers.sensor.light_sensor import LightSensor
-from config import DHT22_PIN, SGP30_I2C_SDA, SGP30_I2C_SCL, LIGHT_SENSOR_PIN, SENSOR_READ_INTERVAL_S
+from core.i2c_bus import get_bus
+from core.filters import SensorFilter
+from core.history import History
+from core import events
+from core import log
+from core.power import get_governor
+from core.settings import get_settings
+from core.rules import get_engine
+from core.commands import handle_command
+from config import DHT22_PIN, LIGHT_SENSOR_PIN
+from config import FILTER_WINDOW, FILTER_HAMPEL_K, FILTER_EMA_ALPHA, TREND_WINDOW
+from config import SPARK_POINTS, HISTORY_SAMPLE_S
+
+FIELDS = ('temperature', 'humidity', 'eco2', 'tvoc', 'light')
+HISTORY_FIELDS = ('temperature', 'humidity', 'eco2', 'light')
 
 async def sensor_reader_task(system_state, lock):
     """周期读取 DHT22/SGP30/光敏传感器，并写入共享状态。"""
     dht = DHT22(DHT22_PIN)
-    sgp = SGP30(SGP30_I2C_SDA, SGP30_I2C_SCL)
+    sgp = SGP30(bus=get_bus())
     light = LightSensor(LIGHT_SENSOR_PIN)
+    sf = SensorFilter(FIELDS, FILTER_WINDOW, FILTER_HAMPEL_K, FILTER_EMA_ALPHA, TREND_WINDOW)
+    sample = {}
+    filtered = {}
+    trend = {}
+    if not system_state.get('history'):
+        system_state['history'] = {f: History(SPARK_POINTS) for f in HISTORY_FIELDS}
+    hist = system_state['history']
+    last_hist = None
+    gov = get_governor()
+    settings = get_settings()
+    rules = get_engine()
+    rules_ver = None
+    t = h = None
+    dht_skip = 0
 
     while True:
         try:
-            t, h = dht.read()
+            # SGP30 needs its 1 Hz measurement; the DHT22 is read less often while
+            # idle and its last reading is held (keeps filter/trend sample rate)
+            fresh = dht_skip <= 0
+            if fresh:
+                t, h = dht.read()
+                dht_skip = gov.stretch(1)
+            dht_skip -= 1
             # humidity compensation for SGP30 using DHT22 temp/humidity
-            if t is not None and h is not None:
+            if fresh and t is not None and h is not None:
                 try:
-                    sgp.set_humidity(t, h)
+                    await sgp.set_humidity_async(t, h)
                 except Exception as e:
-                    print('SGP30 humidity compensation error', e)
-            eco2, tvoc = sgp.read()
+                    log.msg(log.SGP30_HUMIDITY, e)
+            eco2, tvoc = await sgp.read_async()
             lx = light.read()
+            sample['temperature'] = t
+            sample['humidity'] = h
+            sample['eco2'] = eco2
+            sample['tvoc'] = tvoc
+            sample['light'] = lx
+            sf.update(sample, filtered, trend)
+            actions = ()
             try:
                 await lock.acquire()
                 if t is not None:
@@ -34,12 +75,38 @@ async def sensor_reader_task(system_state, lock):
                 if tvoc is not None:
                     system_state['sensor']['tvoc'] = int(tvoc)
                 system_state['sensor']['light'] = int(lx)
+                system_state['filtered'].update(filtered)
+                system_state['trend'].update(trend)
+                now = time.ticks_ms()
+                if last_hist is None or time.ticks_diff(now, last_hist) >= HISTORY_SAMPLE_S * 1000:
+                    last_hist = now
+                    for f in HISTORY_FIELDS:
+                        if f in filtered:
+                            hist[f].push(filtered[f])
+                # local rules on the smoothed values; a field only evaluates the rules that watch it
+                actions = []
+                for f in FIELDS:
+                    actions.extend(rules.evaluate(f, filtered.get(f), now))
+                for rid, act in actions:
+                    log.msg(log.RULE_FIRED, '{} {}'.format(rid, act.get('type') or act['cmd']))
+                    try:
+                        handle_command(system_state, act)
+                    except Exception as e:
+                        # one broken action must not drop the others or the sensor update
+                        log.msg(log.RULE_ACTION, '{} {}'.format(rid, e))
+                if actions or rules_ver != events.version('rules'):
+                    rules_ver = events.version('rules')
+                    system_state['rules'] = rules.report()
             finally:
                 try:
                     lock.release()
                 except:
                     pass
+            events.notify('sensor')
+            if actions:
+                events.notify('lamp')
+                events.notify('rules')
         except Exception as e:
-            print('sensor_task error', e)
-        await asyncio.sleep(SENSOR_READ_INTERVAL_S)
+            log.msg(log.SENSOR_TASK, e)
+        await asyncio.sleep(settings.get('sensor_read_interval_s'))
 
@@ -0,0 +1,43 @@
+# === FILE: tasks/time_task.py ===
+import uasyncio as asyncio
+from core import clock
+from core import events
+from core import log
+from config import NTP_HOST, NTP_PORT, NTP_TIMEOUT_MS, NTP_RESYNC_S, NTP_RETRY_S
+
+
+async def clock_task(system_state, lock):
+    """Wi-Fi 连上后进行 NTP 同步，之后定期重新同步以校正 RTC 漂移。"""
+    sub = events.subscribe()
+    while True:
+        try:
+            if system_state['network']['wifi_status'] != 'connected':
+                await events.wait(sub, 5000)
+                continue
+            step = await clock.sync(NTP_HOST, NTP_PORT, NTP_TIMEOUT_MS)
+            if step is None:
+                log.msg(log.NTP_RETRY)
+                await asyncio.sleep(NTP_RETRY_S)
+                continue
+            log.msg(log.NTP_SYNCED, 'step {} drift {}'.format(step, clock.stats['drift_ppm']))
+            await lock.acquire()
+            try:
+                lamp = system_state['lamp']
+                if lamp.get('animation'):
+                    if lamp.get('animation_sync') is not None:
+                        # group animation: its start is absolute, re-pin it to the corrected clock
+                        lamp['animation_start_ms'] = lamp['animation_sync']
+                    else:
+                        # keep a running animation at the same elapsed time across the step
+                        lamp['animation_start_ms'] = lamp.get('animation_start_ms', 0) + step
+                system_state['clock'] = dict(clock.stats, synced=clock.synced)
+            finally:
+                try:
+                    lock.release()
+                except:
+                    pass
+            events.notify('clock')
+            await asyncio.sleep(NTP_RESYNC_S)
+        except Exception as e:
+            log.msg(log.CLOCK_TASK, e)
+            await asyncio.sleep(NTP_RETRY_S)
@@ -3,7 +3,9 @@ import uasyncio as asyncio
 import time
 from drivers.communication.wifi.wifi_manager import WifiManager
 from drivers.display.rgb import IndicatorRGB
-from config import AP_SSID, AP_PASSWORD, RGB_PIN
+from core import events
+from core import log
+from config import AP_SSID, AP_PASSWORD, RGB_PIN, WIFI_REUSE_IP
 
 AP_TIMEOUT_S = 30
 
@@ -11,7 +13,8 @@ async def wifi_manager_task(system_state, lock):
     """管理 Wi-Fi：优先读取保存配置，失败则开启 AP 配网。
 
     流程：
-      1) 置状态为 connecting，尝试加载 wifi.dat 并连接 STA。
+      1) 置状态为 connecting，尝试加载 wifi.dat 并连接 STA（先用缓存 BSSID/信道快速重连，
+         失败再扫描，按 RSSI 依次尝试已保存网络）。
       2) 成功则维持心跳，掉线后重试。
       3) 失败则进入 AP 模式 + Captive Portal，等待用户提交 ssid/password，
          保存后重启连接。
@@ -19,14 +22,16 @@ async def wifi_manager_task(system_state, lock):
         system_state: 全局状态字典，更新网络状态。
         lock: 协程锁，保护共享状态。
     """
-    wm = WifiManager()
+    wm = WifiManager(reuse_ip=WIFI_REUSE_IP)
     try:
         led = IndicatorRGB(RGB_PIN)
     except Exception as e:
-        print('IndicatorRGB init failed', e)
+        log.msg(log.RGB_LED, e)
         led = None
 
     def show(state):
+        # every wifi_status change goes through here; wake the UI
+        events.notify('network')
         if not led:
             return
         colors = {
@@ -43,7 +48,12 @@ async def wifi_manager_task(system_state, lock):
             system_state['network']['wifi_status'] = 'connecting'
             show('connecting')
             ok = await wm.connect_saved(timeout=AP_TIMEOUT_S)
+            system_state['network']['wifi_stats'] = dict(wm.stats)
             if ok:
+                try:
+                    system_state['network']['ip'] = wm.wlan.ifconfig()[0]
+                except Exception:
+                    pass
                 system_state['network']['wifi_status'] = 'connected'
                 show('connected')
                 # monitor
@@ -58,26 +68,26 @@ async def wifi_manager_task(system_state, lock):
                 show('ap_mode')
                 ap_ok = await wm.start_ap_and_captive(AP_SSID, AP_PASSWORD)
                 if not ap_ok:
-                    print('AP start failed, retrying...')
+                    # start_ap_and_captive() has logged the cause
                     show('error')
                     await asyncio.sleep(3)
                     continue
                 # captive portal to accept POST /save with ssid/password
                 conf = await wm.captive_portal(timeout_s=300)
                 if conf:
-                    print('WiFi config saved via captive portal:', conf.get('ssid'))
+                    log.msg(log.WIFI_SAVED, conf.get('ssid'))
                     system_state['network']['wifi_status'] = 'connecting'
                     show('connecting')
                     await wm.stop_ap()
                     # retry connect immediately with new config
                     continue
                 else:
-                    print('Captive portal timeout, retrying AP...')
+                    log.msg(log.PORTAL_TIMEOUT)
                     await wm.stop_ap()
                     system_state['network']['wifi_status'] = 'offline'
                     show('offline')
                     await asyncio.sleep(5)
         except Exception as e:
-            print('wifi_manager_task error', e)
+            log.msg(log.WIFI_TASK, e)
             show('error')
             await asyncio.sleep(5)
@@ -0,0 +1,39 @@
+"""Precompress static web assets for the device (host-side, CPython).
+
+Usage: python tools/build_assets.py
+
+Every www/*.html|css|js file is written next to itself as <name>.gz at maximum
+compression with a zeroed mtime, so rebuilding unchanged sources gives
+byte-identical output. Upload the .gz files to the device's /www directory;
+the firmware streams them as-is with Content-Encoding: gzip.
+"""
+import gzip
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WWW = os.path.join(ROOT, 'www')
+EXTS = ('.html', '.css', '.js')
+
+
+def build(src):
+    with open(src, 'rb') as f:
+        raw = f.read()
+    dst = src + '.gz'
+    with open(dst, 'wb') as out:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=out, compresslevel=9, mtime=0) as gz:
+            gz.write(raw)
+    return len(raw), os.path.getsize(dst)
+
+
+def main():
+    for name in sorted(os.listdir(WWW)):
+        if not name.endswith(EXTS):
+            continue
+        raw, packed = build(os.path.join(WWW, name))
+        print('{:<24} {:>6} -> {:>6} bytes'.format(name, raw, packed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Build a precompiled .mpy bundle of the firmware (host-side, CPython).
+
+Usage: python tools/build_mpy.py [--march xtensawin] [--out build]
+
+Every module under config.py, core/, drivers/, lib/ and tasks/ is compiled
+with mpy-cross (pip install mpy-cross, same major version as the firmware)
+into <out>/ with the same layout. main.py, boot.py and ota_boot.py stay as
+source because the firmware only runs them by those names. www/*.gz assets are copied as-is.
+Upload with e.g. `mpremote cp -r build/* :` after removing the old .py files
+from the device: MicroPython prefers a .py over an .mpy of the same name.
+
+Set BOOT_PROFILE = True in config.py and boot once from source and once from
+the bundle; the second boot prints the per-stage and per-import difference.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGES = ('core', 'drivers', 'lib', 'tasks')
+MODULES = ('config.py',)
+SOURCE_ONLY = ('main.py', 'boot.py', 'ota_boot.py')
+
+
+def sources():
+    for name in MODULES:
+        if os.path.exists(os.path.join(ROOT, name)):
+            yield name
+    for pkg in PACKAGES:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(ROOT, pkg)):
+            dirnames[:] = [d for d in dirnames if d != '__pycache__' and not d.endswith('.dist-info')]
+            for name in sorted(filenames):
+                if name.endswith('.py'):
+                    yield os.path.relpath(os.path.join(dirpath, name), ROOT)
+
+
+def compile_one(mpy_cross, src, dst, march):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    cmd = [mpy_cross, '-O1', '-s', src, '-o', dst, os.path.join(ROOT, src)]
+    if march:
+        cmd.insert(1, '-march=' + march)
+    subprocess.check_call(cmd)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--march', default='xtensawin', help='mpy-cross -march (ESP32/S3: xtensawin); empty for bytecode only')
+    ap.add_argument('--out', default=os.path.join(ROOT, 'build'))
+    ap.add_argument('--mpy-cross', default=shutil.which('mpy-cross') or 'mpy-cross')
+    args = ap.parse_args()
+
+    if os.path.isdir(args.out):
+        shutil.rmtree(args.out)
+    total_src = total_mpy = 0
+    for src in sources():
+        dst = os.path.join(args.out, src[:-3] + '.mpy')
+        try:
+            compile_one(args.mpy_cross, src, dst, args.march)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print('mpy-cross failed for {}: {}'.format(src, e))
+            return 1
+        total_src += os.path.getsize(os.path.join(ROOT, src))
+        total_mpy += os.path.getsize(dst)
+        print('{:<48} -> {}'.format(src, os.path.relpath(dst, args.out)))
+    for name in SOURCE_ONLY:
+        if os.path.exists(os.path.join(ROOT, name)):
+            shutil.copy(os.path.join(ROOT, name), os.path.join(args.out, name))
+    www = os.path.join(ROOT, 'www')
+    if os.path.isdir(www):
+        os.makedirs(os.path.join(args.out, 'www'), exist_ok=True)
+        for name in os.listdir(www):
+            if name.endswith('.gz'):
+                shutil.copy(os.path.join(www, name), os.path.join(args.out, 'www', name))
+    print('source {} bytes -> mpy {} bytes'.format(total_src, total_mpy))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Build an OTA update package for the device (host-side, CPython).
+
+Usage: python tools/ota_manifest.py --version 1.2.0 [--src .] [--out build/ota]
+                                    [--with-config] [--base old/manifest.json]
+
+Collects main.py, core/, drivers/, lib/, tasks/ (.py and .mpy) and www/*.gz
+from --src (the source tree, or the output of tools/build_mpy.py) into
+<out>/ next to a manifest.json listing the SHA-256 and size of every file.
+boot.py and ota_boot.py are never included: they do the swap and rollback
+and stay as flashed. config.py holds per-device Wi-Fi/MQTT settings and is
+only packaged with --with-config.
+
+The device transfers only the files whose hash differs from what it has
+installed, so the package always lists the full tree. With --base (the
+manifest.json of the package the devices run now) the changed files are
+reported and files that disappeared go into the manifest's "delete" list.
+
+Serve <out>/ over HTTP and send {"cmd": "ota", "op": "fetch", "url":
+"http://host:port/"} or push it over MQTT with
+`python -m sunlamp_backend.ota_push <out>`.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGES = ('core', 'drivers', 'lib', 'tasks')
+MODULES = ('main.py',)
+EXTS = ('.py', '.mpy')
+EXCLUDED = ('boot.py', 'ota_boot.py')
+MAX_FILE = 256 * 1024       # config.OTA_MAX_FILE
+MAX_FILES = 128             # core/ota.py MAX_FILES
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def collect(src, with_config=False):
+    """Relative paths ('/'-separated) of the files that make up a package."""
+    names = list(MODULES) + (['config.py'] if with_config else [])
+    out = [n for n in names if os.path.isfile(os.path.join(src, n))]
+    for pkg in PACKAGES:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(src, pkg)):
+            dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+            for name in sorted(filenames):
+                if name.endswith(EXTS):
+                    rel = os.path.relpath(os.path.join(dirpath, name), src)
+                    out.append(rel.replace(os.sep, '/'))
+    www = os.path.join(src, 'www')
+    if os.path.isdir(www):
+        out.extend('www/' + n for n in sorted(os.listdir(www)) if n.endswith('.gz'))
+    return [p for p in out if p not in EXCLUDED]
+
+
+def build(src, out, version, with_config=False, base=None):
+    """Copy the package files into out/ and write out/manifest.json; returns the manifest."""
+    files = {}
+    if os.path.isdir(out):
+        shutil.rmtree(out)
+    for rel in collect(src, with_config):
+        path = os.path.join(src, rel)
+        size = os.path.getsize(path)
+        if size > MAX_FILE:
+            raise ValueError('{} is {} bytes, the device accepts at most {}'.format(rel, size, MAX_FILE))
+        dst = os.path.join(out, rel)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copyfile(path, dst)
+        files[rel] = {'sha256': sha256_file(path), 'size': size}
+    if len(files) > MAX_FILES:
+        raise ValueError('{} files, the device accepts at most {}'.format(len(files), MAX_FILES))
+    manifest = {'version': version, 'files': files}
+    if base is not None:
+        manifest['delete'] = sorted(p for p in base.get('files', {}) if p not in files)
+    os.makedirs(out, exist_ok=True)
+    with open(os.path.join(out, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+def delta(manifest, base):
+    """Files of manifest that differ from base: [(path, size)]."""
+    old = base.get('files', {})
+    return [(p, i['size']) for p, i in sorted(manifest['files'].items())
+            if old.get(p, {}).get('sha256') != i['sha256']]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--version', required=True, help='version string reported by the device (<= 32 chars)')
+    ap.add_argument('--src', default=ROOT, help='tree to package (default: this repository)')
+    ap.add_argument('--out', default=os.path.join(ROOT, 'build', 'ota'))
+    ap.add_argument('--with-config', action='store_true', help='include config.py')
+    ap.add_argument('--base', help='manifest.json of the installed package, for the delta report')
+    args = ap.parse_args(argv)
+    if len(args.version) > 32:
+        ap.error('--version is limited to 32 characters')
+
+    base = None
+    if args.base:
+        with open(args.base) as f:
+            base = json.load(f)
+    try:
+        manifest = build(args.src, args.out, args.version, args.with_config, base)
+    except ValueError as e:
+        print(e)
+        return 1
+    total = sum(i['size'] for i in manifest['files'].values())
+    print('{} files, {} bytes -> {}'.format(len(manifest['files']), total, args.out))
+    if base is not None:
+        changed = delta(manifest, base)
+        for path, size in changed:
+            print('  changed {:<44} {:>7} bytes'.format(path, size))
+        for path in manifest['delete']:
+            print('  deleted {}'.format(path))
+        print('delta from {}: {} files, {} bytes'.format(
+            base.get('version'), len(changed), sum(s for _p, s in changed)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())